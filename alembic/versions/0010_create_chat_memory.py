@@ -0,0 +1,31 @@
+"""Create chat_memory table (resumo dos turnos antigos do chat)
+
+Revision ID: 0010_create_chat_memory
+Revises: e4a4e6dd66ae
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0010_create_chat_memory'
+down_revision = 'e4a4e6dd66ae'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        'chat_memory',
+        sa.Column('id', sa.Integer, primary_key=True),
+        sa.Column('id_processo', sa.Integer, nullable=False),
+        sa.Column('summary', sa.Text, nullable=False),
+        sa.Column('turns_covered', sa.Integer, nullable=False, server_default='0'),
+        sa.Column('updated_at', sa.DateTime, server_default=sa.func.now(), nullable=False),
+        sa.Column('tenant_id', sa.String, nullable=True),
+    )
+    op.create_foreign_key('fk_chat_memory_processo', 'chat_memory', 'processos', ['id_processo'], ['id_processo'], ondelete='CASCADE')
+    op.create_index('ix_chat_memory_processo_tenant', 'chat_memory', ['id_processo', 'tenant_id'])
+
+def downgrade():
+    op.drop_index('ix_chat_memory_processo_tenant', table_name='chat_memory')
+    op.drop_constraint('fk_chat_memory_processo', 'chat_memory', type_='foreignkey')
+    op.drop_table('chat_memory')
@@ -0,0 +1,18 @@
+"""Índice composto em chat_turns para paginação por keyset do histórico
+
+Revision ID: 0011_chat_turns_keyset_index
+Revises: 0010_create_chat_memory
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0011_chat_turns_keyset_index'
+down_revision = '0010_create_chat_memory'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_index('ix_chat_turns_tenant_processo_id', 'chat_turns', ['tenant_id', 'id_processo', 'id'])
+
+def downgrade():
+    op.drop_index('ix_chat_turns_tenant_processo_id', table_name='chat_turns')
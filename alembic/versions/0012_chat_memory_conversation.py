@@ -0,0 +1,26 @@
+"""chat_memory por conversa (conversation_id), não mais uma por processo
+
+Revision ID: 0012_chat_memory_conversation
+Revises: 0011_chat_turns_keyset_index
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0012_chat_memory_conversation'
+down_revision = '0011_chat_turns_keyset_index'
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Resumos antigos indexavam posições de um histórico de sessão qualquer:
+    # não há como atribuí-los a uma conversa, então são descartados.
+    op.execute("DELETE FROM chat_memory")
+    op.add_column('chat_memory', sa.Column('conversation_id', sa.String(64), nullable=False))
+    op.drop_index('ix_chat_memory_processo_tenant', table_name='chat_memory')
+    op.create_index('ix_chat_memory_conversation', 'chat_memory', ['id_processo', 'tenant_id', 'conversation_id'])
+
+def downgrade():
+    op.drop_index('ix_chat_memory_conversation', table_name='chat_memory')
+    op.create_index('ix_chat_memory_processo_tenant', 'chat_memory', ['id_processo', 'tenant_id'])
+    op.drop_column('chat_memory', 'conversation_id')
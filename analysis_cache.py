@@ -0,0 +1,123 @@
+# analysis_cache.py
+"""
+Cache de artefatos de análise do caso (resumo, riscos, próximos passos...).
+
+Cada artefato é identificado por (tipo, foco, digest dos documentos, modelo,
+versão do prompt) e gravado atomicamente em
+cases/<tenant>/<case_id>/cache/artifacts/<tipo>_<digest>_<hash>.json.
+Mudar documentos, modelo ou prompt gera outra chave; os arquivos antigos
+são removidos na invalidação (upload/deleção de documento) ou pela
+eviction por tamanho (os menos usados primeiro, pelo mtime).
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+
+
+def prompt_version(*templates: str) -> str:
+    """Versão curta derivada do texto dos prompts: editar o prompt invalida o cache."""
+    return hashlib.sha1("\x00".join(templates).encode("utf-8")).hexdigest()[:8]
+
+
+class AnalysisArtifactCache:
+    def __init__(self, cache_dir: Path, max_bytes: int = ANALYSIS_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.artifacts_dir = self.cache_dir / "artifacts"
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize_focus(focus: Optional[str]) -> str:
+        return " ".join((focus or "").lower().split())
+
+    def _path(self, kind: str, focus: Optional[str], digest: str, model: str, version: str) -> Path:
+        key = "\x00".join((self._normalize_focus(focus), model or "", version or ""))
+        fh = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        return self.artifacts_dir / f"{kind}_{digest}_{fh}.json"
+
+    def get(self, kind: str, focus: Optional[str], digest: str, model: str, version: str) -> Optional[Any]:
+        path = self._path(kind, focus, digest, model, version)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Artefato de análise ilegível ({path.name}): {e}")
+            return None
+        try:
+            os.utime(path)  # marca uso recente para a eviction
+        except OSError:
+            pass
+        return data.get("content")
+
+    def put(self, kind: str, focus: Optional[str], digest: str, model: str, version: str, content: Any) -> None:
+        path = self._path(kind, focus, digest, model, version)
+        payload = {
+            "kind": kind,
+            "focus": focus or "",
+            "digest": digest,
+            "model": model,
+            "prompt_version": version,
+            "created_at": time.time(),
+            "content": content,
+        }
+        try:
+            self.artifacts_dir.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, path)
+        except Exception as e:
+            logger.warning(f"Não conseguiu gravar artefato de análise {kind}: {e}")
+            return
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            try:
+                files = [(p, p.stat()) for p in self.artifacts_dir.glob("*.json")]
+            except OSError:
+                return
+            total = sum(st.st_size for _, st in files)
+            if total <= self.max_bytes:
+                return
+            removed = 0
+            for p, st in sorted(files, key=lambda item: item[1].st_mtime):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                    total -= st.st_size
+                    removed += 1
+                except OSError:
+                    pass
+            logger.info(f"Cache de análises ({self.cache_dir}): {removed} artefatos evictados por tamanho.")
+
+    def invalidate(self, keep_digest: Optional[str] = None) -> int:
+        """
+        Remove artefatos (e os caches legados summary_/firac_) de digests
+        diferentes de `keep_digest`; sem `keep_digest`, remove todos.
+        """
+        removed = 0
+        candidates = list(self.artifacts_dir.glob("*.json")) if self.artifacts_dir.exists() else []
+        candidates += list(self.cache_dir.glob("summary_*")) + list(self.cache_dir.glob("firac_*"))
+        for p in candidates:
+            # Nomes no formato <tipo>_<digest>_<hash>
+            if keep_digest is not None and f"_{keep_digest}_" in p.stem:
+                continue
+            try:
+                p.unlink()
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            logger.info(f"Cache de análises ({self.cache_dir}): {removed} artefatos invalidados.")
+        return removed
@@ -2,6 +2,7 @@
 import logging
 import json
 import re  # Para _clean_llm_json_output
+import time
 from typing import Any, Dict, List, Protocol
 
 from langchain_openai import ChatOpenAI
@@ -10,6 +11,8 @@ from langchain.prompts import PromptTemplate
 from langchain.chains.question_answering import load_qa_chain  # Para o chat_qa_chain
 from langchain.chains.summarize import load_summarize_chain  # Para o summarize_chain
 
+from step_graph import Step, record_step, run_steps_sync, run_sync
+
 logger = logging.getLogger(__name__)
 
 
@@ -63,6 +66,30 @@ class CaseAnalyzer:
         self.application_chain = LLMChain(llm=self.llm, prompt=self.APPLICATION_PROMPT, output_key="application")
         self.conclusion_chain = LLMChain(llm=self.llm, prompt=self.CONCLUSION_PROMPT, output_key="conclusion")
         self.firac_chain = SequentialChain(chains=[self.facts_chain, self.issue_chain, self.rule_chain, self.application_chain, self.conclusion_chain], input_variables=["context"], output_variables=["facts", "issue", "rules", "application", "conclusion"], verbose=True)
+        self.last_firac_timings: Dict[str, float] = {}
+
+    def _firac_steps(self) -> List[Step]:
+        """
+        Grafo de dependências do FIRAC (mesmas chains e entradas do firac_chain).
+        Cada prompt usa a saída da etapa anterior, então as cinco etapas rodam
+        em sequência; o grafo acrescenta timeout e tempo por etapa. O ganho de
+        concorrência está no Pipeline (resumo e fatos candidatos em paralelo).
+        """
+        async def facts(r): return (await self.facts_chain.ainvoke({"context": r["context"]}))["facts"]
+        async def issue(r): return (await self.issue_chain.ainvoke({"facts": r["facts"]}))["issue"]
+        async def rules(r): return (await self.rule_chain.ainvoke({"issue": r["issue"], "context": r["context"]}))["rules"]
+        async def application(r):
+            return (await self.application_chain.ainvoke({"facts": r["facts"], "rules": r["rules"], "issue": r["issue"]}))["application"]
+        async def conclusion(r):
+            return (await self.conclusion_chain.ainvoke({"application": r["application"], "issue": r["issue"]}))["conclusion"]
+
+        return [
+            Step("facts", facts, deps=["context"]),
+            Step("issue", issue, deps=["facts"]),
+            Step("rules", rules, deps=["issue"]),
+            Step("application", application, deps=["facts", "rules", "issue"]),
+            Step("conclusion", conclusion, deps=["application", "issue"]),
+        ]
 
     # Métodos que foram movidos do Pipeline e agora usam self.llm, self.case_retriever etc.
     # Em analysis_module.py, dentro da classe CaseAnalyzer
@@ -114,7 +141,10 @@ class CaseAnalyzer:
         docs = self.case_retriever.get_relevant_documents(query_for_relevance)
         if not docs: return "Sem conteúdo para resumir em Português."
         try:
-            result = self.summarize_chain.invoke({"input_documents": docs})
+            # ainvoke: as etapas de map do map_reduce rodam em paralelo (agenerate)
+            t0 = time.perf_counter()
+            result = run_sync(self.summarize_chain.ainvoke({"input_documents": docs}))
+            record_step("summary", "map_reduce", time.perf_counter() - t0)
             return result.get("output_text", "Falha ao resumir.")
         except Exception as e: logger.error(f"Erro summarize: {e}", exc_info=True); return f"Erro ao resumir: {e}"
 
@@ -164,13 +194,13 @@ class CaseAnalyzer:
         inputs = {"context": context}
         logger.debug(f"Input FIRAC: context='{context[:200]}...'")
         try:
-            result_dict: Dict[str, str] = self.firac_chain.invoke(inputs)
-            logger.info("Análise FIRAC concluída.")
+            result_dict, self.last_firac_timings = run_steps_sync("firac", self._firac_steps(), inputs)
+            logger.info(f"Análise FIRAC concluída. Tempos por etapa: {self.last_firac_timings}")
             logger.info(f"[DEBUG] FIRAC passado para petição 12345:\n{json.dumps(result_dict, ensure_ascii=False, indent=2)}")
             logger.debug(f"FIRAC result: {result_dict}")  # Para depuração
             print(f"FIRAC result: {result_dict}", file=sys.stderr)  # Garante saída no terminal stderr
             return {k: result_dict.get(k, f"Seção ({k}) não gerada.") for k in self.firac_chain.output_keys}
         except Exception as e:
-            logger.error(f"Erro firac_chain: {e}", exc_info=True)
+            logger.error(f"Erro no grafo FIRAC: {e}", exc_info=True)
             return {k: f"Erro ({k}): {e}" for k in self.firac_chain.output_keys}
 
@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, render_template, session
 from typing import Dict, List
-from pipeline import Pipeline
+from app.services.pipeline_registry import get_pipeline
+from app.services.sse import sse_event, sse_response
 from cadastro_manager import CadastroManager
 from flask import g
 import logging
@@ -27,16 +28,81 @@ def chat_with_case(id_processo: str):
                 'role': str(msg.get('role') or 'user'),
                 'content': str(msg.get('content') or ''),
             })
-        pipeline = Pipeline(case_id=id_processo)
-        resp = pipeline.chat(query, history)
-        # persist turns
-        _manager().save_chat_turn(id_processo, 'user', query)
-        _manager().save_chat_turn(id_processo, 'assistant', resp.get('output',''))
+        # Esta API sempre abriu o caso sem tenant (Pipeline(case_id=...)); mantém a mesma pasta
+        pipeline = get_pipeline(id_processo, tenant_id=None)
+        # conversation_id (opcional) identifica a conversa do cliente para a memória resumida
+        resp = pipeline.chat(
+            query, history, use_cache=not dados.get('no_cache'),
+            conversation_id=dados.get('conversation_id'),
+        )
+        # persist turns (pergunta + resposta numa única transação)
+        _manager().save_chat_exchange(id_processo, [('user', query), ('assistant', resp.get('output',''))])
         return jsonify(resp)
     except Exception as e:
         logger.exception('Erro chat')
         return jsonify({'erro':f'interno: {e}'}), 500
 
+@bp.route('/api/v1/processos/<id_processo>/chat/stream', methods=['POST'])
+def chat_with_case_stream(id_processo: str):
+    """
+    Igual a chat_with_case, mas responde em Server-Sent Events:
+    `token` (texto parcial), `done` ({output, ttft_s, total_s}) ou `error`.
+    O turno é persistido via save_chat_exchange quando a resposta termina.
+    """
+    dados = request.get_json(silent=True)
+    if not dados or not dados.get('query'):
+        return jsonify({'erro':'query obrigatória'}), 400
+    query = dados['query']
+    scope = str(dados.get('scope') or 'case')
+    history: List[Dict[str, str]] = []
+    for msg in dados.get('history', []):
+        if not isinstance(msg, dict):
+            continue
+        history.append({
+            'role': str(msg.get('role') or 'user'),
+            'content': str(msg.get('content') or ''),
+        })
+    pipeline = get_pipeline(id_processo, tenant_id=None)  # mesma resolução de chat_with_case
+
+    def _events():
+        for kind, payload in pipeline.chat_stream(
+                query, history, search_scope=scope, use_cache=not dados.get('no_cache'),
+                conversation_id=dados.get('conversation_id')):
+            if kind == 'token':
+                yield sse_event('token', {'text': payload})
+            elif kind == 'done':
+                try:
+                    _manager().save_chat_exchange(id_processo, [('user', query), ('assistant', payload['output'])])
+                except Exception:
+                    logger.exception('Erro ao persistir turno do chat (stream)')
+                yield sse_event('done', payload)
+            else:
+                yield sse_event('error', {'erro': payload})
+
+    return sse_response(_events())
+
+@bp.route('/api/v1/processos/<id_processo>/chat/history', methods=['GET'])
+def chat_history(id_processo: str):
+    """
+    Histórico persistido, paginado por keyset: ?limit=50&before_id=<id>.
+    `next_before_id` é o cursor da página anterior (None quando acabou).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
+        before_id = request.args.get('before_id', type=int)
+    except ValueError:
+        return jsonify({'erro':'limit inválido'}), 400
+    try:
+        turns = _manager().get_chat_history(id_processo, limit=limit, before_id=before_id)
+    except Exception as e:
+        logger.exception('Erro ao buscar histórico do chat')
+        return jsonify({'erro':f'interno: {e}'}), 500
+    for t in turns:
+        if t.get('created_at') is not None:
+            t['created_at'] = t['created_at'].isoformat()
+    next_before_id = turns[0]['id'] if len(turns) == limit else None
+    return jsonify({'turns': turns, 'next_before_id': next_before_id})
+
 @bp.route('/processos/ui/<id_processo>/chat', methods=['POST'])
 def ui_chat_with_case(id_processo):
     try:
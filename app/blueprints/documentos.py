@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request, render_template, g
 from werkzeug.utils import secure_filename
 from pipeline import Pipeline
+from app.services.pipeline_registry import get_pipeline
 import logging
 
 bp = Blueprint('documentos', __name__)
@@ -8,9 +9,9 @@ logger = logging.getLogger(__name__)
 
 
 def _build_pipeline(case_id: str) -> Pipeline:
-    """Instancia o Pipeline respeitando o tenant atual."""
+    """Obtém o Pipeline (compartilhado no worker) respeitando o tenant atual."""
     tenant_id = getattr(g, 'tenant_id', None)
-    return Pipeline(case_id=case_id, tenant_id=tenant_id)
+    return get_pipeline(case_id, tenant_id=tenant_id)
 
 @bp.route('/api/v1/processos/<id_processo>/documentos', methods=['POST'])
 def upload_documento(id_processo: str):
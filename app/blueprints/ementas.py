@@ -1,7 +1,7 @@
 from flask import Blueprint, request, render_template, jsonify
 import html
 from flask_login import login_required
-from pipeline import Pipeline
+from app.services.pipeline_registry import get_pipeline
 from werkzeug.utils import secure_filename
 import os
 
@@ -9,6 +9,7 @@ import os
 # duplicate imports removed; the blueprint is defined later in this file so no relative import is needed
 
 from app.services.ementas_kb_store import EmentasFAISSStore
+from app.utils.search_limits import batch_error, parse_k
 
 # Base local para o índice
 _EMENTAS_DIR = os.environ.get("EMENTAS_STORE_DIR", "data/ementas_faiss")
@@ -34,16 +35,40 @@ def ementas_index():
         return jsonify(error="field 'docs' must be a list"), 400
 
     try:
-        added = store.upsert_docs(docs)
+        # defer=true: ingestão em massa (sem fsync/compactação por lote); finalize com /checkpoint
+        added = store.upsert_docs(docs, defer=bool(payload.get("defer")))
         return jsonify(indexed=added), 200
     except Exception as e:
         return jsonify(error=str(e)), 500
 
 
+@ementas_bp.route("/checkpoint", methods=["POST"])
+def ementas_checkpoint():
+    try:
+        version = store.compact()
+        return jsonify(version=version), 200
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+
+@ementas_bp.route("/delete", methods=["POST"])
+def ementas_delete():
+    payload = request.get_json(force=True, silent=True) or {}
+    ids = payload.get("ids", [])
+    if not isinstance(ids, list):
+        return jsonify(error="field 'ids' must be a list"), 400
+
+    try:
+        removed = store.delete_docs(ids)
+        return jsonify(deleted=removed), 200
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+
 @ementas_bp.route('/ui/painel', methods=['GET'])
 @login_required
 def painel_ementas():
-    p = Pipeline(case_id='kb_dummy')
+    p = get_pipeline('kb_dummy', tenant_id=None)
     arquivos = p.get_indexed_ementa_filenames()
     return render_template('ementas.html', ementa_files=arquivos)
 
@@ -89,7 +114,7 @@ def classificar_texto():
 @ementas_bp.route('/ui/upload', methods=['POST'])
 @login_required
 def upload_ementas():
-    p = Pipeline(case_id='kb_dummy')
+    p = get_pipeline('kb_dummy', tenant_id=None)
     files = request.files.getlist('files') or []
     if not files:
         return "<div class='alert alert-warning p-2'>Nenhum arquivo enviado.</div>", 400
@@ -120,10 +145,33 @@ def upload_ementas():
 def ementas_search():
     payload = request.get_json(force=True, silent=True) or {}
     query = payload.get("query", "")
-    k = int(payload.get("k", 10))
+    k = parse_k(payload.get("k"))
     try:
-        hits = store.search(query, top_k=k)
+        # mode: dense | lexical | hybrid (vetores + BM25 por RRF; padrão EMENTAS_SEARCH_MODE)
+        hits = store.search(query, top_k=k, mode=payload.get("mode"))
         return jsonify(results=hits), 200
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        return jsonify(error=str(e)), 500
+
+
+# Busca em lote: um encode e uma busca FAISS para todas as consultas
+@ementas_bp.route("/search_batch", methods=["POST"])
+def ementas_search_batch():
+    payload = request.get_json(force=True, silent=True) or {}
+    queries = payload.get("queries", [])
+    erro = batch_error(queries)
+    if erro:
+        return jsonify(error=erro), 400
+    k = parse_k(payload.get("k"))
+    try:
+        per_query = store.search_many(
+            [str(q or "") for q in queries], top_k=k, dedup=bool(payload.get("dedup")), mode=payload.get("mode"),
+        )
+        return jsonify(results=[{"query": q, "results": hits} for q, hits in zip(queries, per_query)]), 200
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
     except Exception as e:
         return jsonify(error=str(e)), 500
 
@@ -133,7 +181,7 @@ def ementas_search():
 def obter_resumo_case(case_id: str):
     """Retorna um resumo breve do caso para pré-preencher a busca (limite defensivo)."""
     try:
-        pipeline = Pipeline(case_id=case_id)
+        pipeline = get_pipeline(case_id, tenant_id=None)
         resumo, _ = pipeline.summarize_with_cache('Resumo geral do caso')
         resumo = resumo[:5000]  # limite para não inundar textarea
         return f"<textarea class='form-control form-control-sm mb-2' name='q' id='ementa-query-box' rows='6'>{resumo}</textarea>"
@@ -150,14 +198,14 @@ def buscar_ementas():
     # Se modo resumo e texto vazio mas case_id fornecido, tentar gerar.
     if mode == 'resumo' and (not texto_query) and case_id:
         try:
-            pipeline_case = Pipeline(case_id=case_id)
+            pipeline_case = get_pipeline(case_id, tenant_id=None)
             texto_query, _ = pipeline_case.summarize_with_cache('Resumo geral do caso')
             texto_query = (texto_query or '').strip()[:8000]
         except Exception:
             pass
     if not texto_query:
         return "<div class='alert alert-warning p-2'>Consulta vazia.</div>", 400
-    p = Pipeline(case_id='kb_dummy')
+    p = get_pipeline('kb_dummy', tenant_id=None)
     pairs = p.find_similar_ementas_with_scores(texto_query, top_k=k)
     if not pairs:
         return "<div class='alert alert-info p-2'>Nenhum resultado.</div>"
@@ -332,7 +380,7 @@ document.getElementById('ementa-result-list').scrollIntoView({behavior:'smooth',
 @ementas_bp.route('/ui/delete/<filename>', methods=['DELETE'])
 @login_required
 def delete_ementa(filename):
-    p = Pipeline(case_id='kb_dummy')
+    p = get_pipeline('kb_dummy', tenant_id=None)
     removed = p.delete_ementas_by_filename(filename)
     lista = p.get_indexed_ementa_filenames()
     html_list = render_template('_lista_ementas.html', ementa_files=lista)
@@ -384,7 +432,7 @@ def export_all_ementas_txt():
         return "Query vazia", 400
     
     # Get search results
-    p = Pipeline(case_id='kb_dummy')
+    p = get_pipeline('kb_dummy', tenant_id=None)
     pairs = p.find_similar_ementas_with_scores(query, top_k=k)
     
     if not pairs:
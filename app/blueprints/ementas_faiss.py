@@ -2,50 +2,49 @@
 from flask import Blueprint, request, render_template, jsonify, current_app
 from flask_login import login_required
 from pathlib import Path
-import numpy as np
 import pickle
-import faiss
+
+from app.services.ementas_index_service import get_index_service
+from app.utils.search_limits import batch_error, parse_k
+from ementas_index import read_index
 import glob
 import os
 
 # 🔹 NOME DO BLUEPRINT CASA COM app/__init__.py
 ementas_faiss = Blueprint("ementas_faiss", __name__, url_prefix="/ementas/faiss")
 
-# Caminhos do índice
-INDEX_PATH = Path("data/store/ementas_faiss/index.faiss")
-META_PATH  = Path("data/store/ementas_faiss/metadados.pkl")
-
-# Singletons em memória
-_model = None
-_index = None
-_meta  = None
-
+# Raiz do índice publicado por scripts/indexar_ementas_faiss.py (versions/ + CURRENT)
+INDEX_ROOT = Path(os.getenv("EMENTAS_FAISS_ROOT", "data/store/ementas_faiss"))
+# Layout antigo (migrado para a primeira versão na carga)
+INDEX_PATH = INDEX_ROOT / "index.faiss"
+META_PATH  = INDEX_ROOT / "metadados.pkl"
+# Modelo dos índices gerados antes do manifest registrar o modelo
+LEGACY_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
 # --------------------------
 # Utilidades de modelo/index
 # --------------------------
-def _ensure_model():
-    """Carrega modelo de embeddings (mesma dimensão do índice: 384)."""
-    global _model
-    if _model is None:
-        from sentence_transformers import SentenceTransformer
-        # Ajuste aqui se seu índice foi criado com outro modelo
-        _model = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _model
-
-
-def _ensure_faiss():
-    """Carrega índice FAISS e metadados."""
-    global _index, _meta
-    if _index is None or _meta is None:
-        if not INDEX_PATH.exists() or not META_PATH.exists():
-            raise FileNotFoundError(
-                f"Índice ou metadados ausentes.\nINDEX_PATH={INDEX_PATH}\nMETA_PATH={META_PATH}"
-            )
-        _index = faiss.read_index(str(INDEX_PATH))
-        with open(META_PATH, "rb") as f:
-            _meta = pickle.load(f)
-    return _index, _meta
+def _legacy_index():
+    if not INDEX_PATH.exists() or not META_PATH.exists():
+        return None
+    with open(META_PATH, "rb") as f:
+        meta = pickle.load(f)
+    return read_index(INDEX_PATH, mmap=False), meta, {"model": LEGACY_MODEL}, None
+
+
+def _service():
+    """Serviço compartilhado (índice mmap + encoder do processo, troca a quente)."""
+    return get_index_service(INDEX_ROOT, legacy=_legacy_index)
+
+
+def _ensure_snapshot():
+    snap = _service().snapshot()
+    if snap is None:
+        raise FileNotFoundError(
+            f"Índice de ementas ausente em {INDEX_ROOT} "
+            "(gere com scripts/indexar_ementas_faiss.py)."
+        )
+    return snap
 
 
 # --------------------------
@@ -106,8 +105,8 @@ def get_resumo_do_caso(case_id: str) -> str:
 
     # 5) Fallback: tentar Pipeline.summarize_with_cache se disponível
     try:
-        from pipeline import Pipeline
-        pipeline = Pipeline(case_id=case_id)
+        from app.services.pipeline_registry import get_pipeline
+        pipeline = get_pipeline(case_id, tenant_id=None)
         resumo, _ = pipeline.summarize_with_cache("Resumo geral do caso")
         if resumo and resumo.strip():
             return resumo.strip()
@@ -153,9 +152,8 @@ def resumo_faiss():
 @ementas_faiss.get("/ping")
 def ping():
     try:
-        _ensure_model()
-        _, meta = _ensure_faiss()
-        return jsonify(ok=True, meta=len(meta)), 200
+        snap = _ensure_snapshot()
+        return jsonify(ok=True, meta=len(snap.meta), version=snap.version), 200
     except Exception as e:
         return jsonify(ok=False, error=str(e)), 500
 
@@ -163,60 +161,79 @@ def ping():
 # --------------------------
 # Núcleo de busca (para UI)
 # --------------------------
-def _search_cards(query: str, top_k: int = 5):
+def _card(hit):
+    """Formata um hit do serviço para o template _faiss_cards.html."""
+    rank, dist = hit["rank"], hit["score"]
+    m = hit["meta"] or {}
+
+    titulo = (m.get("title") or "").strip() or "—"
+    texto_original = (m.get("text") or "").strip()  # texto inteiro
+    texto_lower = texto_original.lower()
+    exc = texto_lower.replace("\n", " ").strip()
+    if len(exc) > 700:
+        exc = exc[:700] + "…"
+
+    fonte_bits = []
+    if m.get("source"):
+        fonte_bits.append(m["source"])
+    if m.get("orgao"):
+        fonte_bits.append(m["orgao"])
+    if m.get("grupo"):
+        fonte_bits.append(m["grupo"])
+    if m.get("data_decisao"):
+        fonte_bits.append(str(m["data_decisao"]))
+    fonte = ", ".join(fonte_bits) if fonte_bits else "ementa_kb_upload"
+
+    return {
+        "rank": rank,
+        # similaridade densa (None se, no modo híbrido, o documento veio só do BM25)
+        "score": float(dist) if dist is not None else None,
+        "rrf_score": hit.get("rrf_score"),
+        "titulo": titulo,
+        "excerto": exc,
+        "fonte": fonte,
+        "id": m.get("id", ""),
+        "texto_full": texto_original,
+        # campos extras para API JSON
+        "orgao": m.get("orgao"),
+        "grupo": m.get("grupo"),
+        "data_decisao": m.get("data_decisao"),
+        "source": m.get("source"),
+        "path": m.get("path") or m.get("arquivo"),
+    }
+
+
+def _search_cards(query: str, top_k: int = 5, mode=None):
     """
     Executa a busca no FAISS e formata itens para o template _faiss_cards.html.
+    mode: "dense", "lexical" ou "hybrid" (vetores + BM25 por RRF; padrão EMENTAS_SEARCH_MODE).
     """
-    model = _ensure_model()
-    index, metadata = _ensure_faiss()
-
-    emb = model.encode([query], normalize_embeddings=True)
-    D, I = index.search(np.asarray(emb, dtype="float32"), top_k)
-
-    items = []
-    for rank, (dist, idx) in enumerate(zip(D[0], I[0]), start=1):
-        if idx < 0 or idx >= len(metadata):
-            continue
-
-        m = metadata[idx] or {}
-
-        titulo = (m.get("title") or "").strip() or "—"
-        texto_original = (m.get("text") or "").strip()  # texto inteiro
-        texto_lower = texto_original.lower()
-        exc = texto_lower.replace("\n", " ").strip()
-        if len(exc) > 700:
-            exc = exc[:700] + "…"
-
-        fonte_bits = []
-        if m.get("source"):
-            fonte_bits.append(m["source"])
-        if m.get("orgao"):
-            fonte_bits.append(m["orgao"])
-        if m.get("grupo"):
-            fonte_bits.append(m["grupo"])
-        if m.get("data_decisao"):
-            fonte_bits.append(str(m["data_decisao"]))
-        fonte = ", ".join(fonte_bits) if fonte_bits else "ementa_kb_upload"
-
-        items.append(
-            {
-                "rank": rank,
-                "score": float(dist),
-                "titulo": titulo,
-                "excerto": exc,
-                "fonte": fonte,
-                "id": m.get("id", ""),
-                "texto_full": texto_original,
-                # campos extras para API JSON
-                "orgao": m.get("orgao"),
-                "grupo": m.get("grupo"),
-                "data_decisao": m.get("data_decisao"),
-                "source": m.get("source"),
-                "path": m.get("path") or m.get("arquivo"),
-            }
-        )
-
-    return items
+    return _search_cards_many([query], top_k, mode=mode)[0]
+
+
+def _search_cards_many(queries, top_k: int = 5, dedup: bool = False, mode=None):
+    """Várias consultas com um único encode/busca; uma lista de cartões por consulta."""
+    _ensure_snapshot()
+    per_query = _service().search_many(queries, k=top_k, dedup=dedup, mode=mode)
+    return [[_card(hit) for hit in hits] for hits in per_query]
+
+
+def _api_result(it):
+    """Cartão -> item da API JSON do widget."""
+    return {
+        "rank": it["rank"],
+        "id": it["id"],
+        "title": it["titulo"],
+        "ementa": it["excerto"],
+        "ementa_full": it["texto_full"],
+        "score": round(float(it["score"]), 4) if it["score"] is not None else None,
+        "rrf_score": round(float(it["rrf_score"]), 4) if it.get("rrf_score") is not None else None,
+        "orgao": it.get("orgao"),
+        "grupo": it.get("grupo"),
+        "data_decisao": it.get("data_decisao"),
+        "source": it.get("source"),
+        "path": it.get("path"),
+    }
 
 
 # --------------------------
@@ -226,7 +243,7 @@ def _search_cards(query: str, top_k: int = 5):
 def ui_buscar():
     """
     Aceita form (application/x-www-form-urlencoded) ou JSON.
-    Campos: q (query), k (top_k)
+    Campos: q (query), k (top_k), mode (dense | lexical | hybrid, opcional)
     Retorna fragmento HTML com cartões, no formato do painel clássico.
     """
     data = request.form or request.get_json(silent=True) or {}
@@ -245,7 +262,7 @@ def ui_buscar():
         ), 200
 
     try:
-        items = _search_cards(query, top_k)
+        items = _search_cards(query, top_k, mode=data.get("mode"))
         return render_template(
             "_faiss_cards.html",
             items=items,
@@ -269,47 +286,60 @@ def api_search():
     Endpoint usado pelo widget JS (_ementas_faiss_widget.html).
 
     Body JSON:
-      { "query": "...", "top_k": 10 }
+      { "query": "...", "top_k": 10, "mode": "hybrid" }   (mode opcional)
 
     Resposta:
       { "ok": true, "results": [ ... ] }
     """
     data = request.get_json(force=True) or {}
     query = (data.get("query") or "").strip()
-    try:
-        top_k = int(data.get("top_k") or 10)
-    except Exception:
-        top_k = 10
-    top_k = max(1, min(50, top_k))
+    top_k = parse_k(data.get("top_k"))
 
     if not query:
         return jsonify(ok=False, error="query vazio"), 400
 
     try:
-        items = _search_cards(query, top_k)
-        results = []
-        for it in items:
-            results.append(
-                {
-                    "rank": it["rank"],
-                    "id": it["id"],
-                    "title": it["titulo"],
-                    "ementa": it["excerto"],
-                    "ementa_full": it["texto_full"],
-                    "score": round(float(it["score"]), 4),
-                    "orgao": it.get("orgao"),
-                    "grupo": it.get("grupo"),
-                    "data_decisao": it.get("data_decisao"),
-                    "source": it.get("source"),
-                    "path": it.get("path"),
-                }
-            )
+        items = _search_cards(query, top_k, mode=data.get("mode"))
+        results = [_api_result(it) for it in items]
         return jsonify(ok=True, results=results), 200
     except Exception as e:
         current_app.logger.exception("Falha na busca FAISS (JSON)")
         return jsonify(ok=False, error=str(e)), 500
 
 
+@ementas_faiss.post("/search_batch")
+def api_search_batch():
+    """
+    Várias consultas numa chamada (um encode e um index.search para o lote).
+
+    Body JSON:
+      { "queries": ["...", "..."], "top_k": 10, "dedup": false, "mode": "hybrid" }
+
+    Resposta:
+      { "ok": true, "results": [ {"query": "...", "results": [ ... ]}, ... ] }
+
+    dedup=true mantém cada ementa apenas na consulta em que pontuou melhor.
+    """
+    data = request.get_json(force=True) or {}
+    queries = data.get("queries")
+    erro = batch_error(queries)
+    if erro:
+        return jsonify(ok=False, error=erro), 400
+    queries = [str(q or "").strip() for q in queries]
+    top_k = parse_k(data.get("top_k"))
+
+    try:
+        per_query = _search_cards_many(queries, top_k, dedup=bool(data.get("dedup")), mode=data.get("mode"))
+        results = [
+            {"query": q, "results": [_api_result(it) for it in items]}
+            for q, items in zip(queries, per_query)
+        ]
+        return jsonify(ok=True, results=results), 200
+    except Exception as e:
+        current_app.logger.exception("Falha na busca FAISS em lote (JSON)")
+        return jsonify(ok=False, error=str(e)), 500
+
+
 # --------------------------
 # Export TXT (1 resultado)
 # --------------------------
@@ -334,7 +364,7 @@ def export_faiss_txt():
 Data: {timestamp}
 Título: {titulo}
 Fonte: {fonte}
-Similaridade: {score}
+Similaridade: {score or "—"}
 
 {'='*60}
 
@@ -406,7 +436,7 @@ Total de resultados: {len(items)}
             section = f"""[{i:02d}] {titulo}
 ID: {item_id}
 Fonte: {fonte}
-Similaridade: {score:.4f}
+Similaridade: {f"{score:.4f}" if score is not None else "—"}
 Conteúdo:
 {'-'*40}
 {texto}
@@ -13,6 +13,7 @@ from flask import Blueprint, request, jsonify
 # from legal_infer_client import LegalInferClient
 
 from legal_infer_client import LegalInferClient  # Use absolute import if in the same directory
+from app.utils.search_limits import batch_error, parse_k
 
 bp = Blueprint('inference', __name__, url_prefix='/api')
 
@@ -81,3 +82,37 @@ def search_similar():
         return jsonify(res), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/search_similar_batch', methods=['POST'])
+def search_similar_batch():
+    """
+    Similarity search for several queries in a single round-trip.
+    
+    Request JSON:
+    {
+        "queries": ["legal text 1", "legal text 2"],   (at most SEARCH_MAX_BATCH)
+        "k": 10,          (optional, default=10, clamped to 1..SEARCH_MAX_K)
+        "dedup": false    (optional: keep each doc only under its best query)
+    }
+    
+    Returns:
+    {
+        "results": [
+            {"query": "legal text 1", "results": [{"id": "...", "similarity": 0.92, ...}]},
+            ...
+        ]
+    }
+    """
+    try:
+        queries = request.json.get("queries", [])
+        erro = batch_error(queries)
+        if erro:
+            return jsonify({"error": erro}), 400
+        k = parse_k(request.json.get("k"))
+        
+        queries = [str(q or "").strip() for q in queries]
+        res = infer.similar_batch(queries, k=k, dedup=bool(request.json.get("dedup")))
+        return jsonify({"results": [{"query": q, "results": r} for q, r in zip(queries, res)]}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, render_template, g
 from flask_login import login_required
 from pipeline import Pipeline
+from app.services.pipeline_registry import get_pipeline
 from werkzeug.utils import secure_filename
 import os, logging, traceback, json
 from pathlib import Path
@@ -9,7 +10,6 @@ from urllib.parse import unquote
 kb_bp = Blueprint('kb', __name__, url_prefix='/kb')
 logger = logging.getLogger(__name__)
 
-_KB_PIPELINE_CACHE: Pipeline | None = None
 FALLBACK_KB_DIR = Path('./kb_fallback')
 FALLBACK_KB_DIR.mkdir(parents=True, exist_ok=True)
 FALLBACK_INDEX = FALLBACK_KB_DIR / 'index.json'
@@ -52,18 +52,12 @@ def _merged_kb_filenames(pipeline: Pipeline | None) -> list[str]:
     return merged
 
 def _get_kb_pipeline(light: bool = True) -> Pipeline:
-    global _KB_PIPELINE_CACHE
-    if _KB_PIPELINE_CACHE is None:
-        try:
-            tenant_id = getattr(g, 'tenant_id', None) if light else None
-            _KB_PIPELINE_CACHE = Pipeline(
-                case_id='kb_dummy',
-                tenant_id=tenant_id,
-            )
-        except Exception as e:
-            logger.error(f"Falha ao inicializar Pipeline KB: {e}")
-            raise
-    return _KB_PIPELINE_CACHE
+    try:
+        tenant_id = getattr(g, 'tenant_id', None) if light else None
+        return get_pipeline('kb_dummy', tenant_id=tenant_id)
+    except Exception as e:
+        logger.error(f"Falha ao inicializar Pipeline KB: {e}")
+        raise
 
 @kb_bp.route('/ui/painel', methods=['GET'])
 @login_required
@@ -2,9 +2,14 @@
 from flask_login import login_required, current_user
 from app.services.cadastro_service import CadastroService
 from cadastro_manager import CadastroManager
-from pipeline import Pipeline
+from app.services.pipeline_registry import get_pipeline, registry
+from app.services.ingestion_jobs import get_job_queue, TERMINAL_STATUSES
+from app.services.sse import sse_event, sse_response
+from app.services.export_service import (
+    export_artifact, render_firac_pdf, render_resumo_pdf, render_text, send_export,
+)
 from werkzeug.utils import secure_filename
-import os, hashlib, logging, base64
+import os, hashlib, logging, json, uuid, html
 import re
 
 from flask import (
@@ -111,6 +116,38 @@ def novo_processo(id_cliente):
     return render_template('novo_processo.html', id_cliente=id_cliente, advogados=advogados)
 
 # --- Bulk CSV Upload Routes ---
+PREVIEW_MAX_LINHAS = 100
+
+
+def _csv_text_stream(csv_file):
+    """
+    Envolve o stream binário do upload em um decodificador UTF-8 incremental,
+    para que o CSV seja lido linha a linha sem carregar o arquivo inteiro.
+    (utf-8-sig descarta o BOM que o Excel costuma gravar.)
+    """
+    import io
+    return io.TextIOWrapper(csv_file.stream, encoding='utf-8-sig', newline='')
+
+
+def _csv_is_utf8(csv_file, chunk_size: int = 1 << 16) -> bool:
+    """
+    Decodifica o upload inteiro (em blocos, sem guardá-lo) antes de qualquer
+    inserção e volta o stream ao início. Assim um byte inválido no fim do
+    arquivo não deixa lotes já gravados para trás.
+    """
+    import codecs
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    stream = csv_file.stream
+    try:
+        for chunk in iter(lambda: stream.read(chunk_size), b''):
+            decoder.decode(chunk)
+        decoder.decode(b'', final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+    finally:
+        stream.seek(0)
+
 @processos_bp.route('/<id_cliente>/bulk-upload', methods=['GET'])
 @login_required
 def bulk_upload_form(id_cliente):
@@ -155,24 +192,28 @@ def bulk_upload_api(id_cliente):
                 "mensagem": "Arquivo deve ser CSV"
             }), 400
         
-        # Lê conteúdo CSV
-        try:
-            csv_content = csv_file.read().decode('utf-8')
-        except UnicodeDecodeError:
+        if not _csv_is_utf8(csv_file):
             return jsonify({
                 "status": "erro",
-                "mensagem": "Arquivo CSV não está em UTF-8"
+                "mensagem": "Arquivo não está em UTF-8"
             }), 400
-        
-        # Processa CSV via CadastroManager
+
+        # Processa CSV via CadastroManager, lendo o upload como stream (decodificação
+        # incremental) e inserindo em lotes de tamanho fixo
         tenant_id = getattr(g, 'tenant_id', None)
         mgr = CadastroManager(tenant_id=tenant_id)
-        resultado = mgr.bulk_create_processos_from_csv(id_cliente, csv_content)
+        resultado = mgr.bulk_create_processos_from_csv(
+            id_cliente,
+            _csv_text_stream(csv_file),
+            batch_size=current_app.config.get('BULK_CSV_BATCH_SIZE', 1000),
+        )
         
         # Log para auditoria
         logger.info(f"Bulk upload CSV concluído para cliente {id_cliente}: {resultado['processos_criados']} processos criados")
         
-        return jsonify(resultado), 200 if resultado['status'] == 'sucesso' else 400
+        # 207: parte das linhas foi gravada antes da leitura ser interrompida
+        status_http = {'sucesso': 200, 'parcial': 207}.get(resultado['status'], 400)
+        return jsonify(resultado), status_http
         
     except Exception as e:
         logger.error(f"Erro no bulk upload API: {e}", exc_info=True)
@@ -190,28 +231,28 @@ def bulk_upload_preview(id_cliente):
             return jsonify({"status": "erro", "mensagem": "Nenhum arquivo enviado"}), 400
         
         csv_file = request.files['csv_file']
+        # ?linhas só reduz o preview: fica entre 1 e PREVIEW_MAX_LINHAS
+        max_linhas = request.args.get('linhas', PREVIEW_MAX_LINHAS, type=int)
+        max_linhas = max(1, min(max_linhas, PREVIEW_MAX_LINHAS))
+        
+        # Parse CSV para preview: lê só as N primeiras linhas como dict e apenas
+        # conta o restante (sem montar dicts nem guardar as linhas)
+        import csv
+        from itertools import islice
         
         try:
-            csv_content = csv_file.read().decode('utf-8')
+            reader = csv.DictReader(_csv_text_stream(csv_file))
+            preview_rows = list(islice(reader, max_linhas))
+            restantes = sum(1 for row in reader.reader if row)
         except UnicodeDecodeError:
             return jsonify({"status": "erro", "mensagem": "Arquivo não está em UTF-8"}), 400
         
-        # Parse CSV para preview
-        import csv
-        from io import StringIO
-        
-        reader = csv.DictReader(StringIO(csv_content))
-        rows = list(reader)
-        
-        if not rows:
+        if not preview_rows:
             return jsonify({"status": "erro", "mensagem": "CSV vazio"}), 400
         
-        # Retorna preview (máximo 100 linhas)
-        preview_rows = rows[:100]
-        
         return jsonify({
             "status": "sucesso",
-            "total_linhas": len(rows),
+            "total_linhas": len(preview_rows) + restantes,
             "preview": preview_rows,
             "colunas": reader.fieldnames
         }), 200
@@ -253,6 +294,7 @@ def delete_processo_api(id_processo):
         success = mgr.delete_processo(id_processo)
         
         if success:
+            registry.invalidate(id_processo, tenant_id)
             logger.warning(f"⚠️ Processo DELETADO: {id_processo} (desenvolvimento)")
             return jsonify({
                 "status": "sucesso",
@@ -287,29 +329,7 @@ def painel_processo(id_processo):
     except Exception:
         advogado = None
     # Docs & pipeline context could be loaded here
-    from pathlib import Path
-    import openai
-    from ingestion_module import IngestionHandler
-    # Inicialização dos componentes obrigatórios
-    base_cases_dir = Path("./cases")
-    openai_client = openai.OpenAI()
-    # Para inicializar o IngestionHandler, é necessário obter os argumentos corretos
-    # Estes argumentos normalmente são: nlp_processor, text_splitter, label_map, case_store, kb_store
-    # Como exemplo, inicialize com None ou valores padrão se não tiver contexto suficiente
-    ingestion_handler = IngestionHandler(
-        nlp_processor=None,
-        text_splitter=None,
-        label_map=None,
-        case_store=None,
-        kb_store=None
-    )
-    pipeline = Pipeline(
-        case_id=id_processo,
-        ingestion_handler=ingestion_handler,
-        openai_client=openai_client,
-        base_cases_dir=base_cases_dir,
-        tenant_id=getattr(g, 'tenant_id', None)
-    )
+    pipeline = get_pipeline(id_processo)
     documentos = pipeline.list_unique_case_documents()
     chat_history = session.get(f'chat_history_{id_processo}', [])
     # Código curto estável para identificação visual (caso_<8 hex>)
@@ -398,25 +418,7 @@ def ui_upload_form(id_processo):
 @processos_bp.route('/ui/<id_processo>/resumo', methods=['POST'])
 def ui_resumo(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         focus = (request.form.get('focus') or request.values.get('focus') or '').strip()
         resumo, from_cache = pipeline.summarize_with_cache(focus or 'Resumo geral do caso')
@@ -459,138 +461,55 @@ def ui_resumo(id_processo):
     except Exception as e:
         return f"<div class='alert alert-danger mt-4'>Erro: {e}</div>"
 
+def _export_link(id_processo: str, path, label: str, css: str = 'btn-success') -> str:
+    size_kb = path.stat().st_size // 1024
+    href = url_for('processos.ui_download_export', id_processo=id_processo, filename=path.name)
+    return f"<a class='btn btn-sm {css}' href='{href}' target='_blank'>{html.escape(label)} ({size_kb} KB)</a>"
+
+def _export_resumo_txt(pipeline, id_processo: str, code: str):
+    """Resumo (via cache de resumo) gravado como TXT em exports; retorna (resumo, path)."""
+    focus = (request.form.get('focus') or '').strip()
+    resumo, _ = pipeline.summarize_with_cache(focus)
+    path = export_artifact(pipeline.case_dir / 'exports', 'resumo_txt', code, resumo, 'txt', render_text(resumo))
+    return resumo, path
+
 @processos_bp.route('/ui/<id_processo>/export/resumo', methods=['POST'])
 def ui_export_resumo(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
-
-        focus = (request.form.get('focus') or '').strip()
-        resumo = pipeline.summarize(query_for_relevance=focus or 'Resumo geral do caso')
+        pipeline = get_pipeline(id_processo)
         code = _compute_case_code(id_processo)
-        filename = f"resumo_{code}.txt"
-        import base64, html
-        b64 = base64.b64encode(resumo.encode('utf-8')).decode('utf-8')
-        safe_name = html.escape(filename)
-        return f"<a download='{safe_name}' href='data:text/plain;base64,{b64}' class='btn btn-sm btn-success'>Baixar {safe_name}</a>"
+        _, path = _export_resumo_txt(pipeline, id_processo, code)
+        if path is None:
+            return "<div class='alert alert-danger mt-2'>Erro ao exportar: arquivo não gerado.</div>", 500
+        return _export_link(id_processo, path, f"Baixar resumo_{code}.txt")
     except Exception as e:
         return f"<div class='alert alert-danger mt-2'>Erro ao exportar: {e}</div>", 500
 
 @processos_bp.route('/ui/<id_processo>/export/resumo/pdf', methods=['POST'])
 def ui_export_resumo_pdf(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
-
-        focus = (request.form.get('focus') or '').strip()
-        resumo = pipeline.summarize(query_for_relevance=focus or 'Resumo geral do caso')
+        pipeline = get_pipeline(id_processo)
         code = _compute_case_code(id_processo)
-        filename = f"resumo_{code}.pdf"
-        export_dir = pipeline.case_dir / 'exports'
-        export_dir.mkdir(parents=True, exist_ok=True)
-        pdf_path = export_dir / filename
-        generated = False
-        try:
-            from fpdf import FPDF
-            pdf = FPDF()
-            pdf.set_margins(15, 15, 15)
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.add_page()
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(0, 10, f"Resumo do Caso - {code}", ln=1)
-            pdf.set_font("Arial", size=11)
-            # Tratar parágrafos preservando quebras em branco
-            paragraphs = [p.strip() for p in resumo.split('\n')]
-            for para in paragraphs:
-                if not para:
-                    pdf.ln(4)
-                    continue
-                # multi_cell faz wrap automático; substitui tabs múltiplos espaços
-                pdf.multi_cell(0, 6, para.replace('\t', '    '))
-                pdf.ln(1)
-            pdf.output(str(pdf_path))
-            if pdf_path.exists() and pdf_path.stat().st_size > 100:
-                generated = True
-            else:
-                logger.warning('PDF resumo não gerado ou vazio', extra={'case_id': id_processo, 'code': code, 'path': str(pdf_path)})
-        except ImportError:
-            logger.info('fpdf não instalada - fallback para TXT')
-        except Exception:
-            logger.exception('Erro gerando PDF resumo')
-        if generated and pdf_path.exists():
-            try:
-                size = pdf_path.stat().st_size
-            except Exception:
-                size = -1
-            if size > 0:
-                return f"<a class='btn btn-sm btn-success' href='/processos/ui/{id_processo}/download/exports/{filename}' target='_blank'>Baixar {filename} ({size//1024} KB)</a>"
-            else:
-                logger.error('Arquivo PDF resumo ausente ou vazio após geração', extra={'case_id': id_processo, 'code': code, 'path': str(pdf_path), 'size': size})
-        b64 = base64.b64encode(resumo.encode('utf-8')).decode('utf-8')
-        debug = ''
-        if pdf_path and not pdf_path.exists():
-            debug = f" (debug: arquivo não encontrado em {pdf_path})"
-        return f"<a download='{filename.replace('.pdf','.txt')}' href='data:text/plain;base64,{b64}' class='btn btn-sm btn-warning'>Baixar como TXT (fallback)</a><small class='text-muted ms-2'>PDF não gerado{debug}</small>"
+        focus = (request.form.get('focus') or '').strip()
+        resumo, _ = pipeline.summarize_with_cache(focus)
+        pdf_path = export_artifact(
+            pipeline.case_dir / 'exports', 'resumo_pdf', code, resumo, 'pdf', render_resumo_pdf(resumo, code)
+        )
+        if pdf_path is not None:
+            return _export_link(id_processo, pdf_path, f"Baixar resumo_{code}.pdf")
+        logger.warning('PDF resumo não gerado - fallback para TXT', extra={'case_id': id_processo, 'code': code})
+        txt_path = export_artifact(pipeline.case_dir / 'exports', 'resumo_txt', code, resumo, 'txt', render_text(resumo))
+        if txt_path is None:
+            return "<div class='alert alert-danger mt-2'>Erro ao exportar PDF: arquivo não gerado.</div>", 500
+        return _export_link(id_processo, txt_path, "Baixar como TXT (fallback)", 'btn-warning') + "<small class='text-muted ms-2'>PDF não gerado</small>"
     except Exception as e:
         return f"<div class='alert alert-danger mt-2'>Erro ao exportar PDF: {e}</div>", 500
 
 @processos_bp.route('/ui/<id_processo>/download/exports/<path:filename>')
 def ui_download_export(id_processo, filename):
-    """Serve arquivos de export (PDF/TXT) com diagnóstico detalhado em caso de falha."""
+    """Serve arquivos de export com ETag (GET condicional → 304 se não mudou)."""
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         export_dir = pipeline.case_dir / 'exports'
         if not export_dir.exists():
@@ -603,12 +522,7 @@ def ui_download_export(id_processo, filename):
         if not target.exists():
             logger.warning('arquivo export não encontrado', extra={'case_id': id_processo, 'file': str(target)})
             return f"<div class='alert alert-warning mt-2'>Arquivo não encontrado: {filename}</div>", 404
-        mime = 'application/pdf' if filename.lower().endswith('.pdf') else 'text/plain'
-        try:
-            return send_file(str(target), mimetype=mime, as_attachment=True, download_name=filename)
-        except TypeError:
-            # Para compatibilidade Flask mais antiga sem download_name
-            return send_file(str(target), mimetype=mime, as_attachment=True)
+        return send_export(target)
     except Exception as e:
         logger.exception('Erro download export')
         return f"<div class='alert alert-danger mt-2'>Erro download: {e}</div>", 500
@@ -616,25 +530,7 @@ def ui_download_export(id_processo, filename):
 @processos_bp.route('/ui/<id_processo>/analise/firac', methods=['POST'])
 def ui_analise_firac(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         focus = (request.form.get('focus') or '').strip()
         result = pipeline.generate_firac(focus=focus)
@@ -660,89 +556,25 @@ def ui_analise_firac(id_processo):
 @processos_bp.route('/ui/<id_processo>/analise/firac/export/pdf', methods=['POST'])
 def ui_export_firac_pdf(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         focus = (request.form.get('focus') or '').strip()
         result = pipeline.generate_firac(focus=focus)
         data = result.get('data')
         raw = result.get('raw')
-        from datetime import datetime
         code = _compute_case_code(id_processo)
-        filename = f"firac_{code}.pdf"
         export_dir = pipeline.case_dir / 'exports'
-        export_dir.mkdir(parents=True, exist_ok=True)
-        pdf_path = export_dir / filename
-        generated = False
-        try:
-            from fpdf import FPDF
-            pdf = FPDF()
-            pdf.set_auto_page_break(auto=True, margin=12)
-            pdf.add_page()
-            pdf.set_font("Arial", "B", 14)
-            pdf.cell(0, 10, f"Análise FIRAC - {code}", ln=1)
-            pdf.set_font("Arial", size=9)
-            pdf.cell(0, 6, f"Gerado: {datetime.utcnow().isoformat()}Z", ln=1)
-            pdf.ln(2)
-            def write_section(title, content_lines):
-                pdf.set_font("Arial", "B", 11)
-                pdf.cell(0, 7, title, ln=1)
-                pdf.set_font("Arial", size=10)
-                if isinstance(content_lines, list):
-                    for i, l in enumerate(content_lines, 1):
-                        pdf.multi_cell(0, 5, f"{i}. {l}")
-                else:
-                    for para in str(content_lines).split('\n'):
-                        pdf.multi_cell(0, 5, para)
-                pdf.ln(2)
-            if data:
-                write_section('Fatos', data.get('facts') or [])
-                write_section('Questão', data.get('issue',''))
-                write_section('Regras', data.get('rules') or [])
-                write_section('Aplicação', data.get('application',''))
-                write_section('Conclusão', data.get('conclusion',''))
-            else:
-                write_section('FIRAC (Texto)', raw)
-            pdf.output(str(pdf_path))
-            if pdf_path.exists() and pdf_path.stat().st_size > 100:
-                generated = True
-            else:
-                logger.warning('PDF FIRAC não gerado ou vazio', extra={'case_id': id_processo, 'code': code, 'path': str(pdf_path)})
-        except ImportError:
-            logger.info('fpdf não instalada - fallback para TXT FIRAC')
-        except Exception:
-            logger.exception('Erro gerando PDF FIRAC')
-        if generated and pdf_path.exists():
-            try:
-                size = pdf_path.stat().st_size
-            except Exception:
-                size = -1
-            if size > 0:
-                return f"<a class='btn btn-sm btn-success' href='/processos/ui/{id_processo}/download/exports/{filename}' target='_blank'>Baixar {filename} ({size//1024} KB)</a>"
-            else:
-                logger.error('Arquivo PDF FIRAC ausente ou vazio após geração', extra={'case_id': id_processo, 'code': code, 'path': str(pdf_path), 'size': size})
-        b64 = base64.b64encode((raw or 'FIRAC não disponível').encode('utf-8')).decode('utf-8')
-        debug = ''
-        if pdf_path and not pdf_path.exists():
-            debug = f" (debug: arquivo não encontrado em {pdf_path})"
-        return f"<a download='{filename.replace('.pdf','.txt')}' href='data:text/plain;base64,{b64}' class='btn btn-sm btn-warning'>Baixar TXT (fallback)</a><small class='text-muted ms-2'>PDF não gerado{debug}</small>"
+        pdf_path = export_artifact(
+            export_dir, 'firac_pdf', code, {'data': data, 'raw': raw}, 'pdf', render_firac_pdf(data, raw, code)
+        )
+        if pdf_path is not None:
+            return _export_link(id_processo, pdf_path, f"Baixar firac_{code}.pdf")
+        logger.warning('PDF FIRAC não gerado - fallback para TXT', extra={'case_id': id_processo, 'code': code})
+        texto = raw or 'FIRAC não disponível'
+        txt_path = export_artifact(export_dir, 'firac_txt', code, texto, 'txt', render_text(texto))
+        if txt_path is None:
+            return "<div class='alert alert-danger'>Erro exportar FIRAC: arquivo não gerado.</div>", 500
+        return _export_link(id_processo, txt_path, "Baixar TXT (fallback)", 'btn-warning') + "<small class='text-muted ms-2'>PDF não gerado</small>"
     except Exception as e:
         return f"<div class='alert alert-danger'>Erro exportar FIRAC: {e}</div>", 500
 
@@ -820,25 +652,7 @@ def ui_peticao_form(id_processo):
 def ui_peticao_gerar(id_processo):
     """Gera rascunho de petição inicial usando FIRAC + inputs. Retorna bloco HTML com texto e export options."""
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         proc = service.get_processo(id_processo) or {}
         cliente = service.get_cliente(proc.get('id_cliente')) if proc.get('id_cliente') else None
@@ -933,25 +747,7 @@ def ui_peticao_gerar(id_processo):
 @processos_bp.route('/ui/<id_processo>/peticao/export/pdf', methods=['GET'])
 def ui_peticao_export_pdf(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         proc = service.get_processo(id_processo) or {}
         cliente = service.get_cliente(proc.get('id_cliente')) if proc.get('id_cliente') else None
@@ -1029,25 +825,7 @@ def ui_peticao_export_docx(id_processo):
             from docx import Document
         except ImportError:
             return "<div class='text-danger'>Dependência 'python-docx' não instalada. Instale para exportar DOCX: pip install python-docx</div>"
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         proc = service.get_processo(id_processo) or {}
         cliente = service.get_cliente(proc.get('id_cliente')) if proc.get('id_cliente') else None
@@ -1112,28 +890,10 @@ def ui_peticao_export_docx(id_processo):
 @processos_bp.route('/ui/<id_processo>/analise/riscos', methods=['POST'])
 def ui_analise_riscos(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         focus = (request.form.get('focus') or '').strip()
-        txt = pipeline.identify_legal_risks(focus=focus)
+        txt = pipeline.identify_legal_risks(focus=focus, use_cache=not request.form.get('no_cache'))
         return f"<pre style='white-space:pre-wrap;font-size:0.85rem;'>{txt}</pre>"
     except Exception as e:
         return f"<div class='alert alert-danger'>Erro riscos: {e}</div>", 500
@@ -1141,28 +901,10 @@ def ui_analise_riscos(id_processo):
 @processos_bp.route('/ui/<id_processo>/analise/proximos_passos', methods=['POST'])
 def ui_analise_proximos_passos(id_processo):
     try:
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=getattr(g, 'tenant_id', None)
-        )
+        pipeline = get_pipeline(id_processo)
 
         focus = (request.form.get('focus') or '').strip()
-        txt = pipeline.suggest_next_steps(focus=focus)
+        txt = pipeline.suggest_next_steps(focus=focus, use_cache=not request.form.get('no_cache'))
         return f"<pre style='white-space:pre-wrap;font-size:0.85rem;'>{txt}</pre>"
     except Exception as e:
         return f"<div class='alert alert-danger'>Erro próximos passos: {e}</div>", 500
@@ -1182,10 +924,7 @@ def documentos_processo(id_processo):
         tenant_id = getattr(g, 'tenant_id', None)
 
         # ⚠️ Aqui usamos o Pipeline "leve" apenas para listar documentos
-        pipeline = Pipeline(
-            case_id=id_processo,
-            tenant_id=tenant_id
-        )
+        pipeline = get_pipeline(id_processo, tenant_id=tenant_id)
 
         documentos = pipeline.list_unique_case_documents()
 
@@ -1204,116 +943,57 @@ def documentos_processo(id_processo):
 
 @processos_bp.route('/ui/<id_processo>/documentos/novo', methods=['POST'])
 def ui_upload_documento(id_processo):
+    """
+    Recebe o upload, salva o arquivo e enfileira a ingestão em background.
+    Responde na hora com um card de progresso que faz polling em
+    ui_status_ingestao até o job terminar.
+    """
     try:
         tenant_id = getattr(g, 'tenant_id', None)
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=tenant_id
-        )
+        pipeline = get_pipeline(id_processo, tenant_id=tenant_id)
 
         f = request.files.get('file')
         if not f or f.filename == '':
             return "<div class='alert alert-danger mt-2'>Arquivo não enviado.</div>"
 
         filename = secure_filename(f.filename)
-        content = f.read()
         ext = os.path.splitext(filename)[1].lower()
 
-        # 1) Salvar SEMPRE uma cópia para PREVIEW em /uploads
-        try:
-            uploads_dir = pipeline.case_dir / 'uploads'
-            uploads_dir.mkdir(parents=True, exist_ok=True)
-            with open(uploads_dir / filename, 'wb') as out_f:
-                out_f.write(content)
-        except Exception as fs_e:
-            logger.warning(f"Falha ao salvar arquivo para preview: {fs_e}")
-
-        # 2) Descobrir id_cliente a partir do processo (para gravar na tabela documentos)
-        proc = service.get_processo(id_processo) or {}
-        id_cliente = proc.get("id_cliente")
-
-        # 3) Usuário autenticado → criado_por_id (se existir)
-        criado_por_id = getattr(current_user, "id", None)
-
-        # 4) Tipos suportados que entram na TABELA documentos
+        # Tipos suportados que entram na TABELA documentos
         SUPORTADOS_DOCUMENTOS = [
             ".pdf", ".txt",
             ".jpg", ".jpeg", ".png",
             ".mp3", ".wav",
             ".mp4", ".mov",
         ]
-
-        resultado = None
-        added_type = None
-
-        if ext in SUPORTADOS_DOCUMENTOS:
-            # Delega ingestão + criação do registro em `documentos`
-            resultado = pipeline.processar_upload_de_arquivo(
-                id_processo=id_processo,
-                nome_arquivo=filename,
-                conteudo_arquivo_bytes=content,
-                id_cliente=id_cliente,
-                criado_por_id=criado_por_id,
-                storage_backend="local",   # usa pasta /cases/<tenant>/<id>/uploads
-            )
-
-            # só para log / mensagem amigável
-            added_type = {
-                ".pdf": "pdf",
-                ".txt": "text",
-                ".jpg": "image",
-                ".jpeg": "image",
-                ".png": "image",
-                ".mp3": "audio",
-                ".wav": "audio",
-                ".mp4": "video",
-                ".mov": "video",
-            }.get(ext, "file")
-
-            if resultado.get("status") == "erro":
-                return (
-                    f"<div class='alert alert-danger mt-2'>Erro ao processar arquivo: "
-                    f"{resultado.get('mensagem')}</div>"
-                )
-
-        else:
+        if ext not in SUPORTADOS_DOCUMENTOS:
             # Qualquer outra extensão → ainda não suportada
             return (
                 f"<div class='alert alert-warning mt-2'>Tipo de arquivo não suportado: {ext}</div>"
             )
 
-        # 5) Recarregar lista de documentos do caso (já traz texto/pdf/imagem/áudio/vídeo)
-        documentos = pipeline.list_unique_case_documents()
-        lista_html = render_template("_lista_documentos.html", documentos=documentos)
+        # 1) Salvar SEMPRE uma cópia em /uploads (preview + origem do job de ingestão)
+        uploads_dir = pipeline.case_dir / 'uploads'
+        uploads_dir.mkdir(parents=True, exist_ok=True)
+        upload_path = uploads_dir / filename
+        f.save(str(upload_path))
 
-        base_msg = (
-            resultado.get("mensagem")
-            if resultado
-            else f"Arquivo '{filename}' ({added_type}) processado com sucesso."
-        )
+        # 2) Descobrir id_cliente a partir do processo (para gravar na tabela documentos)
+        proc = service.get_processo(id_processo) or {}
+        id_cliente = proc.get("id_cliente")
 
-        msg = (
-            f"<div class='alert alert-success mb-2 p-2'>"
-            f"{base_msg}</div>"
-        )
+        # 3) Usuário autenticado → criado_por_id (se existir)
+        criado_por_id = getattr(current_user, "id", None)
 
-        response_html = msg + lista_html
-        response_headers = {"HX-Trigger": "fecharUploadModal"}
+        # 4) Ingestão (extração/OCR, NER, embeddings) fora do request
+        job_id = get_job_queue().submit(
+            tenant_id=tenant_id,
+            case_id=id_processo,
+            filename=filename,
+            file_path=upload_path,
+            id_cliente=id_cliente,
+            criado_por_id=criado_por_id,
+        )
 
         try:
             logger.info(
@@ -1322,19 +1002,59 @@ def ui_upload_documento(id_processo):
                     "case_id": id_processo,
                     "case_code": _short_case_code(id_processo),
                     "filename": filename,
-                    "type": added_type,
+                    "job_id": job_id,
                 },
             )
         except Exception:
             pass
 
-        return response_html, 200, response_headers
+        job = get_job_queue().get(job_id)
+        documentos = pipeline.list_unique_case_documents()
+        response_html = (
+            render_template("_job_status.html", job=job, id_processo=id_processo)
+            + render_template("_lista_documentos.html", documentos=documentos)
+        )
+        response_headers = {"HX-Trigger": "fecharUploadModal"}
+        return response_html, 202, response_headers
 
     except Exception as e:
         logger.exception("Erro no upload de documento")
         return f"<div class='alert alert-danger mt-2'>Erro no upload: {e}</div>", 500
 
 
+@processos_bp.route('/ui/<id_processo>/documentos/jobs/<job_id>', methods=['GET'])
+def ui_status_ingestao(id_processo, job_id):
+    """
+    Status de um job de ingestão (polling HTMX). Enquanto roda, devolve só o
+    card de progresso; ao terminar, redireciona o swap para #lista-documentos
+    com a mensagem final e a lista atualizada. `?format=json` devolve o job.
+    """
+    tenant_id = getattr(g, 'tenant_id', None)
+    job = get_job_queue().get(job_id)
+    if not job or job.get('case_id') != id_processo or job.get('tenant_id') != tenant_id:
+        return "<div class='alert alert-warning mt-2'>Job de ingestão não encontrado.</div>", 404
+
+    if request.args.get('format') == 'json':
+        return jsonify(job)
+
+    if job['status'] not in TERMINAL_STATUSES:
+        return render_template("_job_status.html", job=job, id_processo=id_processo)
+
+    pipeline = get_pipeline(id_processo, tenant_id=tenant_id)
+    documentos = pipeline.list_unique_case_documents()
+    if job['status'] == 'done':
+        base_msg = job.get('message') or f"Arquivo '{job['filename']}' processado com sucesso."
+        msg = f"<div class='alert alert-success mb-2 p-2'>{base_msg}</div>"
+    else:
+        msg = (
+            f"<div class='alert alert-danger mb-2 p-2'>Erro ao processar arquivo: "
+            f"{job.get('message')}</div>"
+        )
+    lista_html = render_template("_lista_documentos.html", documentos=documentos)
+    headers = {"HX-Retarget": "#lista-documentos", "HX-Reswap": "innerHTML"}
+    return msg + lista_html, 200, headers
+
+
 from pathlib import Path
 import html
 
@@ -1353,25 +1073,7 @@ def ui_preview_documento(id_processo, filename):
     """
     try:
         tenant_id = getattr(g, 'tenant_id', None) or "default"
-        from pathlib import Path
-        import openai
-        from ingestion_module import IngestionHandler
-        base_cases_dir = Path("./cases")
-        openai_client = openai.OpenAI()
-        ingestion_handler = IngestionHandler(
-            nlp_processor=None,
-            text_splitter=None,
-            label_map=None,
-            case_store=None,
-            kb_store=None
-        )
-        pipeline = Pipeline(
-            case_id=id_processo,
-            ingestion_handler=ingestion_handler,
-            openai_client=openai_client,
-            base_cases_dir=base_cases_dir,
-            tenant_id=tenant_id
-        )
+        pipeline = get_pipeline(id_processo, tenant_id=tenant_id)
 
         uploads_dir = pipeline.case_dir / 'uploads'
         target = uploads_dir / filename
@@ -1496,7 +1198,7 @@ def ui_delete_documento(id_processo, filename):
         if not proc_id_db.startswith("caso_"):
             proc_id_db = f"caso_{proc_id_db}"
 
-        pipeline = Pipeline(case_id=id_processo, tenant_id=tenant_id)
+        pipeline = get_pipeline(id_processo, tenant_id=tenant_id)
 
         # 1) Apagar do filesystem / vetor
         ok_fs = pipeline.delete_document_by_filename(filename)
@@ -1522,20 +1224,35 @@ def ui_delete_documento(id_processo, filename):
         return f"<div class='alert alert-danger mt-2'>Erro ao deletar: {e}</div>", 500
 
 # ----------------- Chat do Caso -----------------
+def _chat_conversation_id(id_processo):
+    """
+    Id da conversa desta sessão sobre o processo. A memória resumida do chat
+    (chat_memory) é por conversa: o histórico que ela resume é o da sessão.
+    """
+    key = f'chat_conversation_{id_processo}'
+    conversation_id = session.get(key)
+    if not conversation_id:
+        conversation_id = uuid.uuid4().hex
+        session[key] = conversation_id
+    return conversation_id
+
 @processos_bp.route('/ui/<id_processo>/chat', methods=['POST'])
 def ui_chat(id_processo):
     """Processa uma pergunta do usuário sobre o caso via formulário HTMX.
     Evita 415 Unsupported Media Type aceitando form-urlencoded ou multipart.
     """
     try:
-        pipeline = Pipeline(case_id=id_processo, tenant_id=getattr(g, 'tenant_id', None))
+        pipeline = get_pipeline(id_processo)
 
         query = (request.form.get('query') or '').strip()
         scope = (request.form.get('scope') or 'case').lower()
         if not query:
             return "<div class='alert alert-warning p-2 m-2'>Pergunta vazia.</div>"
         history = session.get(f'chat_history_{id_processo}', [])
-        response = pipeline.chat(query, history, search_scope=scope)
+        response = pipeline.chat(
+            query, history, search_scope=scope, use_cache=not request.form.get('no_cache'),
+            conversation_id=_chat_conversation_id(id_processo),
+        )
         answer = response.get('output', response.get('output_text')) or response.get('final_answer')
         if not answer:
             answer = response.get('answer') or str(response)
@@ -1550,12 +1267,93 @@ def ui_chat(id_processo):
     except Exception as e:
         return f"<div class='alert alert-danger p-2 m-2'>Erro no chat: {e}</div>", 500
 
+@processos_bp.route('/ui/<id_processo>/chat/stream', methods=['POST'])
+def ui_chat_stream(id_processo):
+    """Versão em streaming do chat (HTMX + extensão SSE).
+
+    Registra a pergunta na sessão e devolve o histórico com uma bolha de
+    resposta conectada a ui_chat_stream_events, que recebe os tokens.
+    """
+    query = (request.form.get('query') or '').strip()
+    scope = (request.form.get('scope') or 'case').lower()
+    if not query:
+        return "<div class='alert alert-warning p-2 m-2'>Pergunta vazia.</div>"
+    history = session.get(f'chat_history_{id_processo}', [])
+    history.append({'role': 'user', 'content': query})
+    session[f'chat_history_{id_processo}'] = history
+    stream_id = uuid.uuid4().hex
+    session[f'chat_stream_{id_processo}'] = {
+        'id': stream_id, 'query': query, 'scope': scope, 'no_cache': bool(request.form.get('no_cache')),
+        'conversation_id': _chat_conversation_id(id_processo),
+    }
+    stream = {'url': url_for('processos.ui_chat_stream_events', id_processo=id_processo, stream_id=stream_id)}
+    return render_template('_conversa_chat.html', chat_history=history, stream=stream)
+
+@processos_bp.route('/ui/<id_processo>/chat/stream/<stream_id>', methods=['GET'])
+def ui_chat_stream_events(id_processo, stream_id):
+    """Eventos SSE: `token` (fragmento HTML a anexar) e `done` (fecha a conexão).
+
+    O cookie de sessão não pode ser alterado no meio do stream; o fragmento
+    de `done` dispara ui_chat_stream_commit para gravar a resposta na sessão.
+    """
+    pending = session.get(f'chat_stream_{id_processo}') or {}
+    if pending.get('id') != stream_id:
+        return sse_response(iter([sse_event('done', "<small class='text-muted'>Conversa expirada.</small>")]))
+    # A pergunta atual já está no fim do histórico da sessão
+    history = session.get(f'chat_history_{id_processo}', [])[:-1]
+    pipeline = get_pipeline(id_processo)
+    tenant_id = getattr(g, 'tenant_id', None)
+
+    def _events():
+        for kind, payload in pipeline.chat_stream(
+                pending['query'], history, search_scope=pending.get('scope', 'case'),
+                use_cache=not pending.get('no_cache'), conversation_id=pending.get('conversation_id')):
+            if kind == 'token':
+                yield sse_event('token', html.escape(payload).replace('\n', '<br>'))
+            elif kind == 'done':
+                answer = payload['output']
+                try:
+                    CadastroManager(tenant_id=tenant_id).save_chat_exchange(
+                        id_processo, [('user', pending['query']), ('assistant', answer)]
+                    )
+                except Exception:
+                    logger.exception('Erro ao persistir turno do chat (stream)')
+                commit_url = url_for('processos.ui_chat_stream_commit', id_processo=id_processo, stream_id=stream_id)
+                vals = html.escape(json.dumps({'answer': answer}, ensure_ascii=False), quote=True)
+                ttft = f"{payload['ttft_s']:.1f}s" if payload.get('ttft_s') is not None else '-'
+                yield sse_event('done', (
+                    f"<span hx-post='{commit_url}' hx-trigger='load' hx-swap='none' hx-vals='{vals}'></span>"
+                    f"<small class='text-muted'>1º token em {ttft} · total {payload['total_s']:.1f}s</small>"
+                ))
+            else:
+                yield sse_event('done', f"<div class='alert alert-danger p-2 m-2'>Erro no chat: {html.escape(str(payload))}</div>")
+
+    return sse_response(_events())
+
+@processos_bp.route('/ui/<id_processo>/chat/stream/<stream_id>/commit', methods=['POST'])
+def ui_chat_stream_commit(id_processo, stream_id):
+    """Grava na sessão a resposta que acabou de ser transmitida."""
+    pending = session.pop(f'chat_stream_{id_processo}', None) or {}
+    if pending.get('id') == stream_id:
+        history = session.get(f'chat_history_{id_processo}', [])
+        history.append({'role': 'assistant', 'content': request.form.get('answer', '')})
+        session[f'chat_history_{id_processo}'] = history
+    return '', 204
+
 @processos_bp.route('/ui/<id_processo>/chat/clear', methods=['POST'])
 def ui_chat_clear(id_processo):
     """Limpa o histórico do chat para o processo."""
     try:
         # Clear the session history
         session.pop(f'chat_history_{id_processo}', None)
+        session.pop(f'chat_stream_{id_processo}', None)
+        # Só a memória resumida desta conversa; as de outras sessões continuam
+        conversation_id = session.pop(f'chat_conversation_{id_processo}', None)
+        if conversation_id:
+            try:
+                CadastroManager(tenant_id=getattr(g, 'tenant_id', None)).clear_chat_memory(id_processo, conversation_id)
+            except Exception:
+                logger.exception('Erro ao limpar memória do chat')
         logger.info('chat_cleared', extra={'case_id': id_processo, 'case_code': _short_case_code(id_processo)})
         # Return empty chat container
         return render_template('_conversa_chat.html', chat_history=[])
@@ -1,5 +1,10 @@
+import sys
+
 from flask import Blueprint, jsonify
 from .middleware import REQUEST_METRICS
+from .services.pipeline_registry import registry as pipeline_registry
+from cadastro_manager import chat_history_cache_stats, pool_stats
+from extraction_cache import get_extraction_cache
 
 metrics_bp = Blueprint('metrics', __name__)
 
@@ -12,6 +17,26 @@ def metrics():
                 'count': data['count'],
                 'avg_time': (data['accumulated_time']/data['count']) if data['count'] else 0
             } for path, data in REQUEST_METRICS['by_path'].items()
-        }
+        },
+        'pipelines': pipeline_registry.snapshot(),
+        'db_pool': pool_stats(),
+        'chat_history_cache': chat_history_cache_stats(),
+        'extraction_cache': get_extraction_cache().snapshot(),
     }
+    # Só reporta o cache de embeddings se o módulo já foi carregado (evita importar LangChain)
+    embedding_cache = sys.modules.get('embedding_cache')
+    if embedding_cache is not None:
+        output['embedding_cache'] = embedding_cache.embedding_cache_stats()
+    semantic_cache = sys.modules.get('semantic_cache')
+    if semantic_cache is not None:
+        output['semantic_cache'] = semantic_cache.semantic_cache_stats()
+    step_graph = sys.modules.get('step_graph')
+    if step_graph is not None:
+        output['llm_steps'] = step_graph.step_stats()
+    ementas_index = sys.modules.get('app.services.ementas_index_service')
+    if ementas_index is not None:
+        output['ementas_index'] = ementas_index.index_service_stats()
+    hybrid_retriever = sys.modules.get('hybrid_retriever')
+    if hybrid_retriever is not None:
+        output['lexical_index'] = hybrid_retriever.lexical_stats()
     return jsonify(output)
@@ -1,58 +1,60 @@
 # app/services/ementas_client.py
+import uuid
+from contextlib import contextmanager
 from pathlib import Path
-from typing import List, Dict, Any, Iterable, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+
+from app.services.ementas_index_service import get_index_service, to_id_map
+from ementas_index import doc_key, read_index
 
 class EmentasSearchClient:
     """
-    Tiny client: carrega um SentenceTransformer, um índice FAISS e
-    mantém um mapeamento id->metadata. Guarda tudo em disco.
+    Tiny client sobre o EmentasIndexService: encoder compartilhado do
+    processo e versões em <store_path>/versions/. O layout antigo
+    (index_path + store_path/meta.npy) é migrado na primeira carga.
+
+    Cada lote de `index_texts` é só acrescentado ao WAL (vetores +
+    metadados); checkpoints periódicos (compactação) publicam a versão
+    consolidada. Em `bulk_ingest()` os lotes não fazem fsync nem disparam
+    checkpoint: um único checkpoint é feito ao final.
     """
     def __init__(self,
                  model_name: str,
                  index_path: Path,
                  store_path: Path,
                  normalize: bool = True):
-        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
         self.index_path = Path(index_path)
         self.store_path = Path(store_path)
         self.normalize = normalize
+        self._bulk = False
 
-        self.meta: Dict[int, Dict[str, Any]] = {}
-        self.index = self._load_or_init()
-
-    def _load_or_init(self) -> faiss.Index:
         self.store_path.mkdir(parents=True, exist_ok=True)
-        meta_fp = self.store_path / "meta.npy"
+        self.service = get_index_service(self.store_path, model_name=model_name, legacy=self._legacy)
+        self.service.refresh(force=True)
 
-        if self.index_path.exists():
-            index = faiss.read_index(str(self.index_path))
-            if meta_fp.exists():
-                # dtype=object para dicionários
-                self.meta = {int(k): v.item() for k, v in np.load(meta_fp, allow_pickle=True)}
-            return index
-        else:
-            # Começa vazio (usar índice flat L2; troque p/ IVFFlat/HNSW depois)
-            dim = self.model.get_sentence_embedding_dimension()
-            index = faiss.IndexFlatIP(dim)
-            self._persist(index)
-            return index
+    @property
+    def model(self):
+        return self.service.encoder
 
-    def _persist(self, index: faiss.Index | None = None):
-        target_index = index or self.index
-        faiss.write_index(target_index, str(self.index_path))
-        # salva meta como pares (idx -> dict)
-        items = np.array(list(self.meta.items()), dtype=object)
-        np.save(self.store_path / "meta.npy", items, allow_pickle=True)
+    def _legacy(self):
+        meta_fp = self.store_path / "meta.npy"
+        if not self.index_path.exists():
+            return None
+        index = read_index(self.index_path, mmap=False)
+        meta: Dict[int, Dict[str, Any]] = {}
+        if meta_fp.exists():
+            # dtype=object para dicionários (pares (idx, dict) gravados por _persist)
+            meta = {int(k): (v.item() if hasattr(v, "item") else v) for k, v in np.load(meta_fp, allow_pickle=True)}
+        records = [meta.get(i, {}) for i in range(index.ntotal)]
+        # id estável = linha antiga (ids textuais podem se repetir nesta base)
+        keys = list(range(index.ntotal))
+        return to_id_map(index, keys), records, {"model": self.model_name}, keys
 
     def _embed(self, texts: Iterable[str]) -> np.ndarray:
-        vecs = self.model.encode(list(texts), convert_to_numpy=True, show_progress_bar=False)
-        if self.normalize:
-            faiss.normalize_L2(vecs)
-        return vecs
+        return self.service.encode(list(texts), normalize=self.normalize)
 
     def index_texts(self, docs: List[Dict[str, Any]]) -> int:
         """
@@ -62,25 +64,36 @@ class EmentasSearchClient:
         if not docs:
             return 0
         texts = [d["text"] for d in docs]
-        vecs = self._embed(texts)
+        # append-only: cada doc ganha um id novo (reenvios não substituem)
+        keys = [doc_key(uuid.uuid4().hex) for _ in docs]
+        return self.service.upsert(keys, self._embed(texts), docs, defer=self._bulk)
+
+    @contextmanager
+    def bulk_ingest(self) -> Iterator["EmentasSearchClient"]:
+        """Ingestão em massa: persistência adiada para um checkpoint no final."""
+        self._bulk = True
+        try:
+            yield self
+        finally:
+            self._bulk = False
+            self.checkpoint()
 
-        start_id = self.index.ntotal
-        self.index.add(vecs)
+    def checkpoint(self):
+        """Consolida o WAL numa versão nova (no-op se não há alterações)."""
+        return self.service.compact()
 
-        for i, d in enumerate(docs):
-            self.meta[start_id + i] = d
+    @staticmethod
+    def _item(hit: Dict[str, Any]) -> Dict[str, Any]:
+        item = dict(hit["meta"])
+        item["_score"] = hit["score"]
+        if "rrf_score" in hit:
+            item["_rrf_score"] = hit["rrf_score"]
+        return item
 
-        self._persist()
-        return len(docs)
+    def search(self, query: str, k: int = 10, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        return [self._item(hit) for hit in self.service.search(query, k=k, normalize=self.normalize, mode=mode)]
 
-    def search(self, query: str, k: int = 10) -> List[Dict[str, Any]]:
-        qv = self._embed([query])
-        scores, ids = self.index.search(qv, k)
-        out = []
-        for idx, score in zip(ids[0], scores[0]):
-            if idx == -1:
-                continue
-            item = dict(self.meta.get(int(idx), {}))
-            item["_score"] = float(score)
-            out.append(item)
-        return out
+    def search_many(self, queries: List[str], k: int = 10, dedup: bool = False,
+                    mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        per_query = self.service.search_many(queries, k=k, normalize=self.normalize, dedup=dedup, mode=mode)
+        return [[self._item(hit) for hit in hits] for hits in per_query]
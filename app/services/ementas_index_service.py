@@ -0,0 +1,733 @@
+# app/services/ementas_index_service.py
+"""
+Serviço único de busca nas bases de ementas.
+
+Substitui os carregadores separados (EmentasSearchClient, EmentasFAISSStore
+e o blueprint ementas_faiss): cada raiz é carregada uma vez por processo, o
+índice FAISS é aberto com IO_FLAG_MMAP_IFC (vetores mapeados do arquivo,
+páginas do page cache compartilhadas entre os workers; id_map e demais
+estruturas pequenas ficam na memória de cada processo) e o encoder vem de
+ementas_index.get_encoder.
+
+A versão em uso é um snapshot imutável (índice + metadados). A cada busca o
+ponteiro CURRENT é conferido (no máximo a cada EMENTAS_RELOAD_CHECK_S); se o
+script de indexação ou outro worker publicou versão nova, ela é carregada
+fora do lock e trocada atomicamente: buscas em andamento terminam no
+snapshot antigo.
+
+Bases com ids estáveis (IndexIDMap2) aceitam upsert/deleção sem regravar a
+versão: o lote vai para o WAL da versão e cada worker o reaplica num delta
+em memória (IndexIDMap2 flat pequeno + tombstones das linhas da versão que
+foram substituídas ou removidas). A busca combina versão e delta; quando o
+delta cresce, `compact` publica uma versão nova já consolidada.
+
+A busca pode ser densa (padrão), lexical (BM25, lexical_index) ou híbrida:
+o BM25 de cada versão é gravado em lexical.npz na publicação, recebe o mesmo
+WAL que o delta e as duas listas são fundidas por RRF. Versões publicadas
+sem lexical.npz ganham o arquivo numa thread de fundo; até lá a busca fica
+densa.
+"""
+from __future__ import annotations
+import os, time, logging, threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple, cast
+
+import numpy as np
+import faiss
+
+from app.services.ementas_meta_store import JsonlOffsetStore
+from ementas_index import (
+    DEFAULT_KEEP_VERSIONS, INDEX_FILE, META_FILE, OFFSETS_FILE, WAL_DELETE, WAL_UPSERT,
+    append_wal, build_version_lexical, current_version, get_encoder, lexical_path, lexical_text,
+    loaded_encoders, publish_version, read_ids, read_index, read_manifest, read_wal,
+    version_dir, wal_path,
+)
+from lexical_index import BM25Index, rrf_fuse
+from faiss_index_factory import (
+    describe, new_index_from_env, search_parameters, search_params_from_env, set_search_params,
+)
+
+fcntl: Optional[ModuleType]
+try:  # lock entre processos na publicação (indisponível no Windows)
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+RELOAD_CHECK_S = float(os.getenv("EMENTAS_RELOAD_CHECK_S", 2.0))
+KEEP_VERSIONS = int(os.getenv("EMENTAS_KEEP_VERSIONS", DEFAULT_KEEP_VERSIONS))
+# Compacta quando o delta (upserts + tombstones) passa de max(MIN, RATIO * ntotal)
+COMPACT_MIN_OPS = int(os.getenv("EMENTAS_COMPACT_MIN_OPS", 1000))
+COMPACT_RATIO = float(os.getenv("EMENTAS_COMPACT_RATIO", 0.1))
+WAL_FSYNC = os.getenv("EMENTAS_WAL_FSYNC", "1") == "1"
+# Busca: "dense", "lexical" ou "hybrid" (vetores + BM25 fundidos por RRF)
+SEARCH_MODES = ("dense", "lexical", "hybrid")
+SEARCH_MODE = os.getenv("EMENTAS_SEARCH_MODE", "dense").lower()
+# Candidatos de cada lista antes da fusão no modo híbrido
+HYBRID_FETCH_K = int(os.getenv("EMENTAS_HYBRID_FETCH_K", 50))
+# Índices sem suporte a seletor na busca: máximo de linhas extras buscadas
+# para compensar os tombstones (o resto do top-k pode vir incompleto)
+TOMBSTONE_OVERFETCH_MAX = int(os.getenv("EMENTAS_TOMBSTONE_OVERFETCH_MAX", 1000))
+
+# Migração de bases antigas: devolve (índice, registros, manifest, ids|None) ou None
+LegacyLoader = Callable[[], Optional[Tuple[faiss.Index, Sequence[Dict[str, Any]], Dict[str, Any], Optional[Sequence[int]]]]]
+
+# (score, chave, linha na versão | None, metadados do delta | None)
+_Hit = Tuple[float, int, Optional[int], Optional[Dict[str, Any]]]
+
+
+@dataclass
+class _Delta:
+    """Alterações do WAL ainda não compactadas na versão."""
+    index: faiss.Index
+    records: Dict[int, Dict[str, Any]] = field(default_factory=dict)
+    tombstones: Set[int] = field(default_factory=set)
+    offset: int = 0
+    # SearchParameters que excluem os tombstones (refeitos quando eles mudam;
+    # guarda também os seletores, que o FAISS só referencia)
+    exclude: Optional[Tuple[int, faiss.SearchParameters, Any]] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.records) + len(self.tombstones)
+
+
+@dataclass
+class IndexSnapshot:
+    version: str
+    index: faiss.Index
+    meta: JsonlOffsetStore
+    manifest: Dict[str, Any] = field(default_factory=dict)
+    # id estável -> linha (None em bases posicionais, onde o rótulo do FAISS é a linha)
+    rows: Optional[Dict[int, int]] = None
+    delta: Optional[_Delta] = None
+    # BM25 da versão + delta (lexical.npz carregado na primeira busca lexical/híbrida)
+    lexical: Optional[BM25Index] = None
+    # False se o tipo de índice rejeitou o seletor de tombstones na busca
+    selector_search: bool = True
+    lock: threading.RLock = field(default_factory=threading.RLock)
+    loaded_at: float = field(default_factory=time.time)
+
+    @property
+    def higher_is_better(self) -> bool:
+        return self.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+    @property
+    def ntotal(self) -> int:
+        live = int(self.index.ntotal)
+        if self.delta is not None:
+            live += len(self.delta.records) - len(self.delta.tombstones)
+        return live
+
+
+class EmentasIndexService:
+    def __init__(
+        self,
+        root: Path,
+        model_name: Optional[str] = None,
+        legacy: Optional[LegacyLoader] = None,
+        check_interval_s: float = RELOAD_CHECK_S,
+    ):
+        self.root = Path(root)
+        self.model_name = model_name
+        self.check_interval_s = check_interval_s
+        self._legacy = legacy
+        self._snap: Optional[IndexSnapshot] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._publish_mutex = threading.Lock()
+        self._lexical_lock = threading.Lock()
+        self._lexical_builds: Dict[str, threading.Thread] = {}
+        self.reloads = 0
+        self.compactions = 0
+
+    # ---------- versões ----------
+    def _load(self, version: str) -> IndexSnapshot:
+        vdir = version_dir(self.root, version)
+        t0 = time.perf_counter()
+        index = read_index(vdir / INDEX_FILE, mmap=True)
+        # nprobe/efSearch do índice (gravados pelo script), salvo override no ambiente
+        set_search_params(index, **search_params_from_env())
+        meta = JsonlOffsetStore(str(vdir / META_FILE), str(vdir / OFFSETS_FILE))
+        snap = IndexSnapshot(version, index, meta, read_manifest(self.root, version))
+        ids = read_ids(self.root, version)
+        if ids is not None:
+            snap.rows = {int(i): row for row, i in enumerate(ids.tolist())}
+            delta_index = faiss.IndexIDMap2(faiss.IndexFlat(index.d, index.metric_type))
+            snap.delta = _Delta(delta_index)
+            self._replay(snap)
+        logger.info(
+            f"[EMENTAS] {self.root} versão {version} carregada em "
+            f"{(time.perf_counter() - t0) * 1000:.0f}ms ({snap.ntotal} vetores)"
+        )
+        return snap
+
+    def _publish_legacy(self) -> Optional[str]:
+        if self._legacy is None:
+            return None
+        loaded = self._legacy()
+        if loaded is None:
+            return None
+        index, records, manifest, ids = loaded
+        logger.info(f"[EMENTAS] migrando base antiga em {self.root} para o layout versionado")
+        return publish_version(self.root, index, records, manifest, keep=KEEP_VERSIONS, ids=ids)
+
+    def _migrate_legacy(self) -> Optional[str]:
+        """Publica a base antiga (arquivos soltos na raiz) como primeira versão."""
+        if self._legacy is None:
+            return None
+        with self._publish_lock():
+            # outro worker pode ter migrado enquanto esperávamos o lock
+            return current_version(self.root) or self._publish_legacy()
+
+    def refresh(self, force: bool = False) -> Optional[IndexSnapshot]:
+        """Confere CURRENT e o WAL; troca de snapshot se outra versão foi publicada."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.check_interval_s:
+            return self._snap
+        self._checked_at = now
+        version = current_version(self.root) or self._migrate_legacy()
+        snap = self._snap
+        if version is None:
+            return snap
+        if snap is not None and snap.version == version:
+            self._replay(snap)
+            return snap
+        new_snap = self._load(version)
+        with self._lock:
+            if self._snap is None or self._snap.version != version:
+                self._snap = new_snap
+                self.reloads += 1
+            return self._snap
+
+    def snapshot(self) -> Optional[IndexSnapshot]:
+        return self.refresh()
+
+    # ---------- WAL / delta ----------
+    def _replay(self, snap: IndexSnapshot) -> None:
+        """Aplica ao delta os lotes do WAL gravados depois do último lido."""
+        delta = snap.delta
+        if delta is None:
+            return
+        path = wal_path(self.root, snap.version)
+        try:
+            if path.stat().st_size <= delta.offset:
+                return
+        except FileNotFoundError:
+            return
+        with snap.lock:
+            entries, delta.offset = read_wal(path, delta.offset)
+            for entry in entries:
+                self._apply(snap, entry.op, entry.ids, entry.vectors, entry.records)
+
+    @staticmethod
+    def _apply(snap: IndexSnapshot, op: int, ids: np.ndarray, vectors: Optional[np.ndarray], records: List[Dict[str, Any]]) -> None:
+        delta, rows = snap.delta, snap.rows
+        # só versões com ids estáveis têm WAL (e então delta e rows existem)
+        assert delta is not None and rows is not None
+        keys = [int(i) for i in ids]
+        present = np.asarray([k for k in keys if k in delta.records], dtype="int64")
+        if len(present):
+            delta.index.remove_ids(_id_selector(present))
+        for k in keys:
+            delta.records.pop(k, None)
+            # a linha da versão deixa de valer (substituída ou removida)
+            if k in rows:
+                delta.tombstones.add(k)
+        if op == WAL_UPSERT:
+            delta.index.add_with_ids(np.ascontiguousarray(vectors, dtype="float32"), np.asarray(keys, dtype="int64"))
+            delta.records.update(zip(keys, records))
+        if snap.lexical is not None:
+            if op == WAL_UPSERT:
+                snap.lexical.add(keys, [lexical_text(r) for r in records])
+            else:
+                snap.lexical.remove(keys)
+
+    def _writable_snapshot(self, dim: int) -> IndexSnapshot:
+        """Snapshot atual com delta (cria a versão vazia com IndexIDMap2 se preciso). Exige o lock."""
+        version = current_version(self.root) or self._publish_legacy()
+        if version is None:
+            empty = faiss.IndexIDMap2(new_index_from_env(dim))
+            publish_version(self.root, empty, [], {"model": self.model_name, "index": describe(empty)}, keep=KEEP_VERSIONS, ids=[])
+        snap = self.refresh(force=True)
+        assert snap is not None, "versão recém-publicada não carregou"
+        if snap.delta is None:
+            # versão posicional (script/append): converte uma vez, id = linha
+            logger.info(f"[EMENTAS] {self.root}: convertendo versão {snap.version} para ids estáveis")
+            keys = list(range(int(snap.index.ntotal)))
+            info = dict(snap.manifest)
+            index = to_id_map(read_index(version_dir(self.root, snap.version) / INDEX_FILE, mmap=False), keys)
+            info["index"] = describe(index)
+            records = (m or {} for m in snap.meta.get_many(keys))
+            publish_version(self.root, index, records, info, keep=KEEP_VERSIONS, ids=keys)
+            snap = self.refresh(force=True)
+            assert snap is not None, "versão convertida não carregou"
+        return snap
+
+    def _write(
+        self,
+        op: int,
+        ids: Sequence[int],
+        vectors: Optional[np.ndarray],
+        records: Sequence[Dict[str, Any]],
+        dim: int,
+        fsync: bool = True,
+    ) -> Tuple[IndexSnapshot, int]:
+        """
+        Acrescenta o lote ao WAL sob o lock de publicação, sobre o snapshot
+        relido do disco; retorna (snapshot, nº de ids gravados). Deleções só
+        gravam os ids que existem nesse snapshot (não num possivelmente
+        desatualizado do próprio worker).
+        """
+        with self._publish_lock():
+            snap = self._writable_snapshot(dim)
+            if op == WAL_DELETE:
+                ids = self._existing(snap, ids)
+                if not ids:
+                    return snap, 0
+            assert snap.delta is not None  # _writable_snapshot garante ids estáveis
+            path = wal_path(self.root, snap.version)
+            append_wal(path, op, ids, vectors, records, valid_size=snap.delta.offset, fsync=fsync and WAL_FSYNC)
+            self._replay(snap)
+        return snap, len(ids)
+
+    @staticmethod
+    def _existing(snap: IndexSnapshot, ids: Sequence[int]) -> List[int]:
+        """Ids vivos no snapshot (no delta, ou na versão sem tombstone)."""
+        delta, rows = snap.delta, snap.rows
+        if delta is None or rows is None:
+            return []
+        with snap.lock:
+            return [i for i in ids if i in delta.records or (i in rows and i not in delta.tombstones)]
+
+    def upsert(self, ids: Sequence[int], vectors: np.ndarray, records: Sequence[Dict[str, Any]], defer: bool = False) -> int:
+        """
+        Insere ou substitui pelos ids estáveis (só append no WAL; compacta se
+        o delta cresceu). `defer=True` é a ingestão em massa: sem fsync nem
+        compactação por lote; chame `compact()` (checkpoint) ao terminar.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if not (len(ids) == len(vectors) == len(records)):
+            raise ValueError("ids, vectors e records com tamanhos diferentes")
+        if not len(ids):
+            return 0
+        snap, written = self._write(WAL_UPSERT, ids, vectors, records, vectors.shape[1], fsync=not defer)
+        if not defer:
+            self._maybe_compact(snap)
+        return written
+
+    def delete(self, ids: Sequence[int]) -> int:
+        """Remove pelos ids estáveis; retorna quantos existiam."""
+        if not len(ids):
+            return 0
+        snap = self.refresh(force=True)
+        if snap is None:
+            return 0
+        # a existência é conferida dentro do _write, sob o lock e com o WAL relido
+        snap, removed = self._write(WAL_DELETE, ids, None, [], snap.index.d)
+        if removed:
+            self._maybe_compact(snap)
+        return removed
+
+    def _maybe_compact(self, snap: IndexSnapshot) -> None:
+        if snap.delta is None:
+            return
+        if snap.delta.size >= max(COMPACT_MIN_OPS, COMPACT_RATIO * snap.index.ntotal):
+            try:
+                self.compact()
+            except Exception:
+                # o WAL continua válido; a próxima escrita tenta de novo
+                logger.exception(f"[EMENTAS] falha ao compactar {self.root}")
+
+    def compact(self) -> Optional[str]:
+        """Consolida versão + delta numa versão nova (o WAL recomeça vazio)."""
+        with self._publish_lock():
+            snap = self.refresh(force=True)
+            if snap is None or snap.delta is None or snap.rows is None or not snap.delta.size:
+                return None
+            t0 = time.perf_counter()
+            with snap.lock:
+                delta = snap.delta
+                dead = np.asarray(sorted(delta.tombstones), dtype="int64")
+                new_keys = np.asarray(list(delta.records), dtype="int64")
+                new_vecs = np.vstack([delta.index.reconstruct(int(k)) for k in new_keys]) if len(new_keys) else None
+                new_records = [delta.records[int(k)] for k in new_keys]
+
+            index = read_index(version_dir(self.root, snap.version) / INDEX_FILE, mmap=False)
+            if len(dead):
+                index = _remove_ids(index, dead)
+            if new_vecs is not None:
+                index.add_with_ids(new_vecs, new_keys)
+
+            dead_set = set(dead.tolist())
+            kept = [(k, row) for k, row in snap.rows.items() if k not in dead_set]
+            ids = [k for k, _ in kept] + new_keys.tolist()
+
+            def _records():
+                for start in range(0, len(kept), 1024):
+                    chunk = kept[start:start + 1024]
+                    for meta in snap.meta.get_many(row for _, row in chunk):
+                        yield meta or {}
+                yield from new_records
+
+            info = dict(snap.manifest)
+            info["index"] = describe(index)
+            # o BM25 em memória (se carregado) já é versão + delta: vira o da versão nova
+            version = publish_version(
+                self.root, index, _records(), info, keep=KEEP_VERSIONS, ids=ids,
+                lexical=snap.lexical, lexical_lock=snap.lock,
+            )
+            self.compactions += 1
+            logger.info(
+                f"[EMENTAS] {self.root} compactado em {time.perf_counter() - t0:.1f}s "
+                f"(+{len(new_keys)} / -{len(dead)}) -> {version}"
+            )
+        self.refresh(force=True)
+        return version
+
+    # ---------- encoder ----------
+    @property
+    def encoder(self):
+        snap = self._snap
+        model = (snap.manifest.get("model") if snap is not None else None) or self.model_name
+        return get_encoder(model)
+
+    def encode(self, texts: Sequence[str], normalize: bool = True) -> np.ndarray:
+        vecs = self.encoder.encode(list(texts), convert_to_numpy=True, show_progress_bar=False)
+        vecs = np.ascontiguousarray(vecs, dtype="float32")
+        if normalize:
+            faiss.normalize_L2(vecs)
+        return vecs
+
+    # ---------- índice lexical (BM25) ----------
+    def lexical(self, snap: IndexSnapshot, wait: bool = False) -> Optional[BM25Index]:
+        """
+        BM25 do snapshot (versão + delta), carregado do lexical.npz. Versões
+        sem o arquivo (publicadas antes dele) o ganham numa thread de fundo
+        e, até lá, devolve None; `wait=True` espera a construção.
+        """
+        if snap.lexical is not None:
+            return snap.lexical
+        with self._lexical_lock:
+            if snap.lexical is not None:
+                return snap.lexical
+            path = lexical_path(self.root, snap.version)
+            build = self._lexical_builds.get(snap.version)
+            if build is None and path.exists():
+                try:
+                    self._attach_lexical(snap, BM25Index.load(path))
+                    return snap.lexical
+                except Exception as e:
+                    logger.warning(f"[EMENTAS] {path} ilegível ({e}); reconstruindo")
+            if build is None:
+                build = threading.Thread(
+                    target=self._build_lexical, args=(snap,), daemon=True,
+                    name=f"ementas-bm25-{snap.version}",
+                )
+                self._lexical_builds[snap.version] = build
+                build.start()
+        if wait:
+            build.join()
+        return snap.lexical
+
+    def _build_lexical(self, snap: IndexSnapshot) -> None:
+        """Grava o lexical.npz da versão (um worker por vez; os outros reaproveitam o arquivo)."""
+        path = lexical_path(self.root, snap.version)
+        try:
+            with self._file_lock(".lexical.lock"):
+                index: Optional[BM25Index] = None
+                if path.exists():
+                    try:
+                        index = BM25Index.load(path)
+                    except Exception as e:
+                        logger.warning(f"[EMENTAS] {path} ilegível ({e}); reconstruindo")
+                if index is None:
+                    t0 = time.perf_counter()
+                    index = build_version_lexical(version_dir(self.root, snap.version))
+                    index.save(path)
+                    logger.info(
+                        f"[EMENTAS] {self.root} BM25 da versão {snap.version} construído em "
+                        f"{time.perf_counter() - t0:.1f}s ({len(index)} documentos)"
+                    )
+            with self._lexical_lock:
+                self._attach_lexical(snap, index)
+        except Exception:
+            # a busca segue densa; a próxima busca lexical/híbrida tenta de novo
+            logger.exception(f"[EMENTAS] falha ao construir o BM25 da versão {snap.version}")
+        finally:
+            with self._lexical_lock:
+                self._lexical_builds.pop(snap.version, None)
+
+    @staticmethod
+    def _attach_lexical(snap: IndexSnapshot, index: BM25Index) -> None:
+        with snap.lock:
+            # o delta do momento (o WAL aplicado antes de snap.lexical existir)
+            if snap.delta is not None:
+                index.remove(snap.delta.tombstones)
+                index.add(list(snap.delta.records), [lexical_text(r) for r in snap.delta.records.values()])
+            snap.lexical = index
+
+    # ---------- busca ----------
+    def search(self, query: str, k: int = 10, normalize: bool = True, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k como [{"rank", "key", "score", "meta"}]; key é o id estável (ou a linha)."""
+        return self.search_many([query], k=k, normalize=normalize, mode=mode)[0]
+
+    def search_many(self, queries: Sequence[str], k: int = 10, normalize: bool = True,
+                    dedup: bool = False, mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Busca em lote: um único encode e um único index.search sobre a matriz
+        de consultas. Retorna uma lista de hits (como `search`) por consulta,
+        na mesma ordem. dedup=True mantém cada documento só na consulta em que
+        teve o melhor score.
+
+        mode: "dense" (só vetores), "lexical" (só BM25) ou "hybrid" (as duas
+        listas, até HYBRID_FETCH_K cada, fundidas por RRF). No híbrido a ordem
+        é a do RRF: "score" continua sendo a similaridade densa (None se o
+        documento veio só do BM25) e "rrf_score" traz o score fundido.
+        Padrão: EMENTAS_SEARCH_MODE. Enquanto o BM25 da versão não está
+        pronto, lexical/híbrido caem para a busca densa.
+        """
+        mode = (mode or SEARCH_MODE).lower()
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"mode inválido: {mode} (use {', '.join(SEARCH_MODES)})")
+        queries = [q or "" for q in queries]
+        out: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        snap = self.snapshot()
+        live = [i for i, q in enumerate(queries) if q.strip()]
+        if snap is None or snap.ntotal <= 0 or not live:
+            return out
+        lexical_index = self.lexical(snap) if mode != "dense" else None
+        if mode != "dense" and lexical_index is None:
+            logger.debug(f"[EMENTAS] {self.root}: BM25 da versão {snap.version} em construção; busca densa")
+            mode = "dense"
+        fetch = max(k, HYBRID_FETCH_K) if mode == "hybrid" else k
+        texts = [queries[i] for i in live]
+
+        higher_is_better = snap.higher_is_better
+        dense_scores: Optional[List[Dict[int, float]]] = None
+        if mode != "lexical":
+            hits = self._dense_hits(snap, self.encode(texts, normalize=normalize), fetch)
+        if lexical_index is not None:
+            lexical = self._lexical_hits(snap, lexical_index, texts, fetch)
+            if mode == "lexical":
+                hits, higher_is_better = lexical, True
+            else:
+                dense_scores = [{h[1]: h[0] for h in qhits} for qhits in hits]
+                hits = [self._fuse(d, l) for d, l in zip(hits, lexical)]
+                higher_is_better = True
+        hits = [qhits[:k] for qhits in hits]
+
+        if dedup:
+            best: Dict[int, Tuple[float, int]] = {}
+            for qi, qhits in enumerate(hits):
+                for score, key, _, _ in qhits:
+                    cur = best.get(key)
+                    better = cur is None or (score > cur[0] if higher_is_better else score < cur[0])
+                    if better:
+                        best[key] = (score, qi)
+            hits = [[h for h in qhits if best[h[1]][1] == qi] for qi, qhits in enumerate(hits)]
+
+        # metadados lidos uma vez só para as linhas distintas do lote
+        rows = sorted({h[2] for qhits in hits for h in qhits if h[2] is not None})
+        metas = dict(zip(rows, snap.meta.get_many(rows)))
+        for n, (qi, qhits) in enumerate(zip(live, hits)):
+            for score, key, row, meta in qhits:
+                if row is not None:
+                    meta = metas.get(row)
+                if meta is None:
+                    continue
+                hit: Dict[str, Any] = {"rank": len(out[qi]) + 1, "key": key, "score": float(score), "meta": meta}
+                if dense_scores is not None:
+                    dense = dense_scores[n].get(key)
+                    hit["score"] = float(dense) if dense is not None else None
+                    hit["rrf_score"] = float(score)
+                out[qi].append(hit)
+        return out
+
+    @staticmethod
+    def _dense_hits(snap: IndexSnapshot, qv: np.ndarray, k: int) -> List[List[_Hit]]:
+        """Top-k por consulta (versão + delta, sem tombstones), ordenado pelo score do FAISS."""
+        hits: List[List[_Hit]] = [[] for _ in range(len(qv))]
+        tombstones: Set[int] = set()
+        params: Optional[faiss.SearchParameters] = None
+        if snap.delta is not None:
+            with snap.lock:
+                tombstones = set(snap.delta.tombstones)
+                if tombstones and snap.selector_search:
+                    params = _exclude_params(snap.index, snap.delta)
+                if snap.delta.index.ntotal:
+                    d_scores, d_keys = snap.delta.index.search(qv, min(k, snap.delta.index.ntotal))
+                    for qi in range(len(qv)):
+                        for key, score in zip(d_keys[qi].tolist(), d_scores[qi].tolist()):
+                            if key >= 0:
+                                hits[qi].append((score, key, None, snap.delta.records.get(key)))
+        if snap.index.ntotal:
+            found: Optional[Tuple[np.ndarray, np.ndarray]] = None
+            if params is not None:
+                # os tombstones ficam fora da busca (IDSelectorNot): top-k exato sem buscar a mais
+                try:
+                    found = snap.index.search(qv, min(int(snap.index.ntotal), k), params=params)
+                except RuntimeError:
+                    snap.selector_search = False
+                    logger.warning("[EMENTAS] índice sem suporte a seletor na busca; compensando tombstones com limite")
+            if found is None:
+                # busca um pouco além de k para compensar linhas marcadas como removidas
+                k_base = min(int(snap.index.ntotal), k + min(len(tombstones), TOMBSTONE_OVERFETCH_MAX))
+                found = snap.index.search(qv, k_base)
+            scores, labels = found
+            for qi in range(len(qv)):
+                for label, score in zip(labels[qi].tolist(), scores[qi].tolist()):
+                    if label < 0 or label in tombstones:
+                        continue
+                    row = snap.rows.get(label) if snap.rows is not None else label
+                    hits[qi].append((score, label, row, None))
+        for qhits in hits:
+            qhits.sort(key=lambda h: h[0], reverse=snap.higher_is_better)
+            del qhits[k:]
+        return hits
+
+    @staticmethod
+    def _lexical_hits(snap: IndexSnapshot, index: BM25Index, queries: Sequence[str], k: int) -> List[List[_Hit]]:
+        """Top-k BM25 por consulta, no mesmo formato de `_dense_hits`."""
+        hits: List[List[_Hit]] = []
+        with snap.lock:
+            records = snap.delta.records if snap.delta is not None else {}
+            for query in queries:
+                qhits: List[_Hit] = []
+                for hkey, score in index.search(query, k):
+                    key = cast(int, hkey)  # a BM25 das ementas usa os ids estáveis (int)
+                    if key in records:
+                        qhits.append((score, key, None, records[key]))
+                    else:
+                        qhits.append((score, key, snap.rows.get(key) if snap.rows is not None else key, None))
+                hits.append(qhits)
+        return hits
+
+    @staticmethod
+    def _fuse(dense: List[_Hit], lexical: List[_Hit]) -> List[_Hit]:
+        """RRF das duas listas; o hit carrega o score fundido."""
+        by_key = {h[1]: h for h in lexical}
+        by_key.update((h[1], h) for h in dense)
+        fused = rrf_fuse([[h[1] for h in dense], [h[1] for h in lexical]])
+        out: List[_Hit] = []
+        for hkey, score in fused:
+            _, key, row, meta = by_key[cast(int, hkey)]
+            out.append((score, key, row, meta))
+        return out
+
+    # ---------- escrita ----------
+    @contextmanager
+    def _publish_lock(self) -> Iterator[None]:
+        with self._publish_mutex, self._file_lock(".publish.lock"):
+            yield
+
+    @contextmanager
+    def _file_lock(self, name: str) -> Iterator[None]:
+        """flock exclusivo em <raiz>/<name> (entre processos; no-op sem fcntl)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(self.root / name, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self._snap
+        return {
+            "root": str(self.root),
+            "version": snap.version if snap else None,
+            "ntotal": snap.ntotal if snap else 0,
+            "delta": snap.delta.size if snap and snap.delta else 0,
+            "lexical": len(snap.lexical) if snap and snap.lexical is not None else None,
+            "search_mode": SEARCH_MODE,
+            "model": (snap.manifest.get("model") if snap else None) or self.model_name,
+            "reloads": self.reloads,
+            "compactions": self.compactions,
+        }
+
+
+def to_id_map(index: faiss.Index, keys: Sequence[int], rows: Optional[Sequence[int]] = None) -> faiss.Index:
+    """
+    IndexIDMap2 (mesmo tipo de índice, vazio) com os vetores de um índice
+    posicional: linha rows[i] (ou i) -> id keys[i].
+    """
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass
+    vecs = index.reconstruct_n(0, int(index.ntotal)) if index.ntotal else np.zeros((0, index.d), dtype="float32")
+    if rows is not None:
+        vecs = vecs[np.asarray(rows, dtype="int64")]
+    inner = faiss.clone_index(index)
+    inner.reset()
+    out = faiss.IndexIDMap2(inner)
+    if len(vecs):
+        out.add_with_ids(np.ascontiguousarray(vecs, dtype="float32"), np.asarray(keys, dtype="int64"))
+    return out
+
+
+def _id_selector(ids: np.ndarray) -> faiss.IDSelector:
+    """IDSelectorBatch com os ids (o faiss copia os valores na construção)."""
+    ids = np.ascontiguousarray(ids, dtype="int64")
+    return faiss.IDSelectorBatch(len(ids), faiss.swig_ptr(ids))
+
+
+def _exclude_params(index: faiss.Index, delta: _Delta) -> faiss.SearchParameters:
+    """SearchParameters que pulam os tombstones do delta (em cache até eles mudarem). Exige snap.lock."""
+    # tombstones só crescem até a compactação (que troca de snapshot): o tamanho identifica o conjunto
+    if delta.exclude is None or delta.exclude[0] != len(delta.tombstones):
+        batch = _id_selector(np.fromiter(delta.tombstones, dtype="int64", count=len(delta.tombstones)))
+        sel = faiss.IDSelectorNot(batch)
+        delta.exclude = (len(delta.tombstones), search_parameters(index, sel), (sel, batch))
+    return delta.exclude[1]
+
+
+def _remove_ids(index: faiss.Index, ids: np.ndarray) -> faiss.Index:
+    """remove_ids quando o tipo suporta; senão (ex.: HNSW) reconstrói sem as linhas."""
+    try:
+        index.remove_ids(_id_selector(ids))
+        return index
+    except RuntimeError:
+        pass
+    id_map = faiss.downcast_index(index)
+    assert isinstance(id_map, faiss.IndexIDMap), "remoção por id exige IndexIDMap"
+    all_ids = faiss.vector_to_array(id_map.id_map)
+    keep = all_ids[~np.isin(all_ids, ids)]
+    vecs = np.vstack([index.reconstruct(int(i)) for i in keep]) if len(keep) else None
+    rebuilt = faiss.clone_index(index)
+    rebuilt.reset()
+    if vecs is not None:
+        rebuilt.add_with_ids(vecs, keep)
+    return rebuilt
+
+
+_SERVICES: Dict[str, EmentasIndexService] = {}
+_SERVICES_LOCK = threading.Lock()
+
+
+def get_index_service(root: Path, model_name: Optional[str] = None, legacy: Optional[LegacyLoader] = None) -> EmentasIndexService:
+    """Serviço da raiz `root`, criado uma única vez por processo."""
+    key = str(Path(root).resolve())
+    svc = _SERVICES.get(key)
+    if svc is None:
+        with _SERVICES_LOCK:
+            svc = _SERVICES.get(key)
+            if svc is None:
+                svc = EmentasIndexService(Path(root), model_name=model_name, legacy=legacy)
+                _SERVICES[key] = svc
+    return svc
+
+
+def index_service_stats() -> Dict[str, Any]:
+    return {
+        "encoders": loaded_encoders(),
+        "indexes": [svc.stats() for svc in list(_SERVICES.values())],
+    }
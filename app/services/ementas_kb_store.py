@@ -1,130 +1,116 @@
 # app/services/ementas_kb_store.py
 from __future__ import annotations
-import os, json, threading
-from typing import List, Dict, Any, Tuple
+import os, uuid
+from pathlib import Path
+from typing import List, Dict, Any, Iterable, Optional
+
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
+
+from app.services.ementas_index_service import get_index_service, to_id_map
+from ementas_index import doc_key, read_index
+from faiss_index_factory import describe
 
 DEFAULT_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
 
 class EmentasFAISSStore:
     """
-    Armazena embeddings em FAISS + metadados em JSONL lado a lado.
-    Persistência em disco: <base_dir>/index.faiss, meta.jsonl, ids.npy
+    Base de ementas enviadas por /ementas/index, servida pelo
+    EmentasIndexService: versões em <base_dir>/versions/<v>/ (IndexIDMap2 +
+    meta.jsonl/meta.ids) e o encoder compartilhado do processo.
+
+    Cada ementa tem um id FAISS estável (doc_key do id textual): reenviar o
+    mesmo id substitui o vetor/metadados e `delete_docs` remove. Os lotes só
+    são acrescentados ao WAL da versão; a compactação periódica consolida.
+    Bases antigas (index.faiss, meta.jsonl e ids.npy soltos em base_dir)
+    são migradas para a primeira versão na carga.
     """
     def __init__(self, base_dir: str, model_name: str = DEFAULT_MODEL):
         self.base_dir = base_dir
         os.makedirs(self.base_dir, exist_ok=True)
+        self.model_name = model_name
 
-        self.model = SentenceTransformer(model_name)   # CPU ok
-        self.dim = self.model.get_sentence_embedding_dimension()
-
+        # Arquivos do layout antigo (apenas migração)
         self.index_path = os.path.join(self.base_dir, "index.faiss")
         self.meta_path  = os.path.join(self.base_dir, "meta.jsonl")
-        self.ids_path   = os.path.join(self.base_dir, "ids.npy")
-
-        self._lock = threading.RLock()
 
-        self.index = faiss.IndexFlatIP(self.dim)
-        self.ids: List[str] = []
-        self._load()
+        self.service = get_index_service(Path(base_dir), model_name=model_name, legacy=self._legacy)
 
     # ---------- persistência ----------
-    def _load(self):
-        with self._lock:
-            if os.path.exists(self.index_path):
-                self.index = faiss.read_index(self.index_path)
-            else:
-                # Similaridade por cosseno => normalizamos e usamos inner-product
-                self.index = faiss.IndexFlatIP(self.dim)
-
-            if os.path.exists(self.ids_path):
-                self.ids = list(np.load(self.ids_path, allow_pickle=True))
-            else:
-                self.ids = []
-
-    def _save(self):
-        with self._lock:
-            faiss.write_index(self.index, self.index_path)
-            np.save(self.ids_path, np.array(self.ids, dtype=object))
+    def _legacy(self):
+        if not os.path.exists(self.index_path):
+            return None
+        from app.services.ementas_meta_store import JsonlOffsetStore
+        old = read_index(Path(self.index_path), mmap=False)
+        meta = JsonlOffsetStore(self.meta_path)
+        try:
+            records = [m or {} for m in meta.get_many(range(len(meta)))]
+        finally:
+            meta.close()
+        # Linha i -> id estável; ids repetidos ficam com a última linha
+        last: Dict[int, int] = {}
+        for row, rec in enumerate(records[:old.ntotal]):
+            last[doc_key(rec.get("id") or f"auto:{row}")] = row
+        rows = list(last.values())
+        index = to_id_map(old, list(last), rows=rows)
+        return index, [records[r] for r in rows], {"model": self.model_name, "index": describe(index)}, list(last)
 
     # ---------- util ----------
     def _embed(self, texts: List[str]) -> np.ndarray:
-        embs = self.model.encode(texts, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
-        return embs.astype("float32")
+        return self.service.encode(texts, normalize=True)
 
     # ---------- APIs públicas ----------
-    def upsert_docs(self, docs: List[Dict[str, Any]]) -> int:
+    def upsert_docs(self, docs: List[Dict[str, Any]], defer: bool = False) -> int:
         """
         docs: [{"id": "str", "title": "...", "text": "...", "metadados": {...}}]
+        Insere os ids novos e substitui os existentes; retorna quantos gravou.
+        defer=True (ingestão em massa): sem fsync/compactação por lote, até `compact()`.
         """
         if not docs:
             return 0
 
-        texts = [d.get("text", "") or "" for d in docs]
-        embs  = self._embed(texts)
-
-        with self._lock:
-            # estrategia simples: ids únicos; se já existir, ignoramos (poderia implementar delete+add)
-            existing = set(self.ids)
-            new_pairs: List[Tuple[str, Dict[str,Any]]] = []
-            add_rows = []
-            for i, d in enumerate(docs):
-                doc_id = str(d.get("id") or f"auto:{len(self.ids)+i}")
-                if doc_id in existing:
-                    continue
-                new_pairs.append((doc_id, d))
-                add_rows.append(i)
-
-            if not add_rows:
-                return 0
-
-            add_vecs = embs[add_rows]
-            self.index.add(add_vecs)
-
-            # salvar metadados
-            with open(self.meta_path, "a", encoding="utf-8") as f:
-                for doc_id, d in new_pairs:
-                    f.write(json.dumps({"id": doc_id, **d}, ensure_ascii=False) + "\n")
-                    self.ids.append(doc_id)
-
-            self._save()
-            return len(add_rows)
-
-    def search(self, query: str, top_k: int = 10) -> List[Dict[str, Any]]:
+        # último do lote vence quando o mesmo id aparece mais de uma vez
+        by_key: Dict[int, Dict[str, Any]] = {}
+        for d in docs:
+            # sem id não há o que substituir depois: gera um único
+            doc_id = str(d.get("id") or f"auto:{uuid.uuid4().hex}")
+            by_key[doc_key(doc_id)] = {**d, "id": doc_id}
+
+        records = list(by_key.values())
+        texts = [r.get("text", "") or "" for r in records]
+        return self.service.upsert(list(by_key), self._embed(texts), records, defer=defer)
+
+    def delete_docs(self, ids: Iterable[str]) -> int:
+        """Remove pelos ids textuais; retorna quantos existiam."""
+        return self.service.delete([doc_key(str(i)) for i in ids])
+
+    def compact(self):
+        """Checkpoint: consolida o WAL numa versão nova."""
+        return self.service.compact()
+
+    @staticmethod
+    def _card(hit: Dict[str, Any]) -> Dict[str, Any]:
+        m = hit["meta"]
+        return {
+            "rank": hit["rank"],
+            "score": hit["score"],
+            "rrf_score": hit.get("rrf_score"),
+            "id": m.get("id"),
+            "title": m.get("title"),
+            "text": m.get("text"),
+            "metadados": m.get("metadados", {}),
+        }
+
+    def search(self, query: str, top_k: int = 10, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+        """mode: "dense", "lexical" ou "hybrid" (padrão: EMENTAS_SEARCH_MODE)."""
         q = query.strip()
         if not q:
             return []
 
-        qv = self._embed([q])  # (1, dim)
-        with self._lock:
-            if self.index.ntotal == 0:
-                return []
-            scores, idxs = self.index.search(qv, top_k)  # inner product ~ cos sim (normalizados)
-            idxs = idxs[0].tolist()
-            scores = scores[0].tolist()
-
-        # recuperar metadados pelo deslocamento (ordem de inserção)
-        # como gravamos linha a linha, vamos mapear rapidamente:
-        results = []
-        # carregamento leve: lemos o arquivo inteiro uma vez em memória (ok para ~centenas de milhares)
-        metas = []
-        with open(self.meta_path, "r", encoding="utf-8") as f:
-            for line in f:
-                metas.append(json.loads(line))
-
-        for rank, (i, s) in enumerate(zip(idxs, scores)):
-            if i < 0 or i >= len(metas):
-                continue
-            m = metas[i]
-            results.append({
-                "rank": rank+1,
-                "score": float(s),
-                "id": m.get("id"),
-                "title": m.get("title"),
-                "text": m.get("text"),
-                "metadados": m.get("metadados", {}),
-            })
-        return results
+        # inner product ~ cos sim (normalizados); metadados lidos só para o top-k
+        return [self._card(hit) for hit in self.service.search(q, k=top_k, mode=mode)]
 
+    def search_many(self, queries: List[str], top_k: int = 10, dedup: bool = False,
+                    mode: Optional[str] = None) -> List[List[Dict[str, Any]]]:
+        """Uma lista de resultados por consulta (um encode/busca para o lote todo)."""
+        per_query = self.service.search_many([(q or "").strip() for q in queries], k=top_k, dedup=dedup, mode=mode)
+        return [[self._card(hit) for hit in hits] for hits in per_query]
@@ -0,0 +1,135 @@
+# app/services/ementas_meta_store.py
+"""
+Metadados das ementas em JSONL com índice de deslocamentos.
+
+meta.jsonl continua append-only (uma linha por linha do FAISS); ao lado
+fica meta.offsets, um array uint64 com o byte inicial de cada linha.
+O JSONL é mapeado em memória (mmap) e a busca lê apenas as k linhas do
+top-k, em vez de reler e decodificar o arquivo inteiro a cada consulta.
+"""
+from __future__ import annotations
+import os, json, mmap, logging, threading
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OFFSET_DTYPE = np.dtype("<u8")
+
+
+class JsonlOffsetStore:
+    def __init__(self, meta_path: str, offsets_path: Optional[str] = None):
+        self.meta_path = meta_path
+        self.offsets_path = offsets_path or os.path.splitext(meta_path)[0] + ".offsets"
+        self._lock = threading.RLock()
+        self._file: Optional[BinaryIO] = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offsets = np.zeros(0, dtype=OFFSET_DTYPE)
+        self._size = 0
+        self.refresh()
+
+    # ---------- abertura / índice ----------
+    def _close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _scan_offsets(self) -> np.ndarray:
+        """Varredura única do JSONL (migração de bases antigas ou índice inconsistente)."""
+        offsets: List[int] = []
+        pos = 0
+        with open(self.meta_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    offsets.append(pos)
+                pos += len(line)
+        arr = np.asarray(offsets, dtype=OFFSET_DTYPE)
+        tmp = f"{self.offsets_path}.tmp"
+        arr.tofile(tmp)
+        os.replace(tmp, self.offsets_path)
+        logger.info(f"[EMENTAS] índice de metadados reconstruído ({len(arr)} linhas)")
+        return arr
+
+    def _offsets_valid(self, offsets: np.ndarray, size: int) -> bool:
+        if len(offsets) == 0:
+            return size == 0
+        if int(offsets[-1]) >= size:
+            return False
+        # A última linha indexada deve terminar exatamente no fim do arquivo
+        with open(self.meta_path, "rb") as f:
+            f.seek(int(offsets[-1]))
+            f.readline()
+            return f.tell() == size
+
+    def refresh(self) -> None:
+        """(Re)abre o JSONL e o índice; chamado na carga e após cada append."""
+        with self._lock:
+            self._close()
+            if not os.path.exists(self.meta_path):
+                self._offsets = np.zeros(0, dtype=OFFSET_DTYPE)
+                self._size = 0
+                return
+            size = os.path.getsize(self.meta_path)
+            offsets = None
+            if os.path.exists(self.offsets_path):
+                offsets = np.fromfile(self.offsets_path, dtype=OFFSET_DTYPE)
+                if not self._offsets_valid(offsets, size):
+                    logger.warning("[EMENTAS] meta.offsets inconsistente com meta.jsonl; reconstruindo")
+                    offsets = None
+            if offsets is None:
+                offsets = self._scan_offsets()
+            self._offsets = offsets
+            self._size = size
+            if size:
+                self._file = open(self.meta_path, "rb")
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    # ---------- leitura ----------
+    def _read_row(self, row: int) -> Optional[Dict[str, Any]]:
+        if row < 0 or row >= len(self._offsets) or self._mmap is None:
+            return None
+        start = int(self._offsets[row])
+        end = self._mmap.find(b"\n", start)
+        raw = self._mmap[start:end if end != -1 else self._size]
+        try:
+            return json.loads(raw)
+        except ValueError:
+            logger.warning(f"[EMENTAS] linha {row} de meta.jsonl ilegível")
+            return None
+
+    def get(self, row: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._read_row(row)
+
+    def get_many(self, rows: Iterable[int]) -> List[Optional[Dict[str, Any]]]:
+        with self._lock:
+            return [self._read_row(int(r)) for r in rows]
+
+    # ---------- escrita ----------
+    def append(self, records: List[Dict[str, Any]]) -> None:
+        """Acrescenta registros (na ordem das linhas adicionadas ao FAISS)."""
+        if not records:
+            return
+        with self._lock:
+            pos = os.path.getsize(self.meta_path) if os.path.exists(self.meta_path) else 0
+            new_offsets: List[int] = []
+            with open(self.meta_path, "ab") as f:
+                for rec in records:
+                    line = (json.dumps(rec, ensure_ascii=False) + "\n").encode("utf-8")
+                    new_offsets.append(pos)
+                    f.write(line)
+                    pos += len(line)
+            with open(self.offsets_path, "ab") as f:
+                np.asarray(new_offsets, dtype=OFFSET_DTYPE).tofile(f)
+            self.refresh()
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
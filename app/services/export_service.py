@@ -0,0 +1,215 @@
+# app/services/export_service.py
+"""
+Exports do caso (resumo TXT/PDF, FIRAC PDF) renderizados uma única vez.
+
+O arquivo em case_dir/exports recebe no nome o hash do conteúdo + versão do
+template (<tipo>_<código>_<hash>.<ext>): se o resumo/FIRAC não mudou, o
+arquivo existente é reaproveitado sem chamar o FPDF de novo. O download usa
+send_file com ETag = hash, então o navegador revalida com If-None-Match e
+recebe 304 sem baixar novamente.
+
+Cada conteúdo (ex.: resumos com foco diferente) é uma variante do export;
+ficam as EXPORT_KEEP_VARIANTS usadas mais recentemente (reuso renova o
+mtime), para não quebrar links de download já entregues para outra variante.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from flask import Response, send_file
+
+logger = logging.getLogger(__name__)
+
+# Incrementar ao mudar o layout de um export (invalida os arquivos antigos)
+TEMPLATE_VERSIONS: Dict[str, str] = {
+    "resumo_txt": "1",
+    "resumo_pdf": "1",
+    "firac_pdf": "1",
+    "firac_txt": "1",
+}
+
+MIME_TYPES = {
+    "pdf": "application/pdf",
+    "txt": "text/plain; charset=utf-8",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+}
+
+# Variantes (<tipo>_<código>_*.<ext>) mantidas por export do caso
+EXPORT_KEEP_VARIANTS = int(os.getenv("EXPORT_KEEP_VARIANTS", "5"))
+
+_RENDER_LOCK = threading.Lock()
+
+
+def content_hash(kind: str, content: Any) -> str:
+    payload = content if isinstance(content, str) else json.dumps(content, ensure_ascii=False, sort_keys=True)
+    key = f"{kind}\x00{TEMPLATE_VERSIONS.get(kind, '0')}\x00{payload}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def etag_from_filename(filename: str) -> Optional[str]:
+    """Hash embutido no nome (<tipo>_<código>_<hash>.<ext>), usado como ETag."""
+    stem = Path(filename).stem
+    _, _, tail = stem.rpartition("_")
+    return tail if len(tail) == 16 and all(c in "0123456789abcdef" for c in tail) else None
+
+
+def export_artifact(
+    export_dir: Path,
+    kind: str,
+    code: str,
+    content: Any,
+    ext: str,
+    render: Callable[[Path], None],
+    keep: int = EXPORT_KEEP_VARIANTS,
+) -> Optional[Path]:
+    """
+    Devolve o arquivo do export para `content`, renderizando só se ainda
+    não existir. `render(path)` grava o arquivo; a escrita é atômica.
+    Depois de renderizar, mantém só as `keep` variantes mais recentes.
+    Retorna None se a renderização falhar ou gerar arquivo vazio.
+    """
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    digest = content_hash(kind, content)
+    prefix = f"{kind.rsplit('_', 1)[0]}_{code}_"
+    target = export_dir / f"{prefix}{digest}.{ext}"
+    if target.exists() and target.stat().st_size > 0:
+        _touch(target)
+        logger.info(f"[EXPORT] reutilizado {target.name}")
+        return target
+
+    with _RENDER_LOCK:
+        if target.exists() and target.stat().st_size > 0:
+            return target
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.tmp")
+        try:
+            render(tmp)
+            if not tmp.exists() or tmp.stat().st_size == 0:
+                logger.warning(f"[EXPORT] {kind} gerou arquivo vazio ({target.name})")
+                return None
+            os.replace(tmp, target)
+        except Exception:
+            logger.exception(f"[EXPORT] Erro gerando {kind}")
+            return None
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        _prune_variants(export_dir, f"{prefix}*.{ext}", keep)
+    logger.info(f"[EXPORT] gerado {target.name}")
+    return target
+
+
+def _touch(path: Path) -> None:
+    """Renova o mtime (a variante reaproveitada passa a ser a mais recente)."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _prune_variants(export_dir: Path, pattern: str, keep: int) -> None:
+    """Remove as variantes além das `keep` usadas mais recentemente."""
+    variants = []
+    for path in export_dir.glob(pattern):
+        try:
+            variants.append((path.stat().st_mtime, path))
+        except OSError:
+            continue
+    variants.sort(key=lambda v: v[0], reverse=True)
+    for _, old in variants[max(1, keep):]:
+        try:
+            old.unlink()
+        except OSError:
+            pass
+
+
+def send_export(path: Path, download_name: Optional[str] = None) -> Response:
+    """Download com ETag/Last-Modified e suporte a GET condicional (304) e Range."""
+    path = Path(path)
+    ext = path.suffix.lstrip(".").lower()
+    etag = etag_from_filename(path.name)
+    if download_name is None:
+        # Nome amigável, sem o hash: resumo_caso_ab12cd34.pdf
+        download_name = f"{path.stem.rsplit('_', 1)[0]}{path.suffix}" if etag else path.name
+    return send_file(
+        str(path),
+        mimetype=MIME_TYPES.get(ext, "application/octet-stream"),
+        as_attachment=True,
+        download_name=download_name,
+        conditional=True,
+        etag=etag or True,
+        max_age=0,  # sempre revalida; o 304 evita baixar o arquivo de novo
+    )
+
+
+# ----------------------------------------------------------------------
+# Renderizadores
+# ----------------------------------------------------------------------
+
+def render_text(text: str) -> Callable[[Path], None]:
+    def _render(path: Path) -> None:
+        path.write_text(text, encoding="utf-8")
+    return _render
+
+
+def render_resumo_pdf(resumo: str, code: str) -> Callable[[Path], None]:
+    def _render(path: Path) -> None:
+        from fpdf import FPDF
+        pdf = FPDF()
+        pdf.set_margins(15, 15, 15)
+        pdf.set_auto_page_break(auto=True, margin=15)
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, f"Resumo do Caso - {code}", ln=1)
+        pdf.set_font("Arial", size=11)
+        # Tratar parágrafos preservando quebras em branco
+        for para in (p.strip() for p in resumo.split("\n")):
+            if not para:
+                pdf.ln(4)
+                continue
+            # multi_cell faz wrap automático; substitui tabs por espaços
+            pdf.multi_cell(0, 6, para.replace("\t", "    "))
+            pdf.ln(1)
+        pdf.output(str(path))
+    return _render
+
+
+def render_firac_pdf(data: Optional[Dict[str, Any]], raw: Optional[str], code: str) -> Callable[[Path], None]:
+    def _render(path: Path) -> None:
+        from fpdf import FPDF
+        pdf = FPDF()
+        pdf.set_auto_page_break(auto=True, margin=12)
+        pdf.add_page()
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, f"Análise FIRAC - {code}", ln=1)
+        pdf.set_font("Arial", size=9)
+        pdf.cell(0, 6, f"Gerado: {datetime.utcnow().isoformat()}Z", ln=1)
+        pdf.ln(2)
+
+        def write_section(title, content_lines):
+            pdf.set_font("Arial", "B", 11)
+            pdf.cell(0, 7, title, ln=1)
+            pdf.set_font("Arial", size=10)
+            if isinstance(content_lines, list):
+                for i, line in enumerate(content_lines, 1):
+                    pdf.multi_cell(0, 5, f"{i}. {line}")
+            else:
+                for para in str(content_lines).split("\n"):
+                    pdf.multi_cell(0, 5, para)
+            pdf.ln(2)
+
+        if data:
+            write_section("Fatos", data.get("facts") or [])
+            write_section("Questão", data.get("issue", ""))
+            write_section("Regras", data.get("rules") or [])
+            write_section("Aplicação", data.get("application", ""))
+            write_section("Conclusão", data.get("conclusion", ""))
+        else:
+            write_section("FIRAC (Texto)", raw)
+        pdf.output(str(path))
+    return _render
@@ -0,0 +1,243 @@
+# app/services/ingestion_jobs.py
+"""
+Fila local de jobs de ingestão de documentos.
+
+O upload salva o arquivo e devolve imediatamente um job_id; a ingestão
+(extração/OCR, transcrição, NER, embeddings) roda em um pool de threads
+do próprio worker. O estado dos jobs fica em SQLite, de modo que qualquer
+worker consegue responder ao polling de status (HTMX).
+
+Enquanto um job está na fila ou rodando, o worker dono renova o heartbeat
+dele a cada INGESTION_HEARTBEAT_S; job pendente sem heartbeat há mais de
+INGESTION_STALE_S é de um worker que morreu (restart/deploy) e vira erro.
+O PID sozinho não serve para isso: depois de reiniciar o contêiner outro
+processo pode receber o mesmo PID.
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Banco SQLite dos jobs e threads de ingestão por worker (fonte única: ambiente)
+INGESTION_JOBS_DB = os.getenv("INGESTION_JOBS_DB", "data/jobs/ingestion_jobs.sqlite3")
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+# Renovação do heartbeat dos jobs pendentes e idade a partir da qual são órfãos
+INGESTION_HEARTBEAT_S = float(os.getenv("INGESTION_HEARTBEAT_S", "15"))
+INGESTION_STALE_S = float(os.getenv("INGESTION_STALE_S", "120"))
+
+# Faixa de percentual (início, fim) de cada estágio da ingestão
+STAGE_RANGES: Dict[str, tuple] = {
+    "queued": (0, 0),
+    "saved": (0, 5),
+    "extracting": (5, 45),
+    "ocr": (5, 45),
+    "embedding": (50, 95),
+    "indexed": (100, 100),
+}
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_ERROR = "error"
+TERMINAL_STATUSES = {STATUS_DONE, STATUS_ERROR}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingestion_jobs (
+    id TEXT PRIMARY KEY,
+    tenant_id TEXT,
+    case_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    file_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    percent INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    worker_pid INTEGER,
+    heartbeat_at REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_ingestion_jobs_case ON ingestion_jobs (tenant_id, case_id, created_at);
+"""
+
+
+class IngestionJobQueue:
+    def __init__(self, db_path: Path, max_workers: int = 2):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingestao")
+        self._lock = threading.Lock()
+        # jobs deste worker ainda não terminados (recebem heartbeat)
+        self._live: Set[str] = set()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            colunas = {r["name"] for r in conn.execute("PRAGMA table_info(ingestion_jobs)")}
+            if "heartbeat_at" not in colunas:  # bancos criados antes do heartbeat
+                conn.execute("ALTER TABLE ingestion_jobs ADD COLUMN heartbeat_at REAL")
+        self._fail_orphaned_jobs()
+        threading.Thread(target=self._heartbeat_loop, name="ingestao-heartbeat", daemon=True).start()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:  # commit/rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def _fail_orphaned_jobs(self) -> int:
+        """Jobs pendentes sem heartbeat recente (worker morreu: restart/deploy) viram erro."""
+        agora = time.time()
+        with self._connect() as conn:
+            cur = conn.execute(
+                "UPDATE ingestion_jobs SET status=?, message=?, updated_at=? "
+                "WHERE status IN (?, ?) AND COALESCE(heartbeat_at, updated_at) < ?",
+                (STATUS_ERROR, "Ingestão interrompida (worker reiniciado).", agora,
+                 STATUS_QUEUED, STATUS_RUNNING, agora - INGESTION_STALE_S),
+            )
+        if cur.rowcount:
+            logger.warning(f"{cur.rowcount} job(s) de ingestão órfão(s) marcado(s) como erro")
+        return cur.rowcount
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(INGESTION_HEARTBEAT_S)
+            with self._lock:
+                ids = list(self._live)
+            if not ids:
+                continue
+            try:
+                with self._lock, self._connect() as conn:
+                    conn.execute(
+                        f"UPDATE ingestion_jobs SET heartbeat_at=? WHERE id IN ({','.join('?' * len(ids))})",
+                        (time.time(), *ids),
+                    )
+            except Exception as e:
+                logger.warning(f"Falha ao renovar heartbeat dos jobs de ingestão: {e}")
+
+    def _update(self, job_id: str, **campos: Any) -> None:
+        campos["updated_at"] = time.time()
+        sets = ", ".join(f"{k}=?" for k in campos)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE ingestion_jobs SET {sets} WHERE id=?", (*campos.values(), job_id))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM ingestion_jobs WHERE id=?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        if job["status"] not in TERMINAL_STATUSES and \
+                (job["heartbeat_at"] or job["updated_at"]) < time.time() - INGESTION_STALE_S:
+            # o worker dono morreu sem reiniciar esta fila: não deixa o polling eterno
+            self._fail_orphaned_jobs()
+            return self.get(job_id)
+        job["result"] = json.loads(job["result"]) if job.get("result") else None
+        return job
+
+    def submit(
+        self,
+        tenant_id: Optional[str],
+        case_id: str,
+        filename: str,
+        file_path: Path,
+        id_cliente: Optional[str] = None,
+        criado_por_id: Optional[int] = None,
+    ) -> str:
+        """Registra o job e agenda a ingestão do arquivo já salvo em `file_path`."""
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingestion_jobs (id, tenant_id, case_id, filename, file_path, status, stage, "
+                "percent, worker_pid, heartbeat_at, created_at, updated_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (job_id, tenant_id, case_id, filename, str(file_path), STATUS_QUEUED, "queued",
+                 0, os.getpid(), agora, agora, agora),
+            )
+            self._live.add(job_id)
+        self._executor.submit(self._run, job_id, tenant_id, case_id, filename, Path(file_path), id_cliente, criado_por_id)
+        logger.info(f"Job de ingestão {job_id} enfileirado: {filename} (caso={case_id}, tenant={tenant_id})")
+        return job_id
+
+    def _progress_reporter(self, job_id: str):
+        ultimo: Dict[str, Any] = {"stage": None, "percent": -1}
+
+        def report(stage: str, fracao: float = 0.0) -> None:
+            inicio, fim = STAGE_RANGES.get(stage, (0, 100))
+            percent = int(inicio + (fim - inicio) * max(0.0, min(1.0, fracao)))
+            # Evita escrever no SQLite a cada página quando nada mudou visivelmente
+            if stage == ultimo["stage"] and percent == ultimo["percent"]:
+                return
+            ultimo.update(stage=stage, percent=percent)
+            try:
+                self._update(job_id, stage=stage, percent=percent)
+            except Exception as e:
+                logger.warning(f"Falha ao atualizar progresso do job {job_id}: {e}")
+
+        return report
+
+    def _run(self, job_id, tenant_id, case_id, filename, file_path: Path, id_cliente, criado_por_id) -> None:
+        try:
+            self._execute(job_id, tenant_id, case_id, filename, file_path, id_cliente, criado_por_id)
+        finally:
+            with self._lock:
+                self._live.discard(job_id)
+
+    def _execute(self, job_id, tenant_id, case_id, filename, file_path: Path, id_cliente, criado_por_id) -> None:
+        # Import tardio: mantém o módulo leve (usado também por rotas de status)
+        from app.services.pipeline_registry import get_pipeline
+
+        self._update(job_id, status=STATUS_RUNNING, heartbeat_at=time.time())
+        t0 = time.perf_counter()
+        try:
+            pipeline = get_pipeline(case_id, tenant_id=tenant_id)
+            resultado = pipeline.processar_upload_de_arquivo(
+                id_processo=case_id,
+                nome_arquivo=filename,
+                conteudo_arquivo_bytes=file_path.read_bytes(),
+                id_cliente=id_cliente,
+                criado_por_id=criado_por_id,
+                storage_backend="local",
+                progress=self._progress_reporter(job_id),
+            )
+        except Exception as e:
+            logger.error(f"Job de ingestão {job_id} falhou: {e}", exc_info=True)
+            resultado = {"status": "erro", "mensagem": str(e)}
+
+        resultado["duracao_s"] = round(time.perf_counter() - t0, 2)
+        if resultado.get("status") == "erro":
+            self._update(job_id, status=STATUS_ERROR, message=resultado.get("mensagem"),
+                         result=json.dumps(resultado, default=str))
+        else:
+            self._update(job_id, status=STATUS_DONE, stage="indexed", percent=100,
+                         message=resultado.get("mensagem"), result=json.dumps(resultado, default=str))
+        logger.info(f"Job de ingestão {job_id} finalizado ({resultado.get('status')}) em {resultado['duracao_s']}s")
+
+
+_QUEUE: Optional[IngestionJobQueue] = None
+_QUEUE_LOCK = threading.Lock()
+
+
+def get_job_queue() -> IngestionJobQueue:
+    """Fila do worker (criada na primeira utilização)."""
+    global _QUEUE
+    if _QUEUE is None:
+        with _QUEUE_LOCK:
+            if _QUEUE is None:
+                _QUEUE = IngestionJobQueue(
+                    db_path=Path(INGESTION_JOBS_DB),
+                    max_workers=INGESTION_WORKERS,
+                )
+    return _QUEUE
@@ -0,0 +1,110 @@
+# app/services/pipeline_registry.py
+"""
+Registro de Pipelines por worker.
+
+Mantém um LRU de visões leves `Pipeline` indexadas por (tenant_id, case_id).
+Os recursos pesados (spaCy, embeddings, LLM, Chroma de KB/ementas) ficam em
+`pipeline.PipelineResources` e são carregados uma única vez por processo,
+de modo que rotas simples (download de export, preview, listagem) não pagam
+o custo de carregar modelos a cada request.
+"""
+import os
+import sys
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from flask import g, has_request_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PIPELINES = int(os.getenv("PIPELINE_CACHE_SIZE", "32"))
+
+_UNSET = object()
+
+
+def _tenant_key(tenant_id: Any) -> Optional[str]:
+    """
+    Tenant normalizado pela mesma regra do diretório do Pipeline
+    (`_tenant_segment`): None, "" e "default" caem todos em cases/default e
+    viram uma única entrada (tenant None).
+    """
+    segment = str(tenant_id) if tenant_id else "default"
+    return None if segment == "default" else segment
+
+
+class PipelineRegistry:
+    def __init__(self, max_size: int = DEFAULT_MAX_PIPELINES):
+        self.max_size = max(1, int(max_size))
+        self._pipelines: "OrderedDict[Tuple[Optional[str], str], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, case_id: str, tenant_id: Optional[str] = None):
+        """Retorna o Pipeline do caso, criando-o (e evictando o LRU) se necessário."""
+        tenant_id = _tenant_key(tenant_id)
+        key = (tenant_id, case_id)
+        with self._lock:
+            pipeline = self._pipelines.get(key)
+            if pipeline is not None:
+                self._pipelines.move_to_end(key)
+                self.stats["hits"] += 1
+                return pipeline
+            self.stats["misses"] += 1
+
+        # Import tardio: evita carregar spaCy/LangChain ao importar o módulo
+        # (ex.: /metrics em MINIMAL_MODE).
+        from pipeline import Pipeline
+
+        # Construção fora do lock; se outra thread criou o mesmo caso antes, reaproveita.
+        novo = Pipeline(case_id=case_id, tenant_id=tenant_id)
+        with self._lock:
+            pipeline = self._pipelines.setdefault(key, novo)
+            self._pipelines.move_to_end(key)
+            while len(self._pipelines) > self.max_size:
+                old_key, _ = self._pipelines.popitem(last=False)
+                self.stats["evictions"] += 1
+                logger.info(f"PipelineRegistry: evictando pipeline {old_key}")
+        return pipeline
+
+    def invalidate(self, case_id: str, tenant_id: Optional[str] = None) -> None:
+        """Remove o Pipeline do caso (ex.: processo excluído)."""
+        with self._lock:
+            self._pipelines.pop((_tenant_key(tenant_id), case_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pipelines.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estatísticas do LRU + custo de inicialização dos componentes já criados."""
+        with self._lock:
+            startup = {
+                f"{tenant or 'default'}/{case_id}": dict(getattr(p, "startup_costs", {}))
+                for (tenant, case_id), p in self._pipelines.items()
+            }
+            data = {
+                "size": len(self._pipelines),
+                "max_size": self.max_size,
+                **self.stats,
+                "startup_costs": startup,
+            }
+        # Só consulta o módulo pipeline se ele já foi importado (não força carga de ML).
+        pipeline_mod = sys.modules.get("pipeline")
+        if pipeline_mod is not None and hasattr(pipeline_mod, "shared_startup_costs"):
+            data["shared_startup_costs"] = pipeline_mod.shared_startup_costs()
+        return data
+
+
+registry = PipelineRegistry()
+
+
+def get_pipeline(case_id: str, tenant_id: Any = _UNSET):
+    """
+    Atalho usado pelos blueprints. Sem tenant explícito, usa `g.tenant_id`
+    quando houver contexto de request.
+    """
+    if tenant_id is _UNSET:
+        tenant_id = getattr(g, "tenant_id", None) if has_request_context() else None
+    return registry.get(case_id, tenant_id)
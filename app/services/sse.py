@@ -0,0 +1,30 @@
+# app/services/sse.py
+"""
+Helpers de Server-Sent Events (text/event-stream) para respostas em streaming.
+"""
+import json
+from typing import Any, Iterator
+
+from flask import Response, stream_with_context
+
+
+def sse_event(event: str, data: Any) -> str:
+    """
+    Formata um evento SSE. Strings vão como estão (uma linha `data:` por linha
+    do texto, como exige o protocolo); demais valores são serializados em JSON.
+    """
+    payload = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False)
+    lines = payload.split("\n") or [""]
+    return f"event: {event}\n" + "".join(f"data: {line}\n" for line in lines) + "\n"
+
+
+def sse_response(events: Iterator[str]) -> Response:
+    """Resposta de streaming mantendo o contexto da request (g.tenant_id, session)."""
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx: não bufferizar o stream
+        },
+    )
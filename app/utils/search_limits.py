@@ -0,0 +1,31 @@
+# utils/search_limits.py
+"""
+Limites comuns dos endpoints de busca em lote (/api/search_similar_batch,
+/ementas/search_batch e /ementas/faiss/search_batch): mesmo máximo de
+consultas por chamada e o mesmo tratamento de k.
+"""
+import os
+from typing import Any, Optional
+
+# Consultas por chamada nos endpoints em lote
+SEARCH_MAX_BATCH = int(os.getenv("EMENTAS_SEARCH_MAX_BATCH", "64"))
+# Resultados por consulta (k é limitado a 1..SEARCH_MAX_K)
+SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", "50"))
+
+
+def parse_k(value: Any, default: int = 10) -> int:
+    """k da requisição limitado a 1..SEARCH_MAX_K; ausente ou inválido vira `default`."""
+    try:
+        k = int(value if value is not None else default)
+    except (TypeError, ValueError):
+        k = default
+    return max(1, min(SEARCH_MAX_K, k))
+
+
+def batch_error(queries: Any) -> Optional[str]:
+    """Mensagem de erro (400) para a lista de consultas, ou None se válida."""
+    if not isinstance(queries, list) or not queries:
+        return "queries deve ser uma lista não vazia"
+    if len(queries) > SEARCH_MAX_BATCH:
+        return f"no máximo {SEARCH_MAX_BATCH} consultas por chamada"
+    return None
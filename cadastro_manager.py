@@ -1,8 +1,14 @@
 # cadastro_manager.py (Versão Final e Completa para PostgreSQL)
 import os
+import time
+import threading
+from collections import OrderedDict
+from itertools import islice
+from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import Any, Dict, List, Optional, Tuple, Literal, cast
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor, execute_values
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, Union, Literal, cast
 import uuid
 from datetime import datetime
 import json
@@ -16,6 +22,193 @@ logger = logging.getLogger(__name__)
 FetchMode = Literal["one", "all"]
 Params = Tuple[Any, ...]
 
+
+# ============================================================
+#  POOL DE CONEXÕES (um por processo, compartilhado por tenants)
+# ============================================================
+
+# Tamanho do pool e espera máxima por conexão (fonte única: estas variáveis de ambiente)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = max(DB_POOL_MIN, int(os.getenv("DB_POOL_MAX", "10")))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_POOL: Optional[pg_pool.ThreadedConnectionPool] = None
+_POOL_PID: Optional[int] = None
+_POOL_LOCK = threading.Lock()
+# ThreadedConnectionPool não bloqueia quando esgotado (lança PoolError);
+# o semáforo faz as threads aguardarem uma conexão livre até DB_POOL_TIMEOUT.
+_POOL_SLOTS: Optional[threading.BoundedSemaphore] = None
+_METRICS_LOCK = threading.Lock()
+
+POOL_METRICS: Dict[str, Any] = {
+    "acquired": 0,
+    "in_use": 0,
+    "max_in_use": 0,
+    "waits": 0,
+    "wait_time_total": 0.0,
+    "wait_time_max": 0.0,
+    "timeouts": 0,
+    "discarded": 0,
+}
+
+
+def _connection_params() -> Dict[str, Any]:
+    return {
+        "dbname": os.getenv("DB_NAME", "advocacia_ia"),
+        "user": os.getenv("DB_USER", "postgres"),
+        "password": os.getenv("DB_PASSWORD", ""),
+        "host": os.getenv("DB_HOST", "localhost"),
+        "port": os.getenv("DB_PORT", "5432"),
+    }
+
+
+def _get_pool() -> pg_pool.ThreadedConnectionPool:
+    """Cria o pool na primeira utilização (e novamente após fork do worker)."""
+    global _POOL, _POOL_PID, _POOL_SLOTS
+    pid = os.getpid()
+    if _POOL is not None and _POOL_PID == pid:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_PID != pid:
+            minconn, maxconn = DB_POOL_MIN, DB_POOL_MAX
+            params = _connection_params()
+            safe_params = {k: ("***" if "password" in k.lower() else v) for k, v in params.items()}
+            logger.info(f"[DB POOL] Criando pool ({minconn}-{maxconn}) com params: {safe_params}")
+            _POOL = pg_pool.ThreadedConnectionPool(minconn, maxconn, **params)
+            _POOL_SLOTS = threading.BoundedSemaphore(maxconn)
+            _POOL_PID = pid
+    return _POOL
+
+
+def _count_metric(key: str) -> None:
+    with _METRICS_LOCK:
+        POOL_METRICS[key] += 1
+
+
+def _acquire_connection():
+    db_pool = _get_pool()
+    slots = cast(threading.BoundedSemaphore, _POOL_SLOTS)
+    timeout = DB_POOL_TIMEOUT
+
+    t0 = time.perf_counter()
+    if not slots.acquire(blocking=False):
+        _count_metric("waits")
+        if not slots.acquire(timeout=timeout):
+            _count_metric("timeouts")
+            raise pg_pool.PoolError(f"Pool de conexões esgotado após {timeout}s de espera")
+    waited = time.perf_counter() - t0
+
+    try:
+        conn = db_pool.getconn()
+        if conn.closed:
+            db_pool.putconn(conn, close=True)
+            _count_metric("discarded")
+            conn = db_pool.getconn()
+    except Exception:
+        slots.release()
+        raise
+
+    with _METRICS_LOCK:
+        POOL_METRICS["acquired"] += 1
+        POOL_METRICS["in_use"] += 1
+        POOL_METRICS["max_in_use"] = max(POOL_METRICS["max_in_use"], POOL_METRICS["in_use"])
+        POOL_METRICS["wait_time_total"] += waited
+        POOL_METRICS["wait_time_max"] = max(POOL_METRICS["wait_time_max"], waited)
+    return conn
+
+
+def _release_connection(conn, broken: bool = False) -> None:
+    db_pool = _POOL
+    try:
+        if db_pool is not None:
+            discard = broken or bool(conn.closed)
+            if discard:
+                _count_metric("discarded")
+            db_pool.putconn(conn, close=discard)
+        else:
+            conn.close()
+    finally:
+        with _METRICS_LOCK:
+            POOL_METRICS["in_use"] -= 1
+        if _POOL_SLOTS is not None:
+            _POOL_SLOTS.release()
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Métricas do pool para /metrics (saturação e tempo de espera)."""
+    maxconn = getattr(_POOL, "maxconn", None)
+    with _METRICS_LOCK:
+        stats = dict(POOL_METRICS)
+    stats["max_size"] = maxconn
+    stats["saturation"] = (stats["in_use"] / maxconn) if maxconn else 0.0
+    stats["avg_wait_time"] = (stats["wait_time_total"] / stats["acquired"]) if stats["acquired"] else 0.0
+    return stats
+
+
+# ============================================================
+#  CACHE DO HISTÓRICO RECENTE DO CHAT (por processo, em memória)
+# ============================================================
+
+CHAT_HISTORY_CACHE_TURNS = int(os.getenv("CHAT_HISTORY_CACHE_TURNS", "50"))
+CHAT_HISTORY_CACHE_CASES = int(os.getenv("CHAT_HISTORY_CACHE_CASES", "256"))
+# Outros workers também gravam turnos; o TTL limita quanto tempo uma
+# entrada deste processo pode ficar defasada.
+CHAT_HISTORY_CACHE_TTL = float(os.getenv("CHAT_HISTORY_CACHE_TTL", "60"))
+
+# (tenant|None, id_processo) -> {"turns": [...], "complete": bool, "at": epoch}
+_CHAT_HISTORY_CACHE: "OrderedDict[Tuple[Optional[str], str], Dict[str, Any]]" = OrderedDict()
+_CHAT_HISTORY_LOCK = threading.Lock()
+CHAT_HISTORY_METRICS: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def _chat_cache_get(key: Tuple[Optional[str], str], limit: int) -> Optional[List[Dict[str, Any]]]:
+    with _CHAT_HISTORY_LOCK:
+        entry = _CHAT_HISTORY_CACHE.get(key)
+        if entry is not None and time.time() - entry["at"] > CHAT_HISTORY_CACHE_TTL:
+            _CHAT_HISTORY_CACHE.pop(key, None)
+            entry = None
+        # Só serve do cache se ele cobre o pedido: `limit` turnos ou o histórico inteiro
+        if entry is None or (limit > len(entry["turns"]) and not entry["complete"]):
+            CHAT_HISTORY_METRICS["misses"] += 1
+            return None
+        _CHAT_HISTORY_CACHE.move_to_end(key)
+        CHAT_HISTORY_METRICS["hits"] += 1
+        return [dict(t) for t in entry["turns"][-limit:]] if limit > 0 else []
+
+
+def _chat_cache_store(key: Tuple[Optional[str], str], turns: List[Dict[str, Any]], complete: bool) -> None:
+    with _CHAT_HISTORY_LOCK:
+        _CHAT_HISTORY_CACHE[key] = {
+            "turns": [dict(t) for t in turns[-CHAT_HISTORY_CACHE_TURNS:]],
+            "complete": complete and len(turns) <= CHAT_HISTORY_CACHE_TURNS,
+            "at": time.time(),
+        }
+        _CHAT_HISTORY_CACHE.move_to_end(key)
+        while len(_CHAT_HISTORY_CACHE) > CHAT_HISTORY_CACHE_CASES:
+            _CHAT_HISTORY_CACHE.popitem(last=False)
+
+
+def _chat_cache_append(key: Tuple[Optional[str], str], new_turns: List[Dict[str, Any]]) -> None:
+    """Acrescenta turnos recém-gravados a uma entrada existente (sem criar uma nova)."""
+    with _CHAT_HISTORY_LOCK:
+        entry = _CHAT_HISTORY_CACHE.get(key)
+        if entry is None:
+            return
+        turns = entry["turns"] + [dict(t) for t in new_turns]
+        if len(turns) > CHAT_HISTORY_CACHE_TURNS:
+            turns = turns[-CHAT_HISTORY_CACHE_TURNS:]
+            entry["complete"] = False
+        entry["turns"] = turns
+
+
+def chat_history_cache_stats() -> Dict[str, Any]:
+    with _CHAT_HISTORY_LOCK:
+        stats: Dict[str, Any] = dict(CHAT_HISTORY_METRICS)
+        stats["cases"] = len(_CHAT_HISTORY_CACHE)
+    total = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / total, 4) if total else 0.0
+    return stats
+
 class CadastroManager:
     """Gerencia todos os dados cadastrais em um banco de dados PostgreSQL.
     Suporte multi-tenant simples via coluna tenant_id (quando habilitado).
@@ -35,28 +228,28 @@ class CadastroManager:
         # Tabelas agora gerenciadas exclusivamente por Alembic migrations.
 
     def _get_connection(self):
-        import psycopg2
-        import logging
-
-        logger = logging.getLogger(__name__)
-
-        params = {
-            "dbname": os.getenv("DB_NAME", "advocacia_ia"),
-            "user": os.getenv("DB_USER", "postgres"),
-            "password": os.getenv("DB_PASSWORD", ""),
-            "host": os.getenv("DB_HOST", "localhost"),
-            "port": os.getenv("DB_PORT", "5432"),
-        }
-
-        # log sem expor senha
-        safe_params = {k: ("***" if "password" in k.lower() else v)
-                        for k, v in params.items()}
-        logger.info(f"[DB CONNECT] Connecting with params: {safe_params}")
-
-        # aqui deixamos o psycopg2 cuidar de encoding/DSN
-        return psycopg2.connect(**params)
-
+        """Conexão avulsa (fora do pool). Preferir `_connection()`."""
+        return psycopg2.connect(**_connection_params())
 
+    @contextmanager
+    def _connection(self) -> Iterator[Any]:
+        """
+        Empresta uma conexão do pool do processo: commit ao sair sem erro,
+        rollback em caso de exceção e devolução ao pool em qualquer caso.
+        """
+        conn = _acquire_connection()
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            _release_connection(conn, broken=broken)
 
     def _execute_query(
         self,
@@ -64,30 +257,20 @@ class CadastroManager:
         params: Optional[Params] = None,
         fetch: FetchMode | None = None,
     ) -> Any:
-        conn = None
         try:
-            conn = self._get_connection()
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, params)
-                
-                # Buscar resultado ANTES de commit (mas não retornar ainda)
-                if fetch == "one":
-                    result = cur.fetchone()
-                elif fetch == "all":
-                    result = cur.fetchall()
-                else:
-                    result = cur.rowcount
-                
-                # SEMPRE fazer commit antes de retornar
-                conn.commit()
-                return result
-                
+            with self._connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    cur.execute(query, params)
+
+                    # Buscar resultado ANTES do commit (feito pelo _connection)
+                    if fetch == "one":
+                        return cur.fetchone()
+                    elif fetch == "all":
+                        return cur.fetchall()
+                    return cur.rowcount
         except Exception as e:
-            if conn: conn.rollback()
             logger.error(f"Erro na execução da query: {e}", exc_info=True)
             raise
-        finally:
-            if conn: conn.close()
 
     def _create_tables(self):
         """(Deprecated) Mantido por compatibilidade; não faz nada agora."""
@@ -308,25 +491,11 @@ class CadastroManager:
             return self._execute_query("SELECT * FROM processos WHERE id_processo = %s AND tenant_id = %s", (id_processo, self.tenant_id), fetch="one")
         return self._execute_query("SELECT * FROM processos WHERE id_processo = %s", (id_processo,), fetch="one")
 
-    def save_processo(self, dados: Dict[str, Any], id_processo: Optional[str] = None) -> str:
+    def _normalizar_campos_processo(self, dados: Dict[str, Any]) -> Dict[str, Any]:
         """
-        Salva ou atualiza um processo com suporte aos 12 novos campos (Item 1).
-        
-        Novos campos (Migration 0005):
-        - local_tramite, comarca, area_atuacao, instancia, subfase, assunto
-        - valor_causa, data_distribuicao, data_encerramento, sentenca
-        - em_execucao, segredo_justica
-        
-        Validações aplicadas:
-        - area_atuacao: enum (Civil, Trabalhista, Penal, Tributario, Familia)
-        - instancia: enum (1ª Instância, 2ª Instância, Superior)
-        - subfase: enum (Inicial, Instrução, Sentenciado, Recursal, Execução)
-        - valor_causa: decimal positivo
-        - data_distribuicao/data_encerramento: não podem ser futuras
+        Valida e normaliza os campos opcionais de um processo (usado por
+        save_processo e pelo bulk CSV). Lança ValueError em valores inválidos.
         """
-        if not dados.get("id_cliente") or not dados.get("nome_caso"): 
-            raise ValueError("ID do Cliente e Nome do Caso são obrigatórios.")
-        
         # Normalize tipo_parte to lowercase
         tipo_parte = dados.get("tipo_parte")
         if tipo_parte:
@@ -413,6 +582,48 @@ class CadastroManager:
         if segredo_justica is not None:
             segredo_justica = bool(segredo_justica)
         
+        return {
+            "tipo_parte": tipo_parte,
+            "area_atuacao": area_atuacao,
+            "instancia": instancia,
+            "subfase": subfase,
+            "valor_causa": valor_causa,
+            "data_distribuicao": data_distribuicao,
+            "data_encerramento": data_encerramento,
+            "em_execucao": em_execucao,
+            "segredo_justica": segredo_justica,
+        }
+
+    def save_processo(self, dados: Dict[str, Any], id_processo: Optional[str] = None) -> str:
+        """
+        Salva ou atualiza um processo com suporte aos 12 novos campos (Item 1).
+        
+        Novos campos (Migration 0005):
+        - local_tramite, comarca, area_atuacao, instancia, subfase, assunto
+        - valor_causa, data_distribuicao, data_encerramento, sentenca
+        - em_execucao, segredo_justica
+        
+        Validações aplicadas:
+        - area_atuacao: enum (Civil, Trabalhista, Penal, Tributario, Familia)
+        - instancia: enum (1ª Instância, 2ª Instância, Superior)
+        - subfase: enum (Inicial, Instrução, Sentenciado, Recursal, Execução)
+        - valor_causa: decimal positivo
+        - data_distribuicao/data_encerramento: não podem ser futuras
+        """
+        if not dados.get("id_cliente") or not dados.get("nome_caso"): 
+            raise ValueError("ID do Cliente e Nome do Caso são obrigatórios.")
+        
+        campos_validados = self._normalizar_campos_processo(dados)
+        tipo_parte = campos_validados["tipo_parte"]
+        area_atuacao = campos_validados["area_atuacao"]
+        instancia = campos_validados["instancia"]
+        subfase = campos_validados["subfase"]
+        valor_causa = campos_validados["valor_causa"]
+        data_distribuicao = campos_validados["data_distribuicao"]
+        data_encerramento = campos_validados["data_encerramento"]
+        em_execucao = campos_validados["em_execucao"]
+        segredo_justica = campos_validados["segredo_justica"]
+        
         # === CONSTRUÇÃO DA QUERY COM 12 NOVOS CAMPOS ===
         
         if id_processo:
@@ -778,11 +989,10 @@ class CadastroManager:
         # AND tenant_id = %s
         # e passar self.tenant_id como terceiro parâmetro.
 
-        with self._get_connection() as conn:
+        with self._connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(sql, (self.tenant_id, id_processo, titulo, self.tenant_id))
                 apagados = cur.rowcount
-            conn.commit()
         return apagados > 0
 
     def delete_documento_by_filename(self, id_processo: str, titulo: str) -> bool:
@@ -798,10 +1008,7 @@ class CadastroManager:
         """
         params = (self.tenant_id, id_processo, titulo)
 
-        # 🔥 MUITO IMPORTANTE: use o MESMO helper que as outras funções usam
-        # Ex.: _get_conn(), get_conn(), get_connection()...
-        # Veja um método já existente (listar, inserir, etc.) e copie o padrão.
-        with self._get_connection() as conn:   # <-- troque _get_conn pelo nome correto
+        with self._connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(sql, params)
                 return cur.rowcount > 0
@@ -1049,31 +1256,122 @@ class CadastroManager:
         return self._execute_query("SELECT * FROM usuarios WHERE id = %s", (user_id,), fetch="one")
 
     # --- Chat persistence helpers ---
+    def _chat_cache_key(self, id_processo: str) -> Tuple[Optional[str], str]:
+        return (self.tenant_id if self.multi_tenant else None, str(id_processo))
+
     def save_chat_turn(self, id_processo: str, role: str, content: str):
+        self.save_chat_exchange(id_processo, [(role, content)])
+
+    def save_chat_exchange(self, id_processo: str, turns: List[Tuple[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Grava vários turnos (ex.: pergunta do usuário + resposta) numa única
+        transação e conexão do pool. Retorna os turnos com id/created_at.
+        """
+        if not turns:
+            return []
+        tenant = self.tenant_id if self.multi_tenant else None
+        rows: List[Tuple[Any, ...]]
         if self.multi_tenant:
-            query = "INSERT INTO chat_turns (id_processo, role, content, tenant_id) VALUES (%s,%s,%s,%s)"
-            params = cast(Params, (id_processo, role, content, self.tenant_id))
+            query = "INSERT INTO chat_turns (id_processo, role, content, tenant_id) VALUES %s RETURNING id, role, content, created_at"
+            rows = [(id_processo, role, content, tenant) for role, content in turns]
         else:
-            query = "INSERT INTO chat_turns (id_processo, role, content) VALUES (%s,%s,%s)"
-            params = cast(Params, (id_processo, role, content))
-        self._execute_query(query, params)
+            query = "INSERT INTO chat_turns (id_processo, role, content) VALUES %s RETURNING id, role, content, created_at"
+            rows = [(id_processo, role, content) for role, content in turns]
+        try:
+            with self._connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                    saved = execute_values(cur, query, rows, fetch=True)
+        except Exception as e:
+            logger.error(f"Erro ao gravar turnos do chat: {e}", exc_info=True)
+            raise
+        saved = sorted((dict(r) for r in saved), key=lambda r: r["id"])
+        _chat_cache_append(self._chat_cache_key(id_processo), saved)
+        return saved
+
+    def get_chat_history(self, id_processo: str, limit: int = 50, before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Turnos do chat em ordem cronológica. Paginação por keyset: `before_id`
+        traz os `limit` turnos anteriores ao turno de id informado (use o `id`
+        do primeiro turno da página atual). Usa o índice
+        (tenant_id, id_processo, id); a página mais recente vem do cache.
+        """
+        key = self._chat_cache_key(id_processo)
+        if before_id is None:
+            cached = _chat_cache_get(key, limit)
+            if cached is not None:
+                return cached
+
+        where = "id_processo=%s"
+        params: List[Any] = [id_processo]
+        if self.multi_tenant:
+            where = "tenant_id=%s AND id_processo=%s"
+            params.insert(0, self.tenant_id)
+        if before_id is not None:
+            where += " AND id < %s"
+            params.append(before_id)
+        # Na página mais recente busca o suficiente para preencher o cache
+        fetch_limit = max(limit, CHAT_HISTORY_CACHE_TURNS) if before_id is None else limit
+        params.append(fetch_limit)
+        rows = self._execute_query(
+            "SELECT id, role, content, created_at FROM ("
+            f"SELECT id, role, content, created_at FROM chat_turns WHERE {where} ORDER BY id DESC LIMIT %s"
+            ") t ORDER BY id ASC",
+            cast(Params, tuple(params)), fetch="all"
+        ) or []
+        if before_id is None:
+            _chat_cache_store(key, rows, complete=len(rows) < fetch_limit)
+        return [dict(r) for r in rows[-limit:]] if limit > 0 else []
 
-    def get_chat_history(self, id_processo: str, limit: int = 50) -> List[Dict[str, Any]]:
+    # --- Memória resumida do chat (turnos antigos compactados) ---
+    # Uma memória por conversa: `turns_covered` indexa o histórico daquela
+    # conversa (ex.: a sessão de um usuário), não o do processo.
+    def _chat_memory_where(self, id_processo: str, conversation_id: str) -> Tuple[str, Tuple[Any, ...]]:
         if self.multi_tenant:
-            return self._execute_query(
-                "SELECT role, content, created_at FROM chat_turns WHERE id_processo=%s AND tenant_id=%s ORDER BY id DESC LIMIT %s",
-                (id_processo, self.tenant_id, limit), fetch="all"
-            )[::-1]
+            return (
+                "id_processo=%s AND conversation_id=%s AND tenant_id=%s",
+                (id_processo, conversation_id, self.tenant_id),
+            )
+        return "id_processo=%s AND conversation_id=%s", (id_processo, conversation_id)
+
+    def get_chat_memory(self, id_processo: str, conversation_id: str) -> Optional[Dict[str, Any]]:
+        where, where_params = self._chat_memory_where(id_processo, conversation_id)
         return self._execute_query(
-            "SELECT role, content, created_at FROM chat_turns WHERE id_processo=%s ORDER BY id DESC LIMIT %s",
-            (id_processo, limit), fetch="all"
-        )[::-1]
+            f"SELECT summary, turns_covered, updated_at FROM chat_memory WHERE {where}",
+            where_params, fetch="one"
+        )
+
+    def save_chat_memory(self, id_processo: str, conversation_id: str, summary: str, turns_covered: int):
+        where, where_params = self._chat_memory_where(id_processo, conversation_id)
+        updated = self._execute_query(
+            f"UPDATE chat_memory SET summary=%s, turns_covered=%s, updated_at=NOW() WHERE {where}",
+            cast(Params, (summary, turns_covered, *where_params)),
+        )
+        if not updated:
+            self._execute_query(
+                "INSERT INTO chat_memory (id_processo, conversation_id, summary, turns_covered, tenant_id) "
+                "VALUES (%s,%s,%s,%s,%s)",
+                cast(Params, (id_processo, conversation_id, summary, turns_covered,
+                              self.tenant_id if self.multi_tenant else None)),
+            )
+
+    def clear_chat_memory(self, id_processo: str, conversation_id: str):
+        where, where_params = self._chat_memory_where(id_processo, conversation_id)
+        self._execute_query(f"DELETE FROM chat_memory WHERE {where}", where_params)
 
     # --- Bulk CSV Upload for Multiple Processes ---
-    def bulk_create_processos_from_csv(self, id_cliente: str, csv_content: str) -> Dict[str, Any]:
+    def bulk_create_processos_from_csv(
+        self,
+        id_cliente: str,
+        csv_content: Union[str, TextIO],
+        batch_size: Optional[int] = None,
+    ) -> Dict[str, Any]:
         """
         Cria múltiplos processos a partir de conteúdo CSV.
         
+        `csv_content` pode ser o texto completo ou um stream de texto (ex.: upload
+        decodificado incrementalmente); com `batch_size` as linhas são lidas e
+        inseridas em lotes, sem materializar o arquivo inteiro.
+        
         Formato esperado (com cabeçalho):
         nome_caso,numero_cnj,status,advogado_oab,tipo_parte
         "Processo de Cobrança #1",123456789012345678,ATIVO,OAB123,autor
@@ -1086,19 +1384,19 @@ class CadastroManager:
                 "status": "sucesso" ou "erro",
                 "processos_criados": int,
                 "erros": List[str],
-                "ids_criados": List[str]
+                "ids_criados": List[str],
+                "lotes": int,
+                "tempos": {"validacao_s", "advogados_s", "insercao_s", "total_s"}
             }
         """
         import csv
         from io import StringIO
         
         logger.info(f"Iniciando bulk upload CSV para cliente {id_cliente}")
-        created_count = 0
-        errors = []
-        ids_criados = []
         
         try:
-            reader = csv.DictReader(StringIO(csv_content))
+            stream = StringIO(csv_content) if isinstance(csv_content, str) else csv_content
+            reader = csv.DictReader(stream)
             
             if not reader.fieldnames:
                 return {
@@ -1121,111 +1419,18 @@ class CadastroManager:
                     "ids_criados": []
                 }
             
-            # Processa cada linha
-            for row_num, row in enumerate(reader, start=2):  # start=2 para pular cabeçalho
-                try:
-                    # Extrai e valida dados básicos
-                    nome_caso = (row.get("nome_caso") or "").strip()
-                    numero_cnj = (row.get("numero_cnj") or "").strip()
-                    status = (row.get("status") or "PENDENTE").strip()
-                    advogado_oab = (row.get("advogado_oab") or "").strip()
-                    tipo_parte = (row.get("tipo_parte") or "").strip()
-                    
-                    # Novos campos do Item 1 (DIA 1)
-                    comarca = (row.get("comarca") or "").strip()
-                    vara = (row.get("vara") or "").strip()
-                    juiz_nome = (row.get("juiz_nome") or "").strip()
-                    data_distribuicao = (row.get("data_distribuicao") or "").strip()
-                    data_citacao = (row.get("data_citacao") or "").strip()
-                    data_audiencia = (row.get("data_audiencia") or "").strip()
-                    valor_causa = (row.get("valor_causa") or "").strip()
-                    valor_condenacao = (row.get("valor_condenacao") or "").strip()
-                    tipo_acao = (row.get("tipo_acao") or "").strip()
-                    grau_jurisdicao = (row.get("grau_jurisdicao") or "").strip()
-                    instancia = (row.get("instancia") or "").strip()
-                    observacoes = (row.get("observacoes") or "").strip()
-                    
-                    if not nome_caso:
-                        errors.append(f"Linha {row_num}: nome_caso vazio")
-                        continue
-                    
-                    # Valida tipo_parte se fornecido
-                    valid_tipos = {"autor", "reu", "terceiro", "reclamante", "reclamada"}
-                    if tipo_parte and tipo_parte.lower() not in valid_tipos:
-                        errors.append(f"Linha {row_num}: tipo_parte inválido. Valores válidos: {', '.join(valid_tipos)}")
-                        continue
-                    
-                    # Monta dados do processo (apenas campos com valores)
-                    dados_processo = {
-                        "id_cliente": id_cliente,
-                        "nome_caso": nome_caso,
-                        "status": status if status else "PENDENTE"
-                    }
-                    
-                    # Adiciona campos opcionais apenas se tiverem valores
-                    if numero_cnj:
-                        dados_processo["numero_cnj"] = numero_cnj
-                    if advogado_oab:
-                        dados_processo["advogado_oab"] = advogado_oab
-                    if tipo_parte:
-                        dados_processo["tipo_parte"] = tipo_parte.lower()
-                    if comarca:
-                        dados_processo["comarca"] = comarca
-                    if vara:
-                        dados_processo["vara"] = vara
-                    if juiz_nome:
-                        dados_processo["juiz_nome"] = juiz_nome
-                    if data_distribuicao:
-                        dados_processo["data_distribuicao"] = data_distribuicao
-                    if data_citacao:
-                        dados_processo["data_citacao"] = data_citacao
-                    if data_audiencia:
-                        dados_processo["data_audiencia"] = data_audiencia
-                    if valor_causa:
-                        try:
-                            dados_processo["valor_causa"] = float(valor_causa.replace(',', '.'))
-                        except ValueError:
-                            errors.append(f"Linha {row_num}: valor_causa inválido '{valor_causa}'")
-                            continue
-                    if valor_condenacao:
-                        try:
-                            dados_processo["valor_condenacao"] = float(valor_condenacao.replace(',', '.'))
-                        except ValueError:
-                            errors.append(f"Linha {row_num}: valor_condenacao inválido '{valor_condenacao}'")
-                            continue
-                    if tipo_acao:
-                        dados_processo["tipo_acao"] = tipo_acao
-                    if grau_jurisdicao:
-                        dados_processo["grau_jurisdicao"] = grau_jurisdicao
-                    if instancia:
-                        dados_processo["instancia"] = instancia
-                    if observacoes:
-                        dados_processo["observacoes"] = observacoes
-                    
-                    # Cria processo
-                    proc_id = self.save_processo(dados_processo)
-                    ids_criados.append(proc_id)
-                    created_count += 1
-                    logger.info(f"Processo criado: {proc_id} (linha {row_num})")
-                    
-                except Exception as e:
-                    errors.append(f"Linha {row_num}: {str(e)}")
-                    logger.warning(f"Erro na linha {row_num}: {e}")
-            
-            status_final = "sucesso" if created_count > 0 else "erro"
-            if created_count == 0 and not errors:
-                errors.append("Nenhuma linha válida no CSV")
+            # start=2 para pular cabeçalho
+            return self._bulk_insert_processos(id_cliente, enumerate(reader, start=2), batch_size=batch_size)
             
-            resultado = {
-                "status": status_final,
-                "processos_criados": created_count,
-                "erros": errors,
-                "ids_criados": ids_criados
+        except UnicodeDecodeError as e:
+            logger.warning(f"CSV de bulk upload não está em UTF-8: {e}")
+            return {
+                "status": "erro",
+                "mensagem": "Arquivo CSV não está em UTF-8",
+                "processos_criados": 0,
+                "erros": [str(e)],
+                "ids_criados": []
             }
-            
-            logger.info(f"Bulk upload concluído: {created_count} processos criados, {len(errors)} erros")
-            return resultado
-            
         except Exception as e:
             logger.error(f"Erro geral ao processar CSV: {e}", exc_info=True)
             return {
@@ -1235,3 +1440,285 @@ class CadastroManager:
                 "erros": [str(e)],
                 "ids_criados": []
             }
+
+    def _linha_csv_para_processo(self, id_cliente: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Converte uma linha do CSV de bulk upload em dados de processo (ValueError se inválida)."""
+        # Extrai e valida dados básicos
+        nome_caso = (row.get("nome_caso") or "").strip()
+        numero_cnj = (row.get("numero_cnj") or "").strip()
+        status = (row.get("status") or "PENDENTE").strip()
+        advogado_oab = (row.get("advogado_oab") or "").strip()
+        tipo_parte = (row.get("tipo_parte") or "").strip()
+
+        # Novos campos do Item 1 (DIA 1)
+        comarca = (row.get("comarca") or "").strip()
+        vara = (row.get("vara") or "").strip()
+        juiz_nome = (row.get("juiz_nome") or "").strip()
+        data_distribuicao = (row.get("data_distribuicao") or "").strip()
+        data_citacao = (row.get("data_citacao") or "").strip()
+        data_audiencia = (row.get("data_audiencia") or "").strip()
+        valor_causa = (row.get("valor_causa") or "").strip()
+        valor_condenacao = (row.get("valor_condenacao") or "").strip()
+        tipo_acao = (row.get("tipo_acao") or "").strip()
+        grau_jurisdicao = (row.get("grau_jurisdicao") or "").strip()
+        instancia = (row.get("instancia") or "").strip()
+        observacoes = (row.get("observacoes") or "").strip()
+
+        if not nome_caso:
+            raise ValueError("nome_caso vazio")
+
+        # Valida tipo_parte se fornecido
+        valid_tipos = {"autor", "reu", "terceiro", "reclamante", "reclamada"}
+        if tipo_parte and tipo_parte.lower() not in valid_tipos:
+            raise ValueError(f"tipo_parte inválido. Valores válidos: {', '.join(valid_tipos)}")
+
+        # Monta dados do processo (apenas campos com valores)
+        dados_processo = {
+            "id_cliente": id_cliente,
+            "nome_caso": nome_caso,
+            "status": status if status else "PENDENTE"
+        }
+
+        # Adiciona campos opcionais apenas se tiverem valores
+        if numero_cnj:
+            dados_processo["numero_cnj"] = numero_cnj
+        if advogado_oab:
+            dados_processo["advogado_oab"] = advogado_oab
+        if tipo_parte:
+            dados_processo["tipo_parte"] = tipo_parte.lower()
+        if comarca:
+            dados_processo["comarca"] = comarca
+        if vara:
+            dados_processo["vara"] = vara
+        if juiz_nome:
+            dados_processo["juiz_nome"] = juiz_nome
+        if data_distribuicao:
+            dados_processo["data_distribuicao"] = data_distribuicao
+        if data_citacao:
+            dados_processo["data_citacao"] = data_citacao
+        if data_audiencia:
+            dados_processo["data_audiencia"] = data_audiencia
+        if valor_causa:
+            try:
+                dados_processo["valor_causa"] = float(valor_causa.replace(',', '.'))
+            except ValueError:
+                raise ValueError(f"valor_causa inválido '{valor_causa}'")
+        if valor_condenacao:
+            try:
+                dados_processo["valor_condenacao"] = float(valor_condenacao.replace(',', '.'))
+            except ValueError:
+                raise ValueError(f"valor_condenacao inválido '{valor_condenacao}'")
+        if tipo_acao:
+            dados_processo["tipo_acao"] = tipo_acao
+        if grau_jurisdicao:
+            dados_processo["grau_jurisdicao"] = grau_jurisdicao
+        if instancia:
+            dados_processo["instancia"] = instancia
+        if observacoes:
+            dados_processo["observacoes"] = observacoes
+
+        return dados_processo
+
+    def _advogados_existentes(self, oabs: set) -> set:
+        """Resolve, em UMA query, quais OABs existem na tabela advogados."""
+        if not oabs:
+            return set()
+        if self.multi_tenant:
+            rows = self._execute_query(
+                "SELECT oab FROM advogados WHERE oab = ANY(%s) AND tenant_id = %s",
+                (list(oabs), self.tenant_id), fetch="all"
+            )
+        else:
+            rows = self._execute_query(
+                "SELECT oab FROM advogados WHERE oab = ANY(%s)",
+                (list(oabs),), fetch="all"
+            )
+        return {r["oab"] for r in rows or []}
+
+    def _bulk_insert_processos(self, id_cliente: str, linhas, batch_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Caminho set-based do bulk upload. As linhas são consumidas em lotes de
+        `batch_size` (None = arquivo inteiro em um único lote), de modo que a
+        memória fica limitada ao tamanho do lote mesmo para arquivos grandes.
+        Cada lote é validado em memória, resolve os advogados com uma única
+        query e é inserido em uma única transação (ver _bulk_insert_lote).
+        """
+        t_inicio = time.perf_counter()
+        tempos = {"validacao_s": 0.0, "advogados_s": 0.0, "insercao_s": 0.0}
+        inseridos: List[Tuple[int, str]] = []
+        erros: List[Tuple[int, str]] = []
+        erros_gerais: List[str] = []
+        advogados_conhecidos: Dict[str, bool] = {}
+        lotes = 0
+        ultima_linha = 1  # cabeçalho
+        interrompido = False
+
+        linhas = iter(linhas)
+        while True:
+            try:
+                lote = list(islice(linhas, batch_size)) if batch_size else list(linhas)
+            except UnicodeDecodeError as e:
+                # Lotes anteriores já foram gravados: a importação fica parcial
+                interrompido = True
+                erros_gerais.append(
+                    f"Arquivo CSV não está em UTF-8: leitura interrompida após a linha {ultima_linha} "
+                    f"(linhas seguintes não importadas): {e}"
+                )
+                break
+            if not lote:
+                break
+            lotes += 1
+            ultima_linha = lote[-1][0]
+            ins, errs = self._bulk_insert_lote(id_cliente, lote, advogados_conhecidos, tempos)
+            inseridos.extend(ins)
+            erros.extend(errs)
+            if not batch_size:
+                break
+
+        ids_criados = [id_processo for _, id_processo in inseridos]
+        erros.sort(key=lambda item: item[0])
+        errors = erros_gerais + [f"Linha {row_num}: {msg}" for row_num, msg in erros]
+        created_count = len(ids_criados)
+        for row_num, msg in erros:
+            logger.warning(f"Erro na linha {row_num}: {msg}")
+
+        if created_count == 0 and not errors:
+            errors.append("Nenhuma linha válida no CSV")
+
+        tempos = {k: round(v, 4) for k, v in tempos.items()}
+        tempos["total_s"] = round(time.perf_counter() - t_inicio, 4)
+        if interrompido:
+            status = "parcial" if created_count > 0 else "erro"
+        else:
+            status = "sucesso" if created_count > 0 else "erro"
+        resultado = {
+            "status": status,
+            "processos_criados": created_count,
+            "erros": errors,
+            "ids_criados": ids_criados,
+            "lotes": lotes,
+            "tempos": tempos,
+        }
+        logger.info(
+            f"Bulk upload concluído: {created_count} processos criados, {len(errors)} erros, "
+            f"{lotes} lote(s) em {tempos['total_s']}s"
+        )
+        return resultado
+
+    def _bulk_insert_lote(
+        self,
+        id_cliente: str,
+        linhas: List[Tuple[int, Dict[str, Any]]],
+        advogados_conhecidos: Dict[str, bool],
+        tempos: Dict[str, float],
+    ) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]]]:
+        """
+        Insere um lote de linhas do CSV: valida tudo em memória, resolve as OABs
+        ainda desconhecidas com uma única query e grava o lote em uma transação
+        via execute_values. Se alguma linha violar restrição do banco, refaz a
+        inserção linha a linha com SAVEPOINT para reportar o erro exato sem
+        perder as demais. Retorna (inseridos, erros) como (linha, valor).
+        """
+        t_inicio = time.perf_counter()
+        erros: List[Tuple[int, str]] = []
+        registros: List[Tuple[int, Dict[str, Any]]] = []
+        hoje = datetime.now().strftime("%Y-%m-%d")
+        ids_usados: set = set()
+
+        # 1) Parse + validação (sem tocar no banco)
+        for row_num, row in linhas:
+            try:
+                dados = self._linha_csv_para_processo(id_cliente, row)
+                campos = self._normalizar_campos_processo(dados)
+            except Exception as e:
+                erros.append((row_num, str(e)))
+                continue
+
+            id_processo = f"caso_{str(uuid.uuid4())[:8]}"
+            while id_processo in ids_usados:
+                id_processo = f"caso_{str(uuid.uuid4())[:8]}"
+            ids_usados.add(id_processo)
+
+            registro: Dict[str, Any] = {
+                "id_processo": id_processo,
+                "id_cliente": id_cliente,
+                "nome_caso": dados.get("nome_caso"),
+                "status": dados.get("status", "PENDENTE"),
+                "data_inicio": hoje,
+            }
+            opcionais = {
+                "numero_cnj": dados.get("numero_cnj"),
+                "local_tramite": dados.get("local_tramite"),
+                "comarca": dados.get("comarca"),
+                "assunto": dados.get("assunto"),
+                "sentenca": dados.get("sentenca"),
+                "advogado_oab": dados.get("advogado_oab"),
+                **campos,
+            }
+            registro.update({k: v for k, v in opcionais.items() if v is not None})
+            registros.append((row_num, registro))
+        t_validacao = time.perf_counter()
+
+        # 2) Advogados: uma única query para as OABs ainda não vistas
+        oabs = {r["advogado_oab"] for _, r in registros if r.get("advogado_oab")}
+        novas = oabs - set(advogados_conhecidos)
+        if novas:
+            try:
+                existentes = self._advogados_existentes(novas)
+            except Exception as e:
+                logger.warning(f"Erro ao verificar advogados do bulk: {e}")
+                existentes = set()
+            for oab in sorted(novas):
+                advogados_conhecidos[oab] = oab in existentes
+                if oab not in existentes:
+                    logger.warning(f"Advogado OAB {oab} não encontrado, processos serão criados sem advogado")
+        for _, r in registros:
+            if r.get("advogado_oab") and not advogados_conhecidos.get(r["advogado_oab"]):
+                del r["advogado_oab"]
+            if self.multi_tenant:
+                r["tenant_id"] = self.tenant_id
+        t_advogados = time.perf_counter()
+
+        # 3) Inserção em uma transação. Linhas com o mesmo conjunto de colunas
+        #    vão no mesmo execute_values (preserva DEFAULTs das colunas omitidas).
+        grupos: Dict[Tuple[str, ...], List[Tuple[int, Dict[str, Any]]]] = {}
+        for row_num, r in registros:
+            grupos.setdefault(tuple(r.keys()), []).append((row_num, r))
+
+        inseridos: List[Tuple[int, str]] = []
+        if registros:
+            try:
+                with self._connection() as conn:
+                    with conn.cursor() as cur:
+                        for colunas, itens in grupos.items():
+                            execute_values(
+                                cur,
+                                f"INSERT INTO processos ({','.join(colunas)}) VALUES %s",
+                                [tuple(r[c] for c in colunas) for _, r in itens],
+                                page_size=1000,
+                            )
+                inseridos = [(row_num, r["id_processo"]) for row_num, r in registros]
+            except psycopg2.Error as e:
+                logger.warning(f"Bulk insert em lote falhou ({e}); refazendo linha a linha com SAVEPOINT")
+                with self._connection() as conn:
+                    with conn.cursor() as cur:
+                        for row_num, r in sorted(registros, key=lambda item: item[0]):
+                            colunas = tuple(r.keys())
+                            cur.execute("SAVEPOINT bulk_linha")
+                            try:
+                                cur.execute(
+                                    f"INSERT INTO processos ({','.join(colunas)}) VALUES ({','.join(['%s'] * len(colunas))})",
+                                    tuple(r[c] for c in colunas),
+                                )
+                                cur.execute("RELEASE SAVEPOINT bulk_linha")
+                                inseridos.append((row_num, r["id_processo"]))
+                            except psycopg2.Error as e_linha:
+                                cur.execute("ROLLBACK TO SAVEPOINT bulk_linha")
+                                erros.append((row_num, str(e_linha).strip()))
+        t_insercao = time.perf_counter()
+
+        tempos["validacao_s"] += t_validacao - t_inicio
+        tempos["advogados_s"] += t_advogados - t_validacao
+        tempos["insercao_s"] += t_insercao - t_advogados
+        inseridos.sort(key=lambda item: item[0])
+        return inseridos, erros
@@ -0,0 +1,132 @@
+# case_manifest.py
+"""
+Manifesto de documentos de um caso (cases/<tenant>/<case_id>/manifest.json).
+
+Mantido a cada ingestão/deleção no vector store do caso, com
+source -> {type, chunk_count, checksum}. A listagem de documentos e o digest
+usado pelo cache de resumo passam a ler este arquivo pequeno, em vez de
+puxar os metadados de todos os chunks do Chroma.
+
+Leitura-alteração-gravação sob flock num arquivo ao lado (manifest.json.lock):
+uploads simultâneos em workers diferentes não perdem a soma um do outro.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+fcntl: Optional[ModuleType]
+try:  # lock entre processos (indisponível no Windows)
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+class CaseManifest:
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Exclusivo entre threads (Lock) e entre processos (flock no .lock ao lado)."""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path.with_name(f"{self.path.name}.lock"), "a") as fh:
+                fcntl.flock(fh, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _read(self) -> Optional[Dict[str, Any]]:
+        if not self.path.exists():
+            return None
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"Manifesto do caso ilegível ({self.path}): {e}")
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return data
+
+    def _write(self, documents: Dict[str, Dict[str, Any]]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(
+            json.dumps({"version": MANIFEST_VERSION, "updated_at": time.time(), "documents": documents},
+                       ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.path)
+
+    def exists(self) -> bool:
+        return self._read() is not None
+
+    def documents(self) -> Optional[List[Dict[str, Any]]]:
+        """Documentos do caso, ou None se o manifesto ainda não existe (caso legado)."""
+        data = self._read()
+        if data is None:
+            return None
+        return [{"source": source, **info} for source, info in data.get("documents", {}).items()]
+
+    def record_chunks(self, source: Optional[str], doc_type: Optional[str], chunk_count: int, checksum: Optional[str] = None) -> None:
+        """Soma `chunk_count` chunks ao documento `source` (chamado após inserir no Chroma)."""
+        if not source or chunk_count <= 0:
+            return
+        with self._locked():
+            data = self._read()
+            if data is None:
+                # Sem manifesto não há base confiável para somar; a próxima
+                # listagem reconstrói a partir do vector store.
+                return
+            documents = data.get("documents", {})
+            entry = documents.setdefault(source, {"type": doc_type or "N/A", "chunk_count": 0, "checksum": None})
+            entry["chunk_count"] += chunk_count
+            if checksum:
+                entry["checksum"] = checksum
+            self._write(documents)
+
+    def remove(self, source: str) -> None:
+        with self._locked():
+            data = self._read()
+            if data is None:
+                return
+            documents = data.get("documents", {})
+            if documents.pop(source, None) is not None:
+                self._write(documents)
+
+    def rebuild(self, documents: Iterable[Dict[str, Any]]) -> None:
+        """Recria o manifesto a partir de uma varredura completa do vector store."""
+        with self._locked():
+            self._write({
+                d["source"]: {
+                    "type": d.get("type", "N/A"),
+                    "chunk_count": int(d.get("chunk_count", 0)),
+                    "checksum": d.get("checksum"),
+                }
+                for d in documents
+                if d.get("source")
+            })
+
+    @staticmethod
+    def digest(documents: List[Dict[str, Any]]) -> str:
+        """Mesmo formato do digest anterior (source:chunk_count), para manter caches válidos."""
+        if not documents:
+            return "no_docs"
+        key = "|".join(sorted(f"{d.get('source')}:{d.get('chunk_count')}" for d in documents))
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
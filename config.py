@@ -15,6 +15,8 @@ class BaseConfig:
     DB_NAME = os.getenv("DB_NAME", "advocacia_ia_prod")
     DB_USER = os.getenv("DB_USER", "postgres")
     DB_PASSWORD = os.getenv("DB_PASSWORD", "probe365")
+    # Pool de conexões do CadastroManager: DB_POOL_MIN/MAX/TIMEOUT são lidos
+    # direto do ambiente por cadastro_manager (também usado fora do app, em scripts)
 
     # Flask-SQLAlchemy (apenas para o `db` usado pelo Flask-Migrate)
     SQLALCHEMY_DATABASE_URI = os.getenv(
@@ -31,12 +33,71 @@ class BaseConfig:
     DEFAULT_TENANT_ID = os.getenv("DEFAULT_TENANT_ID", "public")
     METRICS_ENABLED = True
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    # Máximo de Pipelines (visões por caso) mantidos em memória por worker
+    PIPELINE_CACHE_SIZE = int(os.getenv("PIPELINE_CACHE_SIZE", 32))
+    # Linhas por lote/transação no bulk upload de processos via CSV
+    BULK_CSV_BATCH_SIZE = int(os.getenv("BULK_CSV_BATCH_SIZE", 1000))
+    # Fila de ingestão em background: INGESTION_JOBS_DB, INGESTION_WORKERS,
+    # INGESTION_HEARTBEAT_S e INGESTION_STALE_S
+    # são lidos direto do ambiente por app/services/ingestion_jobs
+    # Extração de PDF por página em pool de processos (lidos por utils_arq)
+    PDF_WORKERS = int(os.getenv("PDF_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+    PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", 8))
+    # Cache de extração por SHA-256 (texto, chunks, entidades, vetores), compartilhado entre casos
+    EXTRACTION_CACHE_DIR = os.getenv("EXTRACTION_CACHE_DIR", "cases/_extraction_cache")
+    # Cache persistente de embeddings (OpenAIEmbeddings) com eviction LRU
+    EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "data/cache/embeddings.sqlite3")
+    EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+    # Cache semântico de respostas do LLM (chat, riscos, próximos passos)
+    SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+    SEMANTIC_CACHE_DB = os.getenv("SEMANTIC_CACHE_DB", "data/cache/semantic_responses.sqlite3")
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+    SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", 604800))
+    SEMANTIC_CACHE_MAX_PER_SCOPE = int(os.getenv("SEMANTIC_CACHE_MAX_PER_SCOPE", 200))
+    # Cache de artefatos de análise por caso (resumo, riscos, próximos passos)
+    ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", 20 * 1024 * 1024))
+    # Timeout (s) de cada seção da petição gerada em paralelo (lido por petition_module)
+    PETITION_SECTION_TIMEOUT = float(os.getenv("PETITION_SECTION_TIMEOUT", 60))
+    # Orçamento de tokens do chat (lidos por context_builder) e do contexto de análises
+    CHAT_PROMPT_BUDGET = int(os.getenv("CHAT_PROMPT_BUDGET", 6000))
+    CHAT_HISTORY_SHARE = float(os.getenv("CHAT_HISTORY_SHARE", 0.3))
+    CHAT_MEMORY_MAX_TOKENS = int(os.getenv("CHAT_MEMORY_MAX_TOKENS", 500))
+    COLLECT_CONTEXT_MAX_TOKENS = int(os.getenv("COLLECT_CONTEXT_MAX_TOKENS", 3000))
+    CHAT_HISTORY_CACHE_TURNS = int(os.getenv("CHAT_HISTORY_CACHE_TURNS", 50))
+    CHAT_HISTORY_CACHE_CASES = int(os.getenv("CHAT_HISTORY_CACHE_CASES", 256))
+    CHAT_HISTORY_CACHE_TTL = float(os.getenv("CHAT_HISTORY_CACHE_TTL", 60))
 
     # ---- Config de EMENTAS / FAISS ----
     EMENTAS_EMB_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     # pode ajustar esses paths depois, mas os atributos precisam existir:
     EMENTAS_INDEX_PATH = "data/ementas/faiss.index"
     EMENTAS_STORE_PATH = "data/ementas/store"
+    # Tipo de índice para bases novas (flat | hnsw; ivf/ivfpq/opqpq via script) e parâmetros de consulta
+    EMENTAS_INDEX_TYPE = os.getenv("EMENTAS_INDEX_TYPE", "flat")
+    EMENTAS_HNSW_M = int(os.getenv("EMENTAS_HNSW_M", 32))
+    # nprobe/efSearch: só sobrescrevem o valor gravado no índice quando definidos
+    EMENTAS_NPROBE = os.getenv("EMENTAS_NPROBE")
+    EMENTAS_EF_SEARCH = os.getenv("EMENTAS_EF_SEARCH")
+    # Índice versionado (versions/ + CURRENT) lido pelo EmentasIndexService
+    EMENTAS_FAISS_ROOT = os.getenv("EMENTAS_FAISS_ROOT", "data/store/ementas_faiss")
+    EMENTAS_KEEP_VERSIONS = int(os.getenv("EMENTAS_KEEP_VERSIONS", 3))
+    # Intervalo (s) entre conferências do ponteiro CURRENT (troca a quente)
+    EMENTAS_RELOAD_CHECK_S = float(os.getenv("EMENTAS_RELOAD_CHECK_S", 2.0))
+    # Upsert/deleção via WAL: compacta quando o delta passa de max(MIN_OPS, RATIO * ntotal)
+    EMENTAS_COMPACT_MIN_OPS = int(os.getenv("EMENTAS_COMPACT_MIN_OPS", 1000))
+    EMENTAS_COMPACT_RATIO = float(os.getenv("EMENTAS_COMPACT_RATIO", 0.1))
+    EMENTAS_WAL_FSYNC = os.getenv("EMENTAS_WAL_FSYNC", "1") == "1"
+    # Endpoints de busca em lote (ementas e /api/search_similar_batch; lidos por app/utils/search_limits)
+    EMENTAS_SEARCH_MAX_BATCH = int(os.getenv("EMENTAS_SEARCH_MAX_BATCH", 64))
+    SEARCH_MAX_K = int(os.getenv("SEARCH_MAX_K", 50))
+    # Busca nas ementas: dense | lexical | hybrid (vetores + BM25 fundidos por RRF)
+    EMENTAS_SEARCH_MODE = os.getenv("EMENTAS_SEARCH_MODE", "dense")
+    EMENTAS_HYBRID_FETCH_K = int(os.getenv("EMENTAS_HYBRID_FETCH_K", 50))
+    # Retrievers híbridos do Pipeline (chunks do caso, KB, KB de ementas; lidos por hybrid_retriever)
+    HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+    HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", 20))
+    HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+    LEXICAL_SYNC_S = float(os.getenv("LEXICAL_SYNC_S", 5.0))
 
 
 class DevelopmentConfig(BaseConfig):
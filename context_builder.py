@@ -0,0 +1,178 @@
+# context_builder.py
+"""
+Montagem de contexto do chat com orçamento de tokens (tiktoken).
+
+O orçamento do prompt é dividido entre: prompt de sistema + pergunta (fixos),
+memória resumida das conversas antigas, histórico recente (verbatim) e
+trechos recuperados (deduplicados e na ordem de relevância do retriever).
+O que sobra de uma parte passa para os trechos recuperados.
+"""
+import os
+import re
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Orçamento total do prompt e fração máxima para o histórico verbatim
+CHAT_PROMPT_BUDGET = int(os.getenv("CHAT_PROMPT_BUDGET", "6000"))
+CHAT_HISTORY_SHARE = float(os.getenv("CHAT_HISTORY_SHARE", "0.3"))
+CHAT_MEMORY_MAX_TOKENS = int(os.getenv("CHAT_MEMORY_MAX_TOKENS", "500"))
+
+
+@lru_cache(maxsize=4)
+def _encoding(model: str):
+    import tiktoken
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    if not text:
+        return 0
+    return len(_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = "gpt-4o") -> str:
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _encoding(model)
+    tokens = enc.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return enc.decode(tokens[:max_tokens])
+
+
+def _fingerprint(text: str) -> str:
+    return hashlib.sha1(re.sub(r"\s+", " ", text).strip().lower().encode("utf-8")).hexdigest()
+
+
+def rank_chunks(*ranked_lists: Sequence[str]) -> Tuple[List[str], int]:
+    """
+    Intercala listas já ordenadas por relevância (caso, KB...) pela posição
+    e remove duplicados (mesmo texto normalizado). Retorna (trechos, duplicados).
+    """
+    seen = set()
+    out: List[str] = []
+    dups = 0
+    for i in range(max((len(lst) for lst in ranked_lists), default=0)):
+        for lst in ranked_lists:
+            if i >= len(lst) or not lst[i].strip():
+                continue
+            fp = _fingerprint(lst[i])
+            if fp in seen:
+                dups += 1
+                continue
+            seen.add(fp)
+            out.append(lst[i])
+    return out, dups
+
+
+def fit_chunks(chunks: Sequence[str], max_tokens: int, model: str = "gpt-4o",
+               separator: str = "\n\n") -> Tuple[List[str], int]:
+    """Trechos (em ordem) que cabem em `max_tokens`; retorna (trechos, tokens usados)."""
+    used = 0
+    sep_tokens = count_tokens(separator, model)
+    out: List[str] = []
+    for chunk in chunks:
+        n = count_tokens(chunk, model) + (sep_tokens if out else 0)
+        if used + n > max_tokens:
+            # Corta o primeiro trecho que não cabe, se ainda houver espaço razoável
+            restante = max_tokens - used - (sep_tokens if out else 0)
+            if restante > 100:
+                out.append(truncate_to_tokens(chunk, restante, model))
+                used = max_tokens
+            break
+        out.append(chunk)
+        used += n
+    return out, used
+
+
+def _format_turn(msg: Dict[str, str]) -> str:
+    return f"{msg.get('role', 'user').upper()}: {msg.get('content', '')}\n"
+
+
+class ChatContext:
+    """Resultado da montagem: prompt final, turnos que transbordaram e estatísticas."""
+
+    def __init__(self, prompt: str, overflow_turns: List[Dict[str, str]], stats: Dict[str, Any]):
+        self.prompt = prompt
+        self.overflow_turns = overflow_turns
+        self.stats = stats
+
+
+class ChatContextBuilder:
+    def __init__(self, budget: int = CHAT_PROMPT_BUDGET, history_share: float = CHAT_HISTORY_SHARE,
+                 memory_max_tokens: int = CHAT_MEMORY_MAX_TOKENS, model: str = "gpt-4o"):
+        self.budget = budget
+        self.history_share = history_share
+        self.memory_max_tokens = memory_max_tokens
+        self.model = model
+
+    def build(
+        self,
+        system_template: str,
+        user_query: str,
+        ranked_chunks: Sequence[Sequence[str]],
+        history: List[Dict[str, str]],
+        memory: Optional[str] = None,
+    ) -> ChatContext:
+        """
+        `system_template` deve conter {context}. `history` são os turnos ainda
+        não resumidos (do mais antigo ao mais recente); os mais antigos que não
+        couberem voltam em `overflow_turns` para serem compactados na memória.
+        """
+        tail = f"USUÁRIO: {user_query}\nASSISTENTE:"
+        fixed = count_tokens(system_template.replace("{context}", ""), self.model) + count_tokens(tail, self.model) + 20
+        available = max(0, self.budget - fixed)
+
+        memory_text = truncate_to_tokens(memory or "", self.memory_max_tokens, self.model)
+        memory_tokens = count_tokens(memory_text, self.model)
+        available -= memory_tokens
+
+        # Histórico recente: do mais novo para o mais antigo até o limite
+        history_budget = int(available * self.history_share)
+        kept: List[Dict[str, str]] = []
+        history_tokens = 0
+        for msg in reversed(history):
+            n = count_tokens(_format_turn(msg), self.model)
+            if history_tokens + n > history_budget:
+                break
+            kept.insert(0, msg)
+            history_tokens += n
+        overflow = history[: len(history) - len(kept)]
+
+        chunks, dups = rank_chunks(*ranked_chunks)
+        context_chunks, context_tokens = fit_chunks(chunks, available - history_tokens, self.model)
+        context_text = "\n\n".join(context_chunks) or "(Sem contexto recuperado para esta pergunta.)"
+
+        history_str = ""
+        if memory_text:
+            history_str += f"RESUMO DA CONVERSA ANTERIOR:\n{memory_text}\n\n"
+        history_str += "".join(_format_turn(m) for m in kept)
+
+        prompt = (
+            system_template.format(context=context_text)
+            + "\n\n"
+            + "HISTÓRICO DO CHAT:\n"
+            + history_str
+            + "\n\n"
+            + tail
+        )
+        stats = {
+            "budget": self.budget,
+            "prompt_tokens": count_tokens(prompt, self.model),
+            "context_tokens": context_tokens,
+            "history_tokens": history_tokens,
+            "memory_tokens": memory_tokens,
+            "chunks_used": len(context_chunks),
+            "chunks_dropped": len(chunks) - len(context_chunks),
+            "chunks_duplicated": dups,
+            "turns_verbatim": len(kept),
+            "turns_overflow": len(overflow),
+        }
+        return ChatContext(prompt, overflow, stats)
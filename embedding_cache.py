@@ -0,0 +1,204 @@
+# embedding_cache.py
+"""
+Cache persistente de embeddings (SQLite) na frente do OpenAIEmbeddings.
+
+Chave = sha256(modelo + texto). Perguntas repetidas do chat, as consultas
+fixas de resumo/FIRAC e chunks reingeridos deixam de ir à API. As buscas
+são feitas em lote (um SELECT para todos os textos de embed_documents) e
+só os textos ausentes são enviados ao modelo, numa única chamada.
+O tamanho é limitado por EMBEDDING_CACHE_MAX_ENTRIES, evictando os
+vetores usados há mais tempo.
+"""
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "data/cache/embeddings.sqlite3"
+DEFAULT_MAX_ENTRIES = 200_000
+
+# Limite de parâmetros por SELECT ... IN (...) (SQLite antigo: 999)
+_LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> List[float]:
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec.tolist()
+
+
+class EmbeddingCache:
+    """Armazenamento (texto, modelo) -> vetor com contadores e eviction LRU."""
+
+    def __init__(self, db_path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max(1, int(max_entries))
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            self._size = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:  # commit/rollback
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Vetores na ordem de `texts` (None para os ausentes)."""
+        keys = [self.key(model, t) for t in texts]
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._connect() as conn:
+            for i in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[i:i + _LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                for k, blob in conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch):
+                    found[k] = _unpack(blob)
+            if found:
+                agora = time.time()
+                conn.executemany("UPDATE embeddings SET last_used=? WHERE key=?", [(agora, k) for k in found])
+        result = [found.get(k) for k in keys]
+        hits = sum(1 for v in result if v is not None)
+        with self._lock:
+            self.stats["hits"] += hits
+            self.stats["misses"] += len(result) - hits
+        return result
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        agora = time.time()
+        rows = [(self.key(model, t), model, len(v), _pack(v), agora, agora) for t, v in zip(texts, vectors)]
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, model, dim, vector, created_at, last_used) VALUES (?,?,?,?,?,?)",
+                rows,
+            )
+            inserted = conn.total_changes - before
+        with self._lock:
+            self.stats["writes"] += inserted
+            self._size += inserted
+            excess = self._size - self.max_entries
+        if excess > 0:
+            self._evict(excess)
+
+    def _evict(self, excess: int) -> None:
+        # Remove 10% a mais para não evictar a cada inserção
+        n = excess + self.max_entries // 10
+        with self._connect() as conn:
+            before = conn.total_changes
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (n,),
+            )
+            removed = conn.total_changes - before
+        with self._lock:
+            self._size -= removed
+            self.stats["evictions"] += removed
+        logger.info(f"Cache de embeddings: {removed} vetores evictados (LRU).")
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            data: Dict[str, object] = dict(self.stats)
+            data["size"] = self._size
+        total = data["hits"] + data["misses"]  # type: ignore[operator]
+        data["hit_rate"] = round(data["hits"] / total, 4) if total else 0.0  # type: ignore[operator]
+        data["max_entries"] = self.max_entries
+        return data
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings do LangChain com cache: usado como embedding_function dos
+    Chroma do Pipeline no lugar do OpenAIEmbeddings "puro".
+    """
+
+    def __init__(self, base_embeddings: Embeddings, cache: EmbeddingCache):
+        self.base_embeddings = base_embeddings
+        self.cache = cache
+        self.model = getattr(base_embeddings, "model", type(base_embeddings).__name__)
+
+    @property
+    def _cache_model(self) -> str:
+        return f"{type(self.base_embeddings).__name__}:{self.model}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        vectors = self.cache.get_many(self._cache_model, texts)
+        missing_idx = [i for i, v in enumerate(vectors) if v is None]
+        if missing_idx:
+            # Textos repetidos no mesmo lote são embedados uma única vez
+            pending = list(dict.fromkeys(texts[i] for i in missing_idx))
+            computed = dict(zip(pending, self.base_embeddings.embed_documents(pending)))
+            for i in missing_idx:
+                vectors[i] = computed[texts[i]]
+            self.cache.put_many(self._cache_model, pending, [computed[t] for t in pending])
+        return vectors  # type: ignore[return-value]
+
+    def embed_query(self, text: str) -> List[float]:
+        cached = self.cache.get_many(self._cache_model, [text])[0]
+        if cached is not None:
+            return cached
+        vector = self.base_embeddings.embed_query(text)
+        self.cache.put_many(self._cache_model, [text], [vector])
+        return vector
+
+
+_CACHE: Optional[EmbeddingCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Cache do processo (EMBEDDING_CACHE_DB / EMBEDDING_CACHE_MAX_ENTRIES)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = EmbeddingCache(
+                    Path(os.getenv("EMBEDDING_CACHE_DB", DEFAULT_DB_PATH)),
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                )
+    return _CACHE
+
+
+def embedding_cache_stats() -> Dict[str, object]:
+    """Estatísticas do cache, sem criá-lo (vazio se ainda não usado)."""
+    return _CACHE.snapshot() if _CACHE is not None else {}
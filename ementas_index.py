@@ -0,0 +1,389 @@
+# ementas_index.py
+"""
+Layout versionado das bases de ementas + encoder compartilhado.
+
+Cada base (raiz) guarda versões imutáveis e um ponteiro para a atual:
+
+    <raiz>/versions/<versão>/index.faiss
+                            /meta.jsonl     (uma linha por linha do FAISS)
+                            /meta.offsets   (uint64 LE: byte inicial de cada linha)
+                            /meta.ids       (int64 LE, opcional: id estável de cada linha)
+                            /manifest.json  (modelo, dimensão, ntotal, tipo de índice...)
+                            /lexical.npz    (BM25 das linhas, gerado na publicação)
+    <raiz>/wal/<versão>.wal                 (upserts/deleções desde a versão, só append)
+    <raiz>/CURRENT                          (nome da versão publicada)
+
+`publish_version` grava a versão numa pasta temporária, renomeia e troca o
+CURRENT com os.replace: leitores nunca veem uma versão pela metade e os
+workers trocam de índice sem reiniciar (ver app/services/ementas_index_service.py).
+O script de indexação e o app usam o mesmo módulo.
+
+Bases com ids estáveis (IndexIDMap2) recebem alterações no WAL da versão
+atual em vez de regravar o índice; a compactação junta WAL + versão numa
+nova versão e o WAL recomeça vazio.
+"""
+import os
+import json
+import time
+import zlib
+import shutil
+import struct
+import hashlib
+import logging
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import faiss
+
+from lexical_index import LEXICAL_FILE, BM25Index
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_KEEP_VERSIONS = 3
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+INDEX_FILE = "index.faiss"
+META_FILE = "meta.jsonl"
+OFFSETS_FILE = "meta.offsets"
+IDS_FILE = "meta.ids"
+MANIFEST_FILE = "manifest.json"
+WAL_DIR = "wal"
+
+OFFSET_DTYPE = np.dtype("<u8")
+ID_DTYPE = np.dtype("<i8")
+
+
+# Campos dos metadados que entram no índice lexical (BM25)
+LEXICAL_FIELDS = ("title", "text")
+
+
+def lexical_text(record: Optional[Dict[str, Any]]) -> str:
+    return " ".join(str((record or {}).get(f) or "") for f in LEXICAL_FIELDS)
+
+
+def build_lexical(keys: Sequence[Any], records: Iterable[Optional[Dict[str, Any]]]) -> BM25Index:
+    """BM25 de uma versão: chave = id estável (ou a linha, em bases posicionais)."""
+    index = BM25Index()
+    index.add(list(keys), [lexical_text(r) for r in records])
+    return index
+
+
+def lexical_path(root: Path, version: str) -> Path:
+    return version_dir(root, version) / LEXICAL_FILE
+
+
+def build_version_lexical(vdir: Path) -> BM25Index:
+    """BM25 a partir dos metadados gravados numa pasta de versão (meta.jsonl + meta.ids)."""
+    ids_path = vdir / IDS_FILE
+    ids = np.fromfile(ids_path, dtype=ID_DTYPE).tolist() if ids_path.exists() else None
+    with open(vdir / META_FILE, "r", encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return build_lexical(ids if ids is not None else range(len(records)), records)
+
+
+def doc_key(doc_id: str) -> int:
+    """Id FAISS estável (63 bits, não negativo) derivado do id textual da ementa."""
+    digest = hashlib.blake2b(str(doc_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+# ----------------------------------------------------------------------
+# Encoder único por processo
+# ----------------------------------------------------------------------
+
+_ENCODERS: Dict[str, Any] = {}
+_ENCODERS_LOCK = threading.Lock()
+
+
+def _model_key(model_name: Optional[str]) -> str:
+    # "sentence-transformers/x" e "x" são o mesmo modelo no hub
+    name = (model_name or DEFAULT_MODEL).strip()
+    return name.split("/", 1)[1] if name.startswith("sentence-transformers/") else name
+
+
+def get_encoder(model_name: Optional[str] = None):
+    """SentenceTransformer carregado uma única vez por processo (por modelo)."""
+    key = _model_key(model_name or os.getenv("EMENTAS_EMB_MODEL", DEFAULT_MODEL))
+    enc = _ENCODERS.get(key)
+    if enc is None:
+        with _ENCODERS_LOCK:
+            enc = _ENCODERS.get(key)
+            if enc is None:
+                from sentence_transformers import SentenceTransformer
+                t0 = time.perf_counter()
+                enc = SentenceTransformer(key)
+                _ENCODERS[key] = enc
+                logger.info(f"[EMENTAS] encoder {key} carregado em {time.perf_counter() - t0:.1f}s")
+    return enc
+
+
+def loaded_encoders() -> List[str]:
+    return sorted(_ENCODERS)
+
+
+# ----------------------------------------------------------------------
+# Layout versionado
+# ----------------------------------------------------------------------
+
+def version_dir(root: Path, version: str) -> Path:
+    return Path(root) / VERSIONS_DIR / version
+
+
+def current_version(root: Path) -> Optional[str]:
+    try:
+        version = (Path(root) / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def list_versions(root: Path) -> List[str]:
+    base = Path(root) / VERSIONS_DIR
+    if not base.exists():
+        return []
+    return sorted(p.name for p in base.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def read_manifest(root: Path, version: str) -> Dict[str, Any]:
+    try:
+        return json.loads((version_dir(root, version) / MANIFEST_FILE).read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def read_index(path: Path, mmap: bool = True) -> faiss.Index:
+    """
+    Carrega o índice; com mmap=True os vetores (códigos do flat/HNSW, listas
+    do IVF) ficam mapeados do arquivo (IO_FLAG_MMAP_IFC) e as páginas vêm do
+    page cache do SO, compartilhadas entre os workers; só as estruturas
+    auxiliares (ex.: id_map do IndexIDMap2) são copiadas para a memória.
+    IO_FLAG_MMAP copiaria o arquivo inteiro nesses tipos. Sem suporte, cai
+    para a leitura normal. Índices mapeados não devem receber escrita.
+    """
+    if mmap:
+        try:
+            # sem IO_FLAG_READ_ONLY: combinado com ele o faiss volta a copiar os códigos
+            return faiss.read_index(str(path), faiss.IO_FLAG_MMAP_IFC)
+        except RuntimeError as e:
+            logger.warning(f"[EMENTAS] mmap indisponível para {path} ({e}); lendo em memória")
+    return faiss.read_index(str(path))
+
+
+def read_ids(root: Path, version: str) -> Optional[np.ndarray]:
+    """Ids estáveis por linha (None em bases posicionais: id == linha)."""
+    path = version_dir(root, version) / IDS_FILE
+    return np.fromfile(path, dtype=ID_DTYPE) if path.exists() else None
+
+
+def write_meta(
+    records: Iterable[Dict[str, Any]],
+    meta_path: Path,
+    offsets_path: Path,
+    base: Optional[Path] = None,
+    ids: Optional[Sequence[int]] = None,
+) -> int:
+    """
+    Grava meta.jsonl + meta.offsets (formato lido por JsonlOffsetStore) e,
+    com `ids`, meta.ids alinhado às linhas. `base` é a pasta de uma versão
+    anterior cujos metadados são copiados antes dos novos registros
+    (publicação incremental).
+    """
+    pos = 0
+    offsets: List[int] = []
+    ids_path = meta_path.with_name(IDS_FILE)
+    if base is not None and (base / META_FILE).exists():
+        shutil.copyfile(base / META_FILE, meta_path)
+        shutil.copyfile(base / OFFSETS_FILE, offsets_path)
+        if (base / IDS_FILE).exists():
+            shutil.copyfile(base / IDS_FILE, ids_path)
+        pos = os.path.getsize(meta_path)
+    with open(meta_path, "ab") as f:
+        for rec in records:
+            line = (json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+            offsets.append(pos)
+            f.write(line)
+            pos += len(line)
+    with open(offsets_path, "ab") as f:
+        np.asarray(offsets, dtype=OFFSET_DTYPE).tofile(f)
+    if ids is not None:
+        if len(ids) != len(offsets):
+            raise ValueError("ids e registros com tamanhos diferentes")
+        with open(ids_path, "ab") as f:
+            np.asarray(ids, dtype=ID_DTYPE).tofile(f)
+    return len(offsets)
+
+
+def _new_version_name() -> str:
+    # Ordenável por data (até microssegundos); o pid evita colisão entre processos
+    now = time.time_ns()
+    return f"{time.strftime('%Y%m%d%H%M%S', time.localtime(now // 1_000_000_000))}{now // 1000 % 1_000_000:06d}-{os.getpid()}"
+
+
+def publish_version(
+    root: Path,
+    index: faiss.Index,
+    records: Iterable[Dict[str, Any]],
+    manifest: Optional[Dict[str, Any]] = None,
+    base_version: Optional[str] = None,
+    keep: int = DEFAULT_KEEP_VERSIONS,
+    ids: Optional[Sequence[int]] = None,
+    lexical: Optional[BM25Index] = None,
+    lexical_lock: Optional[threading.RLock] = None,
+) -> str:
+    """
+    Publica uma nova versão (índice + metadados + BM25) e aponta CURRENT
+    para ela. Com `base_version`, os metadados dessa versão são mantidos e
+    `records` são acrescentados (o índice já deve conter as linhas
+    antigas). `ids` (índices IndexIDMap2) grava o id estável de cada
+    registro novo. `lexical` é um BM25 já pronto com as mesmas chaves (a
+    compactação reaproveita o de versão + delta; `lexical_lock` o protege
+    das buscas durante a gravação); sem ele o BM25 é construído dos
+    metadados gravados.
+    """
+    root = Path(root)
+    versions = root / VERSIONS_DIR
+    versions.mkdir(parents=True, exist_ok=True)
+    version = _new_version_name()
+    tmp_dir = versions / f".{version}.tmp"
+    tmp_dir.mkdir()
+    try:
+        faiss.write_index(index, str(tmp_dir / INDEX_FILE))
+        base = version_dir(root, base_version) if base_version else None
+        write_meta(records, tmp_dir / META_FILE, tmp_dir / OFFSETS_FILE, base=base, ids=ids)
+        if lexical is None:
+            build_version_lexical(tmp_dir).save(tmp_dir / LEXICAL_FILE)
+        else:
+            with lexical_lock or nullcontext():
+                lexical.save(tmp_dir / LEXICAL_FILE)
+        info = dict(manifest or {})
+        info.update(version=version, ntotal=int(index.ntotal), dim=int(index.d), created_at=time.time())
+        (tmp_dir / MANIFEST_FILE).write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.rename(tmp_dir, versions / version)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+    pointer_tmp = root / f".{CURRENT_FILE}.{os.getpid()}.tmp"
+    pointer_tmp.write_text(version, encoding="utf-8")
+    os.replace(pointer_tmp, root / CURRENT_FILE)
+    logger.info(f"[EMENTAS] versão {version} publicada em {root} ({int(index.ntotal)} vetores)")
+    prune_versions(root, keep=keep)
+    return version
+
+
+def prune_versions(root: Path, keep: int = DEFAULT_KEEP_VERSIONS) -> List[str]:
+    """
+    Remove versões antigas além das `keep` mais recentes (a atual nunca).
+    Workers que ainda mapeiam uma versão removida seguem lendo: no Linux o
+    arquivo só some de fato quando o último mmap é fechado.
+    """
+    current = current_version(root)
+    removed = []
+    for version in list_versions(root)[:-max(1, keep)]:
+        if version == current:
+            continue
+        shutil.rmtree(version_dir(root, version), ignore_errors=True)
+        try:
+            wal_path(root, version).unlink()
+        except FileNotFoundError:
+            pass
+        removed.append(version)
+    return removed
+
+
+# ----------------------------------------------------------------------
+# WAL de alterações (upsert/deleção) sobre a versão atual
+# ----------------------------------------------------------------------
+
+WAL_UPSERT = 1
+WAL_DELETE = 2
+
+# magic, op, n, dim, bytes de metadados, crc32 do corpo
+_WAL_HEADER = struct.Struct("<2sBIIII")
+_WAL_MAGIC = b"EW"
+
+
+@dataclass
+class WalEntry:
+    op: int
+    ids: np.ndarray
+    vectors: Optional[np.ndarray]
+    records: List[Dict[str, Any]]
+
+
+def wal_path(root: Path, version: str) -> Path:
+    return Path(root) / WAL_DIR / f"{version}.wal"
+
+
+def append_wal(
+    path: Path,
+    op: int,
+    ids: Sequence[int],
+    vectors: Optional[np.ndarray] = None,
+    records: Optional[Sequence[Dict[str, Any]]] = None,
+    valid_size: Optional[int] = None,
+    fsync: bool = True,
+) -> int:
+    """
+    Acrescenta um lote ao WAL (um único write por lote). `valid_size` é o
+    tamanho já lido com sucesso: um final truncado por queda no meio da
+    escrita é descartado antes do append. Retorna o novo tamanho.
+    """
+    ids_arr = np.ascontiguousarray(ids, dtype=ID_DTYPE)
+    n = len(ids_arr)
+    vec_bytes, dim = b"", 0
+    if vectors is not None:
+        vecs = np.ascontiguousarray(vectors, dtype="<f4")
+        dim = int(vecs.shape[1])
+        vec_bytes = vecs.tobytes()
+    meta_bytes = json.dumps(list(records or []), ensure_ascii=False, default=str).encode("utf-8")
+    body = ids_arr.tobytes() + vec_bytes + meta_bytes
+    frame = _WAL_HEADER.pack(_WAL_MAGIC, op, n, dim, len(meta_bytes), zlib.crc32(body)) + body
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "ab") as f:
+        if valid_size is not None and f.tell() > valid_size:
+            logger.warning(f"[EMENTAS] WAL {path.name}: descartando {f.tell() - valid_size} bytes incompletos")
+            f.truncate(valid_size)
+        f.write(frame)
+        f.flush()
+        if fsync:
+            os.fsync(f.fileno())
+        return f.tell()
+
+
+def read_wal(path: Path, offset: int = 0) -> Tuple[List[WalEntry], int]:
+    """Lotes a partir de `offset` até o último íntegro; retorna (lotes, novo offset)."""
+    entries: List[WalEntry] = []
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        return entries, offset
+    with f:
+        f.seek(offset)
+        while True:
+            header = f.read(_WAL_HEADER.size)
+            if len(header) < _WAL_HEADER.size:
+                break
+            magic, op, n, dim, meta_len, crc = _WAL_HEADER.unpack(header)
+            body_len = n * ID_DTYPE.itemsize + n * dim * 4 + meta_len
+            body = f.read(body_len)
+            if magic != _WAL_MAGIC or len(body) < body_len or zlib.crc32(body) != crc:
+                break  # lote incompleto (escrita em andamento ou interrompida)
+            ids = np.frombuffer(body, dtype=ID_DTYPE, count=n)
+            pos = n * ID_DTYPE.itemsize
+            vectors = None
+            if dim:
+                vectors = np.frombuffer(body, dtype="<f4", count=n * dim, offset=pos).reshape(n, dim)
+                pos += n * dim * 4
+            records = json.loads(body[pos:].decode("utf-8")) if meta_len else []
+            entries.append(WalEntry(op, ids, vectors, records))
+            offset += _WAL_HEADER.size + body_len
+    return entries, offset
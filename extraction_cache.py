@@ -0,0 +1,127 @@
+# extraction_cache.py
+"""
+Cache de extração endereçado por conteúdo (SHA-256 do arquivo enviado).
+
+Para cada checksum guarda o texto extraído (PDF/OCR/transcrição), os chunks
+com as entidades NER de cada um e os vetores de embedding. Um mesmo arquivo
+reenviado em outro caso (ou outro tenant) pula extração, NER e embeddings
+e vai direto para a inserção no vector store do caso.
+
+Layout em disco:
+    <base_dir>/<sha[:2]>/<sha>/entry.json   (texto, chunks, entidades, parâmetros)
+    <base_dir>/<sha[:2]>/<sha>/vectors.npy  (float32, um vetor por chunk)
+"""
+import os
+import json
+import time
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = "cases/_extraction_cache"
+
+
+class ExtractionCache:
+    def __init__(self, base_dir: Path):
+        self.base_dir = Path(base_dir)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+
+    def _entry_dir(self, checksum: str) -> Path:
+        return self.base_dir / checksum[:2] / checksum
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, checksum: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Retorna a entrada do checksum ou None. Se houver vetores salvos, vêm em
+        entry['vectors'] (lista de listas de float).
+        """
+        if not checksum:
+            return None
+        entry_dir = self._entry_dir(checksum)
+        entry_file = entry_dir / "entry.json"
+        if not entry_file.exists():
+            self._count("misses")
+            return None
+        try:
+            entry = json.loads(entry_file.read_text(encoding="utf-8"))
+            vectors_file = entry_dir / "vectors.npy"
+            if entry.get("has_vectors") and vectors_file.exists():
+                import numpy as np
+                entry["vectors"] = np.load(vectors_file).tolist()
+            else:
+                entry["vectors"] = None
+        except Exception as e:
+            logger.warning(f"Entrada de cache de extração ilegível ({checksum}): {e}")
+            self._count("errors")
+            return None
+        self._count("hits")
+        return entry
+
+    def put(
+        self,
+        checksum: Optional[str],
+        text: str,
+        chunks: List[Dict[str, Any]],
+        vectors: Optional[List[List[float]]] = None,
+        splitter: Optional[Dict[str, Any]] = None,
+        embedding_model: Optional[str] = None,
+        doc_entities: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        """Grava (ou substitui) a entrada; entry.json é escrito por último."""
+        if not checksum:
+            return
+        entry_dir = self._entry_dir(checksum)
+        try:
+            entry_dir.mkdir(parents=True, exist_ok=True)
+            has_vectors = vectors is not None and 0 < len(vectors) == len(chunks)
+            if has_vectors:
+                import numpy as np
+                tmp_vec = entry_dir / f"vectors.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+                np.save(tmp_vec, np.asarray(vectors, dtype="float32"))
+                os.replace(tmp_vec, entry_dir / "vectors.npy")
+            entry = {
+                "checksum": checksum,
+                "text": text,
+                "chunks": chunks,
+                "doc_entities": doc_entities,
+                "splitter": splitter,
+                "embedding_model": embedding_model,
+                "has_vectors": has_vectors,
+                "created_at": time.time(),
+            }
+            tmp_entry = entry_dir / f"entry.{os.getpid()}.{threading.get_ident()}.tmp"
+            tmp_entry.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_entry, entry_dir / "entry.json")
+            self._count("writes")
+        except Exception as e:
+            logger.warning(f"Falha ao gravar cache de extração ({checksum}): {e}")
+            self._count("errors")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data: Dict[str, Any] = dict(self.stats)
+        total = data["hits"] + data["misses"]
+        data["hit_rate"] = round(data["hits"] / total, 4) if total else 0.0
+        data["base_dir"] = str(self.base_dir)
+        return data
+
+
+_CACHE: Optional[ExtractionCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Cache compartilhado do processo (diretório em EXTRACTION_CACHE_DIR)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = ExtractionCache(Path(os.getenv("EXTRACTION_CACHE_DIR", DEFAULT_CACHE_DIR)))
+    return _CACHE
@@ -0,0 +1,285 @@
+# faiss_index_factory.py
+"""
+Fábrica de índices FAISS para as bases de ementas.
+
+Tipos suportados (EMENTAS_INDEX_TYPE):
+ - flat   : busca exata (IndexFlatIP/L2), baseline; custo linear no corpus
+ - hnsw   : grafo HNSW; não precisa de treino, aceita inserções incrementais
+ - ivf    : IVF-Flat; centróides treinados, busca em `nprobe` listas
+ - ivfpq  : IVF + Product Quantization; vetores comprimidos (pq_m bytes/vetor)
+ - opqpq  : OPQ (rotação) + IVF-PQ; melhor recall que ivfpq no mesmo tamanho
+
+Os parâmetros de consulta (`nprobe` do IVF, `efSearch` do HNSW) são
+aplicados na carga via `set_search_params`. `recall_report` compara um
+índice aproximado com o flat (recall@k e latência por consulta).
+"""
+import os
+import math
+import time
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq", "opqpq")
+# Tipos que exigem index.train() antes do add()
+TRAINED_TYPES = ("ivf", "ivfpq", "opqpq")
+
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_CONSTRUCTION = 200
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+DEFAULT_PQ_NBITS = 8
+
+
+def _metric(metric: str) -> int:
+    return faiss.METRIC_L2 if (metric or "ip").lower() == "l2" else faiss.METRIC_INNER_PRODUCT
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Regra usual: ~4·sqrt(N) listas, entre 16 e 65536."""
+    return int(min(65536, max(16, 4 * math.sqrt(max(1, n_vectors)))))
+
+
+def default_pq_m(dim: int) -> int:
+    """Maior divisor de `dim` até dim/4 (sub-vetores de ao menos 4 dimensões), no máximo 64."""
+    for m in range(min(64, dim // 4), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(
+    kind: str,
+    dim: int,
+    n_vectors: int = 0,
+    nlist: Optional[int] = None,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = DEFAULT_PQ_NBITS,
+) -> str:
+    kind = (kind or "flat").lower()
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice FAISS desconhecido: {kind} (use {', '.join(INDEX_TYPES)})")
+    if kind == "flat":
+        return "Flat"
+    if kind == "hnsw":
+        return f"HNSW{hnsw_m}"
+    nlist = nlist or default_nlist(n_vectors)
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    pq_m = pq_m or default_pq_m(dim)
+    if kind == "ivfpq":
+        return f"IVF{nlist},PQ{pq_m}x{pq_nbits}"
+    return f"OPQ{pq_m},IVF{nlist},PQ{pq_m}x{pq_nbits}"
+
+
+def build_index(
+    dim: int,
+    kind: str = "flat",
+    metric: str = "ip",
+    n_vectors: int = 0,
+    nlist: Optional[int] = None,
+    hnsw_m: int = DEFAULT_HNSW_M,
+    ef_construction: int = DEFAULT_EF_CONSTRUCTION,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = DEFAULT_PQ_NBITS,
+) -> faiss.Index:
+    """
+    Cria o índice (vazio). Para os tipos treinados, `n_vectors` (tamanho
+    esperado do corpus) define o nlist padrão; chame `train_index` antes do add.
+    """
+    spec = factory_string(kind, dim, n_vectors, nlist, hnsw_m, pq_m, pq_nbits)
+    index = faiss.index_factory(dim, spec, _metric(metric))
+    if kind == "hnsw":
+        hnsw_index = faiss.downcast_index(index)
+        assert isinstance(hnsw_index, faiss.IndexHNSW)
+        hnsw_index.hnsw.efConstruction = ef_construction
+    logger.info(f"[FAISS] índice criado: {spec} (dim={dim}, metric={metric})")
+    return index
+
+
+def needs_training(index: faiss.Index) -> bool:
+    return not index.is_trained
+
+
+def train_index(index: faiss.Index, vectors: np.ndarray, max_train: Optional[int] = None, seed: int = 1234) -> None:
+    """
+    Treina centróides/codebooks com uma amostra do corpus. O FAISS recomenda
+    ~39–256 pontos por centróide; `max_train` limita o custo em bases grandes.
+    """
+    if index.is_trained:
+        return
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n = len(vectors)
+    ivf = _ivf(index)
+    if ivf is not None and n < ivf.nlist:
+        raise ValueError(f"Treino do IVF precisa de ao menos nlist={ivf.nlist} vetores (recebidos {n}).")
+    if max_train is None:
+        max_train = 256 * ivf.nlist if ivf is not None else 100_000
+    if n > max_train:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[np.sort(rng.choice(n, size=max_train, replace=False))]
+    t0 = time.perf_counter()
+    index.train(vectors)
+    logger.info(f"[FAISS] treino com {len(vectors)} vetores em {time.perf_counter() - t0:.1f}s")
+
+
+def _ivf(index: faiss.Index):
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def _hnsw(index: faiss.Index):
+    inner = faiss.downcast_index(index)
+    # IndexIDMap2 (bases com upsert/deleção) e OPQ envolvem o índice real
+    while isinstance(inner, (faiss.IndexPreTransform, faiss.IndexIDMap)):
+        inner = faiss.downcast_index(inner.index)
+    return getattr(inner, "hnsw", None)
+
+
+def set_search_params(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> Dict[str, int]:
+    """Aplica os parâmetros de consulta que fazem sentido para o índice; retorna os aplicados."""
+    applied: Dict[str, int] = {}
+    ivf = _ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(int(nprobe), ivf.nlist)
+        applied["nprobe"] = ivf.nprobe
+    hnsw = _hnsw(index)
+    if hnsw is not None and ef_search:
+        hnsw.efSearch = int(ef_search)
+        applied["efSearch"] = hnsw.efSearch
+    return applied
+
+
+def describe(index: faiss.Index) -> Dict[str, Any]:
+    info: Dict[str, Any] = {"type": type(faiss.downcast_index(index)).__name__, "ntotal": int(index.ntotal)}
+    ivf = _ivf(index)
+    if ivf is not None:
+        info.update(nlist=ivf.nlist, nprobe=ivf.nprobe)
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        info.update(efSearch=hnsw.efSearch)
+    return info
+
+
+def search_parameters(index: faiss.Index, sel: Optional[faiss.IDSelector] = None) -> faiss.SearchParameters:
+    """
+    SearchParameters do tipo certo para o índice (IVF/HNSW carregam o
+    nprobe/efSearch atuais, senão a busca usaria o padrão do FAISS) com o
+    seletor `sel`. O chamador mantém `sel` vivo enquanto usar os parâmetros.
+    """
+    ivf = _ivf(index)
+    hnsw = _hnsw(index)
+    params: Any
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = ivf.nprobe
+    elif hnsw is not None:
+        params = faiss.SearchParametersHNSW()  # type: ignore[attr-defined]
+        params.efSearch = hnsw.efSearch
+    else:
+        params = faiss.SearchParameters()
+    if sel is not None:
+        params.sel = sel
+    return params
+
+
+def search_params_from_env() -> Dict[str, int]:
+    """
+    Só os parâmetros de consulta definidos no ambiente: sem eles vale o
+    nprobe/efSearch gravado no índice pelo script de indexação.
+    """
+    params: Dict[str, int] = {}
+    for key, env in (("nprobe", "EMENTAS_NPROBE"), ("ef_search", "EMENTAS_EF_SEARCH")):
+        value = os.getenv(env, "").strip()
+        if value:
+            params[key] = int(value)
+    return params
+
+
+def new_index_from_env(dim: int, metric: str = "ip") -> faiss.Index:
+    """
+    Índice vazio para bases que recebem inserções incrementais (sem etapa de
+    treino): EMENTAS_INDEX_TYPE=hnsw ou flat. Tipos treinados são gerados
+    pelo script de indexação; aqui caem para flat.
+    """
+    kind = os.getenv("EMENTAS_INDEX_TYPE", "flat").lower()
+    if kind in TRAINED_TYPES:
+        logger.warning(
+            f"[FAISS] EMENTAS_INDEX_TYPE={kind} exige treino; base vazia criada como flat "
+            "(gere o índice treinado com scripts/indexar_ementas_faiss.py)."
+        )
+        kind = "flat"
+    return build_index(dim, kind=kind, metric=metric,
+                       hnsw_m=int(os.getenv("EMENTAS_HNSW_M", str(DEFAULT_HNSW_M))))
+
+
+# ----------------------------------------------------------------------
+# Relatório recall@k x latência contra o baseline exato
+# ----------------------------------------------------------------------
+
+def recall_report(
+    index: faiss.Index,
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    ks: Sequence[int] = (1, 10),
+    sweep: Optional[Sequence[Dict[str, int]]] = None,
+    metric: str = "ip",
+) -> List[Dict[str, Any]]:
+    """
+    Compara `index` (já populado com `corpus`) com um IndexFlat exato.
+    `sweep` é uma lista de parâmetros de consulta a testar, ex.
+    [{"nprobe": 4}, {"nprobe": 16}] ou [{"ef_search": 32}, ...].
+    Retorna uma linha por configuração (incluindo o baseline flat) com
+    recall@k e latência média/p95 por consulta em ms.
+    """
+    corpus = np.ascontiguousarray(corpus, dtype="float32")
+    queries = np.ascontiguousarray(queries, dtype="float32")
+    kmax = max(ks)
+    flat = faiss.IndexFlat(corpus.shape[1], _metric(metric))
+    flat.add(corpus)
+
+    def _timed(idx: faiss.Index):
+        lat: List[float] = []
+        ids = np.empty((len(queries), kmax), dtype="int64")
+        for i in range(len(queries)):
+            t0 = time.perf_counter()
+            _, I = idx.search(queries[i:i + 1], kmax)
+            lat.append((time.perf_counter() - t0) * 1000)
+            ids[i] = I[0]
+        return ids, lat
+
+    truth, flat_lat = _timed(flat)
+    rows: List[Dict[str, Any]] = [{
+        "config": "flat (exato)",
+        **{f"recall@{k}": 1.0 for k in ks},
+        "lat_ms_avg": round(float(np.mean(flat_lat)), 3),
+        "lat_ms_p95": round(float(np.percentile(flat_lat, 95)), 3),
+    }]
+    for params in (sweep or [{}]):
+        applied = set_search_params(index, **params)
+        found, lat = _timed(index)
+        row: Dict[str, Any] = {"config": ", ".join(f"{k}={v}" for k, v in applied.items()) or "padrão"}
+        for k in ks:
+            hits = sum(len(set(found[i, :k]) & set(truth[i, :k])) for i in range(len(queries)))
+            row[f"recall@{k}"] = round(hits / (k * len(queries)), 4)
+        row["lat_ms_avg"] = round(float(np.mean(lat)), 3)
+        row["lat_ms_p95"] = round(float(np.percentile(lat, 95)), 3)
+        rows.append(row)
+    return rows
+
+
+def format_report(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return ""
+    cols = list(rows[0].keys())
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in cols}
+    lines = [" | ".join(c.ljust(widths[c]) for c in cols), "-+-".join("-" * widths[c] for c in cols)]
+    lines += [" | ".join(str(r.get(c, "")).ljust(widths[c]) for c in cols) for r in rows]
+    return "\n".join(lines)
@@ -0,0 +1,221 @@
+# hybrid_retriever.py
+"""
+Recuperação híbrida (vetorial + BM25) sobre as vector stores Chroma do
+Pipeline: chunks do caso, KB do tenant e KB de ementas.
+
+`ChromaLexicalIndex` mantém um BM25 (lexical_index) com os ids da coleção
+como chaves, persistido em <persist_directory>/lexical.npz. Quem grava na
+coleção chama `mark_changed(store)`, que troca a geração em
+<persist_directory>/lexical.gen; a cada LEXICAL_SYNC_S (no máximo) o índice
+confere a geração e a contagem da coleção e, se alguma mudou, aplica a
+diferença de ids: chunks novos entram, ids apagados saem, sem reprocessar
+a coleção inteira. (Só a contagem não basta: apagar N chunks e inserir
+outros N a mantém igual.)
+
+`HybridRetriever` é compatível com o retriever do LangChain usado no
+Pipeline (`invoke`, `get_relevant_documents`, `search_kwargs["k"]`): busca
+até `fetch_k` candidatos em cada lista e funde por RRF. Falhas do lado
+lexical caem para a busca só vetorial.
+"""
+from __future__ import annotations
+import os
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from lexical_index import LEXICAL_FILE, BM25Index, rrf_fuse
+
+logger = logging.getLogger(__name__)
+
+# Liga a busca híbrida nos retrievers do Pipeline (0 = só vetorial, como antes)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "1") == "1"
+# Candidatos de cada lista (vetorial e BM25) antes da fusão
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", 20))
+# Intervalo mínimo entre as conferências da coleção Chroma
+LEXICAL_SYNC_S = float(os.getenv("LEXICAL_SYNC_S", "5.0"))
+GENERATION_FILE = "lexical.gen"
+_SYNC_BATCH = 1000
+
+
+def _read_generation(path: Path) -> Optional[str]:
+    """Conteúdo de lexical.gen (None se ainda não existe)."""
+    try:
+        return path.read_text(encoding="utf-8").strip() or None
+    except OSError:
+        return None
+
+
+def mark_changed(store: Any) -> None:
+    """Troca a geração da coleção (chamar após add/delete + persist na store Chroma)."""
+    directory = getattr(store, "_persist_directory", None)
+    if not directory:
+        return
+    path = Path(directory) / GENERATION_FILE
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        tmp.write_text(f"{time.time_ns()}-{os.getpid()}", encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"[LEXICAL] não foi possível gravar {path}: {e}")
+
+
+class ChromaLexicalIndex:
+    """BM25 de uma coleção Chroma (chave = id do chunk)."""
+
+    def __init__(self, store: Any, path: Path, check_interval_s: float = LEXICAL_SYNC_S):
+        self.store = store
+        self.path = Path(path)
+        self.check_interval_s = check_interval_s
+        self.generation_path = self.path.with_name(GENERATION_FILE)
+        self._index: Optional[BM25Index] = None
+        # geração já aplicada ao BM25 (None = ainda não conferida neste processo)
+        self._generation: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> BM25Index:
+        if self.path.exists():
+            try:
+                return BM25Index.load(self.path)
+            except Exception as e:
+                logger.warning(f"[LEXICAL] {self.path} ilegível ({e}); reconstruindo")
+        return BM25Index()
+
+    def sync(self, force: bool = False) -> BM25Index:
+        """Aplica à BM25 os chunks adicionados/removidos desde a última conferência."""
+        with self._lock:
+            if self._index is None:
+                self._index = self._load()
+                force = True
+            now = time.monotonic()
+            if not force and now - self._checked_at < self.check_interval_s:
+                return self._index
+            self._checked_at = now
+            index = self._index
+            # lida antes dos ids: uma escrita concorrente troca a geração de novo
+            # (sem arquivo de geração, só a contagem decide, como antes)
+            generation = _read_generation(self.generation_path) or ""
+            if generation == self._generation and self.store._collection.count() == len(index):
+                return index
+
+            t0 = time.perf_counter()
+            ids = self.store.get(include=[])["ids"]
+            current = set(ids)
+            gone = [k for k in index.keys() if k not in current]
+            new = [i for i in ids if i not in index]
+            index.remove(gone)
+            self._generation = generation
+            for start in range(0, len(new), _SYNC_BATCH):
+                got = self.store.get(ids=new[start:start + _SYNC_BATCH], include=["documents"])
+                index.add(got["ids"], [d or "" for d in got["documents"]])
+            if not new and not gone:
+                return index
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                index.save(self.path)
+            except OSError as e:
+                logger.warning(f"[LEXICAL] não foi possível gravar {self.path}: {e}")
+            logger.info(
+                f"[LEXICAL] {self.path.parent}: +{len(new)} / -{len(gone)} chunks em "
+                f"{(time.perf_counter() - t0) * 1000:.0f}ms ({len(index)} no BM25)"
+            )
+            return index
+
+    def search(self, query: str, k: int) -> List[Tuple[Hashable, float]]:
+        index = self.sync()
+        with self._lock:
+            return index.search(query, k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "docs": len(self._index) if self._index is not None else None,
+            "generation": self._generation,
+        }
+
+
+class HybridRetriever:
+    """Retriever vetorial + BM25 (RRF) sobre uma store Chroma."""
+
+    def __init__(self, store: Any, lexical: ChromaLexicalIndex, k: int = 4, fetch_k: int = HYBRID_FETCH_K):
+        self.store = store
+        self.lexical = lexical
+        self.fetch_k = fetch_k
+        # mesmo contrato do VectorStoreRetriever (o Pipeline ajusta search_kwargs["k"])
+        self.search_kwargs: Dict[str, Any] = {"k": k}
+
+    def invoke(self, query: str, k: Optional[int] = None, **_: Any) -> List[Any]:
+        k = int(k or self.search_kwargs.get("k", 4))
+        fetch = max(k, self.fetch_k)
+        dense = self.store.similarity_search(query, k=fetch)
+        try:
+            lexical = self._lexical_docs(query, fetch) if (query or "").strip() else []
+        except Exception as e:
+            logger.warning(f"[LEXICAL] busca BM25 indisponível ({e}); usando só a vetorial")
+            lexical = []
+        if not lexical:
+            return dense[:k]
+
+        # chunks idênticos vindos das duas listas contam como um só
+        by_key: Dict[Hashable, Any] = {}
+        rankings: List[List[str]] = []
+        for docs in (dense, lexical):
+            keys = []
+            for doc in docs:
+                key = _doc_key(doc)
+                by_key.setdefault(key, doc)
+                keys.append(key)
+            rankings.append(keys)
+        return [by_key[key] for key, _ in rrf_fuse(rankings)[:k]]
+
+    get_relevant_documents = invoke
+
+    def _lexical_docs(self, query: str, k: int) -> List[Any]:
+        from langchain.docstore.document import Document
+
+        hits = self.lexical.search(query, k)
+        if not hits:
+            return []
+        got = self.store.get(ids=[key for key, _ in hits], include=["documents", "metadatas"])
+        found = {
+            i: Document(page_content=doc or "", metadata=meta or {})
+            for i, doc, meta in zip(got["ids"], got["documents"], got["metadatas"])
+        }
+        return [found[key] for key, _ in hits if key in found]
+
+
+def _doc_key(doc: Any) -> str:
+    return hashlib.sha1((doc.page_content or "").encode("utf-8")).hexdigest()
+
+
+_LEXICAL: Dict[str, ChromaLexicalIndex] = {}
+_LEXICAL_LOCK = threading.Lock()
+
+
+def get_chroma_lexical(store: Any, persist_directory: Path) -> ChromaLexicalIndex:
+    """BM25 da coleção em `persist_directory`, um por processo (compartilhado entre Pipelines)."""
+    key = str(Path(persist_directory).resolve())
+    lex = _LEXICAL.get(key)
+    if lex is None:
+        with _LEXICAL_LOCK:
+            lex = _LEXICAL.get(key)
+            if lex is None:
+                lex = ChromaLexicalIndex(store, Path(persist_directory) / LEXICAL_FILE)
+                _LEXICAL[key] = lex
+    # Pipelines novos abrem outra instância Chroma sobre a mesma pasta
+    lex.store = store
+    return lex
+
+
+def hybrid_retriever(store: Any, persist_directory: Path, k: int) -> Any:
+    """Retriever do Pipeline: híbrido se HYBRID_RETRIEVAL, senão o da própria store."""
+    if not HYBRID_RETRIEVAL:
+        return store.as_retriever(search_kwargs={"k": k})
+    return HybridRetriever(store, get_chroma_lexical(store, persist_directory), k=k)
+
+
+def lexical_stats() -> Dict[str, Any]:
+    return {"enabled": HYBRID_RETRIEVAL, "indexes": [lex.stats() for lex in list(_LEXICAL.values())]}
@@ -13,6 +13,7 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.docstore.document import Document 
 from moviepy.editor import VideoFileClip
 import os # Para remoção de arquivos temporários em add_video
+import uuid
 import tempfile
 import openai
 
@@ -23,7 +24,10 @@ openai.api_key = "...seu_token..."
 client = OpenAI()
 
 # Importa as novas funções utilitárias
-from utils_arq import extract_text_from_pdf_bytes, extract_text_from_txt_bytes
+from utils_arq import extract_text_from_pdf_bytes, extract_text_from_txt_bytes, ProgressCallback
+from extraction_cache import ExtractionCache
+from case_manifest import CaseManifest
+from hybrid_retriever import mark_changed
 
 # Funções de fetch dos módulos externos
 # If 'normative_sources.py' is in a subfolder named 'Learning' inside your current directory, use:
@@ -43,12 +47,18 @@ class IngestionHandler:
                  text_splitter: RecursiveCharacterTextSplitter, 
                  label_map: Dict[str, str], 
                  case_store: Chroma, 
-                 kb_store: Chroma):
+                 kb_store: Chroma,
+                 extraction_cache: Optional[ExtractionCache] = None,
+                 manifest: Optional[CaseManifest] = None):
         self.nlp = nlp_processor
         self.splitter = text_splitter
         self.label_map = label_map
         self.case_store = case_store
         self.kb_store = kb_store
+        # Cache por SHA-256 do arquivo: texto, chunks, entidades e vetores
+        self.extraction_cache = extraction_cache
+        # Manifesto do caso (source -> chunk_count/checksum), atualizado a cada inserção
+        self.manifest = manifest
         # self.embeddings = embeddings # Chroma lida com embeddings se embedding_function for passada na sua criação
 
     def _extract_entities_from_spacy_doc(self, doc: spacy.tokens.Doc) -> Dict[str, List[str]]:
@@ -65,21 +75,99 @@ class IngestionHandler:
     def _extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
         return extract_text_from_pdf_bytes(pdf_bytes)
 
-    def _add_text_to_case_store(self, text: str, metadata: Dict[str, Any]):
+    def _cache_get(self, checksum: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not (self.extraction_cache and checksum):
+            return None
+        cached = self.extraction_cache.get(checksum)
+        if cached:
+            logger.info(f"Cache de extração: reaproveitando {checksum[:12]}… ({len(cached.get('chunks') or [])} chunks)")
+        return cached
+
+    def _splitter_params(self) -> Dict[str, Any]:
+        return {
+            "chunk_size": getattr(self.splitter, "_chunk_size", None),
+            "chunk_overlap": getattr(self.splitter, "_chunk_overlap", None),
+        }
+
+    def _embedding_function(self):
+        return getattr(self.case_store, "embeddings", None)
+
+    def _embedding_model_name(self) -> Optional[str]:
+        emb = self._embedding_function()
+        if emb is None:
+            return None
+        emb = getattr(emb, "base_embeddings", emb)  # CachedEmbeddings -> modelo real
+        return f"{type(emb).__name__}:{getattr(emb, 'model', '')}"
+
+    def _insert_chunks(self, chunk_texts: List[str], metadatas: List[Dict[str, Any]], vectors: Optional[List[List[float]]]) -> None:
+        """Insere no case_store; com vetores prontos, evita nova chamada de embeddings."""
+        if vectors is not None:
+            self.case_store._collection.add(
+                ids=[str(uuid.uuid4()) for _ in chunk_texts],
+                embeddings=vectors,
+                documents=chunk_texts,
+                metadatas=metadatas,
+            )
+        else:
+            self.case_store.add_documents([Document(page_content=t, metadata=m) for t, m in zip(chunk_texts, metadatas)])
+        self.case_store.persist()
+        mark_changed(self.case_store)
+
+    def _add_text_to_case_store(
+        self,
+        text: str,
+        metadata: Dict[str, Any],
+        progress: Optional[ProgressCallback] = None,
+        checksum: Optional[str] = None,
+        cached: Optional[Dict[str, Any]] = None,
+        doc_entities: Optional[Dict[str, List[str]]] = None,
+    ):
         # (Código mantido da versão anterior do pipeline.py)
         if not text.strip(): logger.warning(f"Texto vazio para add. Metadados: {metadata}"); return
-        chunks = self.splitter.split_text(text)
-        if not chunks: logger.warning(f"Zero chunks. Texto: {text[:200]}..."); return
-        spacy_docs = list(self.nlp.pipe(chunks, batch_size=16, disable=["parser", "lemmatizer"]))
-        docs_to_add = []
-        for i, chunk_text in enumerate(chunks):
-            spacy_doc = spacy_docs[i]; entities = self._extract_entities_from_spacy_doc(spacy_doc)
-            flat_entities = {key: "; ".join(values) for key, values in entities.items()}
-            combined_metadata = {**metadata, **flat_entities}
+        if progress: progress("embedding", 0.0)
+
+        # Cache válido só se chunking e modelo de embedding forem os mesmos
+        if cached and cached.get("chunks") and cached.get("splitter") == self._splitter_params():
+            chunk_texts = [c["text"] for c in cached["chunks"]]
+            chunk_entities = [c.get("entities") or {} for c in cached["chunks"]]
+            vectors = cached.get("vectors") if cached.get("embedding_model") == self._embedding_model_name() else None
+        else:
+            chunk_texts = self.splitter.split_text(text)
+            if not chunk_texts: logger.warning(f"Zero chunks. Texto: {text[:200]}..."); return
+            spacy_docs = list(self.nlp.pipe(chunk_texts, batch_size=16, disable=["parser", "lemmatizer"]))
+            chunk_entities = [
+                {key: "; ".join(values) for key, values in self._extract_entities_from_spacy_doc(d).items()}
+                for d in spacy_docs
+            ]
+            vectors = None
+        if progress: progress("embedding", 0.3)
+
+        cache_needs_write = bool(checksum and self.extraction_cache) and (cached is None or vectors is None)
+        if vectors is None and cache_needs_write and self._embedding_function() is not None:
+            vectors = self._embedding_function().embed_documents(chunk_texts)
+
+        metadatas = []
+        for entities in chunk_entities:
+            combined_metadata = {**metadata, **entities}
             for key, value in combined_metadata.items():
                 if isinstance(value, (list, dict)): combined_metadata[key] = str(value)
-            docs_to_add.append(Document(page_content=chunk_text, metadata=combined_metadata))
-        if docs_to_add: self.case_store.add_documents(docs_to_add); self.case_store.persist(); logger.info(f"{len(docs_to_add)} chunks adicionados. Fonte: {metadata.get('source')}")
+            metadatas.append(combined_metadata)
+        self._insert_chunks(chunk_texts, metadatas, vectors)
+        logger.info(f"{len(chunk_texts)} chunks adicionados. Fonte: {metadata.get('source')}")
+        if self.manifest is not None:
+            self.manifest.record_chunks(metadata.get("source"), metadata.get("type"), len(chunk_texts), checksum)
+
+        if cache_needs_write and self.extraction_cache is not None:
+            self.extraction_cache.put(
+                checksum,
+                text=text,
+                chunks=[{"text": t, "entities": e} for t, e in zip(chunk_texts, chunk_entities)],
+                vectors=vectors,
+                splitter=self._splitter_params(),
+                embedding_model=self._embedding_model_name(),
+                doc_entities=doc_entities if doc_entities is not None else (cached or {}).get("doc_entities"),
+            )
+        if progress: progress("embedding", 1.0)
 
     def _ingest_kb(self, kb_folder_path: str):
         # (Código mantido da versão anterior do pipeline.py)
@@ -97,26 +185,29 @@ class IngestionHandler:
                     chunks = self.splitter.split_text(text_content)
                     if chunks: all_docs_kb.extend([Document(page_content=c, metadata={"source": "kb", "path": str(pdf_file), "filename": pdf_file.name}) for c in chunks])
             except Exception as e: logger.error(f"Erro processando KB '{pdf_file.name}': {e}", exc_info=True)
-        if all_docs_kb: self.kb_store.add_documents(all_docs_kb); self.kb_store.persist(); logger.info(f"KB: {len(all_docs_kb)} chunks adicionados.")
+        if all_docs_kb: self.kb_store.add_documents(all_docs_kb); self.kb_store.persist(); mark_changed(self.kb_store); logger.info(f"KB: {len(all_docs_kb)} chunks adicionados.")
         else: logger.info("Nenhum doc novo para KB.")
 
     
 
-    def add_pdf(self, pdf_bytes: bytes, source_name: str = "pdf_upload") -> str: 
-        # Usa a função do utils.py
-        text = extract_text_from_pdf_bytes(pdf_bytes)
-        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "pdf"})
+    def add_pdf(self, pdf_bytes: bytes, source_name: str = "pdf_upload", progress: Optional[ProgressCallback] = None, checksum: Optional[str] = None) -> str: 
+        # Usa a função do utils.py (ou o texto já extraído, se o checksum estiver em cache)
+        cached = self._cache_get(checksum)
+        text = cached["text"] if cached else extract_text_from_pdf_bytes(pdf_bytes, progress=progress)
+        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "pdf"}, progress=progress, checksum=checksum, cached=cached)
         else: logger.warning(f"PDF '{source_name}' não continha texto extraível.")
         return text
 
-    def add_image(self, img_bytes: bytes, source_name: str = "image_upload") -> str: 
-        text = "";
-        if img_bytes.lstrip().startswith(b"%PDF"): text = self._extract_text_from_pdf_bytes(img_bytes)
+    def add_image(self, img_bytes: bytes, source_name: str = "image_upload", progress: Optional[ProgressCallback] = None, checksum: Optional[str] = None) -> str: 
+        text = ""; cached = self._cache_get(checksum)
+        if cached: text = cached["text"]
+        elif img_bytes.lstrip().startswith(b"%PDF"): text = extract_text_from_pdf_bytes(img_bytes, progress=progress)
         else:
+            if progress: progress("ocr", 0.0)
             try: text = pytesseract.image_to_string(Image.open(BytesIO(img_bytes)), lang="por+eng")
             except pytesseract.TesseractNotFoundError: logger.error("Tesseract não configurado."); raise
             except Exception as e: logger.error(f"Erro ao processar imagem '{source_name}': {e}", exc_info=True)
-        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "image"})
+        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "image"}, progress=progress, checksum=checksum, cached=cached)
         else: logger.warning(f"Nenhum texto extraído da imagem: {source_name}")
         return text
 
@@ -126,8 +217,16 @@ class IngestionHandler:
         source_name: str = "audio_upload",
         audio_format_suffix: str = ".mp3",
         openai_client: Optional[OpenAI] = None,
+        progress: Optional[ProgressCallback] = None,
+        checksum: Optional[str] = None,
     ) -> str: 
         logger.info(f"Processando áudio: {source_name}, sufixo para temp: {audio_format_suffix}")
+        cached = self._cache_get(checksum)
+        if cached:
+            text = cached["text"]
+            if text: self._add_text_to_case_store(text, {"source": source_name, "type": "audio"}, progress=progress, checksum=checksum, cached=cached)
+            return text
+        if progress: progress("extracting", 0.0)
         text = ""; tmp_path = None
         if not openai_client:
             logger.error("Cliente OpenAI não fornecido para add_audio.")
@@ -144,7 +243,7 @@ class IngestionHandler:
             if tmp_path and os.path.exists(tmp_path): 
                 try: os.remove(tmp_path)
                 except Exception as e_rm: logger.warning(f"Falha ao remover tmp áudio {tmp_path}: {e_rm}")
-        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "audio"})
+        if text: self._add_text_to_case_store(text, {"source": source_name, "type": "audio"}, progress=progress, checksum=checksum)
         else: logger.warning(f"Nenhum texto transcrito do áudio: {source_name}")
         return text
 
@@ -154,8 +253,17 @@ class IngestionHandler:
         source_name: str = "video_upload",
         video_format_suffix: str = ".mp4",
         openai_client: Optional[OpenAI] = None,
+        progress: Optional[ProgressCallback] = None,
+        checksum: Optional[str] = None,
     ) -> Dict[str, Any]:
         logger.info(f"Processando vídeo: {source_name}")
+        cached = self._cache_get(checksum)
+        if cached:
+            # Transcrição já conhecida: dispensa moviepy e Whisper
+            transcript = cached["text"]
+            if transcript: self._add_text_to_case_store(transcript, {"source": f"{source_name}_audio_extrato", "type": "audio"}, progress=progress, checksum=checksum, cached=cached)
+            return {"transcript": transcript, "audio_bytes": None}
+        if progress: progress("extracting", 0.0)
         transcript = ""; audio_bytes_ext = None; tmp_vid, tmp_aud = None, None; clip = None
         if not openai_client:
             logger.error("Cliente OpenAI não fornecido para add_video (necessário para add_audio).")
@@ -167,7 +275,8 @@ class IngestionHandler:
                 with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as tmp_a_f: tmp_aud = tmp_a_f.name
                 clip.audio.write_audiofile(tmp_aud, codec="pcm_s16le", logger=None) 
                 with open(tmp_aud, "rb") as f_a: audio_bytes_ext = f_a.read()
-                if audio_bytes_ext: transcript = self.add_audio(audio_bytes_ext, source_name=f"{source_name}_audio_extrato", audio_format_suffix=".wav", openai_client=openai_client)
+                if progress: progress("extracting", 0.5)
+                if audio_bytes_ext: transcript = self.add_audio(audio_bytes_ext, source_name=f"{source_name}_audio_extrato", audio_format_suffix=".wav", openai_client=openai_client, progress=progress, checksum=checksum)
             else: logger.warning(f"Vídeo '{source_name}' não contém trilha de áudio.")
         except Exception as e: logger.error(f"Erro ao processar vídeo '{source_name}': {e}", exc_info=True); raise
         finally:
@@ -188,16 +297,19 @@ class IngestionHandler:
                     logger.warning(f"Falha rm tmp áudio extraído: {e_rm}")
         return {"transcript": transcript, "audio_bytes": audio_bytes_ext}
 
-    def add_text_direct(self, text: str, source_name: str = "text_input", metadata_override: Optional[Dict] = None) -> List[Tuple[str, str]]:
+    def add_text_direct(self, text: str, source_name: str = "text_input", metadata_override: Optional[Dict] = None, progress: Optional[ProgressCallback] = None, checksum: Optional[str] = None) -> List[Tuple[str, str]]:
         # Renomeado de add_text para add_text_direct para evitar conflito com o add_text da classe Pipeline original
         if not text.strip(): logger.warning("Texto vazio para adicionar."); return []
         logger.info(f"Adicionando Texto Direto: {source_name}")
-        doc_nlp = self.nlp(text); entities = self._extract_entities_from_spacy_doc(doc_nlp)
+        if progress: progress("extracting", 0.0)
+        cached = self._cache_get(checksum)
+        if cached and cached.get("doc_entities") is not None: entities = cached["doc_entities"]
+        else: doc_nlp = self.nlp(text); entities = self._extract_entities_from_spacy_doc(doc_nlp)
         ner_tuples = [(t,lbl) for lbl, txt_list in entities.items() for t in txt_list]
         flat_meta = {k: "; ".join(v) for k,v in entities.items()}
         final_meta = {"source": source_name, "type": "text", **flat_meta}
         if metadata_override: final_meta.update(metadata_override)
-        self._add_text_to_case_store(text, final_meta)
+        self._add_text_to_case_store(text, final_meta, progress=progress, checksum=checksum, cached=cached, doc_entities=entities)
         return ner_tuples
 
     def add_normas_senado(self, sigla: str, numero: Optional[int] = None, ano: Optional[int] = None) -> str:
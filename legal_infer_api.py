@@ -317,6 +317,60 @@ def create_app(models_dir: str) -> Flask:
             })
         return jsonify(results)
 
+    @app.post("/similar_batch")
+    def similar_batch():
+        """
+        Body:
+        {
+          "queries": ["tese 1...", "tese 2..."],
+          "k": 10,
+          "dedup": false
+        }
+        One (B, N) similarity matrix for the whole batch; returns one result
+        list per query, in order. dedup=true keeps each doc only under the
+        query where it scored best.
+        """
+        data = request.get_json(force=True)
+        queries = data.get("queries", [])
+        k = int(data.get("k", 10))
+        if not isinstance(queries, list) or len(queries) == 0:
+            return jsonify({"error": "Provide 'queries' as a non-empty list"}), 400
+
+        with _index_lock:
+            M = index_store["mat"]
+            items = index_store["items"]
+            if M is None or len(items) == 0:
+                return jsonify({"error": "Index is empty. POST /index first."}), 400
+
+        Q = np.vstack([sent_w2v_mean(str(q or ""), kv, embed_dim) for q in queries])  # (B, D) normalized
+        sims = Q @ M.T                                                                # (B, N)
+        kk = min(max(1, k), sims.shape[1])
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        order = np.take_along_axis(sims, top, axis=1).argsort(axis=1)[:, ::-1]
+        top = np.take_along_axis(top, order, axis=1)
+
+        owner = {}
+        if data.get("dedup"):
+            for qi in range(top.shape[0]):
+                for i in top[qi].tolist():
+                    if i not in owner or sims[qi, i] > sims[owner[i], i]:
+                        owner[i] = qi
+
+        results = []
+        for qi in range(top.shape[0]):
+            row = []
+            for i in top[qi].tolist():
+                if owner and owner[i] != qi:
+                    continue
+                it = items[i]
+                row.append({
+                    "id": it["id"],
+                    "similarity": float(sims[qi, i]),
+                    "snippet": it["text"][:300]
+                })
+            results.append(row)
+        return jsonify(results)
+
     @app.post("/reset_index")
     def reset_index():
         with _index_lock:
@@ -60,6 +60,15 @@ class LegalInferClient:
         r.raise_for_status()
         return r.json()
 
+    # ------------------------------
+    # Search similar ementas for several queries at once
+    # ------------------------------
+    def similar_batch(self, queries: List[str], k: int = 10, dedup: bool = False) -> List[List[Dict[str, Any]]]:
+        payload = {"queries": queries, "k": k, "dedup": dedup}
+        r = requests.post(f"{self.base_url}/similar_batch", json=payload, timeout=30)
+        r.raise_for_status()
+        return r.json()
+
     # ------------------------------
     # Reset the semantic index
     # ------------------------------
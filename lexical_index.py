@@ -0,0 +1,277 @@
+# lexical_index.py
+"""
+Índice lexical (BM25) para busca híbrida com os índices vetoriais.
+
+A busca densa sozinha erra citações exatas ("art. 6º, III do CDC",
+"Súmula 297 do STJ") e números CNJ: o embedding aproxima o tema, não o
+dispositivo. Este módulo mantém um índice invertido BM25 local ao lado de
+cada store e `rrf_fuse` combina as duas listas por reciprocal rank fusion
+(a ordem importa, a escala dos scores não).
+
+Tokenização para português jurídico:
+ - caixa baixa + remoção de acentos ("súmula" == "sumula")
+ - stopwords comuns removidas ("não" fica: muda o sentido)
+ - ordinais e milhares normalizados ("6º" -> "6", "8.078" -> "8078")
+ - tokens extras de citação, para casar o dispositivo inteiro:
+   "art:6", "sumula:297", "lei:8078" e "cnj:<20 dígitos>"
+
+O BM25Index não é thread-safe: quem compartilha entre threads protege com
+o próprio lock (o snapshot do EmentasIndexService, o ChromaLexicalIndex).
+"""
+from __future__ import annotations
+import math
+import os
+import re
+import unicodedata
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+LEXICAL_FILE = "lexical.npz"
+# Constante do RRF: 60 é o valor do artigo original (Cormack et al., 2009)
+RRF_K = int(os.getenv("HYBRID_RRF_K", 60))
+DEFAULT_K1 = 1.2
+DEFAULT_B = 0.75
+
+_STOPWORDS = frozenset("""
+a o as os um uma uns umas de da do das dos d em na no nas nos num numa ao aos
+e ou que se por para pra pelo pela pelos pelas com sem sob sobre ate entre
+como mais mas ja tambem muito quando onde qual quais quem cujo cuja
+seu sua seus suas meu minha lhe lhes ele ela eles elas isso isto esse essa
+este esta esses essas estes estas aquele aquela aquilo foi ser sao era sera
+ha tem ter sido pois porque nem
+""".split())
+
+_ORDINAL = re.compile(r"(\d)\s*[ºª°]")
+_THOUSANDS = re.compile(r"(?<=\d)\.(?=\d{3}\b)")
+_CNJ = re.compile(r"\b(\d{7})-?(\d{2})\.?(\d{4})\.?(\d)\.?(\d{2})\.?(\d{4})\b")
+_ART = re.compile(r"\bart(?:igo)?s?\.?\s*(\d+)")
+_SUMULA = re.compile(r"\bsumula(?:\s+vinculante)?\s*(?:n[\s.o]*)?(\d+)")
+_LEI = re.compile(r"\blei(?:\s+complementar)?\s*(?:n[\s.o]*)?(\d+)")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def fold(text: str) -> str:
+    """Caixa baixa sem acentos (NFKD sem marcas combinantes)."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+def citation_tokens(text: str) -> List[str]:
+    """Só os tokens de citação (artigos, súmulas, leis, números CNJ)."""
+    return _citations(_prepare(text))
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos do texto para o BM25 (palavras + tokens de citação)."""
+    norm = _prepare(text)
+    words = [w for w in _WORD.findall(norm) if w not in _STOPWORDS and (len(w) > 1 or w.isdigit())]
+    return words + _citations(norm)
+
+
+def _prepare(text: str) -> str:
+    # ordinais antes do fold ("6º" viraria "6o")
+    return _THOUSANDS.sub("", fold(_ORDINAL.sub(r"\1", text or "")))
+
+
+def _citations(norm: str) -> List[str]:
+    out = ["cnj:" + "".join(m.groups()) for m in _CNJ.finditer(norm)]
+    out += [f"art:{int(n)}" for n in _ART.findall(norm)]
+    out += [f"sumula:{int(n)}" for n in _SUMULA.findall(norm)]
+    out += [f"lei:{int(n)}" for n in _LEI.findall(norm)]
+    return out
+
+
+class BM25Index:
+    """
+    Índice invertido BM25 em memória com chaves externas (int ou str).
+
+    `add` com uma chave existente substitui o documento; `remove` só marca a
+    linha como morta (o df fica levemente superestimado até a compactação,
+    feita automaticamente quando as linhas mortas passam de 25%).
+    Persistência num único .npz (CSR de postings), sem pickle.
+    """
+
+    def __init__(self, k1: float = DEFAULT_K1, b: float = DEFAULT_B):
+        self.k1 = k1
+        self.b = b
+        self._keys: List[Hashable] = []          # linha -> chave
+        self._rows: Dict[Hashable, int] = {}     # chave viva -> linha
+        self._lens: List[int] = []
+        self._total_len = 0
+        self._dead: Set[int] = set()
+        # postings consolidados (arrays) + acréscimos ainda em listas
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._pending: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._norm: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._rows
+
+    def keys(self) -> List[Hashable]:
+        """Chaves vivas."""
+        return list(self._rows)
+
+    # ---------- escrita ----------
+    def add(self, keys: Sequence[Hashable], texts: Sequence[str]) -> None:
+        if len(keys) != len(texts):
+            raise ValueError("keys e texts com tamanhos diferentes")
+        for key, text in zip(keys, texts):
+            old = self._rows.get(key)
+            if old is not None:
+                self._dead.add(old)
+                self._total_len -= self._lens[old]
+            row = len(self._keys)
+            terms = tokenize(text)
+            for term, tf in Counter(terms).items():
+                rows, tfs = self._pending.setdefault(term, ([], []))
+                rows.append(row)
+                tfs.append(tf)
+            self._keys.append(key)
+            self._rows[key] = row
+            self._lens.append(len(terms))
+            self._total_len += len(terms)
+        self._norm = None
+
+    def remove(self, keys: Iterable[Hashable]) -> int:
+        removed = 0
+        for key in keys:
+            row = self._rows.pop(key, None)
+            if row is not None:
+                self._dead.add(row)
+                self._total_len -= self._lens[row]
+                removed += 1
+        if len(self._dead) > max(1000, len(self._keys) // 4):
+            self.compact()
+        return removed
+
+    def compact(self) -> None:
+        """Descarta as linhas mortas (renumera as vivas e recalcula o df)."""
+        if not self._dead:
+            return
+        remap = np.full(len(self._keys), -1, dtype="int64")
+        live = [r for r in range(len(self._keys)) if r not in self._dead]
+        remap[live] = np.arange(len(live))
+        postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        for term in set(self._postings) | set(self._pending):
+            arrays = self._term(term)
+            if arrays is None:
+                continue
+            rows = remap[arrays[0]]
+            keep = rows >= 0
+            if keep.any():
+                postings[term] = (rows[keep].astype("int32"), arrays[1][keep])
+        self._postings, self._pending = postings, {}
+        self._keys = [self._keys[r] for r in live]
+        self._lens = [self._lens[r] for r in live]
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+        self._dead = set()
+        self._norm = None
+
+    # ---------- busca ----------
+    def _term(self, term: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        pending = self._pending.pop(term, None)
+        base = self._postings.get(term)
+        if pending is not None:
+            rows = np.asarray(pending[0], dtype="int32")
+            tfs = np.asarray(pending[1], dtype="float32")
+            base = (rows, tfs) if base is None else (np.concatenate([base[0], rows]), np.concatenate([base[1], tfs]))
+            self._postings[term] = base
+        return base
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Hashable, float]]:
+        """Top-k [(chave, score BM25)] (só documentos com algum termo da consulta)."""
+        n = len(self._rows)
+        terms = set(tokenize(query))
+        if not n or not terms or k <= 0:
+            return []
+        if self._norm is None:
+            lens = np.asarray(self._lens, dtype="float32")
+            avgdl = max(self._total_len / n, 1.0)
+            self._norm = self.k1 * (1 - self.b + self.b * lens / avgdl)
+        scores = np.zeros(len(self._keys), dtype="float32")
+        for term in terms:
+            arrays = self._term(term)
+            if arrays is None:
+                continue
+            rows, tfs = arrays
+            df = len(rows)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[rows])
+        if self._dead:
+            scores[np.fromiter(self._dead, dtype="int64")] = 0
+        cand = np.flatnonzero(scores > 0)
+        if len(cand) > k:
+            cand = cand[np.argpartition(-scores[cand], k - 1)[:k]]
+        cand = cand[np.argsort(-scores[cand], kind="stable")]
+        return [(self._keys[r], float(scores[r])) for r in cand.tolist()]
+
+    # ---------- persistência ----------
+    def save(self, path: Path) -> None:
+        """Grava compactado e atomicamente (tmp + os.replace)."""
+        self.compact()
+        terms = sorted(set(self._postings) | set(self._pending))
+        # após o compact todo termo listado tem postings
+        arrays = [a for a in (self._term(t) for t in terms) if a is not None]
+        indptr = np.zeros(len(terms) + 1, dtype="int64")
+        indptr[1:] = np.cumsum([len(a[0]) for a in arrays])
+        empty = np.zeros(0, dtype="int32")
+        keys = np.asarray(self._keys, dtype="int64" if all(isinstance(k, (int, np.integer)) for k in self._keys) else str)
+        path = Path(path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                params=np.asarray([self.k1, self.b], dtype="float64"),
+                keys=keys,
+                lens=np.asarray(self._lens, dtype="int32"),
+                terms=np.asarray(terms, dtype=str),
+                indptr=indptr,
+                rows=np.concatenate([a[0] for a in arrays]).astype("int32") if arrays else empty,
+                tfs=np.concatenate([a[1] for a in arrays]).astype("float32") if arrays else empty.astype("float32"),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "BM25Index":
+        with np.load(str(path), allow_pickle=False) as data:
+            k1, b = data["params"].tolist()
+            idx = cls(k1=k1, b=b)
+            idx._keys = data["keys"].tolist()
+            idx._lens = data["lens"].tolist()
+            indptr, rows, tfs = data["indptr"], data["rows"], data["tfs"]
+            terms = data["terms"].tolist()
+        idx._rows = {k: i for i, k in enumerate(idx._keys)}
+        idx._total_len = int(sum(idx._lens))
+        idx._postings = {t: (rows[indptr[i]:indptr[i + 1]], tfs[indptr[i]:indptr[i + 1]]) for i, t in enumerate(terms)}
+        return idx
+
+
+def rrf_fuse(
+    rankings: Sequence[Sequence[Hashable]],
+    k: int = RRF_K,
+    weights: Optional[Sequence[float]] = None,
+) -> List[Tuple[Hashable, float]]:
+    """
+    Reciprocal rank fusion: score(d) = soma de w / (k + rank) nas listas em
+    que d aparece (rank a partir de 1). Empates ficam na ordem de chegada.
+    """
+    scores: Dict[Hashable, float] = {}
+    for i, ranking in enumerate(rankings):
+        w = weights[i] if weights is not None else 1.0
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + w / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
+
+def recall_at_k(found: Sequence[Hashable], relevant: Iterable[Any], k: int) -> float:
+    """|top-k ∩ relevantes| / min(k, |relevantes|) (1.0 quando não há relevantes)."""
+    relevant = set(relevant)
+    if not relevant:
+        return 1.0
+    return len(set(list(found)[:k]) & relevant) / min(k, len(relevant))
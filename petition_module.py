@@ -1,9 +1,11 @@
 # petition_module.py
 from email import utils
+import os
+import asyncio
 import logging
 import json
 import re
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
 from datetime import datetime # Movida para cá
 
 from langchain_openai import ChatOpenAI
@@ -11,6 +13,7 @@ from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
 
 from utils.text_helpers import extract_text, format_date_pt, clean_text, normalize_name, format_cpf, format_cnpj, validate_cpf, validate_cnpj, detect_document_type
+from step_graph import Step, run_steps_sync
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -65,8 +68,15 @@ OAB/{uf_oab} nº {numero_oab}
 
     DEFAULT_DATA_PETICAO = format_date_pt()  # Data padrão formatada em português
 
-    def __init__(self, llm: ChatOpenAI):
+    # Seções geradas pelo LLM são independentes entre si (todas leem só o FIRAC):
+    # em modo concorrente a latência é a da seção mais lenta, não a soma.
+    SECTION_TIMEOUT_S = float(os.getenv("PETITION_SECTION_TIMEOUT", "60"))
+
+    def __init__(self, llm: ChatOpenAI, concurrent: bool = True, section_timeout: Optional[float] = None):
         self.llm = llm
+        self.concurrent = concurrent
+        self.section_timeout = section_timeout if section_timeout is not None else self.SECTION_TIMEOUT_S
+        self.last_section_timings: Dict[str, float] = {}
         self._initialize_peticao_prompts_and_chains()
 
     def _initialize_peticao_prompts_and_chains(self):
@@ -166,6 +176,86 @@ OAB/{uf_oab} nº {numero_oab}
         return not faltantes and not vazios
 
 
+    def _section_specs(self, firac_results: Dict[str, str], firac_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Seções da petição geradas pelo LLM: chain, inputs, pós-processamento e placeholder."""
+        return [
+            {
+                "campo": "nome_completo_acao", "chain": self.nome_acao_peticao_chain, "nome": "nome_acao_peticao_chain",
+                "inputs": {"firac_issue": firac_data["issue"], "firac_conclusion": firac_data["conclusion"]},
+                "validar": True, "fallback": "[Nome da ação não gerado]",
+                "pos": lambda t: clean_text(self._clean_llm_response(t, "nome_acao")).upper(),
+            },
+            {
+                "campo": "artigos_fundamentacao_chave", "chain": self.artigos_chave_peticao_chain, "nome": "artigos_chave_peticao_chain",
+                "inputs": {"firac_rules": firac_results.get("rules", "")},
+                "validar": True, "fallback": "[Artigos chave não gerados]",
+                "pos": lambda t: clean_text(self._clean_llm_response(t, "artigos")),
+            },
+            {
+                "campo": "narrativa_dos_fatos", "chain": self.narrativa_fatos_peticao_chain, "nome": "narrativa_fatos_peticao_chain",
+                "inputs": {"firac_facts": firac_results.get("facts", "")},
+                "validar": False, "fallback": "[Narrar os fatos detalhadamente]", "pos": None,
+            },
+            {
+                "campo": "fundamentacao_juridica_geral", "chain": self.fundamentacao_geral_peticao_chain, "nome": "fundamentacao_geral_peticao_chain",
+                "inputs": {"firac_issue": firac_results.get("issue", ""), "firac_rules": firac_results.get("rules", ""), "firac_application": firac_results.get("application", "")},
+                "validar": True, "fallback": "[Fundamentação jurídica detalhada]", "pos": None,
+            },
+            {
+                "campo": "lista_completa_dos_pedidos_formatada", "chain": self.lista_pedidos_completa_peticao_chain, "nome": "lista_pedidos_completa_peticao_chain",
+                "inputs": {"firac_conclusion": firac_results.get("conclusion", ""), "firac_issue": firac_results.get("issue", "")},
+                "validar": False, "fallback": "    a) [DEFINIR PEDIDOS];", "pos": None,
+            },
+        ]
+
+    def _finalizar_secao(self, spec: Dict[str, Any], output: Dict[str, Any]) -> str:
+        texto = output.get(spec["campo"], "")
+        if spec["pos"] is not None:
+            return spec["pos"](texto)
+        return texto or spec["fallback"]
+
+    def _generate_llm_sections(self, firac_results: Dict[str, str], firac_data: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Gera as seções do LLM. Em modo concorrente cada seção tem timeout
+        próprio; seção que falha ou estoura o tempo recebe o placeholder e
+        as demais são aproveitadas.
+        """
+        specs = self._section_specs(firac_results, firac_data)
+        secoes: Dict[str, str] = {}
+        pendentes = []
+        for spec in specs:
+            if spec["validar"] and not self._validar_inputs_para_chain(spec["chain"], spec["inputs"], spec["nome"]):
+                secoes[spec["campo"]] = spec["fallback"]
+            else:
+                pendentes.append(spec)
+
+        if not self.concurrent:
+            for spec in pendentes:
+                try:
+                    secoes[spec["campo"]] = self._finalizar_secao(spec, spec["chain"].invoke(spec["inputs"]))
+                except Exception as e:
+                    logger.error(f"Seção '{spec['campo']}' da petição falhou: {e}", exc_info=True)
+                    secoes[spec["campo"]] = spec["fallback"]
+            return secoes
+
+        def _secao(spec: Dict[str, Any]) -> Callable[[Dict[str, Any]], Any]:
+            async def _run(_: Dict[str, Any]) -> str:
+                try:
+                    output = await asyncio.wait_for(spec["chain"].ainvoke(spec["inputs"]), timeout=self.section_timeout)
+                    return self._finalizar_secao(spec, output)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Seção '{spec['campo']}' da petição excedeu {self.section_timeout}s; usando placeholder.")
+                except Exception as e:
+                    logger.error(f"Seção '{spec['campo']}' da petição falhou: {e}", exc_info=True)
+                return spec["fallback"]
+            return _run
+
+        resultados, self.last_section_timings = run_steps_sync(
+            "peticao", [Step(spec["campo"], _secao(spec)) for spec in pendentes]
+        )
+        secoes.update({spec["campo"]: resultados[spec["campo"]] for spec in pendentes})
+        return secoes
+
     def generate_peticao_rascunho(self, dados_ui: Dict[str, Any], firac_results: Dict[str, str]) -> str:
         logger.debug(f"[TESTE] FIRAC Results:\n{json.dumps(firac_results, ensure_ascii=False, indent=2)}")
         logger.info("Gerando rascunho de petição inicial (PetitionGenerator)...")
@@ -230,48 +320,8 @@ OAB/{uf_oab} nº {numero_oab}
                 "conclusion": firac_results.get("conclusion", "[DADO NÃO DISPONÍVEL]")
             }
 
-            # Nome da ação
-            nome_acao_input = {"firac_issue": firac_data["issue"], "firac_conclusion": firac_data["conclusion"]}
-            if self._validar_inputs_para_chain(self.nome_acao_peticao_chain, nome_acao_input, "nome_acao_peticao_chain"):
-                nome_acao_output = self.nome_acao_peticao_chain.invoke(nome_acao_input)
-                # Extract using the output_key from the chain
-                nome_acao_text = nome_acao_output.get("nome_completo_acao", "")
-                nome_acao_cleaned = self._clean_llm_response(nome_acao_text, "nome_acao")
-                template_data["nome_completo_acao"] = clean_text(nome_acao_cleaned).upper()
-            else:
-                template_data["nome_completo_acao"] = "[Nome da ação não gerado]"
-
-
-            # Artigos chave
-            artigos_input = {"firac_rules": firac_results.get("rules", "")}
-            if self._validar_inputs_para_chain(self.artigos_chave_peticao_chain, artigos_input, "artigos_chave_peticao_chain"):
-                artigos_output = self.artigos_chave_peticao_chain.invoke(artigos_input)
-                # Extract using the output_key from the chain
-                artigos_text = artigos_output.get("artigos_fundamentacao_chave", "")
-                artigos_cleaned = self._clean_llm_response(artigos_text, "artigos")
-                template_data["artigos_fundamentacao_chave"] = clean_text(artigos_cleaned)
-            else:
-                template_data["artigos_fundamentacao_chave"] = "[Artigos chave não gerados]"
-
-
-            fatos_input = {"firac_facts": firac_results.get("facts", "")}
-            fatos_output = self.narrativa_fatos_peticao_chain.invoke(fatos_input)
-            template_data["narrativa_dos_fatos"] = fatos_output.get("narrativa_dos_fatos", "[Narrar os fatos detalhadamente]")
+            template_data.update(self._generate_llm_sections(firac_results, firac_data))
 
-
-            # Fundamentação jurídica geral
-            fund_input = {"firac_issue": firac_results.get("issue", ""), "firac_rules": firac_results.get("rules", ""), "firac_application": firac_results.get("application", "")}
-            if self._validar_inputs_para_chain(self.fundamentacao_geral_peticao_chain, fund_input, "fundamentacao_geral_peticao_chain"):
-                fund_output = self.fundamentacao_geral_peticao_chain.invoke(fund_input)
-                template_data["fundamentacao_juridica_geral"] = fund_output.get("fundamentacao_juridica_geral", "[Fundamentação jurídica detalhada]")
-            else:
-                template_data["fundamentacao_juridica_geral"] = "[Fundamentação jurídica detalhada]"
-
-            # Pedidos: Usando o novo prompt para lista completa
-            pedidos_input = {"firac_conclusion": firac_results.get("conclusion", ""), "firac_issue": firac_results.get("issue", "")}
-            pedidos_output = self.lista_pedidos_completa_peticao_chain.invoke(pedidos_input)
-            template_data["lista_completa_dos_pedidos_formatada"] = pedidos_output.get("lista_completa_dos_pedidos_formatada", "    a) [DEFINIR PEDIDOS];")
-            
             # Seções adicionais
             template_data["secao_gratuidade_justica"] = clean_text(outros_dados.get("texto_gratuidade", "(Seção de gratuidade de justiça...)"))
             template_data["secao_tutela_urgencia"] = clean_text(outros_dados.get("texto_tutela", "(Seção de tutela de urgência...)"))
@@ -2,14 +2,15 @@
 import os
 from flask import g
 import openai
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, Iterator, List, Dict, Any, Optional, Set, Tuple
 
 import logging
 from pathlib import Path
-import spacy
 import json
 import hashlib
 import re
+import threading
+import time
 
 from werkzeug.utils import secure_filename
 import hashlib
@@ -29,6 +30,17 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 
 # Importando os outros módulos do seu projeto
 from ingestion_module import IngestionHandler
+from extraction_cache import get_extraction_cache
+from case_manifest import CaseManifest
+from analysis_cache import AnalysisArtifactCache, prompt_version
+from step_graph import Step, record_step, run_steps_sync
+from context_builder import (
+    CHAT_MEMORY_MAX_TOKENS, ChatContextBuilder, fit_chunks, rank_chunks,
+)
+from concurrent.futures import ThreadPoolExecutor
+from embedding_cache import CachedEmbeddings, get_embedding_cache
+from semantic_cache import SEMANTIC_CACHE_ENABLED, get_semantic_cache
+from hybrid_retriever import hybrid_retriever, mark_changed
 from analysis_module import CaseAnalyzer
 from petition_module import PetitionGenerator
 
@@ -36,12 +48,168 @@ logger = logging.getLogger(__name__)
 
 # Diretório base para os casos (por tenant)
 CASES_DIR = Path("./cases")
+# KBs globais (uma pasta Chroma por tenant)
+KB_STORE_DIR = Path("./kb_store")
+EMENTAS_KB_STORE_DIR = Path("./ementas_kb_store")
 
 AUDIO_EXTS = {".mp3", ".wav", ".m4a", ".ogg", ".aac"}
 VIDEO_EXTS = {".mp4", ".mov", ".avi", ".mkv", ".wmv"}
 IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff"}
 
-class Pipeline:
+# Compactação do histórico do chat em segundo plano (não atrasa a resposta)
+_CHAT_MEMORY_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-memory")
+# Limite de tokens do contexto de riscos / próximos passos (_collect_context)
+COLLECT_CONTEXT_MAX_TOKENS = int(os.getenv("COLLECT_CONTEXT_MAX_TOKENS", "3000"))
+
+# Prompts das análises estratégicas; o texto entra na versão do cache de
+# artefatos (analysis_cache), então editá-los invalida as respostas salvas.
+RISKS_PROMPT = (
+    "Você é um advogado sênior. Analise o contexto do caso abaixo e "
+    "identifique os PRINCIPAIS RISCOS LEGAIS e PROCESSUAIS. "
+    "Responda em português com formato numerado. Para cada risco traga "
+    "campos: Nome do Risco; Descrição; Probabilidade (baixa/média/alta); "
+    "Impacto (baixo/médio/alto); Base Legal/Precedentes; Mitigação "
+    "Recomendada; Observações. Seja conciso e objetivo.\n\n"
+    "Contexto:\n{context}\n\nRiscos:"
+)
+NEXT_STEPS_PROMPT = (
+    "Atue como estrategista jurídico. Com base no contexto a seguir, "
+    "liste Próximos Passos e Oportunidades. "
+    "Divida em seções: (1) Ações Imediatas (2) Coleta/Produção de Provas "
+    "(3) Estratégia Processual / Recursos (4) Negociação / Acordo "
+    "(5) Comunicação com Cliente (6) Riscos Críticos a Monitorar. "
+    "Use bullets curtos e priorize alto impacto / rápida execução.\n\n"
+    "Contexto:\n{context}\n\nPlano Estratégico:"
+)
+
+
+# ============================================================
+#  RECURSOS COMPARTILHADOS (um conjunto por processo/worker)
+# ============================================================
+
+class _LazyComponents:
+    """
+    Mixin de inicialização preguiçosa: cada componente é construído no
+    primeiro acesso (thread-safe) e o tempo de construção fica registrado
+    em `startup_costs` (segundos; inclui dependências construídas em cascata).
+    """
+
+    def _init_lazy(self) -> None:
+        self._components: Dict[str, Any] = {}
+        self._components_lock = threading.RLock()
+        self.startup_costs: Dict[str, float] = {}
+
+    def _lazy(self, name: str, factory):
+        value = self._components.get(name)
+        if value is None:
+            with self._components_lock:
+                value = self._components.get(name)
+                if value is None:
+                    t0 = time.perf_counter()
+                    value = factory()
+                    self.startup_costs[name] = round(time.perf_counter() - t0, 4)
+                    self._components[name] = value
+                    logger.debug(f"{type(self).__name__}: componente '{name}' criado em {self.startup_costs[name]}s")
+        return value
+
+
+class PipelineResources(_LazyComponents):
+    """
+    Recursos pesados compartilhados entre todos os Pipelines do worker:
+    modelo spaCy, embeddings, LLM, cliente OpenAI, splitter e as
+    vector stores globais (KB e ementas) por tenant.
+
+    Cada Pipeline passa a ser apenas uma "visão" leve de um caso
+    sobre estes recursos, evitando recarregar modelos a cada request.
+    Os modelos só são carregados quando algum Pipeline de fato os usa.
+    """
+
+    def __init__(self, openai_client: openai.OpenAI | None = None):
+        self._init_lazy()
+        self._openai_client = openai_client
+
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200
+        )
+
+        self.label_map = {
+            "PARTES": "partes_envolvidas",
+            "LOC": "localizacao",
+            "ORG": "organizacao",
+            "MONEY": "valor_monetario",
+            "DATE": "data"
+        }
+
+        self._lock = threading.Lock()
+        self._kb_stores: Dict[str, Chroma] = {}
+        self._ementas_stores: Dict[str, Chroma] = {}
+
+    @property
+    def nlp(self):
+        def _load():
+            import spacy
+            logger.info("Carregando modelo spaCy pt_core_news_sm (compartilhado)...")
+            return spacy.load("pt_core_news_sm")
+        return self._lazy("nlp", _load)
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        # Cache persistente (SQLite) na frente da API: consultas repetidas não custam nada
+        return self._lazy("embeddings", lambda: CachedEmbeddings(OpenAIEmbeddings(), get_embedding_cache()))
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self._lazy("llm", lambda: ChatOpenAI(temperature=0.5, model="gpt-4o"))
+
+    @property
+    def openai_client(self) -> openai.OpenAI:
+        return self._lazy("openai_client", lambda: self._openai_client or openai.OpenAI())
+
+    def _get_tenant_store(self, cache: Dict[str, Chroma], root: str, tenant_segment: str) -> Chroma:
+        with self._lock:
+            store = cache.get(tenant_segment)
+            if store is None:
+                t0 = time.perf_counter()
+                store_dir = Path(root) / tenant_segment
+                store_dir.mkdir(parents=True, exist_ok=True)
+                store = Chroma(
+                    persist_directory=str(store_dir),
+                    embedding_function=self.embeddings
+                )
+                cache[tenant_segment] = store
+                self.startup_costs[f"{Path(root).name}:{tenant_segment}"] = round(time.perf_counter() - t0, 4)
+            return store
+
+    def get_kb_store(self, tenant_segment: str) -> Chroma:
+        """KB global do tenant (./kb_store/<tenant>), criada uma única vez."""
+        return self._get_tenant_store(self._kb_stores, str(KB_STORE_DIR), tenant_segment)
+
+    def get_ementas_kb_store(self, tenant_segment: str) -> Chroma:
+        """KB de ementas do tenant (./ementas_kb_store/<tenant>), criada uma única vez."""
+        return self._get_tenant_store(self._ementas_stores, str(EMENTAS_KB_STORE_DIR), tenant_segment)
+
+
+_SHARED_RESOURCES: PipelineResources | None = None
+_SHARED_RESOURCES_LOCK = threading.Lock()
+
+
+def get_shared_resources() -> PipelineResources:
+    """Retorna (criando na primeira chamada) os recursos compartilhados do worker."""
+    global _SHARED_RESOURCES
+    if _SHARED_RESOURCES is None:
+        with _SHARED_RESOURCES_LOCK:
+            if _SHARED_RESOURCES is None:
+                _SHARED_RESOURCES = PipelineResources()
+    return _SHARED_RESOURCES
+
+
+def shared_startup_costs() -> Dict[str, float]:
+    """Custos de inicialização dos recursos compartilhados (vazio se ainda não criados)."""
+    return dict(_SHARED_RESOURCES.startup_costs) if _SHARED_RESOURCES is not None else {}
+
+
+class Pipeline(_LazyComponents):
     def __init__(
         self,
         case_id: str,
@@ -49,6 +217,7 @@ class Pipeline:
         openai_client: openai.OpenAI | None = None,
         base_cases_dir: Path | None = None,
         tenant_id: str | None = None,
+        resources: PipelineResources | None = None,
     ):
         """
         Inicializa o pipeline para um caso específico, com suporte multi-tenant.
@@ -56,6 +225,8 @@ class Pipeline:
         Args:
             case_id: identificador lógico do processo (id_processo).
             tenant_id: identificador do tenant (g.tenant_id) para isolar diretórios.
+            resources: recursos pesados compartilhados; por padrão usa os do worker
+                (ver get_shared_resources / app.services.pipeline_registry).
         """
         self.case_id = case_id
         self.base_cases_dir = base_cases_dir
@@ -82,55 +253,18 @@ class Pipeline:
             f"(tenant={tenant_segment}) em {self.case_dir}"
         )
 
-        # --- Modelos e componentes básicos ---
-        self.nlp = spacy.load("pt_core_news_sm")
-        self.embeddings = OpenAIEmbeddings()
-        self.llm = ChatOpenAI(temperature=0.5, model="gpt-4o")
-        self.openai_client = openai_client or openai.OpenAI()
-
-        self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-
-        self.label_map = {
-            "PARTES": "partes_envolvidas",
-            "LOC": "localizacao",
-            "ORG": "organizacao",
-            "MONEY": "valor_monetario",
-            "DATE": "data"
-        }
-
-        # --- Vector Store do CASO ---
-        self.case_store = Chroma(
-            persist_directory=str(self.case_dir / "vectorstore"),
-            embedding_function=self.embeddings
-        )
-        self.case_retriever = self.case_store.as_retriever(
-            search_kwargs={"k": 7}
-        )
-
-        # --- KB Global (pode ser segmentada por tenant também, se desejar) ---
-        kb_store_dir = Path("./kb_store") / tenant_segment
-        kb_store_dir.mkdir(parents=True, exist_ok=True)
-        self.kb_store = Chroma(
-            persist_directory=str(kb_store_dir),
-            embedding_function=self.embeddings
-        )
-        self.kb_retriever = self.kb_store.as_retriever(
-            search_kwargs={"k": 3}
-        )
-
-        # --- KB de Ementas (jurisprudência), também por tenant ---
-        ementas_store_dir = Path("./ementas_kb_store") / tenant_segment
-        ementas_store_dir.mkdir(parents=True, exist_ok=True)
-        self.ementas_kb_store = Chroma(
-            persist_directory=str(ementas_store_dir),
-            embedding_function=self.embeddings
-        )
-        self.ementas_kb_retriever = self.ementas_kb_store.as_retriever(
-            search_kwargs={"k": 5}
-        )
+        # --- Recursos compartilhados no worker; componentes do caso são
+        #     construídos sob demanda (ver propriedades abaixo) ---
+        self._init_lazy()
+        self.resources = resources or get_shared_resources()
+        self._openai_client = openai_client
+        self._ingestion_handler = ingestion_handler
+        self._tenant_segment = tenant_segment
+        self._memory_lock = threading.Lock()
+        # conversas com compactação da memória em andamento
+        self._memory_compacting: Set[str] = set()
+        self.splitter = self.resources.splitter
+        self.label_map = self.resources.label_map
 
         # --- Prompts para sumarização (CaseAnalyzer) ---
         map_prompt_template_pt = (
@@ -151,31 +285,6 @@ class Pipeline:
             input_variables=["text"]
         )
 
-        # --- Módulos especializados ---
-        if ingestion_handler is not None:
-            self.ingestion_handler = ingestion_handler
-        else:
-            self.ingestion_handler = IngestionHandler(
-                nlp_processor=self.nlp,
-                text_splitter=self.splitter,
-                label_map=self.label_map,
-                case_store=self.case_store,
-                kb_store=self.kb_store,
-            )
-
-        self.case_analyzer = CaseAnalyzer(
-            llm=self.llm,
-            case_retriever=self.case_retriever,
-            kb_retriever=self.kb_retriever,
-            map_prompt_pt=self.map_prompt_pt_for_summary,
-            combine_prompt_pt=self.combine_prompt_pt_for_summary,
-        )
-
-        self.petition_generator = PetitionGenerator(llm=self.llm)
-              # --- CadastroManager para persistência em PostgreSQL ---
-        self.cadastro_manager = CadastroManager(tenant_id=self.tenant_id)
-
-
         # --- Prompt simples de CHAT (sem ferramentas externas por enquanto) ---
         self.chat_system_prompt = (
             "Você é um assistente de pesquisa jurídico especializado em Direito "
@@ -189,6 +298,109 @@ class Pipeline:
 
         logger.info("Orquestrador Pipeline inicializado com sucesso.")
 
+    # ------------------------------------------------------------------
+    # Componentes preguiçosos: rotas que só servem arquivos ou listam
+    # diretórios não chegam a carregar modelos nem vector stores.
+    # ------------------------------------------------------------------
+
+    @property
+    def nlp(self):
+        return self.resources.nlp
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        return self.resources.embeddings
+
+    @property
+    def llm(self) -> ChatOpenAI:
+        return self.resources.llm
+
+    @property
+    def openai_client(self) -> openai.OpenAI:
+        return self._openai_client or self.resources.openai_client
+
+    @property
+    def case_store(self) -> Chroma:
+        return self._lazy("case_store", lambda: Chroma(
+            persist_directory=str(self.case_dir / "vectorstore"),
+            embedding_function=self.embeddings
+        ))
+
+    # Retrievers: vetorial + BM25 fundidos por RRF (hybrid_retriever; HYBRID_RETRIEVAL=0 volta ao só vetorial)
+    @property
+    def case_retriever(self):
+        return self._lazy("case_retriever", lambda: hybrid_retriever(self.case_store, self.case_dir / "vectorstore", k=7))
+
+    @property
+    def kb_store(self) -> Chroma:
+        return self.resources.get_kb_store(self._tenant_segment)
+
+    @property
+    def kb_retriever(self):
+        return self._lazy("kb_retriever", lambda: hybrid_retriever(self.kb_store, KB_STORE_DIR / self._tenant_segment, k=3))
+
+    @property
+    def ementas_kb_store(self) -> Chroma:
+        return self.resources.get_ementas_kb_store(self._tenant_segment)
+
+    @property
+    def ementas_kb_retriever(self):
+        return self._lazy("ementas_kb_retriever", lambda: hybrid_retriever(
+            self.ementas_kb_store, EMENTAS_KB_STORE_DIR / self._tenant_segment, k=5,
+        ))
+
+    @property
+    def ingestion_handler(self) -> IngestionHandler:
+        if self._ingestion_handler is not None:
+            return self._ingestion_handler
+        return self._lazy("ingestion_handler", lambda: IngestionHandler(
+            nlp_processor=self.nlp,
+            text_splitter=self.splitter,
+            label_map=self.label_map,
+            case_store=self.case_store,
+            kb_store=self.kb_store,
+            extraction_cache=get_extraction_cache(),
+            manifest=self.case_manifest,
+        ))
+
+    @property
+    def case_manifest(self) -> CaseManifest:
+        return self._lazy("case_manifest", lambda: CaseManifest(self.case_dir / "manifest.json"))
+
+    @property
+    def analysis_cache(self) -> AnalysisArtifactCache:
+        """Artefatos de análise (resumo, riscos, próximos passos) do caso."""
+        return self._lazy("analysis_cache", lambda: AnalysisArtifactCache(self._cache_dir))
+
+    @property
+    def case_analyzer(self) -> CaseAnalyzer:
+        return self._lazy("case_analyzer", lambda: CaseAnalyzer(
+            llm=self.llm,
+            case_retriever=self.case_retriever,
+            kb_retriever=self.kb_retriever,
+            map_prompt_pt=self.map_prompt_pt_for_summary,
+            combine_prompt_pt=self.combine_prompt_pt_for_summary,
+        ))
+
+    @property
+    def petition_generator(self) -> PetitionGenerator:
+        return self._lazy("petition_generator", lambda: PetitionGenerator(llm=self.llm))
+
+    @property
+    def cadastro_manager(self) -> CadastroManager:
+        # --- CadastroManager para persistência em PostgreSQL ---
+        return self._lazy("cadastro_manager", lambda: CadastroManager(tenant_id=self.tenant_id))
+
+    def startup_breakdown(self) -> Dict[str, Dict[str, float]]:
+        """
+        Custos de construção (segundos) dos componentes efetivamente criados:
+        `case` para este Pipeline e `shared` para os recursos do worker.
+        """
+        return {
+            "case": dict(self.startup_costs),
+            "shared": dict(self.resources.startup_costs),
+        }
+
     def _extract_text_from_llm_response(self, response: Any) -> str:
         """Normaliza respostas do LangChain em texto simples."""
         content = getattr(response, "content", "")
@@ -218,6 +430,8 @@ class Pipeline:
         user_query: str,
         chat_history: List[Dict[str, str]],
         search_scope: str = "case",
+        use_cache: bool = True,
+        conversation_id: Optional[str] = None,
     ) -> Dict[str, Any]:
         """
         Executa um chat sobre o caso usando RAG simples (case / kb / both).
@@ -227,6 +441,9 @@ class Pipeline:
             chat_history: Lista de mensagens anteriores, ex:
                 [{'role': 'user','content': '...'}, {'role': 'assistant','content': '...'}]
             search_scope: 'case' (default), 'kb' ou 'both'.
+            use_cache: False força nova resposta do LLM (ignora o cache semântico).
+            conversation_id: Identifica a conversa dona de `chat_history` (ex.: a
+                sessão do usuário); sem ele não há memória resumida dos turnos antigos.
 
         Returns:
             Dict com pelo menos a chave 'output' (string), compatível com processos.ui_chat.
@@ -235,55 +452,220 @@ class Pipeline:
             f"[CHAT] query='{user_query[:80]}...' scope={search_scope} case={self.case_id}"
         )
         try:
-            scope = (search_scope or "case").lower()
-            context_parts: List[str] = []
+            cached, cache_key = self._chat_cache_lookup(user_query, chat_history, search_scope, use_cache)
+            if cached is not None:
+                return {"output": cached, "cached": True}
+            full_prompt = self._build_chat_prompt(user_query, chat_history, search_scope, conversation_id)
+            resp = self.llm.invoke(full_prompt)
+            answer = self._extract_text_from_llm_response(resp)
+            self._semantic_store("chat", search_scope, user_query, cache_key, answer)
+            return {"output": answer}
 
-            if scope in ("case", "both"):
-                try:
-                    case_docs = self.case_retriever.invoke(user_query)
-                    context_parts.append(
-                        "\n\n".join([d.page_content for d in case_docs])
-                    )
-                except Exception as e:
-                    logger.warning(f"[CHAT] Falha ao recuperar docs do caso: {e}")
+        except Exception as e:
+            logger.error(f"Erro no chat: {e}", exc_info=True)
+            return {"error": str(e)}
 
-            if scope in ("kb", "both"):
-                try:
-                    kb_docs = self.kb_retriever.invoke(user_query)
-                    context_parts.append(
-                        "\n\n".join([d.page_content for d in kb_docs])
-                    )
-                except Exception as e:
-                    logger.warning(f"[CHAT] Falha ao recuperar docs da KB: {e}")
+    def _build_chat_prompt(
+        self,
+        user_query: str,
+        chat_history: List[Dict[str, str]],
+        search_scope: str = "case",
+        conversation_id: Optional[str] = None,
+    ) -> str:
+        """
+        Recupera o contexto (case / kb / both) e monta o prompt do chat dentro
+        do orçamento de tokens (context_builder). Turnos antigos que não cabem
+        são compactados em segundo plano na memória resumida da conversa.
+        """
+        scope = (search_scope or "case").lower()
+        case_texts: List[str] = []
+        kb_texts: List[str] = []
 
-            context_text = (
-                "\n\n---\n\n".join([c for c in context_parts if c])
-                or "(Sem contexto recuperado para esta pergunta.)"
-            )
+        if scope in ("case", "both"):
+            try:
+                case_texts = [d.page_content for d in self.case_retriever.invoke(user_query)]
+            except Exception as e:
+                logger.warning(f"[CHAT] Falha ao recuperar docs do caso: {e}")
 
-            # Monta prompt único para o LLM
-            history_str = ""
-            for msg in chat_history:
-                role = msg.get("role", "user")
-                content = msg.get("content", "")
-                history_str += f"{role.upper()}: {content}\n"
-
-            full_prompt = (
-                self.chat_system_prompt.format(context=context_text)
-                + "\n\n"
-                + "HISTÓRICO DO CHAT:\n"
-                + history_str
-                + "\n\n"
-                + f"USUÁRIO: {user_query}\nASSISTENTE:"
+        if scope in ("kb", "both"):
+            try:
+                kb_texts = [d.page_content for d in self.kb_retriever.invoke(user_query)]
+            except Exception as e:
+                logger.warning(f"[CHAT] Falha ao recuperar docs da KB: {e}")
+
+        memory, covered = self._load_chat_memory(conversation_id, len(chat_history))
+        ctx = ChatContextBuilder().build(
+            self.chat_system_prompt,
+            user_query,
+            [case_texts, kb_texts],
+            chat_history[covered:],
+            memory,
+        )
+        logger.info(f"[CHAT] orçamento de tokens: {ctx.stats}")
+        if ctx.overflow_turns and conversation_id:
+            self._schedule_memory_compaction(conversation_id, memory, covered, ctx.overflow_turns)
+        return ctx.prompt
+
+    # ------------------------------------------------------------------
+    # Memória resumida do chat (tabela chat_memory, ao lado de chat_turns)
+    # ------------------------------------------------------------------
+    def _load_chat_memory(self, conversation_id: Optional[str], history_len: int) -> Tuple[str, int]:
+        """(resumo, nº de turnos do histórico da conversa já cobertos pelo resumo)."""
+        if not conversation_id:
+            return "", 0
+        try:
+            row = self.cadastro_manager.get_chat_memory(self.case_id, conversation_id)
+        except Exception as e:
+            logger.warning(f"[CHAT] Memória do chat indisponível: {e}")
+            return "", 0
+        if not row or int(row.get("turns_covered") or 0) > history_len:
+            # Sem memória, ou histórico da sessão foi reiniciado
+            return "", 0
+        return row.get("summary") or "", int(row["turns_covered"])
+
+    def _schedule_memory_compaction(
+        self, conversation_id: str, memory: str, covered: int, turns: List[Dict[str, str]],
+    ) -> None:
+        with self._memory_lock:
+            if conversation_id in self._memory_compacting:
+                return
+            self._memory_compacting.add(conversation_id)
+        _CHAT_MEMORY_EXECUTOR.submit(self._compact_chat_memory, conversation_id, memory, covered, list(turns))
+
+    def _compact_chat_memory(
+        self, conversation_id: str, memory: str, covered: int, turns: List[Dict[str, str]],
+    ) -> None:
+        """Incorpora `turns` ao resumo da conversa e grava em chat_memory."""
+        try:
+            dialogo = "".join(f"{t.get('role', 'user').upper()}: {t.get('content', '')}\n" for t in turns)
+            prompt = (
+                "Atualize o resumo de uma conversa entre um advogado e um assistente "
+                "jurídico sobre um caso. Preserve fatos, valores, datas, decisões e "
+                "perguntas pendentes; descarte cortesias. Responda apenas com o "
+                f"resumo, em português, com no máximo {CHAT_MEMORY_MAX_TOKENS // 2} palavras.\n\n"
+                f"RESUMO ATUAL:\n{memory or '(vazio)'}\n\nNOVOS TURNOS:\n{dialogo}\nRESUMO ATUALIZADO:"
             )
+            resumo = self._extract_text_from_llm_response(self.llm.invoke(prompt)).strip()
+            if resumo:
+                self.cadastro_manager.save_chat_memory(self.case_id, conversation_id, resumo, covered + len(turns))
+                logger.info(
+                    f"[CHAT] Memória da conversa {conversation_id} do caso {self.case_id} "
+                    f"atualizada ({covered + len(turns)} turnos)."
+                )
+        except Exception as e:
+            logger.warning(f"[CHAT] Falha ao compactar histórico do chat: {e}")
+        finally:
+            with self._memory_lock:
+                self._memory_compacting.discard(conversation_id)
 
-            resp = self.llm.invoke(full_prompt)
-            answer = self._extract_text_from_llm_response(resp)
-            return {"output": answer}
+    def chat_stream(
+        self,
+        user_query: str,
+        chat_history: List[Dict[str, str]],
+        search_scope: str = "case",
+        use_cache: bool = True,
+        conversation_id: Optional[str] = None,
+    ) -> Iterator[Tuple[str, Any]]:
+        """
+        Versão em streaming de `chat`: gera ("token", texto) à medida que o
+        LLM responde e termina com ("done", {"output", "ttft_s", "total_s"})
+        ou ("error", mensagem). O time-to-first-token é registrado em
+        step_graph (chat.ttft) junto com a duração total (chat.total).
+        """
+        logger.info(
+            f"[CHAT-STREAM] query='{user_query[:80]}...' scope={search_scope} case={self.case_id}"
+        )
+        t0 = time.perf_counter()
+        ttft: Optional[float] = None
+        parts: List[str] = []
+        try:
+            cached, cache_key = self._chat_cache_lookup(user_query, chat_history, search_scope, use_cache)
+            if cached is not None:
+                total = round(time.perf_counter() - t0, 4)
+                yield "token", cached
+                yield "done", {"output": cached, "ttft_s": total, "total_s": total, "cached": True}
+                return
+            full_prompt = self._build_chat_prompt(user_query, chat_history, search_scope, conversation_id)
+            for chunk in self.llm.stream(full_prompt):
+                text = chunk.content if hasattr(chunk, "content") else str(chunk)
+                if not text:
+                    continue
+                if ttft is None:
+                    ttft = time.perf_counter() - t0
+                    record_step("chat", "ttft", ttft)
+                parts.append(text)
+                yield "token", text
+        except Exception as e:
+            logger.error(f"Erro no chat (stream): {e}", exc_info=True)
+            record_step("chat", "total", time.perf_counter() - t0, failed=True)
+            yield "error", str(e)
+            return
+
+        total = time.perf_counter() - t0
+        record_step("chat", "total", total)
+        logger.info(f"[CHAT-STREAM] ttft={ttft if ttft is not None else -1:.3f}s total={total:.3f}s")
+        answer = "".join(parts)
+        self._semantic_store("chat", search_scope, user_query, cache_key, answer)
+        yield "done", {
+            "output": answer,
+            "ttft_s": round(ttft, 4) if ttft is not None else None,
+            "total_s": round(total, 4),
+        }
 
+    # ------------------------------------------------------------------
+    # Cache semântico de respostas (semantic_cache): perguntas parecidas
+    # sobre o mesmo conjunto de documentos reaproveitam a resposta.
+    # ------------------------------------------------------------------
+    def _semantic_lookup(
+        self, kind: str, scope: str, query: str, use_cache: bool = True
+    ) -> Tuple[Optional[str], Optional[Tuple[List[float], str]]]:
+        """
+        (resposta em cache ou None, chave para _semantic_store). A chave é
+        None quando o cache não se aplica (bypass, desativado ou sem docs).
+        """
+        if not SEMANTIC_CACHE_ENABLED:
+            return None, None
+        cache = get_semantic_cache()
+        if not use_cache:
+            cache.record_bypass(kind)
+            return None, None
+        try:
+            digest = self.compute_case_digest()
+            if digest in ("no_docs", "digest_err"):
+                return None, None
+            vector = self.embeddings.embed_query(" ".join(query.lower().split()))
+            hit = cache.lookup(self.tenant_id, self.case_id, kind, scope, digest, vector, query=query)
         except Exception as e:
-            logger.error(f"Erro no chat: {e}", exc_info=True)
-            return {"error": str(e)}
+            logger.warning(f"[SEMANTIC-CACHE] Falha na consulta ({kind}): {e}")
+            return None, None
+        if hit is not None:
+            logger.info(
+                f"[SEMANTIC-CACHE] hit {kind} case={self.case_id} sim={hit['similarity']} "
+                f"(pergunta original: '{hit['query'][:60]}')"
+            )
+            return hit["answer"], None
+        return None, (vector, digest)
+
+    def _semantic_store(
+        self, kind: str, scope: str, query: str,
+        key: Optional[Tuple[List[float], str]], answer: str,
+    ) -> None:
+        if key is None or not answer or not answer.strip():
+            return
+        vector, digest = key
+        try:
+            get_semantic_cache().store(self.tenant_id, self.case_id, kind, scope, digest, query, vector, answer)
+        except Exception as e:
+            logger.warning(f"[SEMANTIC-CACHE] Falha ao gravar ({kind}): {e}")
+
+    def _chat_cache_lookup(
+        self, user_query: str, chat_history: List[Dict[str, str]], search_scope: str, use_cache: bool
+    ) -> Tuple[Optional[str], Optional[Tuple[List[float], str]]]:
+        # Só perguntas sem histórico: no meio da conversa a resposta depende
+        # dos turnos anteriores ("e o prazo?") e não pode ser reaproveitada.
+        if chat_history:
+            return None, None
+        return self._semantic_lookup("chat", (search_scope or "case").lower(), user_query, use_cache)
 
     # ======================================================================
     # COLETA DE CONTEXTO E ANÁLISES ESTRATÉGICAS (RISCOS, PRÓXIMOS PASSOS)
@@ -298,82 +680,86 @@ class Pipeline:
         Coleta contexto combinando documentos do caso + KB global.
         """
         try:
-            parts = []
+            case_texts: List[str] = []
+            kb_texts: List[str] = []
 
             if self.case_retriever:
                 docs_case = self.case_retriever.invoke(
                     focus or "analise geral do caso"
                 )
-                parts.append(
-                    "\n\n".join([d.page_content for d in docs_case[:k_case]])
-                )
+                case_texts = [d.page_content for d in docs_case[:k_case]]
 
             if self.kb_retriever:
                 docs_kb = self.kb_retriever.invoke(
                     focus or "contexto jurídico geral"
                 )
-                parts.append(
-                    "\n\n".join([d.page_content for d in docs_kb[:k_kb]])
-                )
+                kb_texts = [d.page_content for d in docs_kb[:k_kb]]
 
-            context = "\n\n---\n\n".join([p for p in parts if p])
+            # Trechos deduplicados, intercalados por relevância e limitados
+            # por tokens (antes: corte fixo em 12000 caracteres)
+            chunks, _ = rank_chunks(case_texts, kb_texts)
+            chunks, _ = fit_chunks(chunks, COLLECT_CONTEXT_MAX_TOKENS, separator="\n\n---\n\n")
+            context = "\n\n---\n\n".join(chunks)
 
             if not context.strip():
                 return "(Sem contexto disponível)"
 
-            # Limite defensivo de tamanho
-            return context[:12000]
+            return context
 
         except Exception as e:
             logger.error(f"Falha ao coletar contexto estratégico: {e}")
             return "(Erro ao coletar contexto)"
 
-    def identify_legal_risks(self, focus: Optional[str] = None) -> str:
+    def identify_legal_risks(self, focus: Optional[str] = None, use_cache: bool = True) -> str:
         """
         Gera lista estruturada de riscos legais com probabilidade, impacto e mitigação.
         Usado em /processos/ui/<id_processo>/analise/riscos
         """
+        if use_cache:
+            artifact = self.get_analysis_artifact("riscos", focus, RISKS_PROMPT)
+            if artifact:
+                return artifact
+        cached, cache_key = self._semantic_lookup("riscos", "case", focus or "riscos legais do caso", use_cache)
+        if cached is not None:
+            return cached
         context = self._collect_context(focus)
         if context.startswith("(Sem contexto"):
             return "Nenhum documento disponível para identificar riscos. Faça upload de arquivos primeiro."
 
-        prompt = (
-            "Você é um advogado sênior. Analise o contexto do caso abaixo e "
-            "identifique os PRINCIPAIS RISCOS LEGAIS e PROCESSUAIS. "
-            "Responda em português com formato numerado. Para cada risco traga "
-            "campos: Nome do Risco; Descrição; Probabilidade (baixa/média/alta); "
-            "Impacto (baixo/médio/alto); Base Legal/Precedentes; Mitigação "
-            "Recomendada; Observações. Seja conciso e objetivo.\n\n"
-            f"Contexto:\n{context}\n\nRiscos:"
-        )
+        prompt = RISKS_PROMPT.format(context=context)
         try:
             resp = self.llm.invoke(prompt)
-            return self._extract_text_from_llm_response(resp)
+            answer = self._extract_text_from_llm_response(resp)
+            self._semantic_store("riscos", "case", focus or "riscos legais do caso", cache_key, answer)
+            self.put_analysis_artifact("riscos", focus, answer, RISKS_PROMPT)
+            return answer
         except Exception as e:
             logger.error(f"Erro ao gerar riscos: {e}")
             return f"Erro ao gerar riscos: {e}"
 
-    def suggest_next_steps(self, focus: Optional[str] = None) -> str:
+    def suggest_next_steps(self, focus: Optional[str] = None, use_cache: bool = True) -> str:
         """
         Sugere próximos passos estratégicos e oportunidades.
         Usado em /processos/ui/<id_processo>/analise/proximos_passos
         """
+        if use_cache:
+            artifact = self.get_analysis_artifact("proximos_passos", focus, NEXT_STEPS_PROMPT)
+            if artifact:
+                return artifact
+        cached, cache_key = self._semantic_lookup("proximos_passos", "case", focus or "próximos passos do caso", use_cache)
+        if cached is not None:
+            return cached
         context = self._collect_context(focus)
         if context.startswith("(Sem contexto"):
             return "Sem base documental suficiente para sugerir próximos passos."
 
-        prompt = (
-            "Atue como estrategista jurídico. Com base no contexto a seguir, "
-            "liste Próximos Passos e Oportunidades. "
-            "Divida em seções: (1) Ações Imediatas (2) Coleta/Produção de Provas "
-            "(3) Estratégia Processual / Recursos (4) Negociação / Acordo "
-            "(5) Comunicação com Cliente (6) Riscos Críticos a Monitorar. "
-            "Use bullets curtos e priorize alto impacto / rápida execução.\n\n"
-            f"Contexto:\n{context}\n\nPlano Estratégico:"
-        )
+        prompt = NEXT_STEPS_PROMPT.format(context=context)
         try:
             resp = self.llm.invoke(prompt)
-            return self._extract_text_from_llm_response(resp)
+            answer = self._extract_text_from_llm_response(resp)
+            self._semantic_store("proximos_passos", "case", focus or "próximos passos do caso", cache_key, answer)
+            self.put_analysis_artifact("proximos_passos", focus, answer, NEXT_STEPS_PROMPT)
+            return answer
         except Exception as e:
             logger.error(f"Erro ao gerar próximos passos: {e}")
             return f"Erro ao gerar próximos passos: {e}"
@@ -392,43 +778,46 @@ class Pipeline:
         Se os docs mudarem, o digest muda → invalida cache antigo.
         """
         try:
-            docs = self.list_unique_case_documents()
-            if not docs:
-                return "no_docs"
-
-            parts = [
-                f"{d.get('source')}:{d.get('chunk_count')}"
-                for d in docs
-            ]
-            key = "|".join(sorted(parts))
-            return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+            return CaseManifest.digest(self.list_unique_case_documents())
         except Exception as e:
             logger.warning(f"Falha ao computar digest: {e}")
             return "digest_err"
 
-    def _summary_cache_filename(self, focus: str, digest: str) -> Path:
-        fh = hashlib.sha1(
-            (focus or "").strip().lower().encode("utf-8")
-        ).hexdigest()[:10]
-        return self._case_cache_dir() / f"summary_{digest}_{fh}.txt"
+    # ------------------------------------------------------------------
+    # Cache de artefatos de análise: chave (tipo, foco, digest, modelo,
+    # versão do prompt). Upload/deleção de documento invalida o do caso.
+    # ------------------------------------------------------------------
+    def _llm_model_name(self) -> str:
+        return str(getattr(self.llm, "model_name", None) or getattr(self.llm, "model", "") or "")
 
-    def get_cached_summary(self, focus: str) -> Optional[str]:
+    def get_analysis_artifact(self, kind: str, focus: Optional[str], *templates: str) -> Optional[Any]:
         digest = self.compute_case_digest()
-        path = self._summary_cache_filename(focus, digest)
-        if path.exists():
-            try:
-                return path.read_text(encoding="utf-8")
-            except Exception:
-                return None
-        return None
+        if digest in ("no_docs", "digest_err"):
+            return None
+        return self.analysis_cache.get(kind, focus, digest, self._llm_model_name(), prompt_version(*templates))
 
-    def cache_summary(self, focus: str, content: str) -> None:
+    def put_analysis_artifact(self, kind: str, focus: Optional[str], content: Any, *templates: str) -> None:
+        if not content or (isinstance(content, str) and content.startswith("Erro")):
+            return
         digest = self.compute_case_digest()
-        path = self._summary_cache_filename(focus, digest)
+        if digest in ("no_docs", "digest_err"):
+            return
+        self.analysis_cache.put(kind, focus, digest, self._llm_model_name(), prompt_version(*templates), content)
+
+    def _invalidate_analysis_cache(self) -> None:
         try:
-            path.write_text(content, encoding="utf-8")
+            self.analysis_cache.invalidate(keep_digest=self.compute_case_digest())
         except Exception as e:
-            logger.warning(f"Não conseguiu gravar cache de resumo: {e}")
+            logger.warning(f"Falha ao invalidar cache de análises do caso {self.case_id}: {e}")
+
+    def _summary_prompt_templates(self) -> Tuple[str, str]:
+        return self.map_prompt_pt_for_summary.template, self.combine_prompt_pt_for_summary.template
+
+    def get_cached_summary(self, focus: str) -> Optional[str]:
+        return self.get_analysis_artifact("summary", focus, *self._summary_prompt_templates())
+
+    def cache_summary(self, focus: str, content: str) -> None:
+        self.put_analysis_artifact("summary", focus, content, *self._summary_prompt_templates())
 
     def summarize_with_cache(self, query_for_relevance: str) -> Tuple[str, bool]:
         """
@@ -683,31 +1072,12 @@ class Pipeline:
             logger.warning(f"Falha ao extrair sentenças factuais: {e}")
             return []
 
-    def generate_firac(self, focus: Optional[str] = None) -> Dict[str, Any]:
-        """
-        Gera (ou reutiliza do cache) uma análise FIRAC estruturada:
-        facts, issue, rules, application, conclusion.
-        Usado em /processos/ui/<id_processo>/analise/firac e geração de petição.
-        """
-        summary, summary_cached = self.summarize_with_cache(
-            focus or "Resumo geral do caso"
-        )
-        candidate_facts = self._extract_candidate_fact_sentences()
-        focus_key = (focus or "").strip()
+    def _load_firac_cache(self, focus_key: str) -> Optional[Dict[str, Any]]:
+        """Lê o FIRAC do cache (JSON ou texto bruto parseável); None se precisar gerar."""
         firac_cache_path_json, firac_cache_path_raw = self._firac_cache_paths(
             focus_key
         )
 
-        contexto_firac = ""
-        if candidate_facts:
-            contexto_firac = "\n".join(candidate_facts)
-        elif summary:
-            contexto_firac = summary
-        else:
-            contexto_firac = (
-                "O autor celebrou contrato com o réu em data não especificada."
-            )
-
         # Tentar ler do cache
         if firac_cache_path_json.exists() or firac_cache_path_raw.exists():
             try:
@@ -796,6 +1166,36 @@ class Pipeline:
                 logger.warning(
                     f"Falha ao ler FIRAC cache: {e}. Regenerando..."
                 )
+        return None
+
+    def _firac_inputs(self, focus: Optional[str]) -> Tuple[str, bool, List[str]]:
+        """
+        Resumo do caso (map-reduce no LLM) e fatos candidatos (busca + regex)
+        são independentes: rodam em paralelo e cada um é cronometrado.
+        """
+        steps = [
+            Step("summary", lambda r: self.summarize_with_cache(focus or "Resumo geral do caso")),
+            Step("candidate_facts", lambda r: self._extract_candidate_fact_sentences()),
+        ]
+        results, timings = run_steps_sync("firac_inputs", steps)
+        summary, summary_cached = results["summary"]
+        logger.info(f"[FIRAC] Entradas prontas (resumo em cache={summary_cached}); tempos: {timings}")
+        return summary, summary_cached, results["candidate_facts"]
+
+    def generate_firac(self, focus: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Gera (ou reutiliza do cache) uma análise FIRAC estruturada:
+        facts, issue, rules, application, conclusion.
+        Usado em /processos/ui/<id_processo>/analise/firac e geração de petição.
+        """
+        focus_key = (focus or "").strip()
+
+        # Cache primeiro: o resumo só é calculado se o FIRAC precisar ser gerado
+        cached = self._load_firac_cache(focus_key)
+        if cached is not None:
+            return cached
+
+        summary, summary_cached, candidate_facts = self._firac_inputs(focus)
 
         # Monta prompt FIRAC
         facts_block = (
@@ -889,13 +1289,30 @@ class Pipeline:
     # LISTAGEM / DELEÇÃO DE DOCUMENTOS DO CASO
     # ======================================================================
     def list_unique_case_documents(self) -> List[Dict[str, Any]]:
+        """
+        Lista os documentos únicos do caso a partir do manifesto
+        (cases/<tenant>/<case_id>/manifest.json). Casos sem manifesto
+        (anteriores a ele) são varridos uma vez no vector store e o
+        manifesto é criado.
+        """
+        docs = self.case_manifest.documents()
+        if docs is not None:
+            return docs
+        docs = self._scan_case_documents()
+        if docs is not None:
+            self.case_manifest.rebuild(docs)
+            return docs
+        return []
+
+    def _scan_case_documents(self) -> Optional[List[Dict[str, Any]]]:
         """
         Busca metadados de todos os chunks no vector store do caso,
         mas retorna lista de documentos únicos (agregando por 'source').
+        Retorna None em caso de erro (para não gravar manifesto vazio).
         """
         logger.info(
-            f"Listando documentos únicos para o caso {self.case_id} "
-            f"(tenant={self.tenant_id})"
+            f"Varrendo documentos únicos do caso {self.case_id} "
+            f"(tenant={self.tenant_id}) no vector store"
         )
         try:
             all_metadatas = self.case_store.get(
@@ -923,7 +1340,7 @@ class Pipeline:
             return list(unique_documents.values())
         except Exception as e:
             logger.error(f"Erro ao listar documentos únicos: {e}", exc_info=True)
-            return []
+            return None
 
     def delete_document_by_filename(self, filename: str) -> bool:
         """
@@ -960,6 +1377,9 @@ class Pipeline:
             )
             self.case_store.delete(ids=ids_to_delete)
             self.case_store.persist()
+            mark_changed(self.case_store)
+            self.case_manifest.remove(filename)
+            self._invalidate_analysis_cache()
             logger.info(
                 f"Deleção de '{filename}' concluída e vector store do caso "
                 "persistido."
@@ -993,12 +1413,16 @@ class Pipeline:
         id_cliente: Optional[str] = None,
         criado_por_id: Optional[int] = None,
         storage_backend: str = "local",
+        progress: Optional[Callable[[str, float], None]] = None,
     ):
         """
         API de alto nível para ingestão de PDFs, imagens, TXT, áudio, vídeo etc.
         - salva o arquivo em disco;
         - indexa no vector store;
         - grava metadados na tabela documentos via CadastroManager.
+
+        `progress(estagio, fracao)` é chamado a cada etapa (saved, extracting,
+        ocr, embedding, indexed) — usado pela fila de ingestão em background.
         """
         from mimetypes import guess_type
 
@@ -1020,6 +1444,8 @@ class Pipeline:
         except Exception as e:
             logger.error(f"Erro ao salvar arquivo em disco: {e}", exc_info=True)
             return {"status": "erro", "mensagem": f"Falha ao salvar arquivo: {e}"}
+        if progress:
+            progress("saved", 1.0)
 
         # Metadados básicos
         storage_path = str(file_path.resolve())
@@ -1041,19 +1467,21 @@ class Pipeline:
         else:
             tipo_doc = "outro"
 
-        # Checksum opcional
+        # Checksum: também é a chave do cache de extração (extraction_cache.py)
         checksum_sha256 = hashlib.sha256(conteudo_arquivo_bytes).hexdigest()
 
         # 2) Ingestão no vector store (RAG)
         try:
             if tipo_doc == "pdf":
                 self.ingestion_handler.add_pdf(
-                    conteudo_arquivo_bytes, source_name=nome_arquivo
+                    conteudo_arquivo_bytes, source_name=nome_arquivo, progress=progress,
+                    checksum=checksum_sha256,
                 )
 
             elif tipo_doc == "imagem":
                 self.ingestion_handler.add_image(
-                    conteudo_arquivo_bytes, source_name=nome_arquivo
+                    conteudo_arquivo_bytes, source_name=nome_arquivo, progress=progress,
+                    checksum=checksum_sha256,
                 )
 
             elif tipo_doc == "texto":
@@ -1072,6 +1500,8 @@ class Pipeline:
                     text,
                     source_name=nome_arquivo,
                     metadata_override={"type": "text"},
+                    progress=progress,
+                    checksum=checksum_sha256,
                 )
 
             elif tipo_doc == "audio":
@@ -1080,6 +1510,8 @@ class Pipeline:
                     source_name=nome_arquivo,
                     audio_format_suffix=ext,
                     openai_client=self.openai_client,
+                    progress=progress,
+                    checksum=checksum_sha256,
                 )
 
             elif tipo_doc == "video":
@@ -1088,6 +1520,8 @@ class Pipeline:
                     source_name=nome_arquivo,
                     video_format_suffix=ext,
                     openai_client=self.openai_client,
+                    progress=progress,
+                    checksum=checksum_sha256,
                 )
 
             else:
@@ -1104,6 +1538,9 @@ class Pipeline:
             )
             return {"status": "erro", "mensagem": str(e)}
 
+        # Novo documento → digest mudou; análises antigas do caso não valem mais
+        self._invalidate_analysis_cache()
+
         # 3) Gravar metadados na tabela documentos
         try:
             if id_cliente is None:
@@ -1143,6 +1580,8 @@ class Pipeline:
                 "mensagem": f"Arquivo indexado, mas falha ao salvar metadados: {e}",
             }
 
+        if progress:
+            progress("indexed", 1.0)
         return {
             "status": "sucesso",
             "mensagem": f"Arquivo '{nome_arquivo}' processado e salvo.",
@@ -1183,6 +1622,7 @@ class Pipeline:
             try:
                 self.ementas_kb_store.add_documents(docs_to_add)
                 self.ementas_kb_store.persist()
+                mark_changed(self.ementas_kb_store)
                 logger.info(
                     f"{len(docs_to_add)} documento(s) de ementas "
                     "adicionado(s) e KB de ementas persistida."
@@ -1212,11 +1652,9 @@ class Pipeline:
             logger.error("Retriever da KB de Ementas não foi inicializado.")
             return []
 
-        self.ementas_kb_retriever.search_kwargs["k"] = top_k
         try:
-            similar_docs = self.ementas_kb_retriever.get_relevant_documents(
-                query_text
-            )
+            # k por chamada: o retriever é compartilhado pelas requisições do Pipeline
+            similar_docs = self.ementas_kb_retriever.invoke(query_text, k=top_k)
             return similar_docs
         except Exception as e:
             logger.error(f"Erro ao buscar ementas similares: {e}")
@@ -1309,6 +1747,7 @@ class Pipeline:
             )
             self.ementas_kb_store._collection.delete(ids=ids_to_delete)
             self.ementas_kb_store.persist()
+            mark_changed(self.ementas_kb_store)
             logger.info(
                 f"Deleção de '{filename}' concluída e KB de ementas persistida."
             )
@@ -1391,6 +1830,7 @@ class Pipeline:
             )
             self.kb_store.delete(ids=ids_to_delete)
             self.kb_store.persist()
+            mark_changed(self.kb_store)
             logger.info(
                 f"Deleção de '{filename}' concluída e KB Global persistida."
             )
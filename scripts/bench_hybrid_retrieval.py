@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark da busca nas ementas: densa x lexical (BM25) x híbrida (RRF).
+
+Mede recall@k e latência por consulta (e por consulta em lote, via
+search_many) sobre uma base versionada (<store>/versions + CURRENT).
+
+Consultas:
+ - --queries arquivo.jsonl com {"query": "...", "relevant": ["<id>", ...]}
+   (ids textuais dos metadados), ou
+ - geradas do próprio corpus (padrão): citações presentes nas ementas
+   ("art. 6", "Súmula 297", "Lei 8078", números CNJ), tendo como relevantes
+   todas as ementas que contêm a citação. É justamente o caso em que a
+   busca só vetorial costuma falhar.
+
+Exemplo:
+    python scripts/bench_hybrid_retrieval.py --store data/store/ementas_faiss --n 200 \\
+        --out reports/hybrid_benchmark.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+import numpy as np
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+# Importar app.services sem registrar os blueprints de IA (que abrem os índices na importação)
+os.environ.setdefault("MINIMAL_MODE", "1")
+
+from app.services.ementas_index_service import SEARCH_MODES, EmentasIndexService  # noqa: E402
+from ementas_index import lexical_text  # noqa: E402
+from faiss_index_factory import format_report  # noqa: E402
+from lexical_index import citation_tokens, recall_at_k  # noqa: E402
+
+
+def _surface(token: str) -> str:
+    """Token de citação -> texto de consulta como um usuário digitaria."""
+    kind, value = token.split(":", 1)
+    if kind == "cnj":
+        v = value
+        return f"{v[:7]}-{v[7:9]}.{v[9:13]}.{v[13]}.{v[14:16]}.{v[16:]}"
+    return {"art": "art. {}", "sumula": "Súmula {}", "lei": "Lei {}"}[kind].format(value)
+
+
+def _doc_id(key: Any, meta: Dict[str, Any]) -> str:
+    return str(meta.get("id") or key)
+
+
+def citation_queries(svc: EmentasIndexService, n: int, max_df: int, seed: int = 42) -> List[Dict[str, Any]]:
+    snap = svc.snapshot()
+    if snap is None:
+        return []
+    keys = list(snap.rows) if snap.rows is not None else list(range(int(snap.index.ntotal)))
+    rows = [snap.rows[k] for k in keys] if snap.rows is not None else keys
+    docs_by_token: Dict[str, Set[str]] = {}
+    for start in range(0, len(rows), 1024):
+        chunk_keys = keys[start:start + 1024]
+        for key, meta in zip(chunk_keys, snap.meta.get_many(rows[start:start + 1024])):
+            meta = meta or {}
+            for tok in set(citation_tokens(lexical_text(meta))):
+                docs_by_token.setdefault(tok, set()).add(_doc_id(key, meta))
+    candidates = sorted(t for t, ids in docs_by_token.items() if len(ids) <= max_df)
+    if not candidates:
+        return []
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(candidates), size=min(n, len(candidates)), replace=False)
+    return [
+        {"query": _surface(candidates[i]), "relevant": sorted(docs_by_token[candidates[i]])}
+        for i in sorted(picked.tolist())
+    ]
+
+
+def load_queries(path: str) -> List[Dict[str, Any]]:
+    out = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                item = json.loads(line)
+                out.append({"query": item["query"], "relevant": [str(r) for r in item.get("relevant", [])]})
+    return out
+
+
+def bench_mode(
+    svc: EmentasIndexService, queries: List[Dict[str, Any]], mode: str, ks: Tuple[int, ...],
+) -> Dict[str, Any]:
+    kmax = max(ks)
+    lat: List[float] = []
+    recalls: Dict[int, List[float]] = {k: [] for k in ks}
+    for q in queries:
+        t0 = time.perf_counter()
+        hits = svc.search(q["query"], k=kmax, mode=mode)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found = [_doc_id(h["key"], h["meta"]) for h in hits]
+        for k in ks:
+            recalls[k].append(recall_at_k(found, q["relevant"], k))
+
+    t0 = time.perf_counter()
+    svc.search_many([q["query"] for q in queries], k=kmax, mode=mode)
+    batch_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+
+    row: Dict[str, Any] = {"mode": mode}
+    for k in ks:
+        row[f"recall@{k}"] = round(float(np.mean(recalls[k])), 4)
+    row["lat_ms_avg"] = round(float(np.mean(lat)), 3)
+    row["lat_ms_p95"] = round(float(np.percentile(lat, 95)), 3)
+    row["batch_ms_por_consulta"] = round(batch_ms, 3)
+    return row
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark recall/latência: busca densa x BM25 x híbrida.")
+    ap.add_argument("--store", type=str, default=os.getenv("EMENTAS_FAISS_ROOT", "data/store/ementas_faiss"),
+                    help="Raiz do índice versionado (versions/ + CURRENT).")
+    ap.add_argument("--queries", type=str, default="", help="JSONL com {query, relevant}; vazio = citações do corpus.")
+    ap.add_argument("--n", type=int, default=200, help="Nº de consultas geradas do corpus.")
+    ap.add_argument("--max-df", type=int, default=20, help="Só citações presentes em até N ementas.")
+    ap.add_argument("--ks", type=str, default="1,5,10", help="Valores de k do recall (ex.: 1,5,10).")
+    ap.add_argument("--modes", type=str, default=",".join(SEARCH_MODES), help="Modos a comparar.")
+    ap.add_argument("--out", type=str, default="", help="Grava o relatório em JSON (ex.: reports/hybrid_benchmark.json).")
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    svc = EmentasIndexService(Path(args.store), check_interval_s=3600)
+    snap = svc.snapshot()
+    if snap is None:
+        print(f"Nenhuma versão publicada em {args.store}.")
+        return
+    print(f"==> Base {args.store} versão {snap.version} ({snap.ntotal} ementas)")
+
+    t0 = time.perf_counter()
+    svc.lexical(snap, wait=True)
+    print(f" - BM25 pronto em {time.perf_counter() - t0:.2f}s")
+    svc.encode(["aquecimento do encoder"])
+
+    queries = load_queries(args.queries) if args.queries else citation_queries(svc, args.n, args.max_df)
+    if not queries:
+        print("Nenhuma consulta (corpus sem citações reconhecidas?).")
+        return
+    print(f" - {len(queries)} consultas")
+
+    ks = tuple(int(k) for k in args.ks.split(",") if k.strip())
+    modes = [m.strip() for m in args.modes.split(",") if m.strip()]
+    rows = [bench_mode(svc, queries, mode, ks) for mode in modes]
+    print()
+    print(format_report(rows))
+
+    if args.out:
+        Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({
+                "store": args.store, "version": snap.version, "ntotal": snap.ntotal,
+                "queries": len(queries), "source": args.queries or "citações do corpus", "rows": rows,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nRelatório: {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ Uso (PowerShell):
     --batch 200
 
 Se quiser só CSV, remova --folder. Se quiser só pasta, remova --csv.
+Os lotes vão em modo de ingestão em massa (WAL sem fsync nem compactação
+por lote) e um único checkpoint consolida o índice no final; --no-bulk
+volta ao modo lote a lote.
 """
 
 from __future__ import annotations
@@ -26,6 +29,7 @@ from pypdf import PdfReader
 
 DEFAULT_API = os.environ.get("AIAPP_API_BASE", "http://127.0.0.1:5001")
 INDEX_URL    = "{base}/ementas/index"
+CHECKPOINT_URL = "{base}/ementas/checkpoint"
 
 
 def log(msg: str) -> None:
@@ -91,13 +95,13 @@ def load_from_folder(folder: str) -> List[Dict]:
     return docs
 
 
-def post_batch(base_url: str, docs: List[Dict], batch: int = 200, timeout: int = 60) -> int:
+def post_batch(base_url: str, docs: List[Dict], batch: int = 200, timeout: int = 60, bulk: bool = True) -> int:
     url = INDEX_URL.format(base=base_url.rstrip("/"))
     total_indexed = 0
     for i in range(0, len(docs), batch):
         part = docs[i:i+batch]
         try:
-            r = requests.post(url, json={"docs": part}, timeout=timeout)
+            r = requests.post(url, json={"docs": part, "defer": bulk}, timeout=timeout)
             r.raise_for_status()
             indexed = int(r.json().get("indexed", 0))
             total_indexed += indexed
@@ -116,6 +120,17 @@ def post_batch(base_url: str, docs: List[Dict], batch: int = 200, timeout: int =
     return total_indexed
 
 
+def post_checkpoint(base_url: str, timeout: int = 600) -> None:
+    url = CHECKPOINT_URL.format(base=base_url.rstrip("/"))
+    try:
+        r = requests.post(url, timeout=timeout)
+        r.raise_for_status()
+        log(f"Checkpoint: versão {r.json().get('version')}")
+    except Exception as e:
+        # os lotes já estão no WAL; a compactação automática consolida depois
+        log(f"⚠️  Checkpoint falhou: {e}")
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--api", type=str, default=DEFAULT_API, help="Base da API (ex: http://127.0.0.1:5001)")
@@ -125,6 +140,7 @@ def main():
     ap.add_argument("--csv-id-col", type=str, default=None)
     ap.add_argument("--folder", type=str, help="Pasta com PDFs/TXTs")
     ap.add_argument("--batch", type=int, default=200)
+    ap.add_argument("--no-bulk", dest="bulk", action="store_false", help="Persistência/compactação a cada lote.")
     args = ap.parse_args()
 
     log("==> Indexando CSV (STJ) + PDFs/TXTs (FAISS)")
@@ -147,7 +163,9 @@ def main():
         log("Nada a indexar. Encerrando.")
         return
 
-    total = post_batch(args.api, docs, batch=args.batch)
+    total = post_batch(args.api, docs, batch=args.batch, bulk=args.bulk)
+    if args.bulk:
+        post_checkpoint(args.api)
     log("Concluído.")
     log(f"Total inserido: {total}")
 
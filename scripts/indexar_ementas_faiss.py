@@ -2,10 +2,14 @@
 # -*- coding: utf-8 -*-
 
 """
-Indexador FAISS para ementas (CSV + pasta de PDFs/TXTs), salvando:
+Indexador FAISS para ementas (CSV + pasta de PDFs/TXTs), publicando uma
+nova versão em <store>/versions/<versão>/ (ver ementas_index):
  - index.faiss
- - metadados.pkl  (com texto/ementa incluído)
- - metadados.schema.json
+ - meta.jsonl + meta.offsets  (com texto/ementa incluído)
+ - manifest.json  (modelo, chaves dos metadados, tipo de índice)
+ - lexical.npz    (BM25 para a busca híbrida; ver lexical_index)
+e trocando <store>/CURRENT atomicamente: o app passa a usar a versão nova
+sem reiniciar.
 
 Principais recursos:
  - Suporte a CSV com colunas configuráveis (inclua quantas extras quiser)
@@ -13,6 +17,8 @@ Principais recursos:
  - Normalização opcional (padrão: ligada) p/ simular coseno em FAISS (IP)
  - Lote/batch configurável
  - Deduplicação por ID (caso existam repetidos)
+ - Índices aproximados (--index-type hnsw/ivf/ivfpq/opqpq) com etapa de treino
+   e relatório recall@k x latência contra o flat (--recall-report N)
  - Compatível com Windows (paths absolutos/relativos OK)
 """
 
@@ -20,7 +26,6 @@ import os
 import sys
 import csv
 import json
-import pickle
 import argparse
 from pathlib import Path
 from typing import List, Dict, Any, Optional
@@ -34,17 +39,40 @@ from sentence_transformers import SentenceTransformer
 # FAISS
 import faiss
 
+# Permite reutilizar utils_arq (extração paralela com OCR) a partir da raiz do repo
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from faiss_index_factory import (  # noqa: E402
+    INDEX_TYPES, TRAINED_TYPES, build_index, describe, format_report,
+    recall_report, set_search_params, train_index,
+)
+from ementas_index import (  # noqa: E402
+    DEFAULT_MODEL, current_version, get_encoder, publish_version,
+)
+
 
 # ----------------------------
 # Utilidades de leitura de PDF
 # ----------------------------
 def read_pdf_text(path: str) -> str:
     """
-    Tenta extrair texto de um PDF via PyPDF2, pdfplumber, pdfminer.six (nessa ordem),
+    Tenta extrair texto de um PDF via utils_arq (páginas em paralelo, com OCR
+    nas páginas sem texto), PyPDF2, pdfplumber, pdfminer.six (nessa ordem),
     usando o que estiver disponível. Se tudo falhar, retorna string vazia.
     """
     text = ""
 
+    # 0) utils_arq: pdfplumber por página em pool de processos + OCR (pytesseract)
+    try:
+        from utils_arq import extract_text_from_pdf_path  # type: ignore
+        text = extract_text_from_pdf_path(path)
+        if text:
+            return text
+    except Exception:
+        pass
+
     # 1) PyPDF2
     try:
         import PyPDF2  # type: ignore
@@ -212,17 +240,26 @@ def make_faiss_index(
     dim: int,
     metric: str = "ip",
     normalize: bool = True,
+    index_type: str = "flat",
+    n_vectors: int = 0,
+    nlist: Optional[int] = None,
+    hnsw_m: int = 32,
+    pq_m: Optional[int] = None,
+    pq_nbits: int = 8,
 ):
     """
-    Cria index FAISS.
-    - Para coseno, usamos IndexFlatIP e normalizamos vetores (normalize=True).
-    - Para L2, usamos IndexFlatL2 (normalize=False sugerido).
+    Cria index FAISS (ver faiss_index_factory).
+    - Para coseno, usamos inner-product e normalizamos vetores (normalize=True).
+    - Para L2, normalize=False sugerido.
+    - index_type != flat: HNSW, IVF-Flat, IVF-PQ ou OPQ+IVF-PQ (os IVF exigem treino).
     """
     metric = metric.lower().strip()
-    if metric == "l2":
-        return faiss.IndexFlatL2(dim), False
-    # default: inner-product (para coseno com normalize=True)
-    return faiss.IndexFlatIP(dim), normalize
+    do_norm = False if metric == "l2" else normalize
+    index = build_index(
+        dim, kind=index_type, metric=metric, n_vectors=n_vectors,
+        nlist=nlist, hnsw_m=hnsw_m, pq_m=pq_m, pq_nbits=pq_nbits,
+    )
+    return index, do_norm
 
 
 def embed_corpus(
@@ -282,15 +319,27 @@ def parse_args():
     ap.add_argument("--folder-encoding", type=str, default="utf-8", help="Encoding para TXT da pasta.")
 
     # Modelo / Index
-    ap.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2", help="Modelo de embeddings.")
+    ap.add_argument("--model", type=str, default=os.getenv("EMENTAS_EMB_MODEL", DEFAULT_MODEL), help="Modelo de embeddings (o mesmo encoder do app).")
     ap.add_argument("--batch", type=int, default=64, help="Tamanho do batch de embeddings.")
     ap.add_argument("--metric", type=str, default="ip", choices=["ip", "l2"], help="Métrica FAISS.")
     ap.add_argument("--normalize", action="store_true", default=True, help="Normalizar vetores (recomendado p/ coseno).")
     ap.add_argument("--no-normalize", dest="normalize", action="store_false", help="Desliga normalização (não recomendado p/ coseno).")
 
+    # Índice aproximado (ANN)
+    ap.add_argument("--index-type", type=str, default="flat", choices=list(INDEX_TYPES), help="flat (exato), hnsw, ivf, ivfpq ou opqpq.")
+    ap.add_argument("--nlist", type=int, default=0, help="Listas do IVF (0 = ~4*sqrt(N)).")
+    ap.add_argument("--hnsw-m", type=int, default=32, help="Vizinhos por nó no HNSW.")
+    ap.add_argument("--pq-m", type=int, default=0, help="Sub-vetores do PQ (0 = automático; bytes por vetor com 8 bits).")
+    ap.add_argument("--pq-nbits", type=int, default=8, help="Bits por código do PQ.")
+    ap.add_argument("--train-size", type=int, default=0, help="Máximo de vetores no treino (0 = 256*nlist).")
+    ap.add_argument("--nprobe", type=int, default=16, help="Listas visitadas por consulta (IVF); gravado no índice e usado pelo app, salvo se EMENTAS_NPROBE estiver definido.")
+    ap.add_argument("--ef-search", type=int, default=64, help="efSearch do HNSW; gravado no índice e usado pelo app, salvo se EMENTAS_EF_SEARCH estiver definido.")
+    ap.add_argument("--recall-report", type=int, default=0, help="Nº de consultas (amostradas do corpus) para o relatório recall@k x latência vs flat.")
+
     # Saída
-    ap.add_argument("--store", type=str, default="data/store/ementas_faiss", help="Pasta de saída para index.faiss e metadados.")
-    ap.add_argument("--force", action="store_true", help="Se existir índice, sobrescreve.")
+    ap.add_argument("--store", type=str, default="data/store/ementas_faiss", help="Raiz do índice versionado (versions/ + CURRENT).")
+    ap.add_argument("--keep-versions", type=int, default=3, help="Versões antigas mantidas após publicar.")
+    ap.add_argument("--force", action="store_true", help="Se já houver versão publicada, publica outra por cima.")
 
     return ap.parse_args()
 
@@ -300,14 +349,11 @@ def main():
 
     out_dir = Path(args.store)
     out_dir.mkdir(parents=True, exist_ok=True)
-    index_path = out_dir / "index.faiss"
-    meta_path = out_dir / "metadados.pkl"
-    schema_path = out_dir / "metadados.schema.json"
-
-    if index_path.exists() and meta_path.exists() and not args.force:
-        print(f"⚠️  Já existe índice em: {out_dir} (use --force para sobrescrever).")
-        print(f" - {index_path}")
-        print(f" - {meta_path}")
+
+    published = current_version(out_dir)
+    if published and not args.force:
+        print(f"⚠️  Já existe índice em: {out_dir} (use --force para publicar nova versão).")
+        print(f" - versão atual: {published}")
         return
 
     print("==> Indexando CSV (STJ) + PDFs/TXTs (FAISS)")
@@ -347,7 +393,7 @@ def main():
 
     # 3) Carrega modelo
     print("Carregando modelo de embeddings…")
-    model = SentenceTransformer(args.model)
+    model = get_encoder(args.model)
     try:
         device = "cuda" if model._target_device.type == "cuda" else "cpu"
     except Exception:
@@ -358,7 +404,12 @@ def main():
     # Embedding de uma amostra para descobrir a dimensão
     tmp_vec = model.encode(["DIM_PROBE"], convert_to_numpy=True)
     dim = int(tmp_vec.shape[1])
-    index, do_norm = make_faiss_index(dim=dim, metric=args.metric, normalize=args.normalize)
+    index, do_norm = make_faiss_index(
+        dim=dim, metric=args.metric, normalize=args.normalize,
+        index_type=args.index_type, n_vectors=len(docs),
+        nlist=args.nlist or None, hnsw_m=args.hnsw_m,
+        pq_m=args.pq_m or None, pq_nbits=args.pq_nbits,
+    )
 
     # 5) Embeddings em lotes e adiciona ao índice
     texts = [d["text"] for d in docs]
@@ -375,23 +426,49 @@ def main():
     X = np.vstack(all_vecs).astype("float32")
     assert X.shape[0] == len(docs), "Número de vetores difere do número de docs."
 
+    if args.index_type in TRAINED_TYPES:
+        print(f"Treinando índice {args.index_type} (centróides/codebooks)…")
+        train_index(index, X, max_train=args.train_size or None)
+
     print("Adicionando ao índice FAISS…")
     index.add(X)
-
-    # 6) Salvar
-    print("\n==> Salvando resultados…")
-    faiss.write_index(index, str(index_path))
-    with open(meta_path, "wb") as f:
-        pickle.dump(docs, f)
-
-    # Salvar esquema (chaves/colunas presentes)
+    applied = set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+    print(f" - índice: {describe(index)} {applied or ''}")
+
+    if args.recall_report and args.index_type != "flat":
+        n_q = min(args.recall_report, len(X))
+        rng = np.random.default_rng(42)
+        queries = X[rng.choice(len(X), size=n_q, replace=False)]
+        if args.index_type == "hnsw":
+            sweep = [{"ef_search": ef} for ef in (16, 32, 64, 128, 256)]
+        else:
+            sweep = [{"nprobe": p} for p in (1, 4, 8, 16, 32, 64)]
+        print(f"\n==> Relatório recall@k x latência ({n_q} consultas)…")
+        rows = recall_report(index, X, queries, ks=(1, 10), sweep=sweep, metric=args.metric)
+        print(format_report(rows))
+        with open(out_dir / "recall_report.json", "w", encoding="utf-8") as f:
+            json.dump({"index": describe(index), "queries": n_q, "rows": rows}, f, ensure_ascii=False, indent=2)
+        # O relatório varre os parâmetros; volta aos escolhidos antes de salvar
+        set_search_params(index, nprobe=args.nprobe, ef_search=args.ef_search)
+
+    # 6) Publicar versão (os workers trocam de índice no próximo acesso)
+    print("\n==> Publicando versão…")
     keys = sorted({k for d in docs for k in d.keys()})
-    with open(schema_path, "w", encoding="utf-8") as f:
-        json.dump({"keys": keys}, f, ensure_ascii=False, indent=2)
+    version = publish_version(
+        out_dir, index, docs,
+        manifest={
+            "model": args.model,
+            "metric": args.metric,
+            "normalize": do_norm,
+            "index_type": args.index_type,
+            "index": describe(index),
+            "keys": keys,
+        },
+        keep=args.keep_versions,
+    )
 
-    print(f"\n✅ FAISS: {index_path}")
-    print(f"✅ Metadados: {meta_path}")
-    print(f"📄 Esquema: {schema_path}")
+    print(f"\n✅ Versão: {version}")
+    print(f"✅ Pasta: {out_dir / 'versions' / version}")
     print("🎉 Concluído.")
 
 
@@ -0,0 +1,229 @@
+# semantic_cache.py
+"""
+Cache semântico de respostas do LLM (chat, riscos, próximos passos).
+
+Perguntas quase idênticas sobre o mesmo caso ("quais os riscos?",
+"quais são os riscos do caso?") reaproveitam a resposta anterior quando a
+similaridade de cosseno entre os embeddings da pergunta passa do limiar.
+As entradas são separadas por (tenant, caso, tipo, escopo) e só valem para
+o digest de documentos em que foram geradas: novo upload ou deleção muda o
+digest e invalida as respostas antigas. Também expiram por TTL.
+
+Similaridade alta não basta quando a pergunta cita dispositivos: "art. 5º"
+e "art. 6º" ficam quase idênticos no embedding. Com o texto da pergunta, o
+hit exige as mesmas citações (lexical_index.citation_tokens: artigos,
+súmulas, leis, números CNJ) da pergunta em cache.
+"""
+import os
+import math
+import time
+import sqlite3
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterator, Optional, Sequence
+
+from lexical_index import citation_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = "data/cache/semantic_responses.sqlite3"
+DEFAULT_THRESHOLD = 0.95
+DEFAULT_TTL_S = 7 * 24 * 3600
+# Respostas mantidas por (tenant, caso, tipo, escopo); a busca é linear
+DEFAULT_MAX_PER_SCOPE = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope_key TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    query TEXT NOT NULL,
+    norm REAL NOT NULL,
+    vector BLOB NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_responses_scope ON responses (scope_key, digest);
+"""
+
+
+def _pack(vector: Sequence[float]) -> bytes:
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob: bytes) -> array:
+    vec = array("f")
+    vec.frombytes(blob)
+    return vec
+
+
+def _norm(vector: Sequence[float]) -> float:
+    return math.sqrt(sum(x * x for x in vector))
+
+
+def _citations(query: str) -> FrozenSet[str]:
+    return frozenset(citation_tokens(query))
+
+
+def _scope_key(tenant: Optional[str], case_id: str, kind: str, scope: str) -> str:
+    return f"{tenant or 'default'}|{case_id}|{kind}|{scope}"
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        db_path: Path,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_per_scope: int = DEFAULT_MAX_PER_SCOPE,
+    ):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.threshold = threshold
+        self.ttl_s = ttl_s
+        self.max_per_scope = max(1, int(max_per_scope))
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, kind: str, field: str) -> None:
+        with self._lock:
+            kind_stats = self.stats.setdefault(kind, {"hits": 0, "misses": 0, "bypass": 0, "stores": 0})
+            kind_stats[field] += 1
+
+    def record_bypass(self, kind: str) -> None:
+        self._count(kind, "bypass")
+
+    def lookup(
+        self,
+        tenant: Optional[str],
+        case_id: str,
+        kind: str,
+        scope: str,
+        digest: str,
+        vector: Sequence[float],
+        query: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Resposta mais similar ainda válida (mesmo digest, dentro do TTL) com
+        cosseno >= threshold: {"answer", "query", "similarity"}; senão None.
+        Com `query`, só valem respostas cuja pergunta tem as mesmas citações.
+        """
+        norm = _norm(vector)
+        if not norm:
+            self._count(kind, "misses")
+            return None
+        key = _scope_key(tenant, case_id, kind, scope)
+        cites = _citations(query) if query is not None else None
+        best: Optional[tuple] = None
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, query, norm, vector, answer FROM responses "
+                "WHERE scope_key=? AND digest=? AND created_at>=?",
+                (key, digest, time.time() - self.ttl_s),
+            ).fetchall()
+            for row_id, row_query, row_norm, blob, answer in rows:
+                if not row_norm:
+                    continue
+                sim = sum(a * b for a, b in zip(vector, _unpack(blob))) / (norm * row_norm)
+                if sim < self.threshold or (best is not None and sim <= best[0]):
+                    continue
+                if cites is not None and _citations(row_query) != cites:
+                    continue
+                best = (sim, row_id, row_query, answer)
+            if best is not None:
+                conn.execute("UPDATE responses SET hits=hits+1 WHERE id=?", (best[1],))
+        if best is None:
+            self._count(kind, "misses")
+            return None
+        self._count(kind, "hits")
+        return {"answer": best[3], "query": best[2], "similarity": round(best[0], 4)}
+
+    def store(
+        self,
+        tenant: Optional[str],
+        case_id: str,
+        kind: str,
+        scope: str,
+        digest: str,
+        query: str,
+        vector: Sequence[float],
+        answer: str,
+    ) -> None:
+        key = _scope_key(tenant, case_id, kind, scope)
+        agora = time.time()
+        with self._connect() as conn:
+            # Respostas de outro conjunto de documentos ou expiradas não voltam a valer
+            conn.execute(
+                "DELETE FROM responses WHERE scope_key=? AND (digest<>? OR created_at<?)",
+                (key, digest, agora - self.ttl_s),
+            )
+            conn.execute(
+                "INSERT INTO responses (scope_key, digest, query, norm, vector, answer, created_at) "
+                "VALUES (?,?,?,?,?,?,?)",
+                (key, digest, query, _norm(vector), _pack(vector), answer, agora),
+            )
+            conn.execute(
+                "DELETE FROM responses WHERE scope_key=? AND id NOT IN "
+                "(SELECT id FROM responses WHERE scope_key=? ORDER BY id DESC LIMIT ?)",
+                (key, key, self.max_per_scope),
+            )
+        self._count(kind, "stores")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            by_kind: Dict[str, Dict[str, Any]] = {k: dict(v) for k, v in self.stats.items()}
+        for v in by_kind.values():
+            total = v["hits"] + v["misses"]
+            v["hit_rate"] = round(v["hits"] / total, 4) if total else 0.0
+        hits = sum(v["hits"] for v in by_kind.values())
+        misses = sum(v["misses"] for v in by_kind.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "bypass": sum(v["bypass"] for v in by_kind.values()),
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "threshold": self.threshold,
+            "ttl_s": self.ttl_s,
+            "by_kind": by_kind,
+        }
+
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1") == "1"
+
+_CACHE: Optional[SemanticResponseCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_semantic_cache() -> SemanticResponseCache:
+    """Cache do processo (SEMANTIC_CACHE_DB / _THRESHOLD / _TTL / _MAX_PER_SCOPE)."""
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = SemanticResponseCache(
+                    Path(os.getenv("SEMANTIC_CACHE_DB", DEFAULT_DB_PATH)),
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", str(DEFAULT_THRESHOLD))),
+                    ttl_s=float(os.getenv("SEMANTIC_CACHE_TTL", str(DEFAULT_TTL_S))),
+                    max_per_scope=int(os.getenv("SEMANTIC_CACHE_MAX_PER_SCOPE", str(DEFAULT_MAX_PER_SCOPE))),
+                )
+    return _CACHE
+
+
+def semantic_cache_stats() -> Dict[str, Any]:
+    """Estatísticas do cache, sem criá-lo (vazio se ainda não usado)."""
+    return _CACHE.snapshot() if _CACHE is not None else {}
@@ -0,0 +1,53 @@
+// static/js/sse-stream.js
+// Resposta do chat em streaming (Server-Sent Events), servida pelo próprio app
+// em vez da extensão SSE do HTMX via CDN. Cobre o subconjunto dos atributos
+// da extensão usado em _conversa_chat.html:
+//   sse-connect="<url>"   abre o EventSource no elemento
+//   sse-swap="<evento>"   filho que recebe o HTML do evento (hx-swap: beforeend | innerHTML)
+//   sse-close="<evento>"  fecha a conexão depois desse evento
+(function () {
+  if (window.__sseStreamBound) return;
+  window.__sseStreamBound = true;
+
+  function swap(target, html) {
+    if ((target.getAttribute("hx-swap") || "innerHTML") === "beforeend") {
+      target.insertAdjacentHTML("beforeend", html);
+    } else {
+      target.innerHTML = html;
+    }
+    // o HTML do evento pode trazer atributos hx-* (ex.: hx-post do commit)
+    htmx.process(target);
+  }
+
+  function connect(el) {
+    if (el.__sseSource) return;
+    const source = new EventSource(el.getAttribute("sse-connect"));
+    el.__sseSource = source;
+    const closeOn = el.getAttribute("sse-close");
+    const names = new Set();
+    el.querySelectorAll("[sse-swap]").forEach(function (t) { names.add(t.getAttribute("sse-swap")); });
+    if (closeOn) names.add(closeOn);
+
+    names.forEach(function (name) {
+      source.addEventListener(name, function (ev) {
+        el.querySelectorAll("[sse-swap]").forEach(function (target) {
+          if (target.getAttribute("sse-swap") === name) swap(target, ev.data);
+        });
+        if (name === closeOn) source.close();
+      });
+    });
+    source.onerror = function () {
+      // elemento removido da página (ex.: conversa recarregada): não reconecta
+      if (!document.body.contains(el)) source.close();
+    };
+  }
+
+  function scan(root) {
+    if (!root || !root.querySelectorAll) return;
+    if (root.hasAttribute && root.hasAttribute("sse-connect")) connect(root);
+    root.querySelectorAll("[sse-connect]").forEach(connect);
+  }
+
+  // htmx:load dispara no carregamento da página e a cada conteúdo novo do HTMX
+  document.addEventListener("htmx:load", function (ev) { scan(ev.detail.elt); });
+})();
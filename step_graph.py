@@ -0,0 +1,124 @@
+# step_graph.py
+"""
+Execução de etapas de LLM como grafo de dependências (asyncio).
+
+Cada etapa declara de quais outras depende; etapas independentes rodam em
+paralelo e cada uma é cronometrada. Usado pelo FIRAC (analysis_module) e
+pode ser reaproveitado por outros fluxos com várias chamadas de LLM.
+"""
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latência acumulada por etapa ("grafo.etapa" -> count/total/max)
+STEP_METRICS: Dict[str, Dict[str, float]] = {}
+_METRICS_LOCK = threading.Lock()
+
+
+def record_step(graph: str, step: str, seconds: float, failed: bool = False) -> None:
+    key = f"{graph}.{step}"
+    with _METRICS_LOCK:
+        m = STEP_METRICS.setdefault(key, {"count": 0, "errors": 0, "total_s": 0.0, "max_s": 0.0})
+        m["count"] += 1
+        m["errors"] += int(failed)
+        m["total_s"] += seconds
+        m["max_s"] = max(m["max_s"], seconds)
+
+
+def step_stats() -> Dict[str, Dict[str, float]]:
+    """Cópia das métricas com latência média por etapa (para /metrics)."""
+    with _METRICS_LOCK:
+        return {
+            key: {**m, "avg_s": round(m["total_s"] / m["count"], 4) if m["count"] else 0.0}
+            for key, m in STEP_METRICS.items()
+        }
+
+
+class Step:
+    """
+    Etapa do grafo. `func` recebe o dict de resultados já disponíveis
+    (entradas iniciais + saídas das dependências) e devolve o resultado
+    da etapa; pode ser síncrona (roda em thread) ou corrotina.
+    """
+
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any],
+                 deps: Sequence[str] = (), timeout: Optional[float] = None):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.timeout = timeout
+
+
+async def run_steps(graph: str, steps: Iterable[Step], inputs: Optional[Dict[str, Any]] = None
+                    ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Executa as etapas respeitando as dependências. Retorna (resultados, tempos).
+    Uma falha (ou timeout) numa etapa é propagada para as que dependem dela.
+    """
+    steps = list(steps)
+    by_name = {s.name: s for s in steps}
+    for s in steps:
+        missing = [d for d in s.deps if d not in by_name and d not in (inputs or {})]
+        if missing:
+            raise ValueError(f"Etapa '{s.name}' depende de etapas inexistentes: {missing}")
+
+    results: Dict[str, Any] = dict(inputs or {})
+    timings: Dict[str, float] = {}
+    tasks: Dict[str, "asyncio.Task[Any]"] = {}
+
+    async def _run(step: Step) -> Any:
+        for dep in step.deps:
+            if dep in tasks:
+                await tasks[dep]
+        t0 = time.perf_counter()
+        failed = False
+        try:
+            if asyncio.iscoroutinefunction(step.func):
+                call: Awaitable[Any] = step.func(results)
+            else:
+                call = asyncio.to_thread(step.func, results)
+            value = await asyncio.wait_for(call, timeout=step.timeout) if step.timeout else await call
+            results[step.name] = value
+            return value
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            timings[step.name] = round(time.perf_counter() - t0, 4)
+            record_step(graph, step.name, timings[step.name], failed=failed)
+
+    for s in steps:
+        tasks[s.name] = asyncio.ensure_future(_run(s))
+    try:
+        await asyncio.gather(*tasks.values())
+    finally:
+        for t in tasks.values():
+            if not t.done():
+                t.cancel()
+    logger.info(f"[{graph}] tempos por etapa: {timings}")
+    return results, timings
+
+
+_BRIDGE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="step-graph")
+
+
+def run_sync(coro: Awaitable[Any]) -> Any:
+    """
+    Roda a corrotina a partir de código síncrono (rotas Flask). Se já houver
+    um event loop nesta thread, executa num loop novo em outra thread.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)  # type: ignore[arg-type]
+    return _BRIDGE_EXECUTOR.submit(asyncio.run, coro).result()  # type: ignore[arg-type]
+
+
+def run_steps_sync(graph: str, steps: List[Step], inputs: Optional[Dict[str, Any]] = None
+                   ) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    return run_sync(run_steps(graph, steps, inputs))
@@ -0,0 +1,41 @@
+import os
+
+from analysis_cache import AnalysisArtifactCache, prompt_version
+
+
+def test_key_includes_digest_model_and_prompt_version(tmp_path):
+    cache = AnalysisArtifactCache(tmp_path)
+    v1 = prompt_version("Riscos: {context}")
+    cache.put("riscos", " Prescrição ", "abc123", "gpt-4o", v1, "Risco 1")
+
+    assert cache.get("riscos", "prescrição", "abc123", "gpt-4o", v1) == "Risco 1"
+    assert cache.get("riscos", "prescrição", "def456", "gpt-4o", v1) is None
+    assert cache.get("riscos", "prescrição", "abc123", "gpt-4o-mini", v1) is None
+    assert cache.get("riscos", "prescrição", "abc123", "gpt-4o", prompt_version("Outro: {context}")) is None
+    assert cache.get("proximos_passos", "prescrição", "abc123", "gpt-4o", v1) is None
+    assert not list(cache.artifacts_dir.glob("*.tmp"))
+
+
+def test_eviction_removes_least_recently_used(tmp_path):
+    cache = AnalysisArtifactCache(tmp_path, max_bytes=2000)
+    for i in range(3):
+        cache.put("summary", f"foco {i}", "abc123", "gpt-4o", "v1", "x" * 400)
+        path = cache._path("summary", f"foco {i}", "abc123", "gpt-4o", "v1")
+        os.utime(path, (1000 + i, 1000 + i))
+    cache.get("summary", "foco 0", "abc123", "gpt-4o", "v1")  # foco 0 passa a ser o mais recente
+    cache.put("summary", "foco 3", "abc123", "gpt-4o", "v1", "x" * 400)
+
+    assert cache.get("summary", "foco 0", "abc123", "gpt-4o", "v1") is not None
+    assert cache.get("summary", "foco 1", "abc123", "gpt-4o", "v1") is None
+
+
+def test_invalidate_keeps_only_current_digest(tmp_path):
+    cache = AnalysisArtifactCache(tmp_path)
+    cache.put("riscos", "", "old111", "gpt-4o", "v1", "antigo")
+    cache.put("riscos", "", "new222", "gpt-4o", "v1", "novo")
+    (tmp_path / "summary_old111_aaaa.txt").write_text("legado", encoding="utf-8")
+    (tmp_path / "firac_new222_bbbb.json").write_text("{}", encoding="utf-8")
+
+    assert cache.invalidate(keep_digest="new222") == 2
+    assert cache.get("riscos", "", "new222", "gpt-4o", "v1") == "novo"
+    assert (tmp_path / "firac_new222_bbbb.json").exists()
@@ -0,0 +1,91 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+import psycopg2
+import pytest
+
+import cadastro_manager
+from cadastro_manager import CadastroManager
+
+
+class _FakeCursor:
+    """Cursor que grava os INSERTs e falha nas linhas com numero_cnj duplicado."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if sql.startswith("INSERT"):
+            if "DUPLICADO" in params:
+                raise psycopg2.IntegrityError("duplicate key value violates unique constraint")
+            self.db["inseridos"].append(params)
+        else:
+            self.db["comandos"].append(sql)
+
+
+class _FakeConn:
+    def __init__(self, db):
+        self.db = db
+
+    def cursor(self):
+        return _FakeCursor(self.db)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    db = defaultdict(list)
+    mgr = CadastroManager(tenant_id="t1")
+
+    @contextmanager
+    def _connection():
+        yield _FakeConn(db)
+
+    def _execute_values(cur, sql, rows, page_size=1000):
+        # o lote inteiro falha se alguma linha violar restrição do banco
+        if any("DUPLICADO" in row for row in rows):
+            raise psycopg2.IntegrityError("duplicate key value violates unique constraint")
+        db["inseridos"].extend(rows)
+
+    monkeypatch.setattr(mgr, "_connection", _connection)
+    monkeypatch.setattr(cadastro_manager, "execute_values", _execute_values)
+    return mgr, db
+
+
+def _tempos():
+    return defaultdict(float)
+
+
+def test_invalid_row_does_not_block_the_batch(manager):
+    mgr, db = manager
+    linhas = [
+        (2, {"nome_caso": "Caso A"}),
+        (3, {"nome_caso": "Caso B", "tipo_parte": "invalido"}),
+        (4, {"nome_caso": "Caso C"}),
+    ]
+    inseridos, erros = mgr._bulk_insert_lote("cli_1", linhas, {}, _tempos())
+
+    assert [linha for linha, _ in inseridos] == [2, 4]
+    assert [linha for linha, _ in erros] == [3] and "tipo_parte" in erros[0][1]
+    assert len(db["inseridos"]) == 2
+
+
+def test_db_error_in_one_row_keeps_the_good_rows(manager):
+    mgr, db = manager
+    linhas = [
+        (2, {"nome_caso": "Caso A", "numero_cnj": "0001"}),
+        (3, {"nome_caso": "Caso B", "numero_cnj": "DUPLICADO"}),
+        (4, {"nome_caso": "Caso C", "numero_cnj": "0003"}),
+    ]
+    inseridos, erros = mgr._bulk_insert_lote("cli_1", linhas, {}, _tempos())
+
+    # o execute_values falha e o lote é refeito linha a linha com SAVEPOINT
+    assert [linha for linha, _ in inseridos] == [2, 4]
+    assert [linha for linha, _ in erros] == [3] and "duplicate key" in erros[0][1]
+    assert len(db["inseridos"]) == 2
+    assert db["comandos"].count("ROLLBACK TO SAVEPOINT bulk_linha") == 1
@@ -0,0 +1,48 @@
+from case_manifest import CaseManifest
+
+
+def test_manifest_tracks_ingest_and_delete(tmp_path):
+    manifest = CaseManifest(tmp_path / "manifest.json")
+    assert manifest.documents() is None
+
+    manifest.rebuild([])
+    manifest.record_chunks("contrato.pdf", "pdf", 12, checksum="abc")
+    manifest.record_chunks("contrato.pdf", "pdf", 3)
+    manifest.record_chunks("extrato.txt", "text", 2)
+
+    docs = {d["source"]: d for d in manifest.documents()}
+    assert docs["contrato.pdf"]["chunk_count"] == 15 and docs["contrato.pdf"]["checksum"] == "abc"
+
+    digest = CaseManifest.digest(manifest.documents())
+    manifest.remove("extrato.txt")
+    assert [d["source"] for d in manifest.documents()] == ["contrato.pdf"]
+    assert CaseManifest.digest(manifest.documents()) != digest
+    assert CaseManifest.digest([]) == "no_docs"
+
+
+def test_digest_matches_legacy_format():
+    docs = [{"source": "b.pdf", "chunk_count": 2}, {"source": "a.pdf", "chunk_count": 5}]
+    import hashlib
+    legacy = hashlib.sha1("a.pdf:5|b.pdf:2".encode("utf-8")).hexdigest()[:12]
+    assert CaseManifest.digest(docs) == legacy
+
+
+def _record_many(path, n):
+    manifest = CaseManifest(path)
+    for _ in range(n):
+        manifest.record_chunks("contrato.pdf", "pdf", 1)
+
+
+def test_concurrent_workers_do_not_lose_updates(tmp_path):
+    import multiprocessing as mp
+
+    path = tmp_path / "manifest.json"
+    CaseManifest(path).rebuild([])
+    # um CaseManifest por processo, como os workers do gunicorn
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=_record_many, args=(path, 25)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert CaseManifest(path).documents()[0]["chunk_count"] == 100
@@ -0,0 +1,29 @@
+from context_builder import ChatContextBuilder, count_tokens, fit_chunks, rank_chunks
+
+SYSTEM = "Você é um assistente jurídico.\nContexto a seguir:\n---\n{context}\n---\n"
+
+
+def test_rank_chunks_interleaves_and_dedupes():
+    chunks, dups = rank_chunks(["a1", "a2", "Comum  texto"], ["b1", "comum texto"])
+    assert chunks == ["a1", "b1", "a2", "comum texto"]
+    assert dups == 1
+
+
+def test_fit_chunks_respects_budget():
+    chunks = ["palavra " * 50] * 10
+    fitted, used = fit_chunks(chunks, 120)
+    assert used <= 120
+    assert 1 <= len(fitted) < 10
+
+
+def test_history_overflow_goes_to_memory_and_budget_holds():
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": "turno longo " * 40} for i in range(20)]
+    builder = ChatContextBuilder(budget=1500, history_share=0.3)
+    ctx = builder.build(SYSTEM, "Qual o valor do contrato?", [["trecho do caso " * 30] * 8, ["trecho da KB " * 30]],
+                        history, memory="Cliente questiona descontos do INSS.")
+
+    assert ctx.stats["turns_overflow"] > 0
+    assert ctx.overflow_turns == history[: ctx.stats["turns_overflow"]]
+    assert "RESUMO DA CONVERSA ANTERIOR" in ctx.prompt
+    assert count_tokens(ctx.prompt) <= 1500
+    assert ctx.prompt.rstrip().endswith("ASSISTENTE:")
@@ -0,0 +1,37 @@
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class _FakeEmbeddings:
+    model = "fake-1"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_batch_lookup_only_embeds_missing(tmp_path):
+    base = _FakeEmbeddings()
+    emb = CachedEmbeddings(base, EmbeddingCache(tmp_path / "emb.sqlite3"))
+
+    assert emb.embed_query("Resumo geral do caso") == [20.0, 1.0]
+    emb.embed_query("Resumo geral do caso")
+    vectors = emb.embed_documents(["Resumo geral do caso", "abc", "abc"])
+
+    assert vectors == [[20.0, 1.0], [3.0, 1.0], [3.0, 1.0]]
+    assert base.calls == [["Resumo geral do caso"], ["abc"]]
+    snap = emb.cache.snapshot()
+    assert snap["hits"] == 2 and snap["size"] == 2
+
+
+def test_eviction_keeps_size_bounded(tmp_path):
+    cache = EmbeddingCache(tmp_path / "emb.sqlite3", max_entries=10)
+    emb = CachedEmbeddings(_FakeEmbeddings(), cache)
+    emb.embed_documents([f"texto {i}" for i in range(25)])
+    snap = cache.snapshot()
+    assert snap["size"] <= 10 and snap["evictions"] >= 15
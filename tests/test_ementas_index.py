@@ -0,0 +1,203 @@
+import numpy as np
+import faiss
+
+from ementas_index import (
+    WAL_DELETE, WAL_UPSERT, append_wal, current_version, list_versions, publish_version,
+    read_index, read_manifest, read_wal, version_dir,
+)
+
+
+def _index(n, dim=8, seed=0):
+    vecs = np.random.default_rng(seed).random((n, dim), dtype="float32")
+    index = faiss.IndexFlatIP(dim)
+    index.add(vecs)
+    return index, vecs
+
+
+def test_publish_switches_current_and_prunes(tmp_path):
+    index, _ = _index(4)
+    v1 = publish_version(tmp_path, index, [{"id": str(i)} for i in range(4)], {"model": "m"}, keep=2)
+    assert current_version(tmp_path) == v1
+    assert read_manifest(tmp_path, v1)["ntotal"] == 4
+
+    # Publicação incremental: metadados da base + novos registros
+    index.add(np.ones((1, 8), dtype="float32"))
+    v2 = publish_version(tmp_path, index, [{"id": "4"}], base_version=v1, keep=2)
+    v3 = publish_version(tmp_path, index, [], base_version=v2, keep=2)
+    assert current_version(tmp_path) == v3
+    assert list_versions(tmp_path) == [v2, v3]
+
+    lines = (version_dir(tmp_path, v3) / "meta.jsonl").read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 5
+    assert read_index(version_dir(tmp_path, v3) / "index.faiss").ntotal == 5
+
+
+def test_service_hot_swaps_on_publish(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+
+    index, vecs = _index(3)
+    publish_version(tmp_path, index, [{"id": "a"}, {"id": "b"}, {"id": "c"}])
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    old = svc.snapshot()
+    assert old.index.ntotal == 3
+
+    # nova versão publicada por outro processo (ex.: script de indexação)
+    index.add(np.ones((1, 8), dtype="float32"))
+    publish_version(tmp_path, index, [{"id": "d"}], base_version=old.version)
+    new = svc.snapshot()
+    assert new.version != old.version and new.index.ntotal == 4
+    assert new.meta.get(3)["id"] == "d"
+    # O snapshot antigo continua utilizável por buscas em andamento
+    _, rows = old.index.search(vecs[:1], 3)
+    assert sorted(m["id"] for m in old.meta.get_many(rows[0])) == ["a", "b", "c"]
+
+
+def test_wal_replay_stops_at_torn_tail(tmp_path):
+    wal = tmp_path / "v.wal"
+    size = append_wal(wal, WAL_UPSERT, [7, 9], np.ones((2, 4), dtype="float32"), [{"id": "a"}, {"id": "b"}], fsync=False)
+    with open(wal, "ab") as f:
+        f.write(b"EW\x02parcial")
+
+    entries, offset = read_wal(wal)
+    assert offset == size and [e.ids.tolist() for e in entries] == [[7, 9]]
+    assert entries[0].records[1]["id"] == "b"
+
+    # próximo append descarta o final incompleto
+    append_wal(wal, WAL_DELETE, [7], valid_size=offset, fsync=False)
+    entries, _ = read_wal(wal)
+    assert [e.op for e in entries] == [WAL_UPSERT, WAL_DELETE]
+
+
+def test_service_upsert_delete_and_compact(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    vecs = np.eye(8, dtype="float32")
+    svc.upsert([1, 2, 3], vecs[:3], [{"id": "a"}, {"id": "b"}, {"id": "c"}])
+    svc.compact()
+    base = svc.snapshot()
+    assert base.index.ntotal == 3 and base.delta.size == 0
+
+    # atualização e deleção vão só para o WAL (tombstones sobre a versão)
+    svc.upsert([2], vecs[5:6], [{"id": "b2"}])
+    assert svc.delete([3, 99]) == 1
+    snap = svc.snapshot()
+    assert snap.version == base.version
+    assert snap.delta.tombstones == {2, 3} and snap.ntotal == 2
+
+    # outro worker enxerga as mesmas alterações pelo WAL
+    other = EmentasIndexService(tmp_path, check_interval_s=0)
+    assert other.snapshot().ntotal == 2
+
+    version = svc.compact()
+    compacted = svc.snapshot()
+    assert compacted.version == version and compacted.index.ntotal == 2
+    _, labels = compacted.index.search(vecs[5:6], 1)
+    assert labels[0][0] == 2 and compacted.meta.get(compacted.rows[2])["id"] == "b2"
+
+
+def test_tombstones_excluded_from_dense_search(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+
+    rng = np.random.default_rng(0)
+    vecs = rng.standard_normal((200, 16)).astype("float32")
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    svc.upsert(list(range(200)), vecs, [{"id": str(i)} for i in range(200)])
+    svc.compact()
+    # os vizinhos da consulta viram tombstones: o top-k vem dos vivos sem buscar 150 linhas a mais
+    svc.delete(list(range(150)))
+    svc.encode = lambda texts, normalize=True: np.tile(vecs[0], (len(texts), 1))
+    hits = svc.search("q", k=3, mode="dense")
+    assert len(hits) == 3 and all(h["key"] >= 150 for h in hits)
+    assert svc.snapshot().delta.exclude is not None
+
+
+def test_deferred_upserts_checkpoint_once(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    vecs = np.eye(8, dtype="float32")
+    for i in range(4):
+        svc.upsert([i], vecs[i:i + 1], [{"id": str(i)}], defer=True)
+    snap = svc.snapshot()
+    assert snap.index.ntotal == 0 and snap.delta.size == 4 and svc.compactions == 0
+
+    svc.compact()
+    assert svc.snapshot().index.ntotal == 4 and svc.compactions == 1
+
+
+def test_search_many_matches_single_queries_and_dedups(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+
+    vecs = np.eye(8, dtype="float32")
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    svc.upsert([1, 2, 3], vecs[:3], [{"id": "a"}, {"id": "b"}, {"id": "c"}])
+    svc.compact()
+    svc.upsert([4], vecs[3:4], [{"id": "d"}])  # fica no delta do WAL
+    table = {"q1": vecs[0] + 0.5 * vecs[1], "q2": vecs[1] + 0.2 * vecs[3], "": vecs[7]}
+    svc.encode = lambda texts, normalize=True: np.vstack([table[t] for t in texts]).astype("float32")
+
+    batch = svc.search_many(["q1", "", "q2"], k=2)
+    assert batch[1] == []
+    assert batch[0] == svc.search("q1", k=2) and batch[2] == svc.search("q2", k=2)
+    assert [h["meta"]["id"] for h in batch[2]] == ["b", "d"]
+
+    # "b" pontua melhor em q2 e sai de q1
+    deduped = svc.search_many(["q1", "q2"], k=2, dedup=True)
+    assert [h["meta"]["id"] for h in deduped[0]] == ["a"]
+    assert [h["meta"]["id"] for h in deduped[1]] == ["b", "d"]
+
+
+def test_hybrid_search_finds_exact_citation(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+    from ementas_index import lexical_path
+
+    vecs = np.eye(8, dtype="float32")
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    svc.upsert([1, 2, 3], vecs[:3], [
+        {"id": "a", "text": "Responsabilidade do banco por fraude em empréstimo consignado"},
+        {"id": "b", "text": "Aplica-se a Súmula 297 do STJ às instituições financeiras"},
+        {"id": "c", "text": "Dano moral por negativação indevida"},
+    ])
+    # o embedding "entende" o tema (a), não o número da súmula (b)
+    svc.encode = lambda texts, normalize=True: np.tile(vecs[0], (len(texts), 1))
+
+    dense = svc.search("súmula 297 stj", k=1, mode="dense")
+    hybrid = svc.search("súmula 297 stj", k=2, mode="hybrid")
+    assert dense[0]["meta"]["id"] == "a"
+    assert {h["meta"]["id"] for h in hybrid} == {"a", "b"}
+    # no híbrido "score" segue sendo a similaridade densa; o RRF vem à parte
+    assert "rrf_score" not in dense[0]
+    assert {h["meta"]["id"]: h["score"] for h in hybrid}["a"] == dense[0]["score"]
+    assert all(0 < h["rrf_score"] < 0.1 for h in hybrid)
+    assert svc.search("sumula 297", k=1, mode="lexical")[0]["meta"]["id"] == "b"
+
+    # o BM25 acompanha o WAL e vai para a versão compactada
+    svc.delete([2])
+    assert svc.search("sumula 297", k=1, mode="lexical") == []
+    version = svc.compact()
+    assert lexical_path(tmp_path, version).exists()
+    svc.upsert([4], vecs[3:4], [{"id": "d", "text": "Súmula 297: CDC e bancos"}])
+    assert svc.search("sumula 297", k=1, mode="lexical")[0]["meta"]["id"] == "d"
+
+
+def test_lexical_built_in_background_for_old_versions(tmp_path):
+    from app.services.ementas_index_service import EmentasIndexService
+    from ementas_index import current_version, lexical_path
+
+    vecs = np.eye(4, dtype="float32")
+    EmentasIndexService(tmp_path).upsert([1], vecs[:1], [{"id": "a", "text": "Súmula 297 do STJ"}])
+    # versão publicada antes do lexical.npz existir
+    path = lexical_path(tmp_path, current_version(tmp_path))
+    path.unlink()
+
+    svc = EmentasIndexService(tmp_path, check_interval_s=0)
+    svc.encode = lambda texts, normalize=True: np.tile(vecs[0], (len(texts), 1))
+    snap = svc.snapshot()
+    assert snap is not None
+    # enquanto o BM25 não está pronto a busca cai para a densa
+    hits = svc.search("sumula 297", k=1, mode="hybrid")
+    assert hits[0]["meta"]["id"] == "a" and "rrf_score" not in hits[0]
+    assert svc.lexical(snap, wait=True) is not None
+    assert path.exists()
+    assert "rrf_score" in svc.search("sumula 297", k=1, mode="hybrid")[0]
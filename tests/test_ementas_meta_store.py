@@ -0,0 +1,28 @@
+import json
+
+from app.services.ementas_meta_store import JsonlOffsetStore
+
+
+def test_append_and_lookup_by_row(tmp_path):
+    store = JsonlOffsetStore(str(tmp_path / "meta.jsonl"))
+    store.append([{"id": "a", "text": "Ementa A"}, {"id": "b", "text": "Ementa ção"}])
+    store.append([{"id": "c", "text": "Ementa C"}])
+
+    assert len(store) == 3
+    assert [m["id"] for m in store.get_many([2, 0, 1])] == ["c", "a", "b"]
+    assert store.get_many([-1, 99]) == [None, None]
+
+
+def test_rebuilds_offsets_for_legacy_jsonl(tmp_path):
+    meta = tmp_path / "meta.jsonl"
+    meta.write_text("".join(json.dumps({"id": str(i)}) + "\n" for i in range(5)), encoding="utf-8")
+
+    store = JsonlOffsetStore(str(meta))
+    assert len(store) == 5 and store.get(4)["id"] == "4"
+    assert (tmp_path / "meta.offsets").exists()
+
+    # JSONL cresceu por fora do índice (ex.: gravação interrompida): reconstrói
+    with open(meta, "a", encoding="utf-8") as f:
+        f.write(json.dumps({"id": "5"}) + "\n")
+    store.refresh()
+    assert len(store) == 6 and store.get(5)["id"] == "5"
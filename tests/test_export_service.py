@@ -0,0 +1,42 @@
+import os
+
+from flask import Flask
+
+from app.services.export_service import etag_from_filename, export_artifact, render_text, send_export
+
+
+def test_export_is_rendered_once_per_content(tmp_path):
+    calls = []
+
+    def render(path):
+        calls.append(path)
+        path.write_text("Resumo v1", encoding="utf-8")
+
+    first = export_artifact(tmp_path, "resumo_txt", "caso_ab12cd34", "Resumo v1", "txt", render)
+    again = export_artifact(tmp_path, "resumo_txt", "caso_ab12cd34", "Resumo v1", "txt", render)
+    assert first == again and len(calls) == 1
+
+    # Conteúdo novo gera outro arquivo; o anterior continua baixável
+    novo = export_artifact(tmp_path, "resumo_txt", "caso_ab12cd34", "Resumo v2", "txt", render_text("Resumo v2"), keep=2)
+    assert novo != first and first.exists()
+    assert etag_from_filename(novo.name) is not None
+
+    # além de `keep` variantes, sai a usada há mais tempo
+    os.utime(first, (1, 1))
+    terceiro = export_artifact(tmp_path, "resumo_txt", "caso_ab12cd34", "Resumo v3", "txt", render_text("Resumo v3"), keep=2)
+    assert terceiro.exists() and novo.exists() and not first.exists()
+
+
+def test_download_supports_conditional_get(tmp_path):
+    path = export_artifact(tmp_path, "resumo_txt", "caso_ab12cd34", "Resumo", "txt", render_text("Resumo"))
+    app = Flask(__name__)
+    app.add_url_rule("/dl", "dl", lambda: send_export(path))
+    client = app.test_client()
+
+    resp = client.get("/dl")
+    assert resp.status_code == 200
+    assert resp.headers["ETag"].strip('"') == etag_from_filename(path.name)
+    assert "resumo_caso_ab12cd34.txt" in resp.headers["Content-Disposition"]
+
+    resp = client.get("/dl", headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp.status_code == 304
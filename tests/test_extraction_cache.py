@@ -0,0 +1,24 @@
+from extraction_cache import ExtractionCache
+
+
+def test_roundtrip_with_vectors(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    checksum = "ab" + "0" * 62
+    assert cache.get(checksum) is None
+
+    chunks = [{"text": "cláusula 1", "entities": {"data": "01/02/2020"}}, {"text": "cláusula 2", "entities": {}}]
+    cache.put(checksum, text="cláusula 1\ncláusula 2", chunks=chunks, vectors=[[0.1, 0.2], [0.3, 0.4]],
+              splitter={"chunk_size": 1000, "chunk_overlap": 200}, embedding_model="OpenAIEmbeddings:x")
+
+    entry = cache.get(checksum)
+    assert entry["chunks"] == chunks
+    assert len(entry["vectors"]) == 2 and abs(entry["vectors"][1][0] - 0.3) < 1e-6
+    snap = cache.snapshot()
+    assert snap["hits"] == 1 and snap["misses"] == 1 and snap["writes"] == 1
+
+
+def test_vectors_dropped_when_count_mismatch(tmp_path):
+    cache = ExtractionCache(tmp_path)
+    checksum = "cd" + "1" * 62
+    cache.put(checksum, text="t", chunks=[{"text": "t", "entities": {}}], vectors=[[0.1], [0.2]])
+    assert cache.get(checksum)["vectors"] is None
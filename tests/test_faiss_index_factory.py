@@ -0,0 +1,68 @@
+import numpy as np
+import faiss
+
+from faiss_index_factory import (
+    build_index, describe, factory_string, recall_report, search_parameters, search_params_from_env,
+    set_search_params, train_index,
+)
+
+
+def _corpus(n=2000, dim=32, seed=0):
+    rng = np.random.default_rng(seed)
+    # Vetores agrupados (como embeddings reais), normalizados para cosseno
+    centers = rng.standard_normal((20, dim))
+    X = (centers[rng.integers(0, 20, n)] + 0.3 * rng.standard_normal((n, dim))).astype("float32")
+    faiss.normalize_L2(X)
+    return X
+
+
+def test_factory_strings():
+    assert factory_string("flat", 384) == "Flat"
+    assert factory_string("hnsw", 384, hnsw_m=16) == "HNSW16"
+    assert factory_string("ivf", 384, nlist=100) == "IVF100,Flat"
+    assert factory_string("ivfpq", 384, nlist=100) == "IVF100,PQ64x8"
+    assert factory_string("opqpq", 384, nlist=100, pq_m=48) == "OPQ48,IVF100,PQ48x8"
+
+
+def test_ivf_training_and_search_params():
+    X = _corpus()
+    index = build_index(X.shape[1], kind="ivf", nlist=32)
+    assert not index.is_trained
+    train_index(index, X)
+    index.add(X)
+    assert set_search_params(index, nprobe=8) == {"nprobe": 8}
+    assert describe(index)["nprobe"] == 8
+
+
+def test_search_parameters_keep_nprobe_and_selector():
+    X = _corpus()
+    index = build_index(X.shape[1], kind="ivf", nlist=32)
+    train_index(index, X)
+    index.add(X)
+    set_search_params(index, nprobe=8)
+    dead = np.arange(1000, dtype="int64")
+    sel = faiss.IDSelectorNot(faiss.IDSelectorBatch(len(dead), faiss.swig_ptr(dead)))
+    params = search_parameters(index, sel)
+    assert params.nprobe == 8
+    _, labels = index.search(X[:5], 5, params=params)
+    assert (labels >= 1000).all()
+
+
+def test_search_params_only_from_set_env(monkeypatch):
+    # sem variáveis de ambiente vale o nprobe/efSearch gravado no índice
+    monkeypatch.delenv("EMENTAS_NPROBE", raising=False)
+    monkeypatch.delenv("EMENTAS_EF_SEARCH", raising=False)
+    assert search_params_from_env() == {}
+    monkeypatch.setenv("EMENTAS_NPROBE", "32")
+    assert search_params_from_env() == {"nprobe": 32}
+
+
+def test_recall_report_against_flat():
+    X = _corpus()
+    index = build_index(X.shape[1], kind="hnsw", hnsw_m=16)
+    index.add(X)
+    rows = recall_report(index, X, X[:50], ks=(1, 10), sweep=[{"ef_search": 16}, {"ef_search": 128}])
+
+    assert rows[0]["config"] == "flat (exato)" and rows[0]["recall@10"] == 1.0
+    assert [r["config"] for r in rows[1:]] == ["efSearch=16", "efSearch=128"]
+    assert rows[2]["recall@10"] >= rows[1]["recall@10"] and rows[2]["recall@10"] > 0.9
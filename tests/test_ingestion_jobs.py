@@ -0,0 +1,72 @@
+import time
+
+from app.services import ingestion_jobs, pipeline_registry
+
+
+class _FakePipeline:
+    def processar_upload_de_arquivo(self, progress=None, **kwargs):
+        progress("saved", 1.0)
+        progress("extracting", 0.5)
+        progress("embedding", 1.0)
+        progress("indexed", 1.0)
+        return {"status": "sucesso", "mensagem": f"Arquivo '{kwargs['nome_arquivo']}' processado e salvo."}
+
+
+def _wait(queue, job_id, timeout=5.0):
+    fim = time.time() + timeout
+    while time.time() < fim:
+        job = queue.get(job_id)
+        if job["status"] in ingestion_jobs.TERMINAL_STATUSES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job não terminou")
+
+
+def test_job_reports_stages_and_finishes(tmp_path, monkeypatch):
+    monkeypatch.setattr(pipeline_registry, "get_pipeline", lambda case_id, tenant_id=None: _FakePipeline())
+    arquivo = tmp_path / "peticao.txt"
+    arquivo.write_text("conteúdo", encoding="utf-8")
+
+    queue = ingestion_jobs.IngestionJobQueue(tmp_path / "jobs.sqlite3", max_workers=1)
+    job_id = queue.submit("t1", "caso_1", "peticao.txt", arquivo)
+
+    job = _wait(queue, job_id)
+    assert job["status"] == "done"
+    assert job["stage"] == "indexed" and job["percent"] == 100
+    assert job["result"]["status"] == "sucesso"
+
+
+def test_job_error_is_recorded(tmp_path, monkeypatch):
+    def _boom(case_id, tenant_id=None):
+        raise RuntimeError("falha simulada")
+
+    monkeypatch.setattr(pipeline_registry, "get_pipeline", _boom)
+    arquivo = tmp_path / "a.pdf"
+    arquivo.write_bytes(b"%PDF")
+
+    queue = ingestion_jobs.IngestionJobQueue(tmp_path / "jobs.sqlite3", max_workers=1)
+    job = _wait(queue, queue.submit("t1", "caso_1", "a.pdf", arquivo))
+    assert job["status"] == "error"
+    assert "falha simulada" in job["message"]
+
+
+def test_stale_job_is_failed_even_if_pid_is_alive(tmp_path):
+    import os
+    import sqlite3
+
+    db = tmp_path / "jobs.sqlite3"
+    ingestion_jobs.IngestionJobQueue(db, max_workers=1)
+    antigo = time.time() - ingestion_jobs.INGESTION_STALE_S - 10
+    with sqlite3.connect(str(db)) as conn:
+        # PID reaproveitado após restart: o processo existe, mas não é o dono do job
+        for job_id, heartbeat in (("orfao", antigo), ("vivo", time.time())):
+            conn.execute(
+                "INSERT INTO ingestion_jobs (id, tenant_id, case_id, filename, file_path, status, stage, "
+                "percent, worker_pid, heartbeat_at, created_at, updated_at) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (job_id, "t1", "caso_1", "a.pdf", "a.pdf", "running", "embedding", 60, os.getpid(),
+                 heartbeat, antigo, antigo),
+            )
+
+    queue = ingestion_jobs.IngestionJobQueue(db, max_workers=1)
+    assert queue.get("orfao")["status"] == "error"
+    assert queue.get("vivo")["status"] == "running"
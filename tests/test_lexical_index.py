@@ -0,0 +1,63 @@
+from hybrid_retriever import ChromaLexicalIndex, mark_changed
+from lexical_index import BM25Index, citation_tokens, rrf_fuse, tokenize
+
+
+def test_tokenize_folds_accents_and_extracts_citations():
+    tokens = tokenize("Aplica-se o art. 6º, III do CDC e a Súmula nº 297 do STJ (Lei n. 8.078/90).")
+    assert {"sumula", "iii", "cdc", "stj", "8078"} <= set(tokens)
+    assert "do" not in tokens and "6o" not in tokens
+    assert {"art:6", "sumula:297", "lei:8078"} <= set(tokens)
+    assert citation_tokens("autos 0001234-56.2023.8.26.0100") == ["cnj:00012345620238260100"]
+
+
+def test_bm25_replace_remove_and_persist(tmp_path):
+    index = BM25Index()
+    index.add([1, 2, 3], [
+        "Súmula 297 do STJ: o CDC é aplicável às instituições financeiras",
+        "dano moral por negativação indevida",
+        "art. 6º, III do CDC: informação adequada e clara",
+    ])
+    assert [k for k, _ in index.search("sumula 297", 3)] == [1]
+    assert index.search("art. 6 do cdc", 3)[0][0] == 3
+
+    # reenvio da mesma chave substitui o texto; remoção some da busca
+    index.add([2], ["inversão do ônus da prova, art. 6º, VIII do CDC"])
+    assert index.search("negativacao", 3) == []
+    assert index.remove([3, 99]) == 1 and len(index) == 2
+
+    index.save(tmp_path / "lexical.npz")
+    loaded = BM25Index.load(tmp_path / "lexical.npz")
+    assert loaded.search("art. 6º CDC", 3) == index.search("art. 6º CDC", 3)
+    assert [k for k, _ in loaded.search("onus prova", 3)] == [2]
+
+
+def test_rrf_prefers_documents_in_both_lists():
+    fused = rrf_fuse([["a", "b", "c"], ["c", "a"]])
+    assert [k for k, _ in fused] == ["a", "c", "b"]
+
+
+class _FakeChroma:
+    def __init__(self, directory, docs):
+        self._persist_directory = str(directory)
+        self.docs = dict(docs)
+        self._collection = self
+
+    def count(self):
+        return len(self.docs)
+
+    def get(self, ids=None, include=()):
+        ids = list(self.docs) if ids is None else [i for i in ids if i in self.docs]
+        return {"ids": ids, "documents": [self.docs[i] for i in ids]}
+
+
+def test_chroma_lexical_sees_delete_plus_add_with_same_count(tmp_path):
+    store = _FakeChroma(tmp_path, {"a": "dano moral", "b": "Súmula 297 do STJ"})
+    lexical = ChromaLexicalIndex(store, tmp_path / "lexical.npz", check_interval_s=0)
+    assert [k for k, _ in lexical.search("sumula 297", 3)] == ["b"]
+
+    # remove um chunk e insere outro: a contagem da coleção não muda
+    del store.docs["b"]
+    store.docs["c"] = "art. 6º, III do CDC"
+    mark_changed(store)
+    assert lexical.search("sumula 297", 3) == []
+    assert [k for k, _ in lexical.search("art. 6 cdc", 3)] == ["c"]
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from petition_module import PetitionGenerator
+
+
+class _FakeChain:
+    """Chain com a interface usada por _generate_llm_sections (prompt, invoke, ainvoke)."""
+
+    def __init__(self, campo, variaveis, texto, atraso=0.0):
+        self.prompt = SimpleNamespace(input_variables=variaveis)
+        self.campo = campo
+        self.texto = texto
+        self.atraso = atraso
+
+    def invoke(self, inputs):
+        return {self.campo: self.texto}
+
+    async def ainvoke(self, inputs):
+        await asyncio.sleep(self.atraso)
+        return {self.campo: self.texto}
+
+
+def _generator(lenta: str) -> PetitionGenerator:
+    gen = PetitionGenerator.__new__(PetitionGenerator)
+    gen.concurrent = True
+    gen.section_timeout = 0.2
+    gen.last_section_timings = {}
+    chains = {
+        "nome_acao_peticao_chain": ("nome_completo_acao", ["firac_issue", "firac_conclusion"], "Ação de cobrança"),
+        "artigos_chave_peticao_chain": ("artigos_fundamentacao_chave", ["firac_rules"], "Art. 389 do Código Civil"),
+        "narrativa_fatos_peticao_chain": ("narrativa_dos_fatos", ["firac_facts"], "O réu não pagou a dívida."),
+        "fundamentacao_geral_peticao_chain": ("fundamentacao_juridica_geral", ["firac_issue", "firac_rules", "firac_application"], "Fundamentação."),
+        "lista_pedidos_completa_peticao_chain": ("lista_completa_dos_pedidos_formatada", ["firac_conclusion", "firac_issue"], "    a) a condenação do réu;"),
+    }
+    for nome, (campo, variaveis, texto) in chains.items():
+        atraso = 5.0 if campo == lenta else 0.0
+        setattr(gen, nome, _FakeChain(campo, variaveis, texto, atraso))
+    return gen
+
+
+def test_section_timeout_uses_placeholder_and_keeps_other_sections():
+    firac = {
+        "facts": "Fatos.", "issue": "Questão.", "rules": "Regras.",
+        "application": "Aplicação.", "conclusion": "Conclusão.",
+    }
+    gen = _generator(lenta="narrativa_dos_fatos")
+
+    secoes = gen._generate_llm_sections(firac, firac_data=firac)
+
+    assert secoes["narrativa_dos_fatos"] == "[Narrar os fatos detalhadamente]"
+    assert secoes["nome_completo_acao"] == "AÇÃO DE COBRANÇA"
+    assert secoes["artigos_fundamentacao_chave"] == "Art. 389 do Código Civil"
+    assert secoes["fundamentacao_juridica_geral"] == "Fundamentação."
+    assert secoes["lista_completa_dos_pedidos_formatada"] == "    a) a condenação do réu;"
@@ -0,0 +1,49 @@
+import sys
+import types
+
+from app.services.pipeline_registry import PipelineRegistry
+
+
+class _FakePipeline:
+    def __init__(self, case_id, tenant_id=None):
+        self.case_id = case_id
+        self.tenant_id = tenant_id
+
+
+def _install_fake_pipeline(monkeypatch):
+    fake = types.ModuleType('pipeline')
+    fake.Pipeline = _FakePipeline
+    monkeypatch.setitem(sys.modules, 'pipeline', fake)
+
+
+def test_registry_reuses_pipeline_per_tenant_and_case(monkeypatch):
+    _install_fake_pipeline(monkeypatch)
+    reg = PipelineRegistry(max_size=4)
+    a = reg.get('caso_1', 't1')
+    assert reg.get('caso_1', 't1') is a
+    assert reg.get('caso_1', 't2') is not a
+    snap = reg.snapshot()
+    assert snap['hits'] == 1 and snap['misses'] == 2
+
+
+def test_registry_evicts_least_recently_used(monkeypatch):
+    _install_fake_pipeline(monkeypatch)
+    reg = PipelineRegistry(max_size=2)
+    a = reg.get('caso_a', 't')
+    reg.get('caso_b', 't')
+    reg.get('caso_a', 't')          # 'a' passa a ser o mais recente
+    reg.get('caso_c', 't')          # evicta 'b'
+    assert reg.snapshot()['evictions'] == 1
+    assert reg.get('caso_a', 't') is a
+    assert reg.snapshot()['size'] == 2
+
+
+def test_registry_normalizes_default_tenant(monkeypatch):
+    _install_fake_pipeline(monkeypatch)
+    reg = PipelineRegistry(max_size=4)
+    # None, "" e "default" usam o mesmo diretório (cases/default): um só Pipeline
+    a = reg.get('caso_1', None)
+    assert reg.get('caso_1', 'default') is a and reg.get('caso_1', '') is a
+    assert a.tenant_id is None
+    reg.invalidate('caso_1', 'default')
+    assert reg.snapshot()['size'] == 0
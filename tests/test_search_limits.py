@@ -0,0 +1,16 @@
+from app.utils.search_limits import SEARCH_MAX_BATCH, SEARCH_MAX_K, batch_error, parse_k
+
+
+def test_parse_k_clamps_and_defaults():
+    assert parse_k(None) == 10
+    assert parse_k("abc") == 10 and parse_k([3]) == 10
+    assert parse_k("5") == 5
+    assert parse_k(0) == 1 and parse_k(-3) == 1
+    assert parse_k(10_000) == SEARCH_MAX_K
+
+
+def test_batch_error_caps_queries():
+    assert batch_error(["a"]) is None
+    assert batch_error([]) is not None and batch_error("a") is not None
+    assert batch_error(["q"] * SEARCH_MAX_BATCH) is None
+    assert batch_error(["q"] * (SEARCH_MAX_BATCH + 1)) is not None
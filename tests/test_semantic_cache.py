@@ -0,0 +1,49 @@
+from semantic_cache import SemanticResponseCache
+
+
+def _cache(tmp_path, **kw):
+    return SemanticResponseCache(tmp_path / "sem.sqlite3", threshold=0.9, **kw)
+
+
+def test_similar_question_hits_same_digest_only(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store("t1", "42", "riscos", "case", "d1", "quais os riscos?", [1.0, 0.0, 0.1], "Risco 1")
+
+    hit = cache.lookup("t1", "42", "riscos", "case", "d1", [0.98, 0.05, 0.1])
+    assert hit is not None and hit["answer"] == "Risco 1"
+
+    # Pergunta diferente, outro digest (docs mudaram) ou outro tenant: miss
+    assert cache.lookup("t1", "42", "riscos", "case", "d1", [0.0, 1.0, 0.0]) is None
+    assert cache.lookup("t1", "42", "riscos", "case", "d2", [1.0, 0.0, 0.1]) is None
+    assert cache.lookup("t2", "42", "riscos", "case", "d1", [1.0, 0.0, 0.1]) is None
+
+    snap = cache.snapshot()
+    assert snap["hits"] == 1 and snap["misses"] == 3
+    assert snap["by_kind"]["riscos"]["stores"] == 1
+
+
+def test_ttl_expires_entries(tmp_path):
+    cache = _cache(tmp_path, ttl_s=0)
+    cache.store(None, "42", "chat", "case", "d1", "prazo?", [1.0, 0.0], "5 anos")
+    assert cache.lookup(None, "42", "chat", "case", "d1", [1.0, 0.0]) is None
+
+
+def test_store_drops_answers_from_old_digest(tmp_path):
+    cache = _cache(tmp_path, max_per_scope=2)
+    cache.store(None, "42", "chat", "case", "d1", "a", [1.0, 0.0], "velha")
+    cache.store(None, "42", "chat", "case", "d2", "a", [1.0, 0.0], "nova")
+    with cache._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 1
+
+
+def test_hit_requires_same_citations(tmp_path):
+    cache = _cache(tmp_path)
+    cache.store(None, "42", "chat", "case", "d1", "O que diz o art. 5º da CF?", [1.0, 0.0], "Art. 5º: ...")
+    cache.store(None, "42", "chat", "case", "d1", "Aplica-se a Súmula 297 do STJ?", [0.0, 1.0], "Sim (297)")
+
+    # embeddings quase iguais, mas outro artigo / outra súmula: miss
+    assert cache.lookup(None, "42", "chat", "case", "d1", [1.0, 0.01], query="O que diz o art. 6º da CF?") is None
+    assert cache.lookup(None, "42", "chat", "case", "d1", [0.01, 1.0], query="Aplica-se a Súmula 479 do STJ?") is None
+
+    hit = cache.lookup(None, "42", "chat", "case", "d1", [1.0, 0.01], query="o que diz o artigo 5 da CF")
+    assert hit is not None and hit["answer"] == "Art. 5º: ..."
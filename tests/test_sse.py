@@ -0,0 +1,9 @@
+from app.services.sse import sse_event
+
+
+def test_sse_event_splits_multiline_text():
+    assert sse_event('token', 'linha 1\nlinha 2') == 'event: token\ndata: linha 1\ndata: linha 2\n\n'
+
+
+def test_sse_event_serializes_json():
+    assert sse_event('done', {'output': 'ok', 'ttft_s': 0.5}) == 'event: done\ndata: {"output": "ok", "ttft_s": 0.5}\n\n'
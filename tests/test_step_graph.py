@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+
+from step_graph import Step, run_steps_sync, step_stats
+
+
+def test_independent_steps_run_concurrently_and_respect_deps():
+    def slow(name):
+        def _f(r):
+            time.sleep(0.2)
+            return name
+        return _f
+
+    async def join(r):
+        return f"{r['a']}+{r['b']}+{r['x']}"
+
+    t0 = time.perf_counter()
+    results, timings = run_steps_sync("teste", [
+        Step("a", slow("a")),
+        Step("b", slow("b")),
+        Step("c", join, deps=["a", "b", "x"]),
+    ], inputs={"x": "entrada"})
+
+    assert results["c"] == "a+b+entrada"
+    assert time.perf_counter() - t0 < 0.35
+    assert set(timings) == {"a", "b", "c"}
+    assert step_stats()["teste.a"]["count"] >= 1
+
+
+def test_failure_and_timeout_propagate():
+    async def never(r):
+        await asyncio.sleep(5)
+
+    with pytest.raises(asyncio.TimeoutError):
+        run_steps_sync("teste_timeout", [
+            Step("lento", never, timeout=0.05),
+            Step("depois", lambda r: "ok", deps=["lento"]),
+        ])
+    assert step_stats()["teste_timeout.lento"]["errors"] == 1
+
+    with pytest.raises(ValueError):
+        run_steps_sync("teste_invalido", [Step("a", lambda r: 1, deps=["inexistente"])])
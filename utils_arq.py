@@ -1,34 +1,199 @@
 # utils.py
+import os
+import time
 import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from io import BytesIO
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Optional, Union
 
 import pdfplumber
 import pytesseract
 
 logger = logging.getLogger(__name__)
 
-def extract_text_from_pdf_bytes(pdf_bytes: bytes) -> str:
-    """Extrai texto de bytes de um arquivo PDF, com fallback para OCR."""
+# Callback de progresso: (estágio, fração concluída 0..1)
+ProgressCallback = Callable[[str, float], None]
+
+# Extração paralela por página: abaixo de PDF_PARALLEL_MIN_PAGES o custo de
+# subir processos não compensa e a extração roda no próprio processo.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "300"))
+
+
+def _extract_page(page, page_number: int, ocr_dpi: int) -> Dict[str, Any]:
+    """Extrai o texto de uma página; OCR só quando não há camada de texto."""
+    t0 = time.perf_counter()
+    used_ocr = False
     text = ""
     try:
-        with BytesIO(pdf_bytes) as f, pdfplumber.open(f) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text and page_text.strip():
-                    text += page_text + "\n"
-                else:
-                    logger.info("Usando OCR em página de PDF (sem texto direto).")
-                    try:
-                        ocr_text = pytesseract.image_to_string(page.to_image(resolution=300).original, lang="por+eng")
-                        if ocr_text and ocr_text.strip():
-                            text += ocr_text + "\n"
-                    except Exception as ocr_error:
-                        logger.error(f"Erro de OCR em página de PDF: {ocr_error}")
+        text = page.extract_text() or ""
+    except Exception as e:
+        logger.warning(f"Falha ao extrair texto da página {page_number}: {e}")
+    if not text.strip():
+        used_ocr = True
+        try:
+            text = pytesseract.image_to_string(page.to_image(resolution=ocr_dpi).original, lang="por+eng") or ""
+        except Exception as ocr_error:
+            logger.error(f"Erro de OCR na página {page_number} do PDF: {ocr_error}")
+            text = ""
+    return {
+        "page": page_number,
+        "text": text.strip(),
+        "ocr": used_ocr,
+        "seconds": round(time.perf_counter() - t0, 3),
+    }
+
+
+def _extract_page_range(pdf_path: str, start: int, end: int, ocr_dpi: int,
+                        tesseract_cmd: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Worker do pool: abre o PDF uma vez e processa as páginas [start, end)."""
+    if tesseract_cmd:
+        # Processos filhos (spawn) não herdam a configuração feita no processo pai
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    with pdfplumber.open(pdf_path) as pdf:
+        return [_extract_page(pdf.pages[i], i + 1, ocr_dpi) for i in range(start, end)]
+
+
+_EXECUTOR: Optional[ProcessPoolExecutor] = None
+_EXECUTOR_WORKERS = 0
+_EXECUTOR_LOCK = threading.Lock()
+
+
+def _get_executor(max_workers: int) -> ProcessPoolExecutor:
+    """Pool de processos reutilizado entre PDFs (criado sob demanda)."""
+    global _EXECUTOR, _EXECUTOR_WORKERS
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None or _EXECUTOR_WORKERS != max_workers:
+            if _EXECUTOR is not None:
+                _EXECUTOR.shutdown(wait=False)
+            # spawn: seguro em workers com threads (Flask/fila de ingestão) e igual ao Windows
+            _EXECUTOR = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+            _EXECUTOR_WORKERS = max_workers
+        return _EXECUTOR
+
+
+def _reset_executor() -> None:
+    global _EXECUTOR, _EXECUTOR_WORKERS
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is not None:
+            _EXECUTOR.shutdown(wait=False)
+        _EXECUTOR, _EXECUTOR_WORKERS = None, 0
+
+
+def extract_pdf_pages(
+    pdf: Union[bytes, str, Path],
+    progress: Optional[ProgressCallback] = None,
+    max_workers: Optional[int] = None,
+    ocr_dpi: int = PDF_OCR_DPI,
+) -> List[Dict[str, Any]]:
+    """
+    Extrai o texto de um PDF página a página, distribuindo as páginas entre
+    processos. Páginas sem camada de texto passam por OCR.
+
+    Retorna a lista (na ordem das páginas) de dicts com
+    'page', 'text', 'ocr' e 'seconds' (tempo gasto na página).
+    """
+    workers = PDF_WORKERS if max_workers is None else max(1, int(max_workers))
+    tmp_path: Optional[str] = None
+    try:
+        if isinstance(pdf, (bytes, bytearray)):
+            source: Any = BytesIO(pdf)
+        else:
+            source = str(pdf)
+        with pdfplumber.open(source) as doc:
+            total = len(doc.pages)
+            if total == 0:
+                return []
+            if workers <= 1 or total < PDF_PARALLEL_MIN_PAGES:
+                pages = []
+                for i, page in enumerate(doc.pages):
+                    result = _extract_page(page, i + 1, ocr_dpi)
+                    pages.append(result)
+                    if progress:
+                        progress("ocr" if result["ocr"] else "extracting", (i + 1) / total)
+                return pages
+
+        # Os workers recebem um caminho (e não os bytes) para não serializar
+        # o PDF inteiro em cada tarefa.
+        if isinstance(pdf, (bytes, bytearray)):
+            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+                tmp.write(pdf)
+                tmp_path = tmp.name
+            pdf_path = tmp_path
+        else:
+            pdf_path = str(pdf)
+
+        # Blocos contíguos menores que total/workers equilibram páginas de OCR (lentas)
+        chunk = max(1, -(-total // (workers * 4)))
+        ranges = [(s, min(s + chunk, total)) for s in range(0, total, chunk)]
+        tesseract_cmd = getattr(pytesseract.pytesseract, "tesseract_cmd", None)
+        pages = []
+        done = 0
+        any_ocr = False
+        try:
+            executor = _get_executor(workers)
+            futures = [executor.submit(_extract_page_range, pdf_path, s, e, ocr_dpi, tesseract_cmd) for s, e in ranges]
+            for future in as_completed(futures):
+                chunk_pages = future.result()
+                pages.extend(chunk_pages)
+                done += len(chunk_pages)
+                any_ocr = any_ocr or any(p["ocr"] for p in chunk_pages)
+                if progress:
+                    progress("ocr" if any_ocr else "extracting", done / total)
+        except BrokenProcessPool as e:
+            logger.warning(f"Pool de extração de PDF indisponível ({e}); extraindo no próprio processo.")
+            _reset_executor()
+            return extract_pdf_pages(pdf, progress=progress, max_workers=1, ocr_dpi=ocr_dpi)
+        pages.sort(key=lambda p: p["page"])
+        return pages
+    finally:
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+
+def _log_pdf_timing(pages: List[Dict[str, Any]], elapsed: float) -> None:
+    if not pages:
+        return
+    ocr_pages = [p for p in pages if p["ocr"]]
+    slowest = max(pages, key=lambda p: p["seconds"])
+    logger.info(
+        f"PDF extraído: {len(pages)} páginas ({len(ocr_pages)} com OCR) em {elapsed:.2f}s; "
+        f"tempo somado por página {sum(p['seconds'] for p in pages):.2f}s; "
+        f"página mais lenta: {slowest['page']} ({slowest['seconds']:.2f}s)"
+    )
+
+
+def extract_text_from_pdf_bytes(pdf_bytes: bytes, progress: Optional[ProgressCallback] = None) -> str:
+    """Extrai texto de bytes de um arquivo PDF, com fallback para OCR."""
+    t0 = time.perf_counter()
+    try:
+        pages = extract_pdf_pages(pdf_bytes, progress=progress)
     except Exception as e:
         logger.error(f"Erro ao processar bytes de PDF: {e}", exc_info=True)
-    return text.strip()
+        return ""
+    _log_pdf_timing(pages, time.perf_counter() - t0)
+    return "\n".join(p["text"] for p in pages if p["text"]).strip()
+
+
+def extract_text_from_pdf_path(pdf_path: Union[str, Path], progress: Optional[ProgressCallback] = None) -> str:
+    """Mesmo que extract_text_from_pdf_bytes, lendo o PDF direto do disco."""
+    t0 = time.perf_counter()
+    try:
+        pages = extract_pdf_pages(pdf_path, progress=progress)
+    except Exception as e:
+        logger.error(f"Erro ao processar PDF '{pdf_path}': {e}", exc_info=True)
+        return ""
+    _log_pdf_timing(pages, time.perf_counter() - t0)
+    return "\n".join(p["text"] for p in pages if p["text"]).strip()
 
 def extract_text_from_txt_bytes(txt_bytes: bytes) -> str:
     """Extrai texto de bytes de um arquivo TXT."""